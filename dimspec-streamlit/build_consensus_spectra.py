@@ -0,0 +1,87 @@
+"""
+Compute and store consensus (uncertainty) mass spectra for every peak.
+
+Usage:
+    python build_consensus_spectra.py                      # app database, MS1 and MS2
+    python build_consensus_spectra.py path/to/db.sqlite --ms-level 1 --freq 10
+    python build_consensus_spectra.py --rebuild --masserror 10 --minerror 0.005
+    python build_consensus_spectra.py --optimize --workers 8   # per-peak optimal settings first
+
+Re-running only processes peaks without a stored spectrum; new or changed scans
+drop their peak's spectra automatically. With --optimize, the correl/ph/freq grid
+search of optimal_ums runs for peaks without stored parameters (opt_ums_params)
+and their spectra are built with those; --correl/--ph/--freq apply to the rest. The library fingerprints switch to the
+stored MS1 consensus spectra on the next load.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils import ums
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build per-peak uncertainty mass spectra.")
+    parser.add_argument("db_path", nargs="?", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--ms-level", type=int, action="append", default=None,
+                        help="MS level to build (repeatable; default: 1 and 2)")
+    parser.add_argument("--masserror", type=float, default=ums.DEFAULT_MASS_ERROR_PPM, help="Mass accuracy (ppm)")
+    parser.add_argument("--minerror", type=float, default=ums.DEFAULT_MIN_ERROR, help="Minimum mass error (Da)")
+    parser.add_argument("--correl", type=float, default=None, help="Minimum ion/EIC correlation")
+    parser.add_argument("--ph", type=float, default=None, help="Minimum peak height (%% of EIC range)")
+    parser.add_argument("--freq", type=float, default=None, help="Minimum observation frequency (%% of scans)")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Search optimal correl/ph/freq per peak (stored in opt_ums_params) first")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for --optimize (default: all cores)")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute spectra (and parameters) that are already stored")
+    parser.add_argument("--batch-size", type=int, default=500, help="Peaks per transaction")
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path) if args.db_path else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+
+    print(f"Database: {db_path}")
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        if args.optimize:
+            print(f"Searching optimal parameters into '{ums.OPT_PARAMS_TABLE}'...")
+            written = ums.optimize_ums_params(
+                conn, db_path,
+                ms_levels=args.ms_level or (1, 2),
+                masserror=args.masserror,
+                minerror=args.minerror,
+                workers=args.workers,
+                rebuild=args.rebuild,
+                progress=lambda n: print(f"  - {n:,} parameter sets stored", end="\r")
+            )
+            print(f"\n  {written:,} parameter sets in {time.perf_counter() - start:.1f}s")
+        print(f"Building consensus spectra into '{ums.UMS_TABLE}'...")
+        processed = ums.build_consensus_spectra(
+            conn,
+            ms_levels=args.ms_level or (1, 2),
+            masserror=args.masserror,
+            minerror=args.minerror,
+            correl=args.correl,
+            ph=args.ph,
+            freq=args.freq,
+            rebuild=args.rebuild,
+            batch_size=args.batch_size,
+            progress=lambda n: print(f"  - {n:,} peaks processed", end="\r")
+        )
+    finally:
+        conn.close()
+
+    print(f"\nDone: {processed:,} peaks in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
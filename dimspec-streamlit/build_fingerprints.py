@@ -0,0 +1,53 @@
+"""
+Build (or refresh) the on-disk library fingerprint artifact.
+
+Usage:
+    python build_fingerprints.py                   # app database, all cores
+    python build_fingerprints.py path/to/db.sqlite --workers 4 --force
+
+The app rebuilds a stale artifact on its own; running this ahead of a deploy
+means the first page load (and every replica) only has to memory-map it.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils import fingerprint_store as fs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute library fingerprints.")
+    parser.add_argument("db_path", nargs="?", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--cache-dir", default=str(fs.CACHE_DIR), help="Artifact root directory")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the artifact is current")
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path) if args.db_path else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+
+    print(f"Database: {db_path}")
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        store = fs.load_fingerprint_store(
+            conn, db_path, cache_dir=Path(args.cache_dir),
+            workers=args.workers, force=args.force
+        )
+    finally:
+        conn.close()
+
+    print(f"Artifact: {fs.store_dir_for(db_path, Path(args.cache_dir))}")
+    print(f"Done: {store.matrix.shape[0]:,} fingerprints x {store.matrix.shape[1]} bins "
+          f"({store.matrix.nnz:,} nonzeros) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Build the PFAS explorer database from the DIMSpec CSV exports.
+
+Usage:
+    python build_pfas_db.py path/to/dimspec/data
+    python build_pfas_db.py path/to/dimspec/data -o data/pfas_dimspec.db --chunk-size 1000000 --dtype intensity=float64
+
+Streams ms1s.csv, pfas_ms_intrelpeakid.csv and pfas_ms_intrelscantime.csv (whichever
+exist) into ms1_raw, ms1_peak and ms1_scantime, indexes them and aggregates
+pfas_summary in SQLite. Memory use is bounded by the chunk size, not the file size.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils import db_builder as dbb
+
+DEFAULT_OUTPUT = Path(__file__).parent / "data" / "pfas_dimspec.db"
+
+
+def parse_dtype(text: str):
+    column, sep, dtype = text.partition("=")
+    if not sep or not column or not dtype:
+        raise argparse.ArgumentTypeError(f"expected COLUMN=TYPE, got '{text}'")
+    return column, dtype
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the PFAS SQLite database from DIMSpec CSV exports.")
+    parser.add_argument("data_dir", help="Folder with the CSV exports")
+    parser.add_argument("-o", "--output", default=str(DEFAULT_OUTPUT), help="SQLite database to write")
+    parser.add_argument("--chunk-size", type=int, default=dbb.DEFAULT_CHUNK_ROWS, help="CSV rows per chunk")
+    parser.add_argument("--encoding", default="utf-8", help="CSV encoding (e.g. cp949)")
+    parser.add_argument("--cache-mb", type=int, default=dbb.DEFAULT_CACHE_MB, help="SQLite page cache (MB)")
+    parser.add_argument("--dtype", type=parse_dtype, action="append", default=[],
+                        help="Column type override, e.g. scantime=float64 (repeatable)")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if not data_dir.is_dir():
+        print(f"Error: data folder not found at {data_dir}")
+        sys.exit(1)
+    found = [s for s in dbb.SOURCES if (data_dir / s.filename).exists()]
+    for source in dbb.SOURCES:
+        if source not in found:
+            print(f"Skipping {source.filename} (not found)")
+    if not found:
+        print("Error: none of the CSV exports were found")
+        sys.exit(1)
+
+    print(f"Database: {args.output}")
+    start = time.perf_counter()
+    try:
+        counts = dbb.build_database(
+            data_dir, args.output,
+            dtypes=dict(args.dtype),
+            chunk_rows=args.chunk_size,
+            encoding=args.encoding,
+            cache_mb=args.cache_mb,
+            progress=lambda table, n: print(f"  - {table}: {n:,} rows", end="\r")
+        )
+    except ValueError as e:
+        print(f"\nError: {e}")
+        sys.exit(1)
+
+    print()
+    for table, n in counts.items():
+        print(f"  {table}: {n:,} rows")
+    print(f"Done in {time.perf_counter() - start:.1f}s -> {Path(args.output).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
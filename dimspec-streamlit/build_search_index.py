@@ -0,0 +1,65 @@
+"""
+Build (or refresh) the FTS5 full-text indexes used by table and compound search.
+
+Usage:
+    python build_search_index.py                   # index FTS_TABLES in the app's database
+    python build_search_index.py path/to/db.sqlite --table ms_methods
+    python build_search_index.py --drop            # remove the indexes again
+
+Indexes use the FTS5 trigram tokenizer (SQLite 3.34+), so searches keep the
+substring semantics of the LIKE scan. Indexes built by earlier versions (word
+tokens) are ignored by the app until this script rebuilds them. Indexes stay in
+sync with later inserts/updates/deletes through triggers; re-running rebuilds
+them from scratch.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils import database as db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build FTS5 search indexes.")
+    parser.add_argument("db_path", nargs="?", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--table", action="append", default=None,
+                        help="Table to index (repeatable; default: the FTS_TABLES set)")
+    parser.add_argument("--drop", action="store_true", help="Drop the indexes instead of building them")
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path) if args.db_path else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+
+    print(f"Database: {db_path}")
+    conn = sqlite3.connect(db_path)
+    try:
+        available = set(db.get_tables(conn))
+        tables = args.table or list(db.FTS_TABLES)
+        for table in tables:
+            if table not in available:
+                print(f"  - {table}: not in database, skipped")
+                continue
+            if args.drop:
+                db.drop_fts_index(conn, table)
+                print(f"  - {table}: index dropped")
+                continue
+            start = time.perf_counter()
+            try:
+                rows = db.build_fts_index(conn, table)
+            except ValueError as e:
+                print(f"  - {table}: {e}")
+                continue
+            print(f"  - {table}: {rows:,} rows indexed in {time.perf_counter() - start:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Shared pytest fixtures: a small synthetic DIMSpec database (utils/synthetic_db.py)
+generated once per session, per-test copies for tests that write to it, and a
+reference library snapshot whose fingerprint store lives in the test's tmp_path.
+"""
+import shutil
+import sys
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils import fingerprint_store as fs
+from utils import pfas_library as pl
+from utils.synthetic_db import generate_database
+
+
+@pytest.fixture(scope="session")
+def synthetic_db(tmp_path_factory) -> Path:
+    """Read-only synthetic database: 30 compounds, 2 peaks each, 6 scans per peak."""
+    path = tmp_path_factory.mktemp("synthetic") / "dimspec_test.sqlite"
+    generate_database(path, n_compounds=30, peaks_per_compound=2, scans_per_peak=6, seed=1)
+    return path
+
+
+@pytest.fixture
+def db_copy(synthetic_db, tmp_path) -> Path:
+    """Private copy of the synthetic database for tests that modify it."""
+    path = tmp_path / "dimspec_copy.sqlite"
+    shutil.copy(synthetic_db, path)
+    return path
+
+
+@pytest.fixture
+def store_cache(tmp_path, monkeypatch) -> Path:
+    """Keep fingerprint stores built through ReferenceLibrary out of data/cache/."""
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(fs, "load_fingerprint_store", partial(fs.load_fingerprint_store, cache_dir=cache))
+    return cache
+
+
+@pytest.fixture
+def snapshot(synthetic_db, store_cache) -> pl.LibrarySnapshot:
+    """Reference library of the synthetic database."""
+    return pl.ReferenceLibrary(synthetic_db).snapshot()
@@ -1,110 +1,94 @@
+"""
+Extract a small, referentially consistent sample database (for fixtures and load tests).
 
-import sqlite3
-import pandas as pd
-from pathlib import Path
-import os
+Usage:
+    python create_sample_db.py                                   # ~200 compounds, stratified by family
+    python create_sample_db.py --compound PFOA --compound PFOS -o data/pfoa_pfos.sqlite
+    python create_sample_db.py --family "PFCA (Carboxylic Acids)" --max-peaks 5
+    python create_sample_db.py path/to/db.sqlite --sample 1000 --seed 7 --compounds-file compound_names.txt
+
+Copies the selected compounds with their peaks, ms_data and every other row that
+depends on them or that they reference, plus whole copies of the small lookup
+tables (norm_*, elements, ...), inside SQLite (ATTACH + INSERT ... SELECT).
+pfas_summary and the builder's ms1_* tables keep only the rows of the selected
+compounds / peaks; other tables that cannot be tied to them are left empty.
+The output is replaced.
+"""
+import argparse
 import sys
+import time
+from pathlib import Path
 
-# Setup paths
-BASE_DIR = Path(__file__).parent # dimspec-streamlit
-PARENT_DIR = BASE_DIR.parent # dimspec-main
-ORIGINAL_DB = PARENT_DIR / "data" / "dimspec_nist_pfas.sqlite" # Found this one locally
-if not ORIGINAL_DB.exists():
-    ORIGINAL_DB = PARENT_DIR / "data" / "pfas_dimspec.db"
-    if not ORIGINAL_DB.exists():
-         ORIGINAL_DB = BASE_DIR / "data" / "dimspec_nist_pfas.sqlite" # Try local too
+sys.path.append(str(Path(__file__).parent))
 
-SAMPLE_DB = BASE_DIR / "data" / "dimspec_sample.sqlite"
+from utils.config import PFAS_FAMILIES, get_db_path
+from utils import db_subset as sub
 
-def create_sample_db():
-    print(f"Source DB: {ORIGINAL_DB}")
-    print(f"Target DB: {SAMPLE_DB}")
-    
-    if not ORIGINAL_DB.exists():
-        print("Error: Source database not found!")
-        return
+DEFAULT_OUTPUT = Path(__file__).parent / "data" / "dimspec_sample.sqlite"
 
-    src_conn = sqlite3.connect(ORIGINAL_DB)
-    tgt_conn = sqlite3.connect(SAMPLE_DB)
-    
-    # DEBUG: List tables
-    print("Source Tables:")
-    tables = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type='table'", src_conn)
-    print(tables)
-    
-    # 1. Compounds (Top 200)
-    print("Copying Compounds (Top 200)...")
-    try:
-        df_comp = pd.read_sql_query("SELECT * FROM compounds LIMIT 200", src_conn)
-        df_comp.to_sql("compounds", tgt_conn, if_exists="replace", index=False)
-        print(f"  - Copied {len(df_comp)} rows.")
-        
-        # Get IDs for filtering other tables
-        comp_ids = tuple(df_comp['id'].astype(str).tolist())
-        if not comp_ids:
-            comp_ids = ('-1',) # mild hack for empty tuple
-        
-        id_list = ",".join([f"'{x}'" for x in comp_ids])
-    except Exception as e:
-        print(f"  - Error copying compounds: {e}")
-        return
 
-    # 2. Samples (All or limited)
-    print("Copying Samples...")
-    try:
-        df_samp = pd.read_sql_query("SELECT * FROM samples LIMIT 50", src_conn)
-        df_samp.to_sql("samples", tgt_conn, if_exists="replace", index=False)
-    except Exception as e:
-        print(f"  - Error copying samples: {e}")
+def main():
+    parser = argparse.ArgumentParser(description="Extract a consistent sample of the database.")
+    parser.add_argument("db_path", nargs="?", default=None, help="Source database (default: app database)")
+    parser.add_argument("-o", "--output", default=str(DEFAULT_OUTPUT), help="Sample database to write")
+    parser.add_argument("--compound", action="append", default=[], help="Compound id, name or alias (repeatable)")
+    parser.add_argument("--compounds-file", default=None, help="File with one compound id/name per line")
+    parser.add_argument("--family", action="append", default=[], choices=PFAS_FAMILIES,
+                        help="Include a compound family (repeatable)")
+    parser.add_argument("--sample", type=int, default=None,
+                        help=f"Random compounds, stratified by family (default without other "
+                             f"selection: {sub.DEFAULT_SAMPLE_SIZE})")
+    parser.add_argument("--max-peaks", type=int, default=None, help="At most this many peaks per compound")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random choices")
+    parser.add_argument("--include-unmeasured", action="store_true",
+                        help="Let family/sample selection pick compounds without peaks")
+    args = parser.parse_args()
 
-    # 3. Peaks (Related to compounds)
-    print("Copying Peaks...")
-    try:
-        # Just take peaks blindly to avoid schema headaches
-        df_peaks = pd.read_sql_query("SELECT * FROM peaks LIMIT 500", src_conn)
-        df_peaks.to_sql("peaks", tgt_conn, if_exists="replace", index=False)
-        
-        # Get peak IDs for MS data
-        peak_ids = tuple(df_peaks['id'].astype(str).tolist())
-        if not peak_ids: peak_ids = ('-1',)
-        p_list = ",".join([f"'{x}'" for x in peak_ids])
-        
-        print(f"  - Copied {len(df_peaks)} peaks.")
-    except Exception as e:
-        print(f"  - Error copying peaks (might differ): {e}")
+    db_path = Path(args.db_path) if args.db_path else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+    compounds = list(args.compound)
+    if args.compounds_file:
+        path = Path(args.compounds_file)
+        if not path.exists():
+            print(f"Error: compounds file not found at {path}")
+            sys.exit(1)
+        compounds += [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    sample = args.sample
+    if not (compounds or args.family or sample):
+        sample = sub.DEFAULT_SAMPLE_SIZE
 
-    # 4. MS Data (Related to peaks)
-    print("Copying MS Data...")
+    print(f"Database: {db_path}")
+    print(f"Sample:   {args.output}")
+    start = time.perf_counter()
     try:
-        # Try to filter if possible, otherwise blind copy
-        if 'id' in df_peaks.columns:
-            df_ms = pd.read_sql_query(f"SELECT * FROM ms_data WHERE peak_id IN ({p_list}) LIMIT 2000", src_conn)
-        else:
-            df_ms = pd.read_sql_query("SELECT * FROM ms_data LIMIT 2000", src_conn)
-            
-        df_ms.to_sql("ms_data", tgt_conn, if_exists="replace", index=False)
-        print(f"  - Copied {len(df_ms)} spectra.")
-    except Exception as e:
-        print(f"  - Error copying ms_data: {e}")
-        
-    # 5. Metadata columns (Create empty if needed or copy small tables)
-    # Just copy small tables entirely
-    small_tables = list(tables['name'].values)
-    # Remove huge tables/already processed
-    exclude = ['compounds', 'samples', 'peaks', 'ms_data', 'peak_data', 'sqlite_sequence']
-    
-    for tbl in small_tables:
-        if tbl in exclude: continue
-        print(f"Copying {tbl}...")
-        try:
-            df = pd.read_sql_query(f"SELECT * FROM {tbl}", src_conn)
-            df.to_sql(tbl, tgt_conn, if_exists="replace", index=False)
-        except:
-            pass
+        result = sub.extract_subset(
+            db_path, args.output,
+            compounds=compounds,
+            families=args.family,
+            sample=sample,
+            max_peaks_per_compound=args.max_peaks,
+            seed=args.seed,
+            require_peaks=not args.include_unmeasured,
+            progress=lambda table, n: print(f"  - {table}: {n:,} rows".ljust(60), end="\r")
+        )
+    except ValueError as e:
+        print(f"\nError: {e}")
+        sys.exit(1)
+
+    print(" " * 60, end="\r")
+    for table, n in result.rows.items():
+        if n:
+            print(f"  {table}: {n:,} rows")
+    if result.skipped:
+        print(f"  Left empty: {', '.join(result.skipped)}")
+    for name in result.unmatched:
+        print(f"  Not found: {name}")
+    for table, n in result.fk_violations.items():
+        print(f"  Warning: {n:,} rows in {table} reference missing rows")
+    print(f"Done in {time.perf_counter() - start:.1f}s -> {Path(args.output).resolve()}")
 
-    src_conn.close()
-    tgt_conn.close()
-    print("Sample Database Created Successfully!")
 
 if __name__ == "__main__":
-    create_sample_db()
+    main()
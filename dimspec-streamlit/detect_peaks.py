@@ -0,0 +1,73 @@
+"""
+Headless batch PFAS detection for a whole peak list.
+
+Usage:
+    python detect_peaks.py ../example/PFAC30PAR_PFCA2_peak_list.csv -o results.csv
+    python detect_peaks.py peaks.parquet -o results.parquet --candidates cands.parquet --workers 8
+
+The peak list needs an 'mz' column; 'rt' and the optional 'spectrum_mz' /
+'spectrum_intensity' (space-delimited, as in ms_data) columns are used when present.
+Spectra are matched by accurate mass (ppm-paired dot product); --binned uses the
+1-Da binned cosine similarity instead.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils.detection import DEFAULT_MZ_TOLERANCE_PPM, DEFAULT_RT_MARGIN, TOP_N_CANDIDATES
+from utils.pfas_library import load_reference_library
+from utils import batch_detection as bd
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run PFAS detection over a peak list.")
+    parser.add_argument("peak_list", help="Peak list (.csv or .parquet)")
+    parser.add_argument("-o", "--output", required=True, help="Per-feature results (.csv or .parquet)")
+    parser.add_argument("--candidates", default=None, help="Optional long-form top-k candidates output")
+    parser.add_argument("--db", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--ppm", type=float, default=DEFAULT_MZ_TOLERANCE_PPM, help="m/z tolerance (ppm)")
+    parser.add_argument("--rt-margin", type=float, default=DEFAULT_RT_MARGIN, help="RT margin (min)")
+    parser.add_argument("--top-k", type=int, default=TOP_N_CANDIDATES, help="Candidates kept per feature")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=bd.DEFAULT_CHUNK_SIZE, help="Features per chunk")
+    parser.add_argument("--binned", action="store_true", help="Score spectra by 1-Da binned cosine similarity")
+    args = parser.parse_args()
+
+    db_path = Path(args.db) if args.db else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    peaks = bd.read_peak_list(Path(args.peak_list))
+    print(f"Peak list: {len(peaks):,} features from {args.peak_list}")
+
+    library = load_reference_library(str(db_path))
+    library_df, engine, index = library.df, library.engine, library.index
+    print(f"Library: {len(library_df):,} entries from {db_path.name} ({time.perf_counter() - start:.1f}s)")
+
+    summary, candidates = bd.detect_peak_list(
+        library_df, peaks, engine=engine, index=index,
+        mz_tolerance=args.ppm, rt_margin=args.rt_margin, top_k=args.top_k,
+        workers=args.workers, chunk_size=args.chunk_size,
+        matcher=None if args.binned else library.matcher
+    )
+    # Carry the input columns through (minus bulky spectra) for traceability
+    extra = peaks.drop(columns=[bd.PEAK_MZ_COL, bd.PEAK_RT_COL, bd.PEAK_SPECTRUM_MZ_COL,
+                                bd.PEAK_SPECTRUM_INT_COL], errors="ignore")
+    summary = summary.join(extra)
+
+    bd.write_results(summary, Path(args.output))
+    if args.candidates:
+        bd.write_results(candidates, Path(args.candidates))
+
+    print(summary['status_label'].value_counts().to_string())
+    print(f"Done in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Export a whole table or view to CSV, CSV.gz, Parquet or XLSX with bounded memory.
+
+Usage:
+    python export_table.py ms_data -o ms_data.parquet
+    python export_table.py view_peaks -o peaks.csv.gz --db path/to/db.sqlite --chunk-size 20000
+
+The format follows the output file extension unless --format is given.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils import export as ex
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a table or view to a file.")
+    parser.add_argument("table", help="Table or view name")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.csv, .csv.gz, .parquet, .xlsx)")
+    parser.add_argument("--db", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--format", choices=list(ex.EXPORT_FORMATS), default=None,
+                        help="Override the format implied by the file extension")
+    parser.add_argument("--chunk-size", type=int, default=ex.EXPORT_CHUNK_SIZE, help="Rows per chunk")
+    args = parser.parse_args()
+
+    db_path = Path(args.db) if args.db else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+
+    fmt = args.format or ex.export_format_for(args.output)
+    print(f"Database: {db_path}")
+    print(f"Exporting '{args.table}' to {args.output} ({fmt})...")
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(Path(db_path).as_uri() + "?mode=ro", uri=True)
+    try:
+        rows = ex.export_table(
+            conn, args.table, args.output, fmt=fmt, chunksize=args.chunk_size,
+            progress=lambda n: print(f"  - {n:,} rows written", end="\r")
+        )
+    finally:
+        conn.close()
+
+    print(f"\nDone: {rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Generate a synthetic, schema-compatible DIMSpec database (for benchmarks and load tests).
+
+Usage:
+    python generate_synthetic_db.py                                  # 1,000 compounds, 100k ms_data rows
+    python generate_synthetic_db.py --rows 1m -o data/synthetic_1m.sqlite
+    python generate_synthetic_db.py --compounds 5000 --peaks-per-compound 2 --scans-per-peak 50 --seed 7
+
+Builds the schema and reference data with the DIMSpec scripts in config/, then
+writes made-up PFAS compounds of every family with their peaks and MS1 scans.
+The same sizes and seed always give the same database. The output is replaced.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils import db_optimize as dbo
+from utils import synthetic_db as sdb
+
+DEFAULT_OUTPUT = Path(__file__).parent / "data" / "dimspec_synthetic.sqlite"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic DIMSpec database.")
+    parser.add_argument("-o", "--output", default=str(DEFAULT_OUTPUT), help="Database to write")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--compounds", type=int, default=None,
+                      help=f"Number of compounds (default: {sdb.DEFAULT_COMPOUNDS:,})")
+    size.add_argument("--rows", default=None, help="Target ms_data rows instead, e.g. 10k, 250000, 1m")
+    parser.add_argument("--peaks-per-compound", type=int, default=sdb.DEFAULT_PEAKS_PER_COMPOUND)
+    parser.add_argument("--scans-per-peak", type=int, default=sdb.DEFAULT_SCANS_PER_PEAK)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random data")
+    parser.add_argument("--no-summary", action="store_true", help="Skip the pfas_summary table")
+    parser.add_argument("--optimize", action="store_true", help="Create the lookup indexes (as optimize_db.py)")
+    args = parser.parse_args()
+
+    if min(args.peaks_per_compound, args.scans_per_peak) < 1:
+        print("Error: peaks per compound and scans per peak must be at least 1")
+        sys.exit(1)
+    if args.rows is not None:
+        try:
+            n_compounds = sdb.rows_to_compounds(sdb.parse_count(args.rows), args.peaks_per_compound, args.scans_per_peak)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    else:
+        n_compounds = sdb.DEFAULT_COMPOUNDS if args.compounds is None else args.compounds
+    if n_compounds < 1:
+        print("Error: at least 1 compound is needed")
+        sys.exit(1)
+
+    print(f"Output: {args.output}")
+    print(f"Size:   {n_compounds:,} compounds x {args.peaks_per_compound} peaks x {args.scans_per_peak} scans")
+    start = time.perf_counter()
+    try:
+        result = sdb.generate_database(
+            args.output,
+            n_compounds=n_compounds,
+            peaks_per_compound=args.peaks_per_compound,
+            scans_per_peak=args.scans_per_peak,
+            seed=args.seed,
+            summary=not args.no_summary,
+            progress=lambda table, n: print(f"  - {table}: {n:,} rows".ljust(60), end="\r")
+        )
+        if args.optimize:
+            print("  - Creating indexes".ljust(60), end="\r")
+            conn = sqlite3.connect(args.output)
+            try:
+                dbo.optimize_database(conn, repeat=1)
+            finally:
+                conn.close()
+    except (FileNotFoundError, sqlite3.Error) as e:
+        print(f"\nError: {e}")
+        sys.exit(1)
+
+    print(" " * 60, end="\r")
+    for table, n in result.rows.items():
+        print(f"  {table}: {n:,} rows")
+    for table, n in result.fk_violations.items():
+        print(f"  Warning: {n:,} rows in {table} reference missing rows")
+    print(f"Done in {time.perf_counter() - start:.1f}s -> {Path(args.output).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Bulk-load NTA Method Reporting Tool JSON files (one per compound peak) into the database.
+
+Usage:
+    python ingest_json.py ../example
+    python ingest_json.py ../example/PFAC30PAR_PFCA2_mzML_cmpd*.JSON --db data/dimspec_nist_pfas.sqlite --workers 8
+
+Loads the sample, conversion settings, peak, ms_data, QC and optimal UMS parameter
+nodes and links each peak to its compound. Peaks that are already stored are
+skipped, so re-running over a folder only adds the new files.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils import json_ingest as ji
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import compound JSON files into the database.")
+    parser.add_argument("inputs", nargs="+", help="JSON files or folders of them")
+    parser.add_argument("--db", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--workers", type=int, default=None, help="Parsing processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=ji.DEFAULT_BATCH_SIZE, help="Files per transaction")
+    parser.add_argument("--generation-type", default=ji.DEFAULT_GENERATION_TYPE,
+                        help="Sample generation type ('empirical' or 'in silico')")
+    args = parser.parse_args()
+
+    db_path = Path(args.db) if args.db else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+    paths = ji.expand_import_paths(args.inputs)
+    if not paths:
+        print("Error: no JSON files to import")
+        sys.exit(1)
+
+    print(f"Database: {db_path}")
+    print(f"Importing {len(paths):,} files...")
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        result = ji.ingest_json_files(
+            conn, paths,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            generation_type=args.generation_type,
+            progress=lambda n: print(f"  - {n:,} files processed", end="\r")
+        )
+    finally:
+        conn.close()
+
+    print(f"\nDone: {result.peaks:,} peaks ({result.scans:,} scans, {result.samples:,} new samples) "
+          f"in {time.perf_counter() - start:.1f}s")
+    if result.duplicates:
+        print(f"  {result.duplicates:,} peaks already stored were skipped")
+    for error in result.errors:
+        print(f"  Skipped {error}")
+
+
+if __name__ == "__main__":
+    main()
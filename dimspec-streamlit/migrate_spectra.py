@@ -0,0 +1,54 @@
+"""
+Convert ms_data text spectra into the packed binary sidecar table.
+
+Usage:
+    python migrate_spectra.py                      # migrate the app's database
+    python migrate_spectra.py path/to/db.sqlite --dtype float32
+
+Re-running only converts rows that have no packed copy yet.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils.database import migrate_packed_spectra, PACKED_DTYPES, PACKED_SPECTRA_TABLE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack ms_data spectra into float BLOBs.")
+    parser.add_argument("db_path", nargs="?", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--dtype", choices=list(PACKED_DTYPES), default="float64",
+                        help="Storage precision (float64 is lossless)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per transaction")
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path) if args.db_path else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+
+    print(f"Database: {db_path}")
+    print(f"Packing spectra into '{PACKED_SPECTRA_TABLE}' as {args.dtype}...")
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        converted = migrate_packed_spectra(
+            conn,
+            dtype=args.dtype,
+            batch_size=args.batch_size,
+            progress=lambda n: print(f"  - {n:,} rows packed", end="\r")
+        )
+    finally:
+        conn.close()
+
+    print(f"\nDone: {converted:,} rows packed in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
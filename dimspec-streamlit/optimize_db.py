@@ -0,0 +1,99 @@
+"""
+Index the app's hot lookups and refresh the query planner statistics.
+
+Usage:
+    python optimize_db.py                          # app database
+    python optimize_db.py path/to/db.sqlite --dry-run --plans
+    python optimize_db.py --repeat 5 --analysis-limit 0
+    python optimize_db.py --wal                    # also switch to WAL journaling
+
+Runs each lookup (spectra of a peak, m/z / RT / mass / name searches) against the
+database, checks its EXPLAIN QUERY PLAN, creates the missing (composite, where a
+lookup filters or reads several columns) indexes, runs ANALYZE and PRAGMA
+optimize, and reports the timings before and after. Safe to re-run: existing
+indexes are left alone.
+
+--wal switches the database to WAL journaling so the app's readers never block a
+writer (and vice versa). The app only opens the database read-only and never
+changes its journal mode itself.
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils import db_optimize as dbo
+from utils.db_pool import enable_wal
+
+
+def _ms(value):
+    return f"{value:10.2f}" if value is not None else " " * 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create missing indexes and refresh statistics.")
+    parser.add_argument("db_path", nargs="?", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--repeat", type=int, default=dbo.DEFAULT_REPEAT, help="Timed runs per lookup (best is kept)")
+    parser.add_argument("--analysis-limit", type=int, default=dbo.DEFAULT_ANALYSIS_LIMIT,
+                        help="Rows ANALYZE samples per index (0 = all)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the plans and the indexes to create")
+    parser.add_argument("--plans", action="store_true", help="Print the query plans")
+    parser.add_argument("--wal", action="store_true",
+                        help="Switch the database to WAL journaling (needs write access)")
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path) if args.db_path else get_db_path()
+    if not db_path.exists():
+        print(f"Error: database not found at {db_path}")
+        sys.exit(1)
+
+    print(f"Database: {db_path}")
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        report = dbo.optimize_database(
+            conn,
+            repeat=args.repeat,
+            analysis_limit=args.analysis_limit,
+            apply=not args.dry_run,
+            progress=lambda line: print(f"  - {line}".ljust(60), end="\r")
+        )
+    except sqlite3.Error as e:
+        print(f"\nError: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+    print(" " * 60, end="\r")
+
+    print(f"\n{'Lookup':<36}{'before ms':>10}{'after ms':>10}  Index")
+    for result in report.probes:
+        index = result.index or ""
+        if args.dry_run and index:
+            index += " (would create)"
+        if result.full_scan:
+            index += " (was a full scan)"
+        print(f"{result.name:<36}{_ms(result.before_ms)}{_ms(result.after_ms)}  {index}")
+        if args.plans:
+            for line in result.plan_before:
+                print(f"    before: {line}")
+            for line in result.plan_after:
+                print(f"    after:  {line}")
+    for name in report.skipped:
+        print(f"{name:<36}  skipped (table or column not in this database)")
+
+    if not args.dry_run:
+        print(f"\nCreated {len(report.created)} index(es); ANALYZE took {report.analyze_s:.1f}s")
+    if args.wal and not args.dry_run:
+        if enable_wal(db_path):
+            print("Journal mode: WAL")
+        else:
+            print("Journal mode unchanged (no write access to the database or its directory)")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
 import streamlit as st
-import pandas as pd
+import os
 import sqlite3
 import sys
+import tempfile
 from pathlib import Path
 
 # Move to root to ensure relative imports work standardly
 sys.path.append(str(Path(__file__).parent.parent))
 
-from utils.config import init_page, get_db_path, get_available_table_categories
+from utils.config import init_page, get_db_path, get_available_table_categories, EXPORT_DIR, DOWNLOAD_MAX_BYTES
 from utils import database as db
 from utils import data_processing as dp
+from utils import export as ex
 
 # Page Init
 init_page("Table Explorer")
@@ -80,12 +82,12 @@ if 'selected_table' in st.session_state:
     table_name = st.session_state.selected_table
     conn = db.connect_db(get_db_path())
     
-    # 1. Get total count
+    # 1. Get total count (cached until the database changes; capped for views)
     try:
-        total_rows = db.get_table_count(conn, table_name)
+        total_rows, count_exact = db.get_row_count(conn, table_name)
     except Exception as e:
         st.error(f"Error loading table: {e}")
-        total_rows = 0
+        total_rows, count_exact = 0, True
         
     # 2. Search & Filter
     col_search, col_limit = st.columns([3, 1])
@@ -98,28 +100,93 @@ if 'selected_table' in st.session_state:
     try:
         # Simple data loading with limit
         if search_term:
-             # Load a larger chunk for client-side filtering (prototype approach)
-             df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 2000", conn)
-             # String filter
-             mask = df.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
-             df = df[mask]
-             st.caption(f"Showing matches in first 2000 rows.")
+            # Whole-table search; ranked FTS5 lookup if build_search_index.py indexed this table
+            df = db.search_table(conn, table_name, search_term, limit=limit)
+            if db.has_fts_index(conn, table_name) and db.fts_match_query(search_term) is not None:
+                st.caption(f"Showing the top {len(df):,} matches (ranked, substring matching).")
+            else:
+                st.caption(f"Showing {len(df):,} matches (no search index for this table; "
+                           f"run build_search_index.py to speed this up).")
         else:
-            df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT {limit}", conn)
+            # Keyset pagination: keep the cursor of every visited page so Previous
+            # goes back without re-scanning; reset when the table or page size changes
+            page_key = (table_name, limit)
+            if st.session_state.get("page_key") != page_key:
+                st.session_state.page_key = page_key
+                st.session_state.page_cursors = [None]
+            cursors = st.session_state.page_cursors
+            page_no = len(cursors) - 1
+
+            df, next_cursor = db.get_table_page(conn, table_name, limit=limit, after=cursors[-1])
+
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if st.button("⬅️ Previous", disabled=page_no == 0):
+                    cursors.pop()
+                    st.rerun()
+            with col_page:
+                first_row = page_no * limit + 1
+                st.caption(f"Page {page_no + 1} · rows {first_row:,}–{first_row + len(df) - 1:,}")
+            with col_next:
+                if st.button("Next ➡️", disabled=next_cursor is None):
+                    cursors.append(next_cursor)
+                    st.rerun()
 
         st.dataframe(df, use_container_width=True)
-        st.caption(f"Total Rows in DB: {total_rows:,}")
+        if count_exact:
+            st.caption(f"Total Rows in DB: {total_rows:,}")
+        else:
+            st.caption(f"Total Rows in DB: more than {total_rows:,} (view count capped)")
         
         # Download
         csv = df.to_csv(index=False).encode('utf-8')
         st.download_button(
-            "📥 Download CSV",
+            "📥 Download CSV (this page)",
             csv,
             f"{table_name}.csv",
             "text/csv",
             key='download-csv'
         )
         
+        # Full export: streamed to a file in EXPORT_DIR in chunks, never loaded as one DataFrame
+        with st.expander("📦 Export entire table"):
+            export_fmt = st.selectbox("Format:", list(ex.EXPORT_FORMATS), index=1,
+                                      help="csv.gz and parquet are much smaller for ms_data / peaks")
+            limit_mb = DOWNLOAD_MAX_BYTES // (1024 * 1024)
+            st.caption(f"Exports are saved under {EXPORT_DIR}. Files up to {limit_mb:,} MB can also "
+                       f"be downloaded here; larger ones stay on disk (or use export_table.py).")
+            if st.button("Prepare export"):
+                suffix, mime = ex.EXPORT_FORMATS[export_fmt]
+                progress = st.progress(0.0, text="Exporting...")
+                def report(n):
+                    progress.progress(min(n / max(total_rows, 1), 1.0), text=f"Exported {n:,} rows")
+                EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+                out_path = EXPORT_DIR / f"{table_name}{suffix}"
+                # Written under a temporary name so concurrent exports never see a partial file
+                with tempfile.NamedTemporaryFile(dir=EXPORT_DIR, suffix=suffix, delete=False) as tmp:
+                    try:
+                        n_rows = ex.export_table(conn, table_name, tmp, fmt=export_fmt, progress=report)
+                    except BaseException:
+                        tmp.close()
+                        os.unlink(tmp.name)
+                        raise
+                os.replace(tmp.name, out_path)
+                size = out_path.stat().st_size
+                if size <= DOWNLOAD_MAX_BYTES:
+                    # download_button keeps its own copy of the file (at most limit_mb) for the transfer
+                    with open(out_path, "rb") as f:
+                        st.download_button(
+                            f"📥 Download {n_rows:,} rows ({export_fmt}, {size / 1e6:,.1f} MB)",
+                            f,
+                            out_path.name,
+                            mime,
+                            key='download-full'
+                        )
+                else:
+                    st.info(f"Exported {n_rows:,} rows to {out_path} ({size / 1e6:,.0f} MB). That is "
+                            f"over the {limit_mb:,} MB in-browser download limit; copy the file from "
+                            f"the server instead.")
+        
     except Exception as e:
         st.error(f"Error querying data: {e}")
         
@@ -92,13 +92,35 @@ with search_col2:
     st.text("")
     # Just a visual spacer
 
+search_truncated = False
 if name_query:
-    mask = filtered_df.astype(str).apply(lambda x: x.str.contains(name_query, case=False, na=False)).any(axis=1)
-    filtered_df = filtered_df[mask]
+    # Ranked full-text lookup over names, formulas and aliases (CAS, DTXSID, ...)
+    matched_ids = db.search_compound_ids(conn, name_query, limit=db.COMPOUND_SEARCH_LIMIT + 1)
+    if matched_ids is not None:
+        search_truncated = len(matched_ids) > db.COMPOUND_SEARCH_LIMIT
+        matched_ids = matched_ids[:db.COMPOUND_SEARCH_LIMIT]
+        rank = filtered_df['id'].map(pd.Series(range(len(matched_ids)), index=matched_ids))
+        if name_query.strip().replace('.', '', 1).isdigit():
+            # Ids and masses are not in the index: match them as substrings, like the scan below
+            numeric_hit = filtered_df[['id', 'exact_mass']].astype(str).apply(
+                lambda x: x.str.contains(name_query.strip(), regex=False, na=False)
+            ).any(axis=1)
+            rank = rank.where(rank.notna() | ~numeric_hit, len(matched_ids))
+        filtered_df = filtered_df[rank.notna()]
+        filtered_df = filtered_df.iloc[rank.dropna().to_numpy().argsort(kind='stable')]
+    else:
+        # No search index built yet, or a term shorter than the index's trigrams
+        mask = filtered_df.astype(str).apply(lambda x: x.str.contains(name_query, case=False, na=False)).any(axis=1)
+        filtered_df = filtered_df[mask]
 
 # --- Display Results ---
 
 st.markdown(f"### Results ({len(filtered_df)} matches)")
+if search_truncated:
+    st.caption(
+        f"Results truncated: only the {db.COMPOUND_SEARCH_LIMIT:,} best name matches were used. "
+        "Refine the search to see the rest."
+    )
 
 if len(filtered_df) > 0:
     # Display table
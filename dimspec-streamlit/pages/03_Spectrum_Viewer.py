@@ -6,7 +6,7 @@ import sys
 sys.path.append(str(Path(__file__).parent.parent))
 
 from utils.database import (
-    connect_db, get_view_data, get_spectrum_data, get_ms1_by_peak
+    connect_db, get_view_data, get_ms1_by_peak, get_ms1_consensus_by_peak
 )
 from utils.visualizations import plot_spectrum
 from utils.data_processing import normalize_spectrum, calculate_statistics
@@ -44,7 +44,17 @@ with col_ctrl:
             default=[peak_options[0]] if peak_options else None
         )
         
-        # 2. Normalization
+        # 2. Spectrum source
+        spectrum_source = st.radio(
+            "Spectrum",
+            ["Measured scan", "Consensus (UMS)"],
+            index=0,
+            help="Measured scan: the peak's first scan as recorded. Consensus: the mean of "
+                 "all its MS1 scans after normalizing each to a sum of 1."
+        )
+        use_consensus = spectrum_source == "Consensus (UMS)"
+
+        # 3. Normalization
         norm_method = st.radio(
             "Normalization",
             ["Max (100%)", "Sum (1.0)", "Mean", "None"],
@@ -66,7 +76,7 @@ with col_main:
         
         # Prepare traces
         for pid in selected_peak_ids:
-             data = get_ms1_by_peak(conn, pid)
+             data = get_ms1_consensus_by_peak(conn, pid) if use_consensus else get_ms1_by_peak(conn, pid)
              if data:
                  mz, intensity = data['mz'], data['intensity']
                  
@@ -76,22 +86,28 @@ with col_main:
                  traces.append({
                      'mz': mz_norm,
                      'intensity': int_norm,
-                     'name': f"Peak {pid}",
+                     'name': f"Peak {pid}" + (f" (UMS, {data['n_scans']} scans)" if use_consensus else ""),
                      # 'color': ... (optional, let plotly cycle)
                  })
         
         if traces:
+            if use_consensus:
+                st.caption("Showing consensus (UMS) spectra: intensities are relative "
+                           "(each scan normalized to a sum of 1), even with normalization 'None'.")
+            else:
+                st.caption("Showing the measured first scan of each peak; with normalization "
+                           "'None' intensities are the recorded counts.")
             # We pass the first trace as primary for backward compat or just pass all as 'traces'
             # The refactored plot_spectrum handles 'traces' list
             fig = plot_spectrum(
                 mz=None, intensity=None, # Pure overlay mode
                 traces=traces,
-                title=f"Mass Spectrum Overlay ({len(traces)} peaks)"
+                title=f"{spectrum_source} Overlay ({len(traces)} peaks)"
             )
             st.plotly_chart(fig, use_container_width=True)
             
             # Statistics for the first selected peak (or table for all)
-            st.markdown("### Statistics")
+            st.markdown(f"### Statistics ({'consensus, relative' if use_consensus else 'measured scan'})")
             
             stats_data = []
             for i, t in enumerate(traces):
@@ -7,8 +7,10 @@ from pathlib import Path
 # Move to root to ensure relative imports work standardly
 sys.path.append(str(Path(__file__).parent.parent))
 
-from utils.config import init_page
-from utils.pfas_library import load_library_data
+from utils.config import init_page, get_db_path
+from utils.database import connect_db
+from utils.spectral_comparison import bootstrap_candidates
+from utils.pfas_library import load_reference_library
 from utils.detection import analyze_peak, DEFAULT_MZ_TOLERANCE_PPM, DEFAULT_RT_MARGIN
 from utils.unknown_manager import save_unknown_feature, load_unknowns_df
 
@@ -23,6 +25,16 @@ with st.sidebar:
     st.header("⚙️ Settings")
     mz_tol = st.number_input("m/z Tolerance (ppm)", value=DEFAULT_MZ_TOLERANCE_PPM, min_value=0.1)
     rt_win = st.number_input("RT Margin (min)", value=DEFAULT_RT_MARGIN, min_value=0.0)
+    use_accurate_mass = st.checkbox(
+        "Accurate-mass matching", value=True,
+        help="Spectrum mode: pair ions within the ppm tolerance of the library spectra "
+             "(dot product) instead of comparing 1-Da binned fingerprints (cosine)"
+    )
+    use_bootstrap = st.checkbox(
+        "Bootstrap match confidence", value=False,
+        help="Spectrum mode: 95% interval of the dot-product score against the consensus "
+             "spectra of the top candidates, from their measurement uncertainty"
+    )
     
     st.info("""
     **Pipeline Steps:**
@@ -33,7 +45,12 @@ with st.sidebar:
     """)
 
 # --- 2. Load Library ---
-library_df = load_library_data()
+# One snapshot so rows, engine and index match (the library refreshes as the DB grows)
+library = load_reference_library()
+library_df = library.df
+similarity_engine = library.engine
+mass_matcher = library.matcher
+precursor_index = library.index
 st.toast(f"Loaded {len(library_df)} library entries", icon="📚")
 
 # --- 3. Input Section ---
@@ -100,7 +117,10 @@ if input_data:
             spectrum_mz=input_data['spectrum_mz'],
             spectrum_int=input_data['spectrum_int'],
             mz_tolerance=mz_tol,
-            rt_margin=rt_win
+            rt_margin=rt_win,
+            engine=similarity_engine,
+            index=precursor_index,
+            matcher=mass_matcher if use_accurate_mass else None
         )
     
     # Unpack
@@ -109,6 +129,14 @@ if input_data:
     is_unknown = results['is_unknown']
     candidates = results['candidates']
     status_label = results['status_label']
+
+    if use_bootstrap and input_data['spectrum_mz'] and not candidates.empty:
+        conn = connect_db(get_db_path())
+        if conn:
+            with st.spinner("Bootstrapping match scores..."):
+                candidates = bootstrap_candidates(
+                    conn, candidates, input_data['spectrum_mz'], input_data['spectrum_int'], seed=0
+                )
     
     # Display Summary Cards
     m1, m2, m3 = st.columns(3)
@@ -143,13 +171,22 @@ if input_data:
         display_df = candidates[['pfas_id', 'name', 'Family', 'precursor_mz', 'mz_error_ppm', 'similarity']].copy()
         display_df['mz_error_ppm'] = display_df['mz_error_ppm'].map('{:.2f}'.format)
         display_df['similarity'] = display_df['similarity'].map('{:.3f}'.format)
+        if 'reverse_similarity' in candidates.columns:
+            display_df['reverse_similarity'] = candidates['reverse_similarity'].map('{:.3f}'.format)
+        if 'dp_low' in candidates.columns:
+            # Point score [95% bootstrap interval]; rdp also counts unmatched library ions
+            for score in ('dp', 'rdp'):
+                display_df[f'{score}_ci'] = [
+                    f"{v:.3f} [{lo:.3f}, {hi:.3f}]" if pd.notna(lo) else ""
+                    for v, lo, hi in zip(candidates[score], candidates[f'{score}_low'], candidates[f'{score}_high'])
+                ]
         
         st.dataframe(
             display_df,
             column_config={
                 "similarity": st.column_config.ProgressColumn(
                     "Similarity Score",
-                    help="Cosine similarity (0-1)",
+                    help="Accurate-mass dot product (0-1)" if use_accurate_mass else "Cosine similarity (0-1)",
                     min_value=0,
                     max_value=1,
                     format="%.3f",
@@ -0,0 +1,117 @@
+"""
+Benchmark the detection and lookup hot paths on synthetic DIMSpec-scale databases.
+
+Usage:
+    python run_benchmarks.py                                 # 10k, 100k and 1m ms_data rows
+    python run_benchmarks.py --scales 10k 100k --repeat 5 --only analyze_peak
+    python run_benchmarks.py --compare data/benchmarks/bench-20250101-120000.json
+    python run_benchmarks.py --compare old.json new.json     # compare two saved runs, no benchmarking
+
+Synthetic databases are generated on first use (see generate_synthetic_db.py)
+and kept in data/benchmarks/ for later runs. Each run is saved there as JSON
+(per-call best / median / mean ms, commit, environment); --compare prints the
+median ratios against a saved run and marks slowdowns beyond --threshold.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils import benchmarks as bench
+from utils import synthetic_db as sdb
+
+
+def _ms(value):
+    return f"{value:12.3f}" if value is not None else " " * 12
+
+
+def print_comparison(baseline, current, threshold):
+    """Print the comparison table; returns the number of regressions."""
+    regressions = 0
+    print(f"\n{'Benchmark':<36}{'rows':>10}{'base ms':>12}{'new ms':>12}{'ratio':>8}")
+    for c in bench.compare_results(baseline, current):
+        ratio = c.ratio
+        flag = ""
+        if ratio is not None and ratio > threshold:
+            flag = "  slower"
+            regressions += 1
+        elif ratio is not None and ratio < 1 / threshold:
+            flag = "  faster"
+        ratio_text = f"{ratio:8.2f}" if ratio is not None else " " * 8
+        print(f"{c.name:<36}{c.rows:>10,}{_ms(c.baseline_ms)}{_ms(c.current_ms)}{ratio_text}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app on synthetic databases.")
+    parser.add_argument("--scales", nargs="+", default=list(bench.DEFAULT_SCALES),
+                        help="ms_data rows of the databases, e.g. 10k 100k 1m")
+    parser.add_argument("--repeat", type=int, default=bench.DEFAULT_REPEAT, help="Timed runs per benchmark")
+    parser.add_argument("--queries", type=int, default=bench.DEFAULT_QUERIES, help="Query peaks per run")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the databases and queries")
+    parser.add_argument("--only", nargs="+", default=None, help="Run only benchmarks whose name contains these")
+    parser.add_argument("--no-optimize", action="store_true", help="Benchmark databases without lookup indexes")
+    parser.add_argument("--work-dir", default=str(bench.BENCH_DIR), help="Directory for databases and results")
+    parser.add_argument("-o", "--output", default=None, help="Results file (default: work dir, timestamped)")
+    parser.add_argument("--compare", nargs="+", default=None, metavar="RESULTS",
+                        help="Saved run to compare against; with two files, compare them without running")
+    parser.add_argument("--threshold", type=float, default=bench.DEFAULT_THRESHOLD,
+                        help="Slowdown ratio reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        print("Error: --compare takes one or two results files")
+        sys.exit(1)
+    try:
+        saved = [bench.load_results(Path(p)) for p in args.compare or []]
+        scales = [sdb.parse_count(s) for s in args.scales]
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    if len(saved) == 2:
+        regressions = print_comparison(saved[0], saved[1], args.threshold)
+    else:
+        print(f"Scales: {', '.join(f'{n:,}' for n in scales)} ms_data rows")
+        try:
+            doc = bench.run_suite(
+                scales,
+                seed=args.seed,
+                runs=args.repeat,
+                n_queries=args.queries,
+                optimize=not args.no_optimize,
+                only=args.only,
+                work_dir=Path(args.work_dir),
+                progress=lambda line: print(f"  - {line}"[:79].ljust(79), end="\r")
+            )
+        except (FileNotFoundError, ValueError) as e:
+            print(f"\nError: {e}")
+            sys.exit(1)
+        print(" " * 79, end="\r")
+
+        for database in doc["databases"]:
+            generated = f", generated in {database['generated_s']:.1f}s" if database["generated_s"] else ""
+            print(f"  {database['rows']:,} rows: {database['compounds']:,} compounds, "
+                  f"{database['peaks']:,} peaks, {database['size_mb']:,.0f} MB{generated}")
+        print(f"\n{'Benchmark':<36}{'rows':>10}{'calls':>7}{'best ms':>12}{'median ms':>12}  Info")
+        for r in doc["results"]:
+            info = ", ".join(f"{k}={v:g}" if isinstance(v, float) else f"{k}={v}" for k, v in r["info"].items())
+            print(f"{r['name']:<36}{r['rows']:>10,}{r['calls']:>7}{_ms(r['best_ms'])}{_ms(r['median_ms'])}  {info}")
+
+        path = bench.save_results(doc, Path(args.output) if args.output else bench.default_results_path(Path(args.work_dir)))
+        print(f"\nResults: {path}")
+        regressions = print_comparison(saved[0], doc, args.threshold) if saved else 0
+
+    if regressions:
+        print(f"\n{regressions} benchmark(s) slower than {args.threshold:g}x the baseline")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
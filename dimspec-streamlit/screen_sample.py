@@ -0,0 +1,72 @@
+"""
+Screen an mzML sample for every library compound (or a peak list) in one file pass.
+
+Usage:
+    python screen_sample.py sample.mzML -o hits.csv
+    python screen_sample.py sample.mzML -o hits.parquet --ppm 3 --rt-min 2 --rt-max 20 --polarity neg
+    python screen_sample.py sample.mzML -o hits.csv --suspects ../example/PFAC30PAR_PFCA2_peak_list.csv
+
+Extracts the chromatogram of every suspect m/z (library precursor_mz, or the 'mz'
+column of --suspects) and reports apex intensity / time, area and scans with signal
+for those that were seen.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from utils.config import get_db_path
+from utils import batch_detection as bd
+from utils import chromatogram as ch
+from utils import ums
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract suspect chromatograms from an mzML file.")
+    parser.add_argument("mzml", help="Sample (.mzML, indexed or plain)")
+    parser.add_argument("-o", "--output", required=True, help="Hits table (.csv or .parquet)")
+    parser.add_argument("--suspects", default=None, help="Peak list with an 'mz' column (default: the library)")
+    parser.add_argument("--db", default=None, help="SQLite database (default: app database)")
+    parser.add_argument("--ppm", type=float, default=ums.DEFAULT_MASS_ERROR_PPM, help="Mass accuracy (ppm)")
+    parser.add_argument("--minerror", type=float, default=ums.DEFAULT_MIN_ERROR, help="Minimum mass error (Da)")
+    parser.add_argument("--ms-level", type=int, default=1, help="MS level of the scans to read")
+    parser.add_argument("--rt-min", type=float, default=None, help="First scan time (min)")
+    parser.add_argument("--rt-max", type=float, default=None, help="Last scan time (min)")
+    parser.add_argument("--polarity", choices=["pos", "neg"], default=None, help="Only scans of this polarity")
+    parser.add_argument("--min-intensity", type=float, default=0.0, help="Minimum apex intensity to report")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.suspects:
+        suspects = bd.read_peak_list(Path(args.suspects))
+        mz_col = bd.PEAK_MZ_COL
+        print(f"Suspects: {len(suspects):,} features from {args.suspects}")
+    else:
+        from utils.pfas_library import load_library_data
+
+        db_path = Path(args.db) if args.db else get_db_path()
+        if not db_path.exists():
+            print(f"Error: database not found at {db_path}")
+            sys.exit(1)
+        print(f"Database: {db_path}")
+        suspects = load_library_data(str(db_path)).drop(columns=["fp_row", "has_spectrum"], errors="ignore")
+        mz_col = "precursor_mz"
+        print(f"Suspects: {len(suspects):,} library compounds")
+
+    print(f"Screening {args.mzml}...")
+    hits = ch.screen_suspects(
+        args.mzml, suspects, mz_col=mz_col, min_intensity=args.min_intensity,
+        ms_level=args.ms_level,
+        rt_range=(args.rt_min, args.rt_max),
+        masserror=args.ppm,
+        minerror=args.minerror,
+        polarity={"pos": 1, "neg": -1}.get(args.polarity)
+    )
+    bd.write_results(hits, Path(args.output))
+    print(f"Done: {len(hits):,} suspects detected in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark suite checks: the synthetic database generator and every workload in
+utils/benchmarks.py, run once on the small session database.
+"""
+import sqlite3
+
+import pytest
+
+from utils import benchmarks as bench
+from utils import synthetic_db as sdb
+
+
+# --- synthetic databases ----------------------------------------------------
+
+def test_generator_is_consistent_and_deterministic(tmp_path):
+    first = sdb.generate_database(tmp_path / "a.sqlite", n_compounds=8, peaks_per_compound=2, scans_per_peak=3, seed=4)
+    second = sdb.generate_database(tmp_path / "b.sqlite", n_compounds=8, peaks_per_compound=2, scans_per_peak=3, seed=4)
+    other = sdb.generate_database(tmp_path / "c.sqlite", n_compounds=8, peaks_per_compound=2, scans_per_peak=3, seed=5)
+    assert first.fk_violations == {}
+    assert first.rows["compounds"] == 8 and first.rows["peaks"] == 16 and first.rows["ms_data"] == 48
+    assert first.rows["pfas_summary"] == 8
+
+    def spectra(name):
+        conn = sqlite3.connect(tmp_path / name)
+        try:
+            return conn.execute("SELECT measured_mz, measured_intensity FROM ms_data ORDER BY id").fetchall()
+        finally:
+            conn.close()
+    assert spectra("a.sqlite") == spectra("b.sqlite")
+    assert spectra("a.sqlite") != spectra("c.sqlite")
+
+
+def test_row_counts():
+    assert sdb.parse_count("10k") == 10_000
+    assert sdb.parse_count("2.5M") == 2_500_000
+    assert sdb.parse_count("1_000") == 1_000
+    for text in ("lots", "0", "-5k"):
+        with pytest.raises(ValueError):
+            sdb.parse_count(text)
+    assert sdb.rows_to_compounds(10_000, peaks_per_compound=4, scans_per_peak=25) == 100
+
+
+# --- workloads and results --------------------------------------------------
+
+@pytest.fixture
+def bench_context(synthetic_db, snapshot):
+    conn = sqlite3.connect(synthetic_db)
+    queries, peak_ids = bench.draw_inputs(conn, n_queries=10, n_lookups=5, seed=0)
+    ctx = bench.BenchContext(synthetic_db, 360, conn, queries, peak_ids, _library=snapshot)
+    yield ctx
+    conn.close()
+
+
+@pytest.mark.parametrize("benchmark", bench.BENCHMARKS, ids=lambda b: b.name)
+def test_every_workload_runs(bench_context, benchmark):
+    result = bench.run_benchmark(benchmark, bench_context, runs=1)
+    assert result.runs == 1 and result.calls >= 1
+    assert result.best_ms <= result.median_ms
+    if "top1_hit_rate" in result.info:
+        # Queries are library scans with small m/z and RT errors
+        assert result.info["top1_hit_rate"] >= 0.8
+
+
+def test_results_round_trip_and_compare(tmp_path):
+    result = {"name": "get_ms1_by_peak", "rows": 10_000, "median_ms": 2.0}
+    baseline = {"format": bench.RESULTS_FORMAT, "results": [result]}
+    current = {"format": bench.RESULTS_FORMAT,
+               "results": [dict(result, median_ms=3.0), dict(result, name="new", median_ms=1.0)]}
+    path = bench.save_results(baseline, tmp_path / "runs" / "base.json")
+    loaded = bench.load_results(path)
+    comparisons = bench.compare_results(loaded, current)
+    assert [c.ratio for c in comparisons] == [1.5, None]
+
+    bench.save_results({"format": bench.RESULTS_FORMAT + 1, "results": []}, tmp_path / "future.json")
+    with pytest.raises(ValueError):
+        bench.load_results(tmp_path / "future.json")
@@ -0,0 +1,70 @@
+"""
+Reference library tests: incremental refresh of ReferenceLibrary snapshots as
+peaks are appended, checked against a full load of the same database.
+"""
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from utils import pfas_library as pl
+
+
+def _append_peak(conn: sqlite3.Connection, compound_id: int) -> None:
+    """A new peak of compound_id with one scan copied from one of its peaks."""
+    peak_id = conn.execute("SELECT MAX(id) + 1 FROM peaks").fetchone()[0]
+    ms_id = conn.execute("SELECT MAX(id) + 1 FROM ms_data").fetchone()[0]
+    conn.execute("""
+        INSERT INTO peaks (id, sample_id, conversion_software_peaks_linkage_id, num_points, precursor_mz,
+                           ion_state, rt_start, rt_centroid, rt_end, identification_confidence, compound_id)
+        SELECT ?, sample_id, conversion_software_peaks_linkage_id, 1, precursor_mz,
+               ion_state, rt_start, rt_centroid, rt_end, identification_confidence, compound_id
+        FROM peaks WHERE compound_id = ? ORDER BY id LIMIT 1
+    """, (peak_id, compound_id))
+    conn.execute("INSERT INTO compound_fragments (peak_id, compound_id) VALUES (?, ?)", (peak_id, compound_id))
+    conn.execute("""
+        INSERT INTO ms_data
+        SELECT ?, ?, ms_n, scantime, base_ion, base_int, measured_mz, measured_intensity
+        FROM ms_data WHERE peak_id = (SELECT MIN(id) FROM peaks WHERE compound_id = ?) ORDER BY id LIMIT 1
+    """, (ms_id, peak_id, compound_id))
+    conn.commit()
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(list(pl.SUMMARY_ROW_KEY)).reset_index(drop=True)
+
+
+def test_refresh_with_several_summary_rows_per_compound(db_copy, store_cache):
+    conn = sqlite3.connect(db_copy)
+    # A second summary row for compound 5 (build_pfas_summary groups by pfas, name, precursor_mz)
+    conn.execute("""
+        INSERT INTO pfas_summary (pfas_id, name, precursor_mz, rt_mean, rt_min, rt_max, n_points, n_peaks)
+        SELECT pfas_id, name || ' isomer', precursor_mz + 0.5, rt_mean + 1, rt_min + 1, rt_max + 1, n_points, 1
+        FROM pfas_summary WHERE pfas_id = 5
+    """)
+    conn.commit()
+
+    library = pl.ReferenceLibrary(db_copy)
+    first = library.snapshot()
+    assert (first.df["pfas_id"] == 5).sum() == 2
+
+    _append_peak(conn, 5)
+    conn.execute("UPDATE pfas_summary SET rt_mean = rt_mean + 0.25 WHERE pfas_id = 5")
+    conn.commit()
+    conn.close()
+
+    refreshed = library.snapshot()
+    assert (library.full_loads, library.incremental_loads) == (1, 1)
+    rows = refreshed.df[refreshed.df["pfas_id"] == 5]
+    np.testing.assert_allclose(
+        np.sort(rows["rt_mean"].to_numpy()),
+        np.sort(first.df.loc[first.df["pfas_id"] == 5, "rt_mean"].to_numpy()) + 0.25
+    )
+
+    fresh = pl.ReferenceLibrary(db_copy).snapshot()
+    columns = [c for c in fresh.df.columns if c != "fp_row"]
+    pd.testing.assert_frame_equal(_sorted(refreshed.df)[columns], _sorted(fresh.df)[columns], check_dtype=False)
+    # Index positions still point at the right rows
+    for mz in rows["precursor_mz"]:
+        hits = refreshed.index.window(float(mz), 1.0)
+        assert 5 in set(refreshed.df["pfas_id"].iloc[hits])
@@ -0,0 +1,155 @@
+"""
+Scoring tests: the sparse SimilarityEngine against the per-pair
+calculate_similarity it replaced, ppm-paired dot products against a direct
+port of R overlap()/dotprod(), and analyze_peak's fallback when no scorer is given.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from utils import batch_detection as bd
+from utils import detection as det
+from utils import pfas_library as pl
+from utils import scoring as sc
+from utils import spectral_comparison as scmp
+from utils import ums
+
+
+# --- binned cosine ----------------------------------------------------------
+
+def _fingerprints(rng, n_rows, n_bins, density=0.05):
+    dense = sparse.random(n_rows, n_bins, density=density, random_state=rng, dtype=np.float64).toarray()
+    dense[3] = 0.0  # an empty library row scores 0
+    return dense
+
+
+def test_engine_scores_match_calculate_similarity():
+    rng = np.random.default_rng(5)
+    library = _fingerprints(rng, 40, 300)
+    engine = sc.SimilarityEngine.from_fingerprints(list(library))
+    for _ in range(10):
+        query = _fingerprints(rng, 4, 300, density=0.1)[0]
+        expected = [det.calculate_similarity(query, fp) for fp in library]
+        np.testing.assert_allclose(engine.score(query), expected, rtol=1e-5, atol=1e-6)
+
+
+def test_score_pairs_matches_score():
+    rng = np.random.default_rng(6)
+    library = _fingerprints(rng, 25, 200)
+    queries = _fingerprints(rng, 6, 200, density=0.1)
+    engine = sc.SimilarityEngine(sparse.csr_matrix(library, dtype=np.float32))
+    query_idx = np.repeat(np.arange(6), 25)
+    rows = np.tile(np.arange(25), 6)
+    rows[::7] = -1  # no fingerprint
+    pairs = engine.score_pairs(engine.normalize_queries(list(queries)), query_idx, rows, block=17)
+    for q in range(6):
+        mask = query_idx == q
+        np.testing.assert_allclose(pairs[mask], engine.score(queries[q], rows[mask]), rtol=1e-5, atol=1e-7)
+    assert np.all(pairs[rows == -1] == 0.0)
+
+
+def test_merge_reuses_kept_rows():
+    rng = np.random.default_rng(8)
+    library = _fingerprints(rng, 10, 120)
+    extra = _fingerprints(rng, 4, 120)
+    engine = sc.SimilarityEngine(sparse.csr_matrix(library, dtype=np.float32))
+    kept = np.array([0, 2, 5, 9])
+    merged = engine.merge(kept, sparse.csr_matrix(extra, dtype=np.float32))
+    fresh = sc.SimilarityEngine(sparse.csr_matrix(np.vstack([library[kept], extra]), dtype=np.float32))
+    query = library[2] + extra[1]
+    np.testing.assert_allclose(merged.score(query), fresh.score(query), rtol=1e-6)
+
+
+def test_library_rows_need_fp_row():
+    with pytest.raises(ValueError):
+        sc.library_rows(pd.DataFrame({"pfas_id": [1]}), pd.DataFrame({"pfas_id": [1]}))
+
+
+# --- accurate-mass dot products ---------------------------------------------
+
+def _reference_dotprod(mz_a, int_a, mz_b, int_b, error=5.0, minerror=0.002, m=1.0, n=0.5):
+    """overlap() + dotprod() as in spectral_comparison.R, one ion at a time."""
+    int_a, int_b = int_a / int_a.sum(), int_b / int_b.sum()
+    tol_a = ums.mass_tolerance(mz_a, error, minerror)
+    tol_b = ums.mass_tolerance(mz_b, error, minerror)
+    paired_mz, paired_int = np.zeros(len(mz_a)), np.zeros(len(mz_a))
+    for i in range(len(mz_a)):
+        hit = (mz_b - tol_b <= mz_a[i] + tol_a[i]) & (mz_b + tol_b >= mz_a[i] - tol_a[i])
+        if hit.any():
+            paired_mz[i], paired_int[i] = mz_b[hit].mean(), int_b[hit].sum()
+    w1 = mz_a ** m * int_a ** n
+    w2 = paired_mz ** m * paired_int ** n
+    return (w1 * w2).sum() ** 2 / ((w1 ** 2).sum() * (w2 ** 2).sum())
+
+
+def test_compare_ms_matches_reference_dotprod():
+    rng = np.random.default_rng(12)
+    for _ in range(20):
+        mz1 = np.sort(rng.uniform(60, 500, 15))
+        mz2 = np.sort(np.concatenate([mz1[:10] + rng.normal(0, 0.0005, 10), rng.uniform(60, 500, 5)]))
+        int1, int2 = rng.uniform(1, 100, 15), rng.uniform(1, 100, 15)
+        scores = scmp.compare_ms(pd.DataFrame({"mz": mz1, "int": int1}), pd.DataFrame({"mz": mz2, "int": int2}))
+        assert scores["dp"] == pytest.approx(_reference_dotprod(mz1, int1, mz2, int2), rel=1e-10)
+        assert scores["rdp"] == pytest.approx(_reference_dotprod(mz2, int2, mz1, int1), rel=1e-10)
+
+
+def test_matcher_scores_match_compare_ms():
+    rng = np.random.default_rng(13)
+    spectra = [(np.sort(rng.uniform(60, 500, k)), rng.uniform(1, 100, k)) for k in (8, 12, 5, 20)]
+    matcher = scmp.AccurateMassMatcher(*scmp.pack_spectra(spectra))
+    query_mz, query_int = spectra[1][0] + 0.0003, spectra[1][1] * 2.0
+    dp, rdp = matcher.score(query_mz, query_int, np.array([0, 1, 2, 3, -1]))
+    for row, (mz, inten) in enumerate(spectra):
+        expected = scmp.compare_ms(pd.DataFrame({"mz": query_mz, "int": query_int}),
+                                   pd.DataFrame({"mz": mz, "int": inten}))
+        # No shared ions: compare_ms keeps R's NaN, the matcher ranks it as 0
+        assert dp[row] == pytest.approx(np.nan_to_num(expected["dp"]), rel=1e-9, abs=1e-12)
+        assert rdp[row] == pytest.approx(np.nan_to_num(expected["rdp"]), rel=1e-9, abs=1e-12)
+    assert dp[1] == pytest.approx(1.0)
+    assert dp[4] == rdp[4] == 0.0
+
+
+# --- analyze_peak -----------------------------------------------------------
+
+def _store_spectrum(snapshot, row):
+    start, end = snapshot.store.peak_offsets[row], snapshot.store.peak_offsets[row + 1]
+    return snapshot.store.peak_mz[start:end].tolist(), snapshot.store.peak_int[start:end].tolist()
+
+
+def test_analyze_peak_without_a_scorer_uses_the_library_engine(snapshot, monkeypatch):
+    monkeypatch.setattr(pl, "load_similarity_engine", lambda db_path=None: snapshot.engine)
+    library = snapshot.df.drop(columns=["fingerprint"], errors="ignore")
+    target = library[library["fp_row"] >= 0].iloc[0]
+    mz, inten = _store_spectrum(snapshot, int(target["fp_row"]))
+    result = det.analyze_peak(library, float(target["precursor_mz"]), spectrum_mz=mz, spectrum_int=inten)
+    expected = det.analyze_peak(library, float(target["precursor_mz"]), spectrum_mz=mz, spectrum_int=inten,
+                                engine=snapshot.engine)
+    pd.testing.assert_frame_equal(result["candidates"], expected["candidates"])
+    assert result["candidates"]["similarity"].iloc[0] == pytest.approx(1.0, abs=1e-5)
+
+    peaks = pd.DataFrame({"mz": [float(target["precursor_mz"])], "spectrum_mz": [" ".join(map(str, mz))],
+                          "spectrum_intensity": [" ".join(map(str, inten))]})
+    summary, _ = bd.detect_peak_list(library, peaks)
+    assert summary["best_similarity"].iloc[0] == pytest.approx(1.0, abs=1e-5)
+
+    # Rows that are neither load_library_data() output nor fingerprints cannot be scored
+    with pytest.raises(ValueError):
+        det.analyze_peak(library.drop(columns=["fp_row"]), float(target["precursor_mz"]),
+                         spectrum_mz=mz, spectrum_int=inten)
+
+
+@pytest.mark.parametrize("scorer", ["engine", "matcher"])
+def test_analyze_peak_finds_the_library_spectrum(snapshot, scorer):
+    library = snapshot.df
+    target = library[library["fp_row"] >= 0].iloc[2]
+    mz, inten = _store_spectrum(snapshot, int(target["fp_row"]))
+    result = det.analyze_peak(
+        library, float(target["precursor_mz"]), float(target["rt_mean"]),
+        spectrum_mz=mz, spectrum_int=inten, index=snapshot.index,
+        **{scorer: getattr(snapshot, scorer)}
+    )
+    best = result["candidates"].iloc[0]
+    assert best["pfas_id"] == target["pfas_id"]
+    assert best["similarity"] == pytest.approx(1.0, abs=1e-5)
+    assert not result["is_unknown"]
@@ -0,0 +1,121 @@
+"""
+Search tests: FTS5 trigram indexes (build_search_index.py), their LIKE fallback
+and the PrecursorIndex ppm windows used for candidate lookup.
+"""
+import sqlite3
+
+import numpy as np
+import pytest
+
+from utils import database as db
+from utils.library_index import PrecursorIndex
+
+
+# --- full-text search -------------------------------------------------------
+
+@pytest.fixture
+def search_conn(db_copy):
+    conn = sqlite3.connect(db_copy)
+    conn.execute("UPDATE compounds SET name = 'N-MeFOSAA' WHERE id = 3")
+    conn.execute("UPDATE compounds SET name = 'Perfluorooctanesulfonamide (FOSA)' WHERE id = 4")
+    conn.execute("INSERT INTO compound_aliases (compound_id, alias_type, alias) VALUES (7, 1, 'FOSA-like standard')")
+    conn.commit()
+    for table in ("compounds", "compound_aliases"):
+        db.build_fts_index(conn, table)
+    yield conn
+    conn.close()
+
+
+def test_fts_matches_substrings_like_the_scan(search_conn):
+    assert db.has_fts_index(search_conn, "compounds")
+    ids = db.search_compound_ids(search_conn, "FOSA")
+    assert set(ids) == {3, 4, 7}
+    # Same rows as the LIKE scan it replaces (over the indexed column)
+    like = {row[0] for row in search_conn.execute("SELECT id FROM compounds WHERE name LIKE '%fosa%'")}
+    assert like <= set(ids)
+    found = db.search_table(search_conn, "compounds", "mefosaa")
+    assert found["id"].tolist() == [3]
+
+
+def test_every_word_must_match(search_conn):
+    assert db.search_compound_ids(search_conn, "fosa sulfonamide") == [4]
+
+
+def test_short_terms_fall_back_to_like(search_conn):
+    assert db.fts_match_query("HF") is None
+    assert db.search_compound_ids(search_conn, "HF") is None  # caller scans instead
+    found = db.search_table(search_conn, "compounds", "HF")
+    expected = search_conn.execute(
+        "SELECT COUNT(*) FROM compounds WHERE name LIKE '%HF%' OR formula LIKE '%HF%'"
+    ).fetchone()[0]
+    assert len(found) >= expected > 0
+
+
+def test_alias_hits_are_ranked_on_their_own_scale(search_conn):
+    # The best hit of each table scores 1.0 after normalisation, so an alias-only
+    # match is not pushed behind every compound hit by incomparable bm25 values
+    ids = db.search_compound_ids(search_conn, "FOSA")
+    assert 7 in ids[:2]
+
+
+def test_index_follows_updates(search_conn):
+    search_conn.execute("UPDATE compounds SET name = 'Et-FOSE' WHERE id = 9")
+    search_conn.commit()
+    assert 9 in db.search_compound_ids(search_conn, "fose")
+
+
+def test_word_token_indexes_are_ignored(db_copy):
+    conn = sqlite3.connect(db_copy)
+    conn.execute("CREATE VIRTUAL TABLE fts_compounds USING fts5(name, content='compounds', content_rowid='rowid')")
+    conn.commit()
+    assert not db.has_fts_index(conn, "compounds")
+    assert db.search_compound_ids(conn, "acid") is None
+    conn.close()
+
+
+# --- precursor index --------------------------------------------------------
+
+def _brute_force(mz: np.ndarray, query: float, ppm: float) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return np.flatnonzero(np.abs(mz - query) <= mz * ppm * 1e-6)
+
+
+def test_ppm_window_matches_full_scan():
+    rng = np.random.default_rng(7)
+    mz = rng.uniform(100, 1000, 5000)
+    mz[::97] = np.nan
+    index = PrecursorIndex(mz)
+    for query in rng.uniform(100, 1000, 200):
+        for ppm in (1.0, 5.0, 50.0):
+            np.testing.assert_array_equal(index.window(query, ppm), _brute_force(mz, query, ppm))
+
+
+def test_ppm_window_boundaries():
+    library = np.array([500.0, 500.0025, 500.0026, 499.9975, 499.9974])
+    index = PrecursorIndex(library)
+    hits = index.window(500.0, 5.0)
+    np.testing.assert_array_equal(hits, _brute_force(library, 500.0, 5.0))
+    assert 0 in hits and 4 not in hits
+
+
+def test_vectorised_windows_match_single_windows():
+    rng = np.random.default_rng(11)
+    index = PrecursorIndex(rng.uniform(200, 800, 2000))
+    queries = rng.uniform(200, 800, 100)
+    query_idx, positions = index.windows(queries, 10.0)
+    for i, query in enumerate(queries):
+        np.testing.assert_array_equal(np.sort(positions[query_idx == i]), index.window(query, 10.0))
+
+
+def test_extended_index_matches_a_rebuild():
+    rng = np.random.default_rng(11)
+    mz, extra = rng.uniform(200, 800, 2000), rng.uniform(200, 800, 300)
+    extended = PrecursorIndex(mz).extend(extra)
+    rebuilt = PrecursorIndex(np.concatenate([mz, extra]))
+    for query in rng.uniform(200, 800, 100):
+        np.testing.assert_array_equal(extended.window(query, 10.0), rebuilt.window(query, 10.0))
+
+
+def test_rt_filter_keeps_unknown_retention_times():
+    index = PrecursorIndex(np.array([300.0, 300.0, 300.0]), np.array([5.0, 9.0, np.nan]))
+    np.testing.assert_array_equal(index.query(300.0, input_rt=5.2, mz_tolerance_ppm=5.0, rt_margin=0.5), [0, 2])
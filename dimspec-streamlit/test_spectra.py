@@ -0,0 +1,167 @@
+"""
+Spectrum tests: uncertainty mass spectra against values worked through the R
+get_ums() formulas, and the streaming mzML reader on small generated files.
+"""
+import base64
+import zlib
+
+import numpy as np
+import pytest
+
+from utils import mzml
+from utils import ums
+
+
+# --- uncertainty mass spectra -----------------------------------------------
+
+# Two ions over three scans; the first is missing from scan 3.
+MASSES = np.array([[100.0, 100.0002, np.nan],
+                   [200.0, 200.0004, 200.0002]])
+INTENSITIES = np.array([[10.0, 30.0, np.nan],
+                        [90.0, 70.0, 50.0]])
+
+
+def test_get_ums_matches_r_reference():
+    # Scans are sum-normalised (scan 3 over its one ion), then mean and sd per ion
+    result = ums.get_ums(MASSES, INTENSITIES)
+    assert result.attrs["numscans"] == 3
+    np.testing.assert_allclose(result["mz"], [100.0001, 200.0002], rtol=1e-12)
+    np.testing.assert_allclose(result["mz_u"], [1.41421356e-4, 2e-4], rtol=1e-6)
+    np.testing.assert_allclose(result["int"], [0.2, 0.86666667], rtol=1e-7)
+    np.testing.assert_allclose(result["int_u"], [0.14142136, 0.15275252], rtol=1e-7)
+    assert result["n"].tolist() == [2, 3]
+
+
+def test_get_ums_filters():
+    # freq = 100: only ions seen in every scan
+    assert ums.get_ums(MASSES, INTENSITIES, freq=100)["mz"].tolist() == pytest.approx([200.0002])
+    # ph = 50 of EIC range 1..10 keeps scans at or above 5.5, i.e. scan 2 only
+    result = ums.get_ums(MASSES, INTENSITIES, eic=np.array([1.0, 10.0, 4.0]), ph=50)
+    assert result.attrs["numscans"] == 1
+    np.testing.assert_allclose(result["int"], [0.3, 0.7])
+    np.testing.assert_allclose(result["mz"], [100.0002, 200.0004])
+    with pytest.raises(ValueError):
+        ums.get_ums(MASSES, INTENSITIES, normfn="max")
+
+
+def test_peak_table_groups_ions_within_tolerance():
+    mz_arrays = [np.array([100.0, 200.0]), np.array([100.0002, 200.0004, 300.0]), np.array([200.0002])]
+    int_arrays = [np.array([10.0, 90.0]), np.array([30.0, 70.0, 5.0]), np.array([50.0])]
+    masses, intensities = ums.build_peak_table(mz_arrays, int_arrays)
+    assert masses.shape == intensities.shape == (3, 3)
+    order = np.argsort(np.nanmean(masses, axis=1))
+    np.testing.assert_array_equal(np.isnan(masses[order]), [[False, False, True],
+                                                            [False, False, False],
+                                                            [True, False, True]])
+    np.testing.assert_allclose(intensities[order][1], [90.0, 70.0, 50.0])
+
+
+# --- mzML reader ------------------------------------------------------------
+
+def _cv(accession, value="", unit=None):
+    unit_attr = f' unitAccession="{unit}"' if unit else ""
+    return f'<cvParam cvRef="MS" accession="{accession}" name="" value="{value}"{unit_attr}/>'
+
+
+def _array(values, kind, compress):
+    raw = np.asarray(values, dtype="<f8").tobytes()
+    if compress:
+        raw = zlib.compress(raw)
+    return (
+        f'<binaryDataArray encodedLength="0">{_cv("MS:1000523")}'
+        f'{_cv(mzml.CV_ZLIB if compress else mzml.CV_NO_COMPRESSION)}{_cv(kind)}'
+        f'<binary>{base64.b64encode(raw).decode()}</binary></binaryDataArray>'
+    )
+
+
+SPECTRA = [
+    # (id, ms level, scan time in seconds, precursor m/z, m/z, intensity)
+    ("scan=1", 1, 30.0, None, [100.0, 200.0, 300.0], [5.0, 50.0, 500.0]),
+    ("scan=2", 2, 45.0, 498.93, [78.96, 98.95], [1000.0, 20.0]),
+    ("scan=3", 1, 90.0, None, [150.5], [7.0]),
+    ("scan=4", 2, 150.0, 412.97, [168.99, 218.99, 368.98], [3.0, 30.0, 300.0]),
+]
+
+
+def _spectrum(i, spectrum_id, level, seconds, precursor, mz, intensity):
+    precursor_xml = ""
+    if precursor is not None:
+        precursor_xml = (
+            "<precursorList count=\"1\"><precursor><selectedIonList count=\"1\"><selectedIon>"
+            f"{_cv(mzml.CV_SELECTED_ION_MZ, precursor)}</selectedIon></selectedIonList></precursor></precursorList>"
+        )
+    return (
+        f'<spectrum index="{i}" id="{spectrum_id}" defaultArrayLength="{len(mz)}">'
+        f'{_cv(mzml.CV_MS_LEVEL, level)}{_cv(mzml.CV_NEGATIVE_SCAN)}'
+        f'<scanList count="1"><scan>{_cv(mzml.CV_SCAN_START_TIME, seconds, mzml.UNIT_SECOND)}</scan></scanList>'
+        f'{precursor_xml}<binaryDataArrayList count="2">'
+        f'{_array(mz, mzml.CV_MZ_ARRAY, compress=i % 2 == 0)}{_array(intensity, mzml.CV_INTENSITY_ARRAY, compress=False)}'
+        "</binaryDataArrayList></spectrum>\n"
+    )
+
+
+def _write_mzml(path, indexed):
+    head = '<?xml version="1.0" encoding="utf-8"?>\n'
+    if indexed:
+        head += '<indexedmzML xmlns="http://psi.hupo.org/ms/mzml">\n'
+    head += '<mzML xmlns="http://psi.hupo.org/ms/mzml"><run id="r"><spectrumList count="4">\n'
+    body, offsets = b"", []
+    for i, spectrum in enumerate(SPECTRA):
+        offsets.append(len(head.encode()) + len(body))
+        body += _spectrum(i, *spectrum).encode()
+    data = head.encode() + body + b"</spectrumList></run></mzML>\n"
+    if indexed:
+        index_offset = len(data)
+        entries = "".join(f'<offset idRef="{s[0]}">{o}</offset>' for s, o in zip(SPECTRA, offsets))
+        data += (
+            f'<indexList count="1"><index name="spectrum">{entries}</index></indexList>\n'
+            f"<indexListOffset>{index_offset}</indexListOffset>\n</indexedmzML>\n"
+        ).encode()
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture(params=[True, False], ids=["indexed", "plain"])
+def mzml_file(request, tmp_path):
+    return _write_mzml(tmp_path / "run.mzML", indexed=request.param), request.param
+
+
+def test_reader_decodes_every_scan(mzml_file):
+    path, indexed = mzml_file
+    with mzml.MzMLReader(path) as reader:
+        assert reader.indexed == indexed
+        assert reader.ids == [s[0] for s in SPECTRA]
+        assert len(reader) == 4
+        scans = list(reader.iter_scans())
+    for scan, (spectrum_id, level, seconds, precursor, mz, intensity) in zip(scans, SPECTRA):
+        assert scan.id == spectrum_id and scan.ms_level == level
+        assert scan.scan_time == pytest.approx(seconds / 60.0)  # minutes, as ms_data.scantime
+        assert scan.precursor_mz == precursor
+        assert scan.polarity == -1
+        np.testing.assert_array_equal(scan.mz, mz)
+        np.testing.assert_array_equal(scan.intensity, intensity)
+
+
+def test_reader_random_access_and_filters(mzml_file):
+    path, _ = mzml_file
+    with mzml.MzMLReader(path) as reader:
+        assert reader["scan=3"].mz.tolist() == [150.5]
+        assert reader[1].precursor_mz == pytest.approx(498.93)
+        with pytest.raises(KeyError):
+            reader.get_scan("scan=99")
+        ms2 = [scan.id for scan in reader.iter_scans(ms_level=2)]
+        assert ms2 == ["scan=2", "scan=4"]
+        window = list(reader.iter_scans(rt_range=(0.7, 1.6), decode=False))
+        assert [scan.id for scan in window] == ["scan=2", "scan=3"]
+        assert all(len(scan.mz) == 0 for scan in window)
+    assert [scan.id for scan in mzml.read_scans(path, ms_level=1)] == ["scan=1", "scan=3"]
+
+
+def test_stale_index_falls_back_to_scanning(tmp_path):
+    path = _write_mzml(tmp_path / "stale.mzML", indexed=True)
+    data = path.read_bytes()
+    # Prepend bytes so every stored offset is off by one
+    path.write_bytes(data.replace(b"<mzML ", b" <mzML ", 1))
+    with mzml.MzMLReader(path) as reader:
+        assert not reader.indexed
+        assert reader["scan=4"].mz.tolist() == pytest.approx([168.99, 218.99, 368.98])
@@ -0,0 +1,197 @@
+"""
+Storage tests on a synthetic database: packed spectra, the on-disk fingerprint
+store and foreign-key-consistent subsets (utils/db_subset.py).
+"""
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from utils import database as db
+from utils import db_subset
+from utils import fingerprint_store as fs
+from utils.scoring import SimilarityEngine
+
+
+# --- packed spectra ---------------------------------------------------------
+
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_pack_array_round_trip(dtype):
+    values = np.array([78.95888, 96.73124, 442.97309, 1199.5])
+    packed = db.pack_array(values, dtype)
+    restored = db.unpack_array(packed, db.PACKED_DTYPES[dtype])
+    np.testing.assert_allclose(restored, values, rtol=1e-7 if dtype == "float32" else 0)
+
+
+def test_migrated_spectra_read_back_unchanged(db_copy):
+    conn = sqlite3.connect(db_copy)
+    peak_ids = [row[0] for row in conn.execute("SELECT id FROM peaks ORDER BY id LIMIT 5")]
+    before = db.fetch_peak_scans(conn, peak_ids)
+    assert not db.has_packed_spectra(conn)
+
+    converted = db.migrate_packed_spectra(conn, batch_size=7)
+    assert converted == conn.execute("SELECT COUNT(*) FROM ms_data").fetchone()[0]
+    assert db.migrate_packed_spectra(conn) == 0  # incremental: nothing left to convert
+    assert db.has_packed_spectra(conn)
+
+    after = db.fetch_peak_scans(conn, peak_ids)
+    assert before.keys() == after.keys()
+    for peak_id, scans in before.items():
+        assert [s["ms_data_id"] for s in scans] == [s["ms_data_id"] for s in after[peak_id]]
+        for old, new in zip(scans, after[peak_id]):
+            np.testing.assert_array_equal(old["mz"], new["mz"])
+            np.testing.assert_array_equal(old["intensity"], new["intensity"])
+    conn.close()
+
+
+# --- fingerprint store ------------------------------------------------------
+
+def _representative(store: fs.FingerprintStore, row: int) -> int:
+    return int(store.sources[row][0])
+
+
+def test_store_is_reused_until_a_spectrum_changes(db_copy, tmp_path):
+    cache = tmp_path / "cache"
+    conn = sqlite3.connect(db_copy)
+    store = fs.load_fingerprint_store(conn, db_copy, cache_dir=cache, workers=1)
+    store_dir = fs.store_dir_for(db_copy, cache)
+    version = fs.current_version_dir(store_dir)
+    written = (version / fs.META_FILE).stat().st_mtime_ns
+
+    again = fs.load_fingerprint_store(conn, db_copy, cache_dir=cache, workers=1)
+    assert fs.current_version_dir(store_dir) == version
+    assert (version / fs.META_FILE).stat().st_mtime_ns == written
+    assert again.key == store.key
+
+    # Edit the representative scan of one compound in place (same ids, same row count)
+    row = 0
+    ms_id = _representative(store, row)
+    mz_text, int_text = conn.execute(
+        "SELECT measured_mz, measured_intensity FROM ms_data WHERE id = ?", (ms_id,)
+    ).fetchone()
+    intensity = db.parse_spectrum_text(int_text)
+    intensity[0] *= 50.0
+    conn.execute("UPDATE ms_data SET measured_intensity = ? WHERE id = ?",
+                 (" ".join(f"{v:.1f}" for v in intensity), ms_id))
+    conn.commit()
+
+    updated = fs.load_fingerprint_store(conn, db_copy, cache_dir=cache, workers=1)
+    assert updated.key != store.key
+    assert fs.current_version_dir(store_dir) != version
+    compound = int(store.compound_ids[row])
+    new_row = updated.row_map()[compound]
+    assert (updated.matrix[new_row] != store.matrix[row]).nnz > 0
+    # Other compounds keep their fingerprints
+    other = int(store.compound_ids[1])
+    assert (updated.matrix[updated.row_map()[other]] != store.matrix[1]).nnz == 0
+    conn.close()
+
+
+def test_writes_publish_new_versions(synthetic_db, tmp_path, monkeypatch):
+    conn = sqlite3.connect(synthetic_db)
+    first = fs.load_fingerprint_store(conn, synthetic_db, cache_dir=tmp_path, workers=1)
+    expected = first.matrix.toarray()
+    store_dir = fs.store_dir_for(synthetic_db, tmp_path)
+    versions = [fs.current_version_dir(store_dir)]
+
+    def rebuild(_):
+        own = sqlite3.connect(synthetic_db)
+        try:
+            return fs.load_fingerprint_store(own, synthetic_db, cache_dir=tmp_path, workers=1, force=True)
+        finally:
+            own.close()
+
+    # Concurrent writers in one process each publish a complete version
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        rebuilt = list(pool.map(rebuild, range(3)))
+    versions.append(fs.current_version_dir(store_dir))
+    conn.close()
+
+    assert versions[1] != versions[0]
+    for store in rebuilt:
+        np.testing.assert_array_equal(store.matrix.toarray(), expected)
+    # Snapshots keep reading the version they mapped, even once it is replaced
+    np.testing.assert_array_equal(first.matrix.toarray(), expected)
+    reopened = fs.open_fingerprint_store(versions[1], first.key)
+    np.testing.assert_array_equal(reopened.matrix.toarray(), expected)
+
+    # Past the grace period only the current version and the one it replaced are kept
+    monkeypatch.setattr(fs, "VERSION_GRACE_S", 0)
+    rebuild(None)
+    left = sorted(p.name for p in store_dir.iterdir() if p.name.startswith(fs.VERSION_PREFIX))
+    assert left == sorted([versions[1].name, fs.current_version_dir(store_dir).name])
+    assert not any(p.name.startswith(fs.STAGING_PREFIX) for p in store_dir.iterdir())
+
+
+def test_engine_keeps_the_memory_mapped_store(synthetic_db, tmp_path):
+    conn = sqlite3.connect(synthetic_db)
+    store = fs.load_fingerprint_store(conn, synthetic_db, cache_dir=tmp_path, workers=1)
+    conn.close()
+    engine = SimilarityEngine(store.matrix, bin_params=store.key["params"])
+    assert np.shares_memory(engine.matrix.data, store.matrix.data)
+    assert np.shares_memory(engine.matrix.indices, store.matrix.indices)
+
+
+# --- subsets ----------------------------------------------------------------
+
+def test_subset_is_foreign_key_consistent(synthetic_db, tmp_path):
+    target = tmp_path / "subset.sqlite"
+    result = db_subset.extract_subset(synthetic_db, target, sample=6, seed=3)
+    assert result.fk_violations == {}
+
+    conn = sqlite3.connect(target)
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    kept = {row[0] for row in conn.execute("SELECT id FROM compounds")}
+    assert 0 < len(kept) < 30
+    # pfas_summary has no foreign keys; it must still only describe kept compounds
+    summary = {row[0] for row in conn.execute("SELECT pfas_id FROM pfas_summary")}
+    assert summary and summary <= kept
+    # Every kept peak belongs to a kept compound and brings its scans along
+    orphans = conn.execute("""
+        SELECT COUNT(*) FROM peaks p
+        WHERE p.id NOT IN (SELECT peak_id FROM compound_fragments WHERE compound_id IN (SELECT id FROM compounds))
+    """).fetchone()[0]
+    assert orphans == 0
+    assert conn.execute("SELECT COUNT(*) FROM ms_data").fetchone()[0] == result.rows["ms_data"] > 0
+    conn.close()
+
+
+def test_subset_falls_back_to_peak_compound_ids(tmp_path):
+    # No compound_fragments: both the compound selection and the peak copy
+    # must link through peaks.compound_id (this used to fail on the selection)
+    source = tmp_path / "minimal.sqlite"
+    conn = sqlite3.connect(source)
+    conn.executescript("""
+        CREATE TABLE compounds (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE peaks (id INTEGER PRIMARY KEY, compound_id INTEGER REFERENCES compounds(id),
+                            precursor_mz REAL);
+        CREATE TABLE ms_data (id INTEGER PRIMARY KEY, peak_id INTEGER REFERENCES peaks(id),
+                              measured_mz TEXT, measured_intensity TEXT);
+        CREATE TABLE pfas_summary (pfas_id INTEGER, name TEXT, precursor_mz REAL, rt_mean REAL);
+        CREATE TABLE scratch (payload BLOB);
+    """)
+    names = ["Perfluorooctanoic acid", "Perfluorobutanesulfonic acid", "Perfluorohexanoic acid",
+             "6:2 Fluorotelomer sulfonic acid"]
+    for i, name in enumerate(names, start=1):
+        conn.execute("INSERT INTO compounds VALUES (?, ?)", (i, name))
+        conn.execute("INSERT INTO pfas_summary VALUES (?, ?, ?, ?)", (i, name, 300.0 + i, 5.0 + i))
+        if i != 4:  # compound 4 has no peaks
+            conn.execute("INSERT INTO peaks VALUES (?, ?, ?)", (i, i, 300.0 + i))
+            conn.execute("INSERT INTO ms_data VALUES (?, ?, '100 200', '1 2')", (i, i))
+    conn.execute("INSERT INTO scratch VALUES (zeroblob(1000))")
+    conn.commit()
+    conn.close()
+
+    target = tmp_path / "minimal_subset.sqlite"
+    result = db_subset.extract_subset(source, target, sample=10)
+    assert result.fk_violations == {}
+    assert result.skipped == ["scratch"]
+
+    conn = sqlite3.connect(target)
+    kept = {row[0] for row in conn.execute("SELECT id FROM compounds")}
+    assert kept == {1, 2, 3}  # require_peaks skips compound 4
+    assert {row[0] for row in conn.execute("SELECT compound_id FROM peaks")} == kept
+    assert {row[0] for row in conn.execute("SELECT pfas_id FROM pfas_summary")} == kept
+    assert conn.execute("SELECT COUNT(*) FROM scratch").fetchone()[0] == 0
+    conn.close()
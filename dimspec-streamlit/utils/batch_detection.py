@@ -0,0 +1,295 @@
+"""
+Batch PFAS Detection
+Runs the analyze_peak pipeline (Filter -> Rank -> Classify -> Tag Unknown) over a
+whole peak list at once: all ppm windows are resolved with one searchsorted pass,
+every (feature, candidate) pair is scored in bulk, and top-k / family votes are
+computed with group-wise array operations instead of a per-feature Python loop.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from utils import data_processing as dp
+from utils import detection as det
+from utils import scoring as sc
+from utils import spectral_comparison as scmp
+from utils.common import pool_workers
+from utils.database import parse_spectrum_text
+from utils.library_index import PrecursorIndex
+
+# Peak list columns (example/PFAC30PAR_PFCA2_peak_list.csv); spectra are optional
+# and use the same space-delimited encoding as ms_data.measured_mz / _intensity.
+PEAK_MZ_COL = "mz"
+PEAK_RT_COL = "rt"
+PEAK_SPECTRUM_MZ_COL = "spectrum_mz"
+PEAK_SPECTRUM_INT_COL = "spectrum_intensity"
+
+LIBRARY_COLUMNS = ["pfas_id", "name", "Family", "precursor_mz"]
+DEFAULT_CHUNK_SIZE = 5000
+PARALLEL_MIN_CHUNKS = 2  # a single chunk runs in this process
+
+# Worker-process state, set once per process by _init_worker
+_WORKER_STATE: Dict[str, Any] = {}
+
+
+def read_peak_list(path: Path) -> pd.DataFrame:
+    """Load a peak list from CSV or Parquet; requires an 'mz' column."""
+    path = Path(path)
+    if path.suffix.lower() == ".parquet":
+        peaks = pd.read_parquet(path)
+    else:
+        peaks = pd.read_csv(path)
+    if PEAK_MZ_COL not in peaks.columns:
+        raise ValueError(f"Peak list must have a '{PEAK_MZ_COL}' column (found {list(peaks.columns)})")
+    return peaks
+
+
+def write_results(df: pd.DataFrame, path: Path) -> None:
+    """Write a result table as CSV or Parquet (chosen by file extension)."""
+    path = Path(path)
+    if path.suffix.lower() == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def _query_spectra(peaks: pd.DataFrame) -> Optional[list]:
+    """(mz, intensity) for peaks that carry a spectrum (None elsewhere), or None if no spectra."""
+    if PEAK_SPECTRUM_MZ_COL not in peaks.columns or PEAK_SPECTRUM_INT_COL not in peaks.columns:
+        return None
+    spectra = [None] * len(peaks)
+    for i, (mz_text, int_text) in enumerate(zip(peaks[PEAK_SPECTRUM_MZ_COL], peaks[PEAK_SPECTRUM_INT_COL])):
+        if not isinstance(mz_text, str) or not mz_text.strip():
+            continue
+        try:
+            mz = parse_spectrum_text(mz_text)
+            inten = parse_spectrum_text(int_text)
+        except ValueError:
+            continue
+        if len(mz) == len(inten) and len(mz):
+            spectra[i] = (mz, inten)
+    return spectra
+
+
+def _query_fingerprints(spectra: list, bin_params: Dict[str, float]) -> sparse.csr_matrix:
+    """Fingerprints of the spectra from _query_spectra as CSR rows (empty where there is none)."""
+    empty = np.empty(0)
+    mz_values, offsets = dp.pack_ragged([empty if s is None else s[0] for s in spectra])
+    int_values, _ = dp.pack_ragged([empty if s is None else s[1] for s in spectra])
+    return det.generate_fingerprint_sparse(mz_values, int_values, offsets, **bin_params)
+
+
+def _detect_chunk(
+    library_df: pd.DataFrame,
+    index: PrecursorIndex,
+    engine: Optional[sc.SimilarityEngine],
+    peaks: pd.DataFrame,
+    mz_tolerance: float,
+    rt_margin: float,
+    top_k: int,
+    matcher: Optional[scmp.AccurateMassMatcher] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Vectorized pipeline for one block of features (positions are block-local)."""
+    n = len(peaks)
+    input_mz = pd.to_numeric(peaks[PEAK_MZ_COL], errors='coerce').to_numpy(dtype=np.float64)
+    input_rt = np.full(n, np.nan)
+    if PEAK_RT_COL in peaks.columns:
+        input_rt = pd.to_numeric(peaks[PEAK_RT_COL], errors='coerce').to_numpy(dtype=np.float64)
+
+    # 1. Filter: every (feature, library row) pair inside the ppm window, then RT
+    feat, pos = index.windows(input_mz, mz_tolerance)
+    if index.rt_mean is not None:
+        q_rt = input_rt[feat]
+        lib_rt = index.rt_mean[pos]
+        keep = np.isnan(q_rt) | np.isnan(lib_rt) | (
+            (lib_rt >= q_rt - rt_margin) & (lib_rt <= q_rt + rt_margin)
+        )
+        feat, pos = feat[keep], pos[keep]
+
+    precursor = pd.to_numeric(library_df['precursor_mz'], errors='coerce').to_numpy(dtype=np.float64)[pos]
+    mz_error_ppm = np.abs(precursor - input_mz[feat]) / precursor * 1e6
+
+    # 2. Rank: similarity for features with a spectrum, else 0
+    similarity = np.zeros(len(feat), dtype=np.float64)
+    reverse = np.zeros(len(feat), dtype=np.float64) if matcher is not None else None
+    has_spectrum = np.zeros(n, dtype=bool)
+    rows = None  # engine / matcher row per pair, resolved once there is something to score
+    if matcher is None and engine is None and 'fingerprint' in library_df.columns:
+        engine = sc.SimilarityEngine.from_fingerprints(library_df['fingerprint'])
+        rows = pos
+    spectra = _query_spectra(peaks)
+    if spectra is not None and engine is None and matcher is None:
+        raise ValueError(
+            "detect_peak_list: the peak list has spectra but no engine, matcher or 'fingerprint' column "
+            "to score them with"
+        )
+    if spectra is not None:
+        has_spectrum = np.array([spectrum is not None for spectrum in spectra], dtype=bool)
+        if has_spectrum.any() and len(feat):
+            if rows is None:
+                rows = sc.library_rows(library_df, library_df)[pos]
+            if matcher is not None:
+                # Accurate-mass dp / rdp for every (feature, candidate) pair at once
+                similarity, reverse = matcher.score_pairs(scmp.pack_spectra(spectra), feat, rows)
+            else:
+                queries = engine.normalize_queries(_query_fingerprints(spectra, engine.bin_params))
+                similarity = engine.score_pairs(queries, feat, rows)
+
+    # Per-feature order: similarity desc, mass error asc, library order
+    order = np.lexsort((pos, mz_error_ppm, -similarity, feat))
+    feat, pos = feat[order], pos[order]
+    similarity, mz_error_ppm = similarity[order], mz_error_ppm[order]
+    if reverse is not None:
+        reverse = reverse[order]
+    n_candidates = np.bincount(feat, minlength=n)
+    group_start = np.cumsum(n_candidates) - n_candidates
+    rank = np.arange(len(feat)) - group_start[feat]
+    top = rank < top_k
+
+    candidates = library_df.iloc[pos[top]][
+        [c for c in LIBRARY_COLUMNS if c in library_df.columns]
+    ].reset_index(drop=True)
+    candidates.insert(0, 'rank', rank[top] + 1)
+    candidates.insert(0, 'feature', feat[top])
+    candidates['mz_error_ppm'] = mz_error_ppm[top]
+    candidates['similarity'] = similarity[top]
+    if reverse is not None:
+        candidates['reverse_similarity'] = reverse[top]
+
+    # 3. Classify: similarity-weighted family vote over each feature's top-k
+    predicted_class = np.full(n, "Unknown", dtype=object)
+    class_conf = np.zeros(n, dtype=np.float64)
+    if not candidates.empty and 'Family' in candidates.columns:
+        votes = candidates.groupby(['feature', 'Family'], sort=True)['similarity'].sum()
+        totals = votes.groupby(level=0).sum()
+        best = votes.groupby(level=0).idxmax()
+        voted = totals.index[totals.to_numpy() > 0]
+        best_family = np.array([best[f][1] for f in voted], dtype=object)
+        predicted_class[voted] = best_family
+        class_conf[voted] = votes.loc[list(zip(voted, best_family))].to_numpy() / totals[voted].to_numpy()
+
+    # 4. Unknown tagging (same rules as analyze_peak)
+    best_sim = np.zeros(n)
+    best_err = np.full(n, np.nan)
+    best_row = np.full(n, -1, dtype=np.int64)
+    first = top & (rank == 0)
+    best_sim[feat[first]] = similarity[first]
+    best_err[feat[first]] = mz_error_ppm[first]
+    best_row[feat[first]] = pos[first]
+
+    status = np.where(n_candidates > 0, "Putative Mass Match", "No Mass Match").astype(object)
+    is_unknown = n_candidates == 0
+    low_sim = has_spectrum & (best_sim < det.COSINE_SIMILARITY_THRESHOLD)
+    status[has_spectrum] = "Confirmed Match"
+    status[low_sim] = "Unknown Structure"
+    is_unknown = np.where(has_spectrum, low_sim, is_unknown)
+    predicted_class[has_spectrum & (best_sim < 0.5)] = "Unknown"
+
+    summary = pd.DataFrame({
+        'feature': np.arange(n),
+        'mz': input_mz,
+        'rt': input_rt,
+        'status_label': status,
+        'is_unknown': is_unknown,
+        'predicted_class': predicted_class,
+        'class_confidence': class_conf,
+        'n_candidates': n_candidates,
+        'best_similarity': best_sim,
+        'best_mz_error_ppm': best_err,
+    })
+    matched = best_row >= 0
+    for col in ('pfas_id', 'name'):
+        if col in library_df.columns:
+            picked = np.full(n, None, dtype=object)
+            picked[matched] = library_df[col].to_numpy(dtype=object)[best_row[matched]]
+            summary[f'best_{col}'] = picked
+    return summary, candidates
+
+
+def _init_worker(library_df, index, engine, matcher) -> None:
+    _WORKER_STATE.update(library_df=library_df, index=index, engine=engine, matcher=matcher)
+
+
+def _run_worker_chunk(peaks: pd.DataFrame, mz_tolerance: float, rt_margin: float, top_k: int):
+    return _detect_chunk(
+        _WORKER_STATE['library_df'], _WORKER_STATE['index'], _WORKER_STATE['engine'],
+        peaks, mz_tolerance, rt_margin, top_k, _WORKER_STATE['matcher']
+    )
+
+
+def detect_peak_list(
+    library_df: pd.DataFrame,
+    peaks: pd.DataFrame,
+    engine: Optional[sc.SimilarityEngine] = None,
+    index: Optional[PrecursorIndex] = None,
+    mz_tolerance: float = det.DEFAULT_MZ_TOLERANCE_PPM,
+    rt_margin: float = det.DEFAULT_RT_MARGIN,
+    top_k: int = det.TOP_N_CANDIDATES,
+    workers: Optional[int] = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    matcher: Optional[scmp.AccurateMassMatcher] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Analyze every feature of a peak list.
+
+    Args:
+        library_df: Output of load_library_data()
+        peaks: Peak list with 'mz' and optional 'rt', 'spectrum_mz', 'spectrum_intensity'
+        engine / index / matcher: As for analyze_peak (index is built here if not given)
+        workers: Processes to spread chunks over (1 = run in this process, None = all cores)
+        chunk_size: Features per chunk
+
+    Returns:
+        (summary, candidates): one row per feature, and the long-form top-k candidates
+        per feature. 'feature' is the row position in `peaks`.
+    """
+    if index is None:
+        index = PrecursorIndex.from_library(library_df)
+    peaks = peaks.reset_index(drop=True)
+    has_spectra = PEAK_SPECTRUM_MZ_COL in peaks.columns and PEAK_SPECTRUM_INT_COL in peaks.columns
+    if has_spectra and engine is None and matcher is None:
+        engine = det.default_similarity_engine(library_df)
+    # Workers only need the columns the pipeline reads
+    keep_cols = [c for c in LIBRARY_COLUMNS + ['fp_row'] if c in library_df.columns]
+    if engine is None and 'fingerprint' in library_df.columns:
+        keep_cols.append('fingerprint')
+    library_slim = library_df[keep_cols]
+
+    starts = list(range(0, len(peaks), max(1, chunk_size)))
+    chunks = [peaks.iloc[s:s + chunk_size] for s in starts]
+    workers = pool_workers(len(chunks), PARALLEL_MIN_CHUNKS, workers)
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(library_slim, index, engine, matcher)
+        ) as pool:
+            results = list(pool.map(
+                _run_worker_chunk, chunks,
+                [mz_tolerance] * len(chunks), [rt_margin] * len(chunks), [top_k] * len(chunks)
+            ))
+    else:
+        results = [
+            _detect_chunk(library_slim, index, engine, chunk, mz_tolerance, rt_margin, top_k, matcher)
+            for chunk in chunks
+        ]
+
+    summaries, candidates = [], []
+    for start, (summary, cands) in zip(starts, results):
+        summary['feature'] += start
+        cands['feature'] += start
+        summaries.append(summary)
+        candidates.append(cands)
+    if not summaries:
+        empty_summary, empty_cands = _detect_chunk(
+            library_slim, index, engine, peaks, mz_tolerance, rt_margin, top_k, matcher
+        )
+        return empty_summary, empty_cands
+    return (
+        pd.concat(summaries, ignore_index=True),
+        pd.concat(candidates, ignore_index=True),
+    )
@@ -0,0 +1,427 @@
+"""
+Benchmark Suite
+Times the app's hot paths (library load, candidate filtering, peak analysis,
+fingerprint binning, spectrum and table lookups) against synthetic DIMSpec
+databases of increasing size (see utils/synthetic_db.py) and records the
+results as JSON together with the commit and environment, so runs on
+different commits or machines can be compared.
+
+Generated databases are kept in the work directory and reused by later runs
+with the same size and seed.
+"""
+import gc
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from utils import data_processing as dp
+from utils import database as db
+from utils import db_optimize as dbo
+from utils import detection as det
+from utils import fingerprint_store as fs
+from utils import synthetic_db as sdb
+from utils.config import BASE_DIR
+from utils.pfas_library import LibrarySnapshot, ReferenceLibrary
+
+RESULTS_FORMAT = 1
+BENCH_DIR = BASE_DIR / "data" / "benchmarks"
+DEFAULT_SCALES = ("10k", "100k", "1m")    # ms_data rows
+DEFAULT_REPEAT = 3                        # timed runs per benchmark (best, median and mean are kept)
+DEFAULT_QUERIES = 100                     # query peaks per run of the per-peak benchmarks
+DEFAULT_LOOKUPS = 20                      # peaks per run of get_ms1_by_peak
+DEFAULT_THRESHOLD = 1.25                  # slowdown ratio reported as a regression
+
+QUERY_PPM = 2.0                           # m/z error added to the query precursors
+QUERY_RT_SD = 0.05                        # RT error (min) added to the query peaks
+SEARCH_TERM = "sulfonic"
+NO_MATCH_TERM = "no such text"            # LIKE search that has to read every row
+
+
+@dataclass
+class Query:
+    """A measured peak to identify: one MS1 scan of a library compound."""
+    compound_id: int
+    mz: float
+    rt: float
+    spectrum_mz: np.ndarray
+    spectrum_int: np.ndarray
+
+
+@dataclass
+class BenchContext:
+    """One synthetic database and the inputs drawn from it."""
+    db_path: Path
+    rows: int
+    conn: sqlite3.Connection
+    queries: List[Query]
+    peak_ids: List[int]
+    _library: Optional[LibrarySnapshot] = None
+
+    def library(self) -> LibrarySnapshot:
+        if self._library is None:
+            self._library = ReferenceLibrary(self.db_path).snapshot()
+        return self._library
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    rows: int                   # ms_data rows of the database
+    calls: int                  # calls per timed run
+    runs: int
+    best_ms: float              # per call
+    median_ms: float
+    mean_ms: float
+    info: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    """
+    A timed workload. prepare(ctx) returns (function, calls per run, setup, info):
+    the function is timed `runs` times, setup (if any) runs untimed before each.
+    """
+    name: str
+    prepare: Callable[[BenchContext], Tuple[Callable[[], Any], int, Optional[Callable[[], None]], Dict[str, Any]]]
+
+
+@dataclass
+class Comparison:
+    name: str
+    rows: int
+    baseline_ms: Optional[float]
+    current_ms: Optional[float]
+
+    @property
+    def ratio(self) -> Optional[float]:
+        if not self.baseline_ms or self.current_ms is None:
+            return None
+        return self.current_ms / self.baseline_ms
+
+
+# ============================================================================
+# Workloads
+# ============================================================================
+
+def _cold_library(ctx: BenchContext):
+    store_dir = fs.store_dir_for(ctx.db_path)
+
+    def clear_store():
+        gc.collect()  # release the memory maps of earlier snapshots
+        shutil.rmtree(store_dir, ignore_errors=True)
+    return lambda: ReferenceLibrary(ctx.db_path).snapshot(), 1, clear_store, {}
+
+
+def _warm_library(ctx: BenchContext):
+    snap = ctx.library()  # leaves the fingerprint store on disk
+    info = {"compounds": len(snap.df), "with_spectrum": int(snap.df["has_spectrum"].sum())}
+    return lambda: ReferenceLibrary(ctx.db_path).snapshot(), 1, None, info
+
+
+def _filter(indexed: bool):
+    def prepare(ctx: BenchContext):
+        snap = ctx.library()
+        index = snap.index if indexed else None
+        found = [len(det.filter_candidates_fast(snap.df, q.mz, q.rt, index=index)) for q in ctx.queries]
+
+        def run():
+            for q in ctx.queries:
+                det.filter_candidates_fast(snap.df, q.mz, q.rt, index=index)
+        return run, len(ctx.queries), None, {"mean_candidates": float(np.mean(found))}
+    return prepare
+
+
+def _analyze(accurate_mass: bool):
+    def prepare(ctx: BenchContext):
+        snap = ctx.library()
+        matcher = snap.matcher if accurate_mass else None
+
+        def analyze(q: Query):
+            return det.analyze_peak(
+                snap.df, q.mz, q.rt, q.spectrum_mz, q.spectrum_int,
+                engine=snap.engine, index=snap.index, matcher=matcher
+            )
+        top = [analyze(q)["candidates"] for q in ctx.queries]
+        hits = [len(c) and c.iloc[0]["pfas_id"] == q.compound_id for c, q in zip(top, ctx.queries)]
+
+        def run():
+            for q in ctx.queries:
+                analyze(q)
+        return run, len(ctx.queries), None, {"top1_hit_rate": float(np.mean(hits))}
+    return prepare
+
+
+def _bin_fingerprints(ctx: BenchContext):
+    def run():
+        for q in ctx.queries:
+            dp.bin_spectrum_fingerprint(q.spectrum_mz, q.spectrum_int)
+    return run, len(ctx.queries), None, {"mean_ions": float(np.mean([len(q.spectrum_mz) for q in ctx.queries]))}
+
+
+def _ms1_by_peak(ctx: BenchContext):
+    def run():
+        for peak_id in ctx.peak_ids:
+            db.get_ms1_by_peak(ctx.conn, peak_id)
+    return run, len(ctx.peak_ids), None, {}
+
+
+def _search(table: str, term: str):
+    def prepare(ctx: BenchContext):
+        found = len(db.search_table(ctx.conn, table, term))
+        return lambda: db.search_table(ctx.conn, table, term), 1, None, {"rows_found": found}
+    return prepare
+
+
+BENCHMARKS: Tuple[Benchmark, ...] = (
+    Benchmark("load_library_data (cold)", _cold_library),
+    Benchmark("load_library_data (warm)", _warm_library),
+    Benchmark("filter_candidates_fast (index)", _filter(indexed=True)),
+    Benchmark("filter_candidates_fast (scan)", _filter(indexed=False)),
+    Benchmark("analyze_peak (accurate mass)", _analyze(accurate_mass=True)),
+    Benchmark("analyze_peak (binned cosine)", _analyze(accurate_mass=False)),
+    Benchmark("bin_spectrum_fingerprint", _bin_fingerprints),
+    Benchmark("get_ms1_by_peak", _ms1_by_peak),
+    Benchmark("search_table compounds", _search("compounds", SEARCH_TERM)),
+    Benchmark("search_table ms_data (no match)", _search("ms_data", NO_MATCH_TERM)),
+)
+
+
+# ============================================================================
+# Databases and Inputs
+# ============================================================================
+
+def synthetic_db_path(rows: int, seed: int, optimized: bool, work_dir: Path = BENCH_DIR) -> Path:
+    return Path(work_dir) / f"synthetic_{rows}_s{seed}{'_opt' if optimized else ''}.sqlite"
+
+
+def prepare_database(
+    rows: int,
+    seed: int = 0,
+    optimize: bool = True,
+    work_dir: Path = BENCH_DIR,
+    progress: Optional[Callable[[str], None]] = None
+) -> Tuple[Path, Optional[float]]:
+    """
+    Synthetic database with about `rows` ms_data rows, generated (and indexed
+    by db_optimize when optimize is set) unless the work directory has it.
+
+    Returns:
+        (database path, generation seconds or None when reused)
+    """
+    path = synthetic_db_path(rows, seed, optimize, work_dir)
+    if path.exists():
+        return path, None
+    start = time.perf_counter()
+    partial = path.with_name(path.name + ".partial")
+    sdb.generate_database(
+        partial, n_compounds=sdb.rows_to_compounds(rows), seed=seed,
+        progress=(lambda table, n: progress(f"Generating {table}: {n:,} rows")) if progress else None
+    )
+    if optimize:
+        if progress:
+            progress("Optimizing")
+        conn = sqlite3.connect(partial)
+        try:
+            dbo.optimize_database(conn, repeat=1)
+        finally:
+            conn.close()
+    partial.replace(path)
+    return path, time.perf_counter() - start
+
+
+def draw_inputs(
+    conn: sqlite3.Connection,
+    n_queries: int,
+    n_lookups: int,
+    seed: int = 0
+) -> Tuple[List[Query], List[int]]:
+    """Query peaks (random MS1 scans with perturbed precursor m/z and RT) and peak ids to look up."""
+    rng = np.random.default_rng(seed)
+    max_id = conn.execute("SELECT MAX(id) FROM ms_data").fetchone()[0] or 0
+    ids = sorted(set(rng.integers(1, max_id + 1, n_queries).tolist())) if max_id else []
+    rows = conn.execute(f"""
+        SELECT p.compound_id, p.precursor_mz, p.rt_centroid, m.measured_mz, m.measured_intensity
+        FROM ms_data m JOIN peaks p ON p.id = m.peak_id
+        WHERE m.id IN ({','.join('?' * len(ids))})
+    """, ids).fetchall()
+    queries = [
+        Query(
+            int(compound_id),
+            float(mz) * (1 + rng.normal(0, QUERY_PPM * 1e-6)),
+            float(rt) + rng.normal(0, QUERY_RT_SD),
+            db.parse_spectrum_text(mz_text),
+            db.parse_spectrum_text(int_text),
+        )
+        for compound_id, mz, rt, mz_text, int_text in rows
+    ]
+    max_peak = conn.execute("SELECT MAX(id) FROM peaks").fetchone()[0] or 0
+    peak_ids = rng.integers(1, max_peak + 1, n_lookups).tolist() if max_peak else []
+    return queries, peak_ids
+
+
+# ============================================================================
+# Timing
+# ============================================================================
+
+def measure(
+    fn: Callable[[], Any],
+    runs: int = DEFAULT_REPEAT,
+    setup: Optional[Callable[[], None]] = None
+) -> List[float]:
+    """Seconds of each of `runs` calls of fn (setup, if given, runs untimed before each)."""
+    times = []
+    for _ in range(max(1, runs)):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmark(benchmark: Benchmark, ctx: BenchContext, runs: int = DEFAULT_REPEAT) -> BenchmarkResult:
+    fn, calls, setup, info = benchmark.prepare(ctx)
+    per_call = [t * 1000 / max(1, calls) for t in measure(fn, runs, setup)]
+    return BenchmarkResult(
+        benchmark.name, ctx.rows, calls, len(per_call),
+        min(per_call), statistics.median(per_call), statistics.fmean(per_call), info
+    )
+
+
+# ============================================================================
+# Suite
+# ============================================================================
+
+def git_revision() -> Dict[str, Any]:
+    """Commit of the working tree and whether it has uncommitted changes (None outside git)."""
+    def git(*args):
+        out = subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True, timeout=30)
+        return out.stdout.strip() if out.returncode == 0 else None
+    try:
+        commit = git("rev-parse", "HEAD")
+        status = git("status", "--porcelain", "--untracked-files=no", "--", ".")
+    except (OSError, subprocess.SubprocessError):
+        commit = status = None
+    return {"commit": commit, "dirty": bool(status) if commit else None}
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scipy": scipy.__version__,
+    }
+
+
+def run_suite(
+    scales: Sequence[int],
+    seed: int = 0,
+    runs: int = DEFAULT_REPEAT,
+    n_queries: int = DEFAULT_QUERIES,
+    optimize: bool = True,
+    only: Optional[Sequence[str]] = None,
+    work_dir: Path = BENCH_DIR,
+    progress: Optional[Callable[[str], None]] = None
+) -> Dict[str, Any]:
+    """
+    Run the benchmarks at each scale.
+
+    Args:
+        scales: ms_data row counts of the synthetic databases
+        seed: Seed of the databases and of the query draw
+        runs: Timed runs per benchmark
+        n_queries: Query peaks per run of the per-peak benchmarks
+        optimize: Index the databases with db_optimize first (as optimize_db.py would)
+        only: Run only benchmarks whose name contains one of these strings
+        work_dir: Where the synthetic databases are kept
+        progress: Optional callable receiving a status line
+
+    Returns:
+        Results document (see save_results)
+    """
+    selected = [b for b in BENCHMARKS if not only or any(s.lower() in b.name.lower() for s in only)]
+    doc = {
+        "format": RESULTS_FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "environment": environment(),
+        "settings": {"seed": seed, "runs": runs, "queries": n_queries, "optimize": optimize},
+        "databases": [],
+        "results": [],
+    }
+    for rows in scales:
+        db_path, generated_s = prepare_database(rows, seed, optimize, work_dir, progress)
+        conn = sqlite3.connect(f"file:{db_path.resolve().as_posix()}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            queries, peak_ids = draw_inputs(conn, n_queries, DEFAULT_LOOKUPS, seed)
+            ctx = BenchContext(db_path.resolve(), rows, conn, queries, peak_ids)
+            doc["databases"].append({
+                "rows": rows,
+                "path": str(db_path),
+                "size_mb": round(db_path.stat().st_size / 2**20, 1),
+                "compounds": conn.execute("SELECT COUNT(*) FROM compounds").fetchone()[0],
+                "peaks": conn.execute("SELECT COUNT(*) FROM peaks").fetchone()[0],
+                "ms_data": conn.execute("SELECT COUNT(*) FROM ms_data").fetchone()[0],
+                "generated_s": None if generated_s is None else round(generated_s, 2),
+            })
+            for benchmark in selected:
+                if progress:
+                    progress(f"{rows:,} rows: {benchmark.name}")
+                doc["results"].append(asdict(run_benchmark(benchmark, ctx, runs)))
+        finally:
+            ctx = None
+            conn.close()
+            gc.collect()
+    return doc
+
+
+# ============================================================================
+# Results Files
+# ============================================================================
+
+def default_results_path(work_dir: Path = BENCH_DIR) -> Path:
+    return Path(work_dir) / f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+
+
+def save_results(doc: Dict[str, Any], path: Path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2)
+    return path
+
+
+def load_results(path: Path) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    if doc.get("format") != RESULTS_FORMAT:
+        raise ValueError(f"{path}: unsupported results format {doc.get('format')!r}")
+    return doc
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Comparison]:
+    """Median per-call times of every benchmark in current next to the baseline's (matched by name and scale)."""
+    before = {(r["name"], r["rows"]): r["median_ms"] for r in baseline["results"]}
+    return [
+        Comparison(r["name"], r["rows"], before.get((r["name"], r["rows"])), r["median_ms"])
+        for r in current["results"]
+    ]
@@ -0,0 +1,220 @@
+"""
+Chromatogram Extraction
+Extracted ion chromatograms for many target masses in one pass over the scans,
+the multi-target form of EIC / TIC / BIC (R/base/mzML_base.R) and getEIC
+(R/base/peaktable.R).
+
+Targets are sorted once and turned into ppm/minerror windows. Scans are taken in
+blocks: their ions are concatenated under a (scan, m/z) key with a running
+intensity sum, so every window of every scan in the block is summed with two
+searchsorted calls. A suspect list is screened against a sample in a single read
+of the file.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils import data_processing as dp
+from utils import ums
+from utils.mzml import MsLevels, MzMLReader, RtRange, Scan
+
+EIC_DTYPE = np.float32
+SCANS_PER_BLOCK = 64
+
+
+@dataclass
+class Chromatograms:
+    """
+    Extracted ion chromatograms of many targets over the same scans.
+    intensity is (n_targets, n_scans) in target input order; tic and bic are the
+    total and base-peak intensity of each scan, taken from the same pass.
+    """
+    targets: np.ndarray
+    scan_time: np.ndarray
+    scan_index: np.ndarray
+    intensity: np.ndarray
+    tic: np.ndarray
+    bic: np.ndarray
+
+    @property
+    def n_scans(self) -> int:
+        return len(self.scan_time)
+
+    def eic(self, target: int) -> pd.DataFrame:
+        """One chromatogram as time / intensity (the R EIC list)."""
+        return pd.DataFrame({"time": self.scan_time, "intensity": self.intensity[target]})
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Per target: apex intensity and time, trapezoid area over scan time and the
+        number of scans with signal.
+        """
+        n = len(self.targets)
+        if self.n_scans == 0:
+            return pd.DataFrame({
+                "mz": self.targets, "max_intensity": np.zeros(n), "apex_time": np.full(n, np.nan),
+                "area": np.zeros(n), "n_scans": np.zeros(n, dtype=np.int64),
+            })
+        intensity = self.intensity.astype(np.float64)
+        apex = intensity.argmax(axis=1)
+        max_intensity = intensity[np.arange(n), apex]
+        dt = np.diff(self.scan_time)
+        area = ((intensity[:, 1:] + intensity[:, :-1]) * 0.5 * dt).sum(axis=1)
+        return pd.DataFrame({
+            "mz": self.targets,
+            "max_intensity": max_intensity,
+            "apex_time": np.where(max_intensity > 0, self.scan_time[apex], np.nan),
+            "area": area,
+            "n_scans": (intensity > 0).sum(axis=1),
+        })
+
+
+def target_windows(
+    targets: Sequence[float],
+    masserror: float = ums.DEFAULT_MASS_ERROR_PPM,
+    minerror: float = ums.DEFAULT_MIN_ERROR
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort order of the targets and their window bounds in that order.
+
+    Returns:
+        (order, low, high): targets[order] is ascending; low/high are inclusive
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    order = np.argsort(targets, kind="stable")
+    sorted_targets = targets[order]
+    tol = ums.mass_tolerance(sorted_targets, masserror, minerror)
+    return order, sorted_targets - tol, sorted_targets + tol
+
+
+def window_sums(
+    mz_values: np.ndarray,
+    int_values: np.ndarray,
+    offsets: np.ndarray,
+    low: np.ndarray,
+    high: np.ndarray
+) -> np.ndarray:
+    """
+    Summed intensity inside each [low, high] window for every packed scan
+    (see data_processing.pack_ragged), as a (n_windows, n_scans) array.
+    """
+    n_scans = len(offsets) - 1
+    out = np.zeros((len(low), n_scans), dtype=np.float64)
+    if n_scans == 0 or len(low) == 0 or len(mz_values) == 0:
+        return out
+    seg = np.repeat(np.arange(n_scans), np.diff(offsets))
+    # One sorted key over all scans: scan s occupies [s * span, (s + 1) * span)
+    span = np.ceil(max(np.nanmax(mz_values), high[-1])) + 1.0
+    key = seg * span + mz_values
+    order = None
+    if np.any(np.diff(key) < 0):
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+    weights = int_values if order is None else int_values[order]
+    running = np.concatenate([[0.0], np.cumsum(weights)])
+    base = (np.arange(n_scans) * span)[None, :]
+    start = np.searchsorted(key, (base + low[:, None]).ravel(), side="left")
+    stop = np.searchsorted(key, (base + high[:, None]).ravel(), side="right")
+    out[:] = (running[stop] - running[start]).reshape(len(low), n_scans)
+    # Running sums can leave rounding residue where a window holds no ions
+    out[stop.reshape(out.shape) == start.reshape(out.shape)] = 0.0
+    return out
+
+
+def extract_chromatograms(
+    scans: Iterable[Scan],
+    targets: Sequence[float],
+    masserror: float = ums.DEFAULT_MASS_ERROR_PPM,
+    minerror: float = ums.DEFAULT_MIN_ERROR,
+    polarity: Optional[int] = None,
+    scans_per_block: int = SCANS_PER_BLOCK
+) -> Chromatograms:
+    """
+    Chromatograms of all targets from one pass over `scans`.
+
+    Args:
+        scans: Decoded scans, e.g. MzMLReader.iter_scans(ms_level=1)
+        targets: Target m/z values (any order; duplicates allowed)
+        polarity: Keep only scans of this polarity (1 / -1); None keeps all
+        scans_per_block: Scans summed per array operation
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    order, low, high = target_windows(targets, masserror, minerror)
+    blocks: List[np.ndarray] = []
+    times, indices, tic, bic = [], [], [], []
+    pending: List[Scan] = []
+
+    def flush():
+        mz_values, offsets = dp.pack_ragged([s.mz for s in pending])
+        int_values, _ = dp.pack_ragged([s.intensity for s in pending])
+        sums = window_sums(mz_values, int_values, offsets, low, high)
+        block = np.empty_like(sums, dtype=EIC_DTYPE)
+        block[order] = sums
+        blocks.append(block)
+        pending.clear()
+
+    for scan in scans:
+        if polarity is not None and scan.polarity != polarity:
+            continue
+        pending.append(scan)
+        times.append(scan.scan_time)
+        indices.append(scan.index)
+        tic.append(float(scan.intensity.sum()))
+        bic.append(float(scan.intensity.max()) if len(scan.intensity) else 0.0)
+        if len(pending) >= scans_per_block:
+            flush()
+    if pending:
+        flush()
+
+    intensity = np.hstack(blocks) if blocks else np.zeros((len(targets), 0), dtype=EIC_DTYPE)
+    return Chromatograms(
+        targets=targets,
+        scan_time=np.asarray(times, dtype=np.float64),
+        scan_index=np.asarray(indices, dtype=np.int64),
+        intensity=intensity,
+        tic=np.asarray(tic, dtype=np.float64),
+        bic=np.asarray(bic, dtype=np.float64),
+    )
+
+
+def extract_from_mzml(
+    path: Union[str, Path],
+    targets: Sequence[float],
+    ms_level: MsLevels = 1,
+    rt_range: RtRange = None,
+    masserror: float = ums.DEFAULT_MASS_ERROR_PPM,
+    minerror: float = ums.DEFAULT_MIN_ERROR,
+    polarity: Optional[int] = None
+) -> Chromatograms:
+    """Chromatograms of all targets from one streaming read of an mzML file."""
+    with MzMLReader(path) as reader:
+        return extract_chromatograms(
+            reader.iter_scans(ms_level=ms_level, rt_range=rt_range),
+            targets, masserror, minerror, polarity
+        )
+
+
+def screen_suspects(
+    path: Union[str, Path],
+    suspects: pd.DataFrame,
+    mz_col: str = "precursor_mz",
+    min_intensity: float = 0.0,
+    **extract_args
+) -> pd.DataFrame:
+    """
+    Screen a suspect list (e.g. load_library_data() or a peak list) against a sample.
+
+    Returns:
+        suspects joined with their chromatogram summary (max_intensity, apex_time,
+        area, n_scans), keeping rows whose apex reaches min_intensity, strongest first
+    """
+    mz = pd.to_numeric(suspects[mz_col], errors="coerce").to_numpy(dtype=np.float64)
+    valid = np.isfinite(mz)
+    chroms = extract_from_mzml(path, mz[valid], **extract_args)
+    summary = chroms.summary().drop(columns="mz")
+    hits = suspects[valid].reset_index(drop=True).join(summary)
+    hits = hits[(hits["max_intensity"] > 0) & (hits["max_intensity"] >= min_intensity)]
+    return hits.sort_values("max_intensity", ascending=False).reset_index(drop=True)
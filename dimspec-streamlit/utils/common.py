@@ -0,0 +1,34 @@
+"""
+Common Helpers
+Small pieces shared by the build and maintenance modules: SQL identifier
+quoting, read-only connections for worker processes and the process-pool size
+of a batch.
+"""
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Optional
+
+
+def quote_identifier(name: Any) -> str:
+    """Quote a table or column name for SQL ("a""b" for a"b)."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def connect_readonly(db_path: Any) -> sqlite3.Connection:
+    """
+    Read-only connection to a database file. Worker processes open their own,
+    since a connection cannot be shared across processes.
+    """
+    return sqlite3.connect(Path(db_path).as_uri() + "?mode=ro", uri=True)
+
+
+def pool_workers(n_items: int, min_items: int, workers: Optional[int] = None) -> int:
+    """
+    Process count for a batch of n_items: workers if given, otherwise every core
+    once the batch has min_items. Smaller batches run in-process, where starting
+    a process pool would cost more than it saves. Never more than n_items.
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if n_items >= min_items else 1
+    return max(1, min(workers, n_items))
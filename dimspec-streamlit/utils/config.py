@@ -26,6 +26,24 @@ def get_db_path() -> Path:
             return path
     return DEFAULT_DB_PATH
 
+# Query instrumentation of the app's pooled connections (see utils/query_log.py)
+QUERY_LOG_ENABLED = True
+SLOW_QUERY_MS = 250.0                                   # statements at least this slow are logged with their plan
+SLOW_QUERY_LOG = BASE_DIR / "data" / "logs" / "slow_queries.jsonl"
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024              # rolled over at this size...
+SLOW_QUERY_LOG_BACKUPS = 3                              # ...keeping this many old files
+QUERY_DIAGNOSTICS_PANEL = True                          # per-session query statistics in the sidebar
+
+# Whole-table exports from the Table Explorer are written here. Streamlit holds a
+# download_button's payload in server memory, so only files up to
+# DOWNLOAD_MAX_BYTES are offered as a browser download; larger ones stay on disk.
+EXPORT_DIR = BASE_DIR / "data" / "exports"
+DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+# Library fingerprint bin width (Da). Fingerprints are stored sparse, so
+# sub-Da bins (e.g. 0.1) only cost memory per peak, not per bin.
+FINGERPRINT_BIN_SIZE = 1.0
+
 # Page Configuration
 PAGE_CONFIG = {
     "page_title": "DIMSpec Explorer",
@@ -73,6 +91,9 @@ def init_page(page_title: str = None):
     
     st.set_page_config(**config)
     st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    if QUERY_LOG_ENABLED and QUERY_DIAGNOSTICS_PANEL:
+        from utils.query_log import render_query_diagnostics
+        render_query_diagnostics()
 
 # --- Constants for Data Selection & Smart Search ---
 
@@ -114,17 +135,15 @@ def get_available_table_categories(db_path: Path = None) -> dict:
     Returns:
         Dictionary of categories with only existing tables/views
     """
-    import sqlite3
+    from utils import database as db
     
     if db_path is None:
         db_path = get_db_path()
     
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")
-        available = set([row[0] for row in cursor.fetchall()])
-        conn.close()
+        # Pooled connection + cached schema catalog: no new connection per rerun
+        conn = db.get_pool(str(Path(db_path).resolve())).connection()
+        available = set(db.get_tables(conn))
     except Exception as e:
         # If database connection fails, return empty dict
         return {}
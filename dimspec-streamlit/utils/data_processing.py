@@ -7,7 +7,7 @@ import pandas as pd
 import numpy as np
 import re
 from typing import List, Tuple, Optional, Any
-from scipy import stats
+from scipy import sparse, stats
 
 def normalize_spectrum(
     mz: List[float],
@@ -22,7 +22,7 @@ def normalize_spectrum(
         intensity: Intensity values
         method: 'max' (scale to 100%), 'sum' (scale to total 1), 'mean' (scale to avg 100)
     """
-    if not intensity:
+    if intensity is None or len(intensity) == 0:
         return mz, intensity
         
     intensity_array = np.array(intensity)
@@ -41,6 +41,131 @@ def normalize_spectrum(
     
     return mz, normalized.tolist()
 
+def make_bins(mz_min: float = 50.0, mz_max: float = 1200.0, bin_size: float = 1.0) -> np.ndarray:
+    """Bin edges used by all fingerprint binning (last edge may equal mz_max)."""
+    return np.arange(mz_min, mz_max + bin_size, bin_size)
+
+
+def _bin_indices(mz_array: np.ndarray, bins: np.ndarray, mz_min: float, mz_max: float) -> np.ndarray:
+    """0-based bin index per peak, -1 for peaks outside [mz_min, mz_max] or past the last edge."""
+    idx = np.digitize(mz_array, bins) - 1
+    valid = (mz_array >= mz_min) & (mz_array <= mz_max) & (idx >= 0) & (idx < len(bins) - 1)
+    return np.where(valid, idx, -1)
+
+
+def bin_spectrum_array(
+    mz: Any,
+    intensity: Any,
+    mz_min: float = 50.0,
+    mz_max: float = 1200.0,
+    bin_size: float = 1.0
+) -> np.ndarray:
+    """
+    Sum intensities into fixed-width m/z bins (vectorized with np.bincount).
+    Returns the binned intensity vector only; see bin_spectrum_fingerprint for the DataFrame form.
+    """
+    bins = make_bins(mz_min, mz_max, bin_size)
+    n_bins = len(bins) - 1
+    mz_array = np.asarray(mz, dtype=np.float64)
+    int_array = np.asarray(intensity, dtype=np.float64)
+    if len(mz_array) == 0:
+        return np.zeros(n_bins)
+    idx = _bin_indices(mz_array, bins, mz_min, mz_max)
+    keep = idx >= 0
+    return np.bincount(idx[keep], weights=int_array[keep], minlength=n_bins)
+
+
+def pack_ragged(arrays: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate ragged 1-D arrays into (values, offsets), where array i is
+    values[offsets[i]:offsets[i+1]].
+    """
+    lengths = np.fromiter((len(a) for a in arrays), dtype=np.int64, count=len(arrays))
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if offsets[-1] == 0:
+        return np.empty(0, dtype=np.float64), offsets
+    return np.concatenate([np.asarray(a, dtype=np.float64) for a in arrays]), offsets
+
+
+def ragged_positions(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions in the packed values of arrays `rows`, concatenated in that order,
+    and the offsets of the result (see pack_ragged).
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    positions = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return positions, new_offsets
+
+
+def bin_spectra_batch(
+    mz_values: np.ndarray,
+    int_values: np.ndarray,
+    offsets: np.ndarray,
+    mz_min: float = 50.0,
+    mz_max: float = 1200.0,
+    bin_size: float = 1.0
+) -> np.ndarray:
+    """
+    Bin many ragged spectra in one call.
+    
+    Args:
+        mz_values / int_values: All spectra concatenated (see pack_ragged)
+        offsets: Spectrum i spans [offsets[i], offsets[i+1])
+        
+    Returns:
+        (n_spectra, n_bins) matrix of summed intensities
+    """
+    bins = make_bins(mz_min, mz_max, bin_size)
+    n_bins = len(bins) - 1
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_spectra = len(offsets) - 1
+    mz_values = np.asarray(mz_values, dtype=np.float64)
+    int_values = np.asarray(int_values, dtype=np.float64)
+    
+    spectrum_idx = np.repeat(np.arange(n_spectra), np.diff(offsets))
+    idx = _bin_indices(mz_values, bins, mz_min, mz_max)
+    keep = idx >= 0
+    flat = spectrum_idx[keep] * n_bins + idx[keep]
+    binned = np.bincount(flat, weights=int_values[keep], minlength=n_spectra * n_bins)
+    return binned.reshape(n_spectra, n_bins)
+
+
+def bin_spectra_sparse(
+    mz_values: np.ndarray,
+    int_values: np.ndarray,
+    offsets: np.ndarray,
+    mz_min: float = 50.0,
+    mz_max: float = 1200.0,
+    bin_size: float = 1.0
+) -> sparse.csr_matrix:
+    """
+    bin_spectra_batch returning a CSR matrix, so fine bin sizes never
+    materialize a dense (n_spectra, n_bins) block.
+    """
+    bins = make_bins(mz_min, mz_max, bin_size)
+    n_bins = len(bins) - 1
+    offsets = np.asarray(offsets, dtype=np.int64)
+    n_spectra = len(offsets) - 1
+    mz_values = np.asarray(mz_values, dtype=np.float64)
+    int_values = np.asarray(int_values, dtype=np.float64)
+    
+    spectrum_idx = np.repeat(np.arange(n_spectra), np.diff(offsets))
+    idx = _bin_indices(mz_values, bins, mz_min, mz_max)
+    keep = idx >= 0
+    # COO -> CSR sums duplicate (spectrum, bin) entries
+    binned = sparse.coo_matrix(
+        (int_values[keep], (spectrum_idx[keep], idx[keep])), shape=(n_spectra, n_bins)
+    ).tocsr()
+    binned.sum_duplicates()
+    return binned
+
+
 def bin_spectrum_fingerprint(
     mz: List[float],
     intensity: List[float],
@@ -52,34 +177,10 @@ def bin_spectrum_fingerprint(
     Convert spectrum to a binned fingerprint vector.
     Useful for similarity searching and ML features.
     """
-    # Create bins
-    bins = np.arange(mz_min, mz_max + bin_size, bin_size)
-    
-    # Digitizing
-    mz_array = np.array(mz)
-    int_array = np.array(intensity)
-    
-    # Filter out of range
-    mask = (mz_array >= mz_min) & (mz_array <= mz_max)
-    mz_clean = mz_array[mask]
-    int_clean = int_array[mask]
-    
-    if len(mz_clean) == 0:
-        return pd.DataFrame({'bin_mz': bins[:-1], 'intensity': 0.0})
-        
-    digitized = np.digitize(mz_clean, bins)
-    
-    # Sum intensities in each bin
-    binned_intensities = np.zeros(len(bins) - 1)
-    for i, bin_idx in enumerate(digitized):
-        # digitize returns index 1..len(bins)-1 usually, we map to 0..len-1
-        # indices outside bounds handled by filter above, but digitize bins are 1-based index
-        if 0 < bin_idx < len(bins):
-            binned_intensities[bin_idx-1] += int_clean[i]
-            
+    bins = make_bins(mz_min, mz_max, bin_size)
     return pd.DataFrame({
         'bin_mz': bins[:-1],
-        'intensity': binned_intensities
+        'intensity': bin_spectrum_array(mz, intensity, mz_min, mz_max, bin_size)
     })
 
 # ... (Previous functions kept for compatibility) ...
@@ -115,9 +216,9 @@ def filter_spectrum_by_intensity(
         return list(filtered_mz), list(filtered_intensity)
     return [], []
 
-def format_for_export(df: pd.DataFrame) -> pd.DataFrame:
-    """Prepare DF for CSV/Excel export."""
-    df_export = df.copy()
+def format_for_export(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Prepare DF for CSV/Excel export (copy=False rounds in place, e.g. on a throwaway chunk)."""
+    df_export = df.copy() if copy else df
     for col in df_export.select_dtypes(include=['float64']).columns:
         df_export[col] = df_export[col].round(6)
     for col in df_export.select_dtypes(include=['datetime64']).columns:
@@ -126,7 +227,7 @@ def format_for_export(df: pd.DataFrame) -> pd.DataFrame:
 
 def calculate_statistics(values: List[float]) -> dict:
     """Basic stats."""
-    if not values: return {}
+    if values is None or len(values) == 0: return {}
     arr = np.array(values)
     return {
         'count': len(arr),
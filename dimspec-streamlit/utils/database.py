@@ -4,35 +4,49 @@ Handles all SQLite database operations with caching and standardized queries.
 """
 
 import sqlite3
+import threading
+import numpy as np
 import pandas as pd
 from typing import List, Tuple, Optional, Dict, Any, Union
 import streamlit as st
+from pathlib import Path
+
+from utils.config import QUERY_LOG_ENABLED
+from utils.db_pool import ConnectionPool
+from utils.query_log import InstrumentedConnection
+from utils.schema_catalog import get_catalog, main_db_file
 
 # ============================================================================
 # Core Database Connection
 # ============================================================================
 
 @st.cache_resource
+def get_pool(db_path: str) -> ConnectionPool:
+    """Connection pool for a database file, shared by all sessions."""
+    return ConnectionPool(db_path, factory=InstrumentedConnection if QUERY_LOG_ENABLED else sqlite3.Connection)
+
+
 def connect_db(db_path: str) -> sqlite3.Connection:
     """
-    Create a cached database connection.
+    Get the calling thread's read-only database connection.
     
     Args:
         db_path: Path to SQLite database file
         
     Returns:
-        SQLite connection object
+        SQLite connection object (owned by this thread; do not share it)
     """
     try:
-        # check_same_thread=False is needed for Streamlit caching
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row  # Enable column access by name
-        # Cache Invalidated Phase 2
-        return conn
+        return get_pool(str(Path(db_path).resolve())).connection()
     except Exception as e:
         st.error(f"Failed to connect to database: {e}")
         return None
 
+
+def get_pool_stats(db_path: str) -> Dict[str, Any]:
+    """Metrics of the connection pool for db_path (see ConnectionPool.stats)."""
+    return get_pool(str(Path(db_path).resolve())).stats()
+
 # ============================================================================
 # Table Operations
 # ============================================================================
@@ -41,15 +55,7 @@ def get_tables(conn: sqlite3.Connection) -> List[str]:
     """
     Get list of all tables and views in the database.
     """
-    query = """
-    SELECT name FROM sqlite_master 
-    WHERE type IN ('table', 'view') 
-    AND name NOT LIKE 'sqlite_%'
-    ORDER BY name
-    """
-    cursor = conn.cursor()
-    cursor.execute(query)
-    return [row[0] for row in cursor.fetchall()]
+    return get_catalog(conn).names()
 
 
 def get_table_data(
@@ -85,12 +91,129 @@ def get_table_data(
     return pd.read_sql_query(query, conn, params=params)
 
 
-def get_table_count(conn: sqlite3.Connection, table_name: str) -> int:
-    """Get total row count for a table."""
-    query = f"SELECT COUNT(*) as count FROM {table_name}"
+def get_seek_columns(conn: sqlite3.Connection, table_name: str) -> Optional[List[str]]:
+    """
+    Columns that give a table a stable, indexed order for keyset pagination:
+    ['rowid'] for ordinary tables, the primary key for WITHOUT ROWID tables,
+    None for views (they fall back to OFFSET paging).
+    """
+    catalog = get_catalog(conn)
+    if catalog.object_type(table_name) != 'table':
+        return None
+    if table_name in catalog.without_rowid:
+        return catalog.primary_key(table_name) or None
+    return ['rowid']
+
+
+def get_table_page(
+    conn: sqlite3.Connection,
+    table_name: str,
+    limit: int = 100,
+    after: Optional[Any] = None,
+    filters: Optional[Dict[str, Any]] = None
+) -> Tuple[pd.DataFrame, Optional[Any]]:
+    """
+    Get one page of a table using keyset (seek) pagination.
+    
+    Each page is an index range scan starting at the last key of the previous
+    page, so deep pages cost the same as the first one. Views have no stable
+    key and page with OFFSET instead.
+    
+    Args:
+        conn: SQLite connection
+        table_name: Name of table or view
+        limit: Max rows
+        after: Cursor returned with the previous page (None = first page)
+        filters: Dict of col=val for WHERE clause (exact match)
+        
+    Returns:
+        (page, next_cursor): next_cursor is None when there are no more rows
+    """
+    seek = get_seek_columns(conn, table_name)
+    conditions, params = [], []
+    if filters:
+        for col, val in filters.items():
+            conditions.append(f"{col} = ?")
+            params.append(val)
+
+    if seek is None:
+        offset = int(after or 0)
+        query = f"SELECT * FROM {table_name}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " LIMIT ? OFFSET ?"
+        df = pd.read_sql_query(query, conn, params=params + [limit + 1, offset])
+        has_more = len(df) > limit
+        return df.iloc[:limit], (offset + limit if has_more else None)
+
+    key_aliases = [f"__seek_{i}" for i in range(len(seek))]
+    select_keys = ", ".join(f"{col} AS {alias}" for col, alias in zip(seek, key_aliases))
+    if after is not None:
+        # Row-value comparison follows the (composite) key order
+        conditions.append(f"({', '.join(seek)}) > ({', '.join('?' * len(seek))})")
+        params.extend(after)
+    query = f"SELECT {select_keys}, * FROM {table_name}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {', '.join(seek)} LIMIT ?"
+    df = pd.read_sql_query(query, conn, params=params + [limit + 1])
+
+    has_more = len(df) > limit
+    df = df.iloc[:limit]
+    next_cursor = None
+    if has_more:
+        last = df.iloc[-1]
+        next_cursor = tuple(last[alias].item() if hasattr(last[alias], 'item') else last[alias]
+                            for alias in key_aliases)
+    return df.drop(columns=key_aliases).reset_index(drop=True), next_cursor
+
+
+# Row counts per (database file, table), valid while the database is unchanged
+_ROW_COUNT_CACHE: Dict[Tuple[str, str], Tuple[Any, int, bool]] = {}
+_ROW_COUNT_LOCK = threading.Lock()
+# Views are only counted up to this many rows; beyond it the count is a lower bound
+VIEW_COUNT_CAP = 10000
+
+
+def _count_rows(conn: sqlite3.Connection, table_name: str) -> Tuple[int, bool]:
     cursor = conn.cursor()
-    cursor.execute(query)
-    return cursor.fetchone()[0]
+    if get_catalog(conn).object_type(table_name) == 'view':
+        # Views can be expensive joins; stop counting at the cap
+        cursor.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM {table_name} LIMIT ?)", (VIEW_COUNT_CAP + 1,)
+        )
+        count = cursor.fetchone()[0]
+        return (min(count, VIEW_COUNT_CAP), count <= VIEW_COUNT_CAP)
+    cursor.execute(f"SELECT COUNT(*) as count FROM {table_name}")
+    return (cursor.fetchone()[0], True)
+
+
+def get_row_count(conn: sqlite3.Connection, table_name: str) -> Tuple[int, bool]:
+    """
+    Row count of a table or view, cached until the database changes
+    (PRAGMA data_version via the connection pool).
+    
+    Returns:
+        (count, exact): for views larger than VIEW_COUNT_CAP, count is the cap
+        and exact is False
+    """
+    db_file = main_db_file(conn)
+    if db_file is None:
+        return _count_rows(conn, table_name)
+    token = get_pool(db_file).change_token()
+    with _ROW_COUNT_LOCK:
+        cached = _ROW_COUNT_CACHE.get((db_file, table_name))
+    if cached is not None and cached[0] == token:
+        return cached[1], cached[2]
+    count, exact = _count_rows(conn, table_name)
+    with _ROW_COUNT_LOCK:
+        _ROW_COUNT_CACHE[(db_file, table_name)] = (token, count, exact)
+    return count, exact
+
+
+def get_table_count(conn: sqlite3.Connection, table_name: str) -> int:
+    """Get total row count for a table (cached, see get_row_count)."""
+    return get_row_count(conn, table_name)[0]
 
 
 def search_table(
@@ -99,10 +222,16 @@ def search_table(
     search_term: str,
     limit: int = 100
 ) -> pd.DataFrame:
-    """Search for rows containing search term in any text column."""
-    cursor = conn.cursor()
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [row[1] for row in cursor.fetchall()]
+    """
+    Search for rows containing search term in any text column.
+    Uses the table's FTS5 index when one was built (ranked substring matching);
+    otherwise, or for terms too short for the index, falls back to a LIKE scan
+    over every column.
+    """
+    if has_fts_index(conn, table_name) and fts_match_query(search_term) is not None:
+        return search_fts(conn, table_name, search_term, limit=limit)
+
+    columns = get_column_names(conn, table_name)
     
     where_clauses = [f"CAST({col} AS TEXT) LIKE ?" for col in columns]
     where_sql = " OR ".join(where_clauses)
@@ -112,6 +241,195 @@ def search_table(
     
     return pd.read_sql_query(query, conn, params=params)
 
+# ============================================================================
+# Full-Text Search (FTS5)
+# ============================================================================
+
+# Text columns indexed per table by build_search_index.py. Each index is an
+# external-content FTS5 table 'fts_<table>' (no copy of the text) kept in sync
+# with its source table by triggers.
+FTS_TABLES = {
+    "compounds": ["name", "formula", "additional", "obtained_from"],
+    "compound_aliases": ["alias"],
+    "fragment_aliases": ["alias"],
+    "sample_aliases": ["alias", "reference"],
+    "samples": ["mzml_name", "description", "source_citation", "sample_contributor"],
+    "contributors": ["username", "first_name", "last_name", "contact"],
+}
+# The trigram tokenizer (SQLite 3.34+) makes every query a substring match, like
+# the LIKE '%term%' scan it replaces ('FOSA' finds 'N-MeFOSAA'). It cannot answer
+# terms shorter than a trigram, so those still go through LIKE.
+FTS_TOKENIZER = "trigram"
+FTS_MIN_TERM = 3
+COMPOUND_SEARCH_LIMIT = 5000  # best matches returned by search_compound_ids
+
+
+def fts_table_name(table_name: str) -> str:
+    return f"fts_{table_name}"
+
+
+def has_fts_index(conn: sqlite3.Connection, table_name: str) -> bool:
+    """True if the table has a trigram FTS5 index (older word-token indexes are ignored)."""
+    fts = fts_table_name(table_name)
+    if get_catalog(conn).object_type(fts) != 'table':
+        return False
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (fts,)).fetchone()
+    return row is not None and FTS_TOKENIZER in (row[0] or "")
+
+
+def fts_match_query(search_term: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query: every whitespace-separated word must
+    occur somewhere in the row, as a substring. None if the text is empty or a
+    word is too short for the trigram index (the caller then scans with LIKE).
+    """
+    words = (search_term or "").split()
+    if not words or any(len(w) < FTS_MIN_TERM for w in words):
+        return None
+    return " ".join('"{}"'.format(w.replace('"', '""')) for w in words)
+
+
+def build_fts_index(
+    conn: sqlite3.Connection,
+    table_name: str,
+    columns: Optional[List[str]] = None
+) -> int:
+    """
+    Create (or recreate) the FTS5 index for a table and its sync triggers, then
+    fill it from the table. Columns default to FTS_TABLES or, for other tables,
+    every TEXT column.
+    
+    Returns:
+        Number of rows indexed
+    """
+    cursor = conn.cursor()
+    column_types = get_catalog(conn).column_types(table_name)
+    existing = list(column_types)
+    if columns is None:
+        columns = FTS_TABLES.get(table_name) or [
+            col for col, col_type in column_types.items() if "TEXT" in col_type.upper()
+        ]
+    columns = [c for c in columns if c in existing]
+    if not columns:
+        raise ValueError(f"No text columns to index in '{table_name}'")
+
+    fts = fts_table_name(table_name)
+    col_list = ", ".join(columns)
+    new_list = ", ".join(f"new.{c}" for c in columns)
+    old_list = ", ".join(f"old.{c}" for c in columns)
+    drop_fts_index(conn, table_name, commit=False)
+    cursor.executescript(f"""
+    CREATE VIRTUAL TABLE {fts} USING fts5(
+        {col_list},
+        content='{table_name}', content_rowid='rowid',
+        tokenize='{FTS_TOKENIZER}'
+    );
+    CREATE TRIGGER {fts}_ai AFTER INSERT ON {table_name} BEGIN
+        INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new_list});
+    END;
+    CREATE TRIGGER {fts}_ad AFTER DELETE ON {table_name} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old_list});
+    END;
+    CREATE TRIGGER {fts}_au AFTER UPDATE ON {table_name} BEGIN
+        INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old_list});
+        INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new_list});
+    END;
+    INSERT INTO {fts}({fts}) VALUES ('rebuild');
+    INSERT INTO {fts}({fts}) VALUES ('optimize');
+    """)
+    conn.commit()
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    return cursor.fetchone()[0]
+
+
+def drop_fts_index(conn: sqlite3.Connection, table_name: str, commit: bool = True) -> None:
+    """Remove a table's FTS5 index and its triggers."""
+    fts = fts_table_name(table_name)
+    conn.executescript(f"""
+    DROP TRIGGER IF EXISTS {fts}_ai;
+    DROP TRIGGER IF EXISTS {fts}_ad;
+    DROP TRIGGER IF EXISTS {fts}_au;
+    DROP TABLE IF EXISTS {fts};
+    """)
+    if commit:
+        conn.commit()
+
+
+def search_fts(
+    conn: sqlite3.Connection,
+    table_name: str,
+    search_term: str,
+    limit: int = 100
+) -> pd.DataFrame:
+    """
+    Rows of table_name matching search_term through its FTS5 index, best (bm25)
+    first. Terms the index cannot answer return no rows; search_table routes
+    those to the LIKE scan.
+    """
+    match = fts_match_query(search_term)
+    if match is None:
+        return pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 0", conn)
+    fts = fts_table_name(table_name)
+    query = f"""
+    SELECT t.* FROM {fts} f
+    JOIN {table_name} t ON t.rowid = f.rowid
+    WHERE {fts} MATCH ?
+    ORDER BY f.rank
+    LIMIT ?
+    """
+    return pd.read_sql_query(query, conn, params=[match, limit])
+
+
+def search_compound_ids(
+    conn: sqlite3.Connection,
+    search_term: str,
+    limit: int = COMPOUND_SEARCH_LIMIT
+) -> Optional[List[int]]:
+    """
+    Compound ids whose name/formula/description or any alias (CAS, DTXSID,
+    synonyms) matches search_term, best match first.
+    
+    bm25 scores depend on each table's own term statistics, so they are
+    normalised per table (score / best score in that table, 1.0 = best) before
+    the two result sets are merged.
+    
+    Returns:
+        None if the compounds index has not been built or the term is too short
+        for it (caller falls back to a substring scan)
+    """
+    if not has_fts_index(conn, "compounds"):
+        return None
+    match = fts_match_query(search_term)
+    if match is None:
+        return None
+    parts = [f"""
+        SELECT c.id AS compound_id, f.rank AS rank
+        FROM {fts_table_name('compounds')} f JOIN compounds c ON c.rowid = f.rowid
+        WHERE {fts_table_name('compounds')} MATCH ?
+    """]
+    params = [match]
+    if has_fts_index(conn, "compound_aliases"):
+        parts.append(f"""
+        SELECT a.compound_id, f.rank
+        FROM {fts_table_name('compound_aliases')} f JOIN compound_aliases a ON a.rowid = f.rowid
+        WHERE {fts_table_name('compound_aliases')} MATCH ?
+        """)
+        params.append(match)
+    # bm25 is negative, lower is better: rank / MIN(rank) maps each table's best hit to 1.0
+    normalised = " UNION ALL ".join(
+        f"SELECT compound_id, COALESCE(rank / NULLIF(MIN(rank) OVER (), 0), 1.0) AS score FROM ({part})"
+        for part in parts
+    )
+    query = f"""
+    SELECT compound_id FROM ({normalised})
+    GROUP BY compound_id
+    ORDER BY MAX(score) DESC, compound_id
+    LIMIT ?
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, params + [limit])
+    return [row[0] for row in cursor.fetchall()]
+
 # ============================================================================
 # PFAS & Compound Queries
 # ============================================================================
@@ -135,8 +453,9 @@ def search_pfas(
     """
     # Prefer pfas_summary view if available, otherwise compounds
     # Checks if pfas_summary exists
-    tables = get_tables(conn)
-    target_table = "pfas_summary" if "pfas_summary" in tables else "compounds"
+    catalog = get_catalog(conn)
+    target_table = "pfas_summary" if catalog.has("pfas_summary") else "compounds"
+    target_columns = catalog.column_names(target_table)
     
     query = f"SELECT * FROM {target_table}"
     conditions = []
@@ -146,12 +465,14 @@ def search_pfas(
         conditions.append("name LIKE ?")
         params.append(f"%{name}%")
         
-    if mz_range and "precursor_mz" in get_column_names(conn, target_table):
+    if mz_range and "precursor_mz" in target_columns:
         conditions.append("precursor_mz BETWEEN ? AND ?")
         params.extend([mz_range[0], mz_range[1]])
         
-    if rt_range and "rt" in get_column_names(conn, target_table):
-        conditions.append("rt BETWEEN ? AND ?")
+    # pfas_summary stores the mean retention time of each compound's peaks
+    rt_column = next((c for c in ("rt", "rt_mean") if c in target_columns), None)
+    if rt_range and rt_column:
+        conditions.append(f"{rt_column} BETWEEN ? AND ?")
         params.extend([rt_range[0], rt_range[1]])
         
     if conditions:
@@ -178,23 +499,109 @@ def get_compound_details(conn: sqlite3.Connection, compound_id: int) -> Dict[str
 # Spectrum & Peak Queries
 # ============================================================================
 
+def compound_peak_links(conn: sqlite3.Connection) -> Optional[str]:
+    """
+    Query of the (compound_id, peak_id) pairs tying compounds to their peaks:
+    compound_fragments in a stock DIMSpec database, else peaks.compound_id.
+    None when the database links peaks in neither way.
+    """
+    if get_catalog(conn).object_type("compound_fragments") == 'table':
+        return """
+        SELECT DISTINCT compound_id, peak_id FROM compound_fragments
+        WHERE compound_id IS NOT NULL AND peak_id IS NOT NULL
+        """
+    if "compound_id" in get_column_names(conn, "peaks"):
+        return "SELECT compound_id, id AS peak_id FROM peaks WHERE compound_id IS NOT NULL"
+    return None
+
+
+def fetch_peak_scans(conn: sqlite3.Connection, peak_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    All scans of the given peaks as {peak_id: [{'ms_data_id', 'ms_n', 'scantime',
+    'mz', 'intensity'}, ...]} in scan time order. Reads the packed sidecar where
+    available; rows whose spectrum cannot be parsed are skipped.
+    """
+    if not peak_ids:
+        return {}
+    placeholders = ",".join("?" * len(peak_ids))
+    if has_packed_spectra(conn):
+        query = f"""
+        SELECT m.peak_id, m.id, m.ms_n, m.scantime, pk.dtype,
+               CASE WHEN pk.ms_data_id IS NULL THEN m.measured_mz ELSE pk.mz END,
+               CASE WHEN pk.ms_data_id IS NULL THEN m.measured_intensity ELSE pk.intensity END
+        FROM ms_data m
+        LEFT JOIN {PACKED_SPECTRA_TABLE} pk ON pk.ms_data_id = m.id
+        WHERE m.peak_id IN ({placeholders})
+        ORDER BY m.peak_id, m.scantime, m.id
+        """
+    else:
+        query = f"""
+        SELECT peak_id, id, ms_n, scantime, NULL, measured_mz, measured_intensity
+        FROM ms_data WHERE peak_id IN ({placeholders})
+        ORDER BY peak_id, scantime, id
+        """
+    scans: Dict[int, List[Dict[str, Any]]] = {}
+    for peak_id, ms_id, ms_n, scantime, dtype, mz_raw, int_raw in conn.execute(query, list(peak_ids)):
+        try:
+            if dtype is not None:
+                mz, intensity = unpack_array(mz_raw, dtype), unpack_array(int_raw, dtype)
+            else:
+                mz, intensity = parse_spectrum_text(mz_raw), parse_spectrum_text(int_raw)
+        except ValueError:
+            continue
+        if len(mz) != len(intensity):
+            continue
+        scans.setdefault(peak_id, []).append({
+            "ms_data_id": ms_id, "ms_n": ms_n, "scantime": scantime,
+            "mz": mz, "intensity": intensity,
+        })
+    return scans
+
+
 def get_ms1_by_peak(conn: sqlite3.Connection, peak_id: int) -> Optional[Dict[str, Any]]:
     """
-    Get parsed MS1 spectrum data for a specific peak.
-    Returns: Dict with mz, intensity lists and metadata.
+    Get the measured spectrum of a peak: its first scan, as stored (no consensus,
+    no normalization; see get_ms1_consensus_by_peak for the UMS).
+    Reads the packed binary sidecar when it has been built (see migrate_spectra.py),
+    falling back to parsing the space-delimited text columns.
+    Returns: Dict with mz, intensity arrays and the scan's ms_data columns.
     """
-    query = "SELECT * FROM ms_data WHERE peak_id = ?"
+    if has_packed_spectra(conn):
+        meta_cols = [c for c in get_column_names(conn, "ms_data") if c not in SPECTRUM_TEXT_COLUMNS]
+        select_cols = ", ".join(f"m.{c}" for c in meta_cols)
+        query = f"""
+        SELECT {select_cols},
+               CASE WHEN pk.ms_data_id IS NULL THEN m.measured_mz END AS measured_mz,
+               CASE WHEN pk.ms_data_id IS NULL THEN m.measured_intensity END AS measured_intensity,
+               pk.dtype AS packed_dtype, pk.mz AS packed_mz, pk.intensity AS packed_intensity
+        FROM ms_data m
+        LEFT JOIN {PACKED_SPECTRA_TABLE} pk ON pk.ms_data_id = m.id
+        WHERE m.peak_id = ?
+        ORDER BY m.scantime, m.id
+        LIMIT 1
+        """
+    else:
+        query = "SELECT * FROM ms_data WHERE peak_id = ? ORDER BY scantime, id LIMIT 1"
     cursor = conn.cursor()
     cursor.execute(query, (peak_id,))
     row = cursor.fetchone()
-    
+
     if row:
-        data = dict(row)
+        data = dict(zip([d[0] for d in cursor.description], row))
+        packed_dtype = data.pop('packed_dtype', None)
+        packed_mz = data.pop('packed_mz', None)
+        packed_int = data.pop('packed_intensity', None)
+        if packed_dtype is not None:
+            data['mz'] = unpack_array(packed_mz, packed_dtype)
+            data['intensity'] = unpack_array(packed_int, packed_dtype)
+            data.pop('measured_mz', None)
+            data.pop('measured_intensity', None)
+            return data
         # Parse packed arrays if they exist
         if 'measured_mz' in data and data['measured_mz']:
             try:
-                data['mz'] = [float(x) for x in str(data['measured_mz']).split()]
-                data['intensity'] = [float(x) for x in str(data['measured_intensity']).split()]
+                data['mz'] = parse_spectrum_text(data['measured_mz'])
+                data['intensity'] = parse_spectrum_text(data['measured_intensity'])
                 del data['measured_mz']
                 del data['measured_intensity']
                 return data
@@ -202,6 +609,32 @@ def get_ms1_by_peak(conn: sqlite3.Connection, peak_id: int) -> Optional[Dict[str
                 return None
     return None
 
+
+def get_ms1_consensus_by_peak(conn: sqlite3.Connection, peak_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get the MS1 consensus spectrum (UMS) of a peak over all its MS1 scans,
+    read from the peak_ums table when it has been built (see
+    build_consensus_spectra.py) and otherwise computed on the fly. Intensities
+    are the mean of the sum-normalized scans, not measured counts.
+    Returns: Dict with mz, intensity arrays, their uncertainties (mz_u,
+    intensity_u), per-ion scan counts (n) and the number of scans used (n_scans).
+    """
+    from utils import ums
+
+    consensus = ums.get_peak_ums(conn, peak_id, ms_n=1)
+    if consensus is None or len(consensus) == 0:
+        return None
+    return {
+        "peak_id": peak_id,
+        "ms_n": 1,
+        "n_scans": int(consensus.attrs.get("numscans", 0)),
+        "mz": consensus["mz"].to_numpy(),
+        "intensity": consensus["int"].to_numpy(),
+        "mz_u": consensus["mz_u"].to_numpy(),
+        "intensity_u": consensus["int_u"].to_numpy(),
+        "n": consensus["n"].to_numpy(),
+    }
+
 def get_ms1_by_pfas(conn: sqlite3.Connection, pfas_id: int) -> pd.DataFrame:
     """
     Get all MS1 peaks associated with a PFAS compound ID.
@@ -231,17 +664,135 @@ def get_spectrum_data(conn: sqlite3.Connection, peak_id: int) -> Optional[Tuple[
         return data['mz'], data['intensity']
     return None
 
+# ============================================================================
+# Packed Spectrum Storage
+# ============================================================================
+
+# Sidecar table holding ms_data spectra as little-endian float BLOBs, keyed 1:1 on ms_data.id.
+# The TEXT columns stay authoritative (the R tooling reads them); triggers drop a packed
+# row whenever its source row changes so readers fall back to the text until re-migrated.
+PACKED_SPECTRA_TABLE = "ms_data_packed"
+PACKED_DTYPES = {"float64": "<f8", "float32": "<f4"}
+SPECTRUM_TEXT_COLUMNS = ("measured_mz", "measured_intensity")
+
+PACKED_SPECTRA_DDL = f"""
+CREATE TABLE IF NOT EXISTS {PACKED_SPECTRA_TABLE} (
+    ms_data_id INTEGER NOT NULL PRIMARY KEY,
+    dtype TEXT NOT NULL,
+    n_points INTEGER NOT NULL,
+    mz BLOB NOT NULL,
+    intensity BLOB NOT NULL,
+    FOREIGN KEY (ms_data_id) REFERENCES ms_data(id) ON UPDATE CASCADE ON DELETE CASCADE
+);
+CREATE TRIGGER IF NOT EXISTS {PACKED_SPECTRA_TABLE}_stale_on_update
+AFTER UPDATE OF measured_mz, measured_intensity ON ms_data
+BEGIN
+    DELETE FROM {PACKED_SPECTRA_TABLE} WHERE ms_data_id = OLD.id;
+END;
+CREATE TRIGGER IF NOT EXISTS {PACKED_SPECTRA_TABLE}_stale_on_delete
+AFTER DELETE ON ms_data
+BEGIN
+    DELETE FROM {PACKED_SPECTRA_TABLE} WHERE ms_data_id = OLD.id;
+END;
+"""
+
+
+def parse_spectrum_text(packed: Any) -> np.ndarray:
+    """Parse a space-delimited ms_data text column into a float64 array."""
+    return np.array(str(packed).split(), dtype=np.float64)
+
+
+def pack_array(values: Any, dtype: str = "float64") -> bytes:
+    """Serialize values to a little-endian BLOB for the packed spectrum table."""
+    return np.ascontiguousarray(values, dtype=PACKED_DTYPES[dtype]).tobytes()
+
+
+def unpack_array(blob: bytes, dtype: str = "<f8") -> np.ndarray:
+    """
+    Zero-copy view of a packed BLOB as a numpy array.
+    The returned array is read-only; call .copy() before modifying it in place.
+    """
+    return np.frombuffer(blob, dtype=np.dtype(dtype))
+
+
+def has_packed_spectra(conn: sqlite3.Connection) -> bool:
+    """True if the packed spectrum sidecar exists in this database."""
+    return get_catalog(conn).object_type(PACKED_SPECTRA_TABLE) == 'table'
+
+
+def migrate_packed_spectra(
+    conn: sqlite3.Connection,
+    dtype: str = "float64",
+    batch_size: int = 5000,
+    progress: Optional[Any] = None
+) -> int:
+    """
+    Convert ms_data text spectra into the packed BLOB sidecar table.
+    Only rows without a packed copy are processed, so re-running is incremental.
+    Requires a writable connection (not the cached read connection used by the app).
+    
+    Args:
+        conn: Writable SQLite connection
+        dtype: 'float64' (lossless) or 'float32' (half the size)
+        batch_size: Rows parsed and inserted per transaction
+        progress: Optional callable receiving the running count of converted rows
+        
+    Returns:
+        Number of ms_data rows converted
+    """
+    if dtype not in PACKED_DTYPES:
+        raise ValueError(f"dtype must be one of {list(PACKED_DTYPES)}")
+    conn.executescript(PACKED_SPECTRA_DDL)
+    
+    cursor = conn.cursor()
+    converted = 0
+    last_id = -1
+    while True:
+        cursor.execute(f"""
+            SELECT m.id, m.measured_mz, m.measured_intensity
+            FROM ms_data m
+            LEFT JOIN {PACKED_SPECTRA_TABLE} pk ON pk.ms_data_id = m.id
+            WHERE m.id > ? AND pk.ms_data_id IS NULL
+            ORDER BY m.id
+            LIMIT ?
+        """, (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        batch = []
+        for ms_data_id, mz_text, int_text in rows:
+            try:
+                mz = parse_spectrum_text(mz_text)
+                inten = parse_spectrum_text(int_text)
+            except ValueError:
+                continue
+            if len(mz) != len(inten):
+                continue
+            batch.append((
+                ms_data_id, PACKED_DTYPES[dtype], len(mz),
+                pack_array(mz, dtype), pack_array(inten, dtype)
+            ))
+        conn.executemany(
+            f"INSERT INTO {PACKED_SPECTRA_TABLE} "
+            "(ms_data_id, dtype, n_points, mz, intensity) VALUES (?, ?, ?, ?, ?)",
+            batch
+        )
+        conn.commit()
+        converted += len(batch)
+        if progress:
+            progress(converted)
+    return converted
+
 # ============================================================================
 # Helpers
 # ============================================================================
 
 def get_column_names(conn: sqlite3.Connection, table_name: str) -> List[str]:
-    """Helper to check column existence."""
-    cursor = conn.cursor()
+    """Helper to check column existence (served from the schema catalog)."""
     try:
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        return [row[1] for row in cursor.fetchall()]
-    except:
+        return get_catalog(conn).column_names(table_name)
+    except sqlite3.Error:
         return []
 
 def get_view_data(conn: sqlite3.Connection, view_name: str, limit: int = 100) -> pd.DataFrame:
@@ -0,0 +1,312 @@
+"""
+Database Builder
+Builds the PFAS explorer database from the DIMSpec CSV exports (ms1s.csv,
+pfas_ms_intrelpeakid.csv, pfas_ms_intrelscantime.csv) without holding a file in
+memory: each CSV is streamed in chunks with fixed column types into a typed
+table under bulk-load pragmas, indexes are created once the rows are in, and
+pfas_summary is aggregated by SQLite.
+"""
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils.common import quote_identifier
+
+DEFAULT_CHUNK_ROWS = 500_000
+INFER_ROWS = 100_000  # rows read to infer the types of columns not given explicitly
+DEFAULT_CACHE_MB = 512
+
+# Bulk-load settings: no rollback journal or fsync (a failed build is rebuilt)
+BULK_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "locking_mode": "EXCLUSIVE",
+}
+
+
+@dataclass(frozen=True)
+class CsvSource:
+    """One CSV export and the table it is loaded into."""
+    label: str
+    filename: str
+    table: str
+    dtypes: Dict[str, str] = field(default_factory=dict)  # known columns; others are inferred
+
+
+SOURCES: Tuple[CsvSource, ...] = (
+    CsvSource("ms1", "ms1s.csv", "ms1_raw"),
+    CsvSource("scantime", "pfas_ms_intrelscantime.csv", "ms1_scantime", {
+        "peak_id": "Int64", "scantime": "float64",
+    }),
+    CsvSource("peakid", "pfas_ms_intrelpeakid.csv", "ms1_peak", {
+        "pfas": "Int64", "name": "string", "precursor_mz": "float64",
+        "scantime": "float64", "peak_id": "Int64",
+    }),
+)
+
+# Columns indexed (after loading) in every table that has them
+INDEXED_COLUMNS = ("pfas", "peak_id", "precursor_mz")
+
+SUMMARY_TABLE = "pfas_summary"
+SUMMARY_SOURCE = "ms1_peak"
+SUMMARY_COLUMNS = ("pfas", "name", "precursor_mz", "scantime", "peak_id")
+SUMMARY_INDEXED_COLUMNS = ("pfas_id", "precursor_mz", "rt_mean")  # search_pfas filters
+SUMMARY_DDL = f"""
+CREATE TABLE {SUMMARY_TABLE} (
+    pfas_id INTEGER,
+    name TEXT,
+    precursor_mz REAL,
+    rt_mean REAL,
+    rt_min REAL,
+    rt_max REAL,
+    n_points INTEGER,
+    n_peaks INTEGER
+)
+"""
+
+Progress = Optional[Callable[[str, int], None]]
+
+
+# ============================================================================
+# Connection Setup
+# ============================================================================
+
+def apply_bulk_pragmas(conn: sqlite3.Connection, cache_mb: int = DEFAULT_CACHE_MB) -> None:
+    """Fast, non-durable settings for a one-off load into this connection."""
+    for name, value in BULK_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    conn.execute(f"PRAGMA cache_size=-{int(cache_mb) * 1024}")
+
+
+# ============================================================================
+# Streaming CSV Load
+# ============================================================================
+
+def _sql_type(dtype: str) -> str:
+    kind = pd.api.types.pandas_dtype(dtype).kind
+    if kind in "iub":
+        return "INTEGER"
+    if kind == "f":
+        return "REAL"
+    return "TEXT"
+
+
+def _read_dtypes(column_types: Dict[str, str]) -> Dict[str, str]:
+    """
+    Types handed to the CSV parser: integer columns are parsed as float64, which
+    the C parser handles natively (nullable Int64 goes through a slow object
+    path), and turned back into integers by _sql_values.
+    """
+    return {
+        col: "float64" if pd.api.types.pandas_dtype(dt).kind in "iu" else dt
+        for col, dt in column_types.items()
+    }
+
+
+def infer_dtypes(
+    path: Path,
+    dtypes: Optional[Dict[str, str]] = None,
+    encoding: str = "utf-8",
+    sample_rows: int = INFER_ROWS
+) -> Dict[str, str]:
+    """
+    Column types for a chunked read: the given ones, the rest inferred from the
+    first `sample_rows` rows as nullable types (so missing values in a later
+    chunk cannot change a column's type).
+    """
+    dtypes = dict(dtypes or {})
+    sample = pd.read_csv(path, nrows=sample_rows, encoding=encoding, dtype=_read_dtypes(dtypes))
+    resolved = {}
+    for col in sample.columns:
+        if col in dtypes:
+            resolved[col] = dtypes[col]
+            continue
+        kind = sample[col].dtype.kind
+        resolved[col] = {"i": "Int64", "u": "Int64", "f": "float64", "b": "boolean"}.get(kind, "string")
+    return resolved
+
+
+def _sql_values(series: pd.Series, integer: bool = False) -> list:
+    """A column as Python values for sqlite3 (missing -> None)."""
+    if series.dtype.kind == "f":
+        values = series.to_numpy(dtype=np.float64)
+        missing = np.isnan(values)
+        if integer:
+            values = np.where(missing, 0.0, values)
+            if np.any(values != np.trunc(values)):
+                raise ValueError(f"column '{series.name}' has non-integer values")
+            values = values.astype(np.int64)
+        values = values.tolist()
+        if missing.any():
+            for i in np.flatnonzero(missing).tolist():
+                values[i] = None
+        return values
+    if series.hasnans:
+        return series.astype(object).where(series.notna(), None).tolist()
+    if series.dtype.kind in "iu":
+        return series.to_numpy(dtype=np.int64).tolist()
+    return series.tolist()
+
+
+def load_csv(
+    conn: sqlite3.Connection,
+    path: Union[str, Path],
+    table: str,
+    dtypes: Optional[Dict[str, str]] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    encoding: str = "utf-8",
+    progress: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Replace `table` with the contents of a CSV, streamed `chunk_rows` at a time.
+
+    Args:
+        conn: Writable SQLite connection (see apply_bulk_pragmas)
+        path: CSV file with a header row
+        table: Destination table (dropped and re-created with typed columns)
+        dtypes: Column types (pandas names, e.g. 'Int64', 'float64', 'string');
+            columns not listed are inferred from the start of the file
+        progress: Optional callable receiving the running row count
+
+    Returns:
+        Number of rows loaded
+    """
+    path = Path(path)
+    try:
+        column_types = infer_dtypes(path, dtypes, encoding)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"{path.name}: cannot read with column types {dtypes} ({e})") from e
+    sql_types = {col: _sql_type(dt) for col, dt in column_types.items()}
+    columns = list(column_types)
+    conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(table)}")
+    conn.execute(
+        f"CREATE TABLE {quote_identifier(table)} ("
+        + ", ".join(f"{quote_identifier(c)} {sql_types[c]}" for c in columns) + ")"
+    )
+    insert = (
+        f"INSERT INTO {quote_identifier(table)} ({', '.join(quote_identifier(c) for c in columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))})"
+    )
+    integer = {col: sql_types[col] == "INTEGER" for col in columns}
+    loaded = 0
+    try:
+        reader = pd.read_csv(path, chunksize=max(1, chunk_rows), encoding=encoding, dtype=_read_dtypes(column_types))
+        for chunk in reader:
+            conn.executemany(insert, zip(*(_sql_values(chunk[c], integer[c]) for c in columns)))
+            conn.commit()
+            loaded += len(chunk)
+            if progress:
+                progress(loaded)
+    except (ValueError, TypeError) as e:
+        raise ValueError(
+            f"{path.name}: rows after {loaded:,} do not fit the column types {column_types} ({e}); "
+            "pass explicit dtypes for the affected columns"
+        ) from e
+    return loaded
+
+
+# ============================================================================
+# Indexes and Summary
+# ============================================================================
+
+def create_indexes(conn: sqlite3.Connection, tables: Sequence[str]) -> List[str]:
+    """Index INDEXED_COLUMNS in the given tables; returns the index names created."""
+    created = []
+    for table in tables:
+        present = {row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")}
+        for col in INDEXED_COLUMNS:
+            if col in present:
+                name = f"ix_{table}_{col}"
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON {quote_identifier(table)} ({quote_identifier(col)})")
+                created.append(name)
+    conn.commit()
+    return created
+
+
+def build_pfas_summary(conn: sqlite3.Connection, source: str = SUMMARY_SOURCE) -> int:
+    """
+    Re-create pfas_summary (one row per pfas / name / precursor_mz with its
+    retention time range and point / peak counts) with a SQL GROUP BY.
+
+    Returns:
+        Number of summary rows
+    """
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(source)})")}
+    missing = [c for c in SUMMARY_COLUMNS if c not in present]
+    if missing:
+        raise ValueError(f"'{source}' lacks the columns {missing} needed for {SUMMARY_TABLE}")
+    conn.execute(f"DROP TABLE IF EXISTS {SUMMARY_TABLE}")
+    conn.execute(SUMMARY_DDL)
+    conn.execute(f"""
+        INSERT INTO {SUMMARY_TABLE}
+            (pfas_id, name, precursor_mz, rt_mean, rt_min, rt_max, n_points, n_peaks)
+        SELECT pfas, name, precursor_mz,
+               AVG(scantime), MIN(scantime), MAX(scantime),
+               COUNT(*), COUNT(DISTINCT peak_id)
+        FROM {quote_identifier(source)}
+        WHERE pfas IS NOT NULL AND name IS NOT NULL AND precursor_mz IS NOT NULL
+        GROUP BY pfas, name, precursor_mz
+        ORDER BY pfas, name, precursor_mz
+    """)
+    for col in SUMMARY_INDEXED_COLUMNS:
+        conn.execute(f"CREATE INDEX ix_{SUMMARY_TABLE}_{col} ON {SUMMARY_TABLE} ({col})")
+    conn.commit()
+    return conn.execute(f"SELECT COUNT(*) FROM {SUMMARY_TABLE}").fetchone()[0]
+
+
+# ============================================================================
+# Build
+# ============================================================================
+
+def build_database(
+    data_dir: Union[str, Path],
+    output: Union[str, Path],
+    sources: Sequence[CsvSource] = SOURCES,
+    dtypes: Optional[Dict[str, str]] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    encoding: str = "utf-8",
+    cache_mb: int = DEFAULT_CACHE_MB,
+    progress: Progress = None
+) -> Dict[str, int]:
+    """
+    Load every source CSV found in `data_dir` into `output` (existing tables of
+    the same name are replaced), index them and build pfas_summary from the
+    peak table. Missing CSVs are skipped.
+
+    Args:
+        dtypes: Extra column types applied to every source (override the defaults)
+        progress: Optional callable receiving (table, running row count)
+
+    Returns:
+        Rows per table written, including pfas_summary when it was built
+    """
+    data_dir, output = Path(data_dir), Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    counts: Dict[str, int] = {}
+    conn = sqlite3.connect(output)
+    try:
+        apply_bulk_pragmas(conn, cache_mb)
+        for source in sources:
+            path = data_dir / source.filename
+            if not path.exists():
+                continue
+            counts[source.table] = load_csv(
+                conn, path, source.table,
+                dtypes={**source.dtypes, **(dtypes or {})},
+                chunk_rows=chunk_rows,
+                encoding=encoding,
+                progress=(lambda n, t=source.table: progress(t, n)) if progress else None
+            )
+        create_indexes(conn, list(counts))
+        if SUMMARY_SOURCE in counts:
+            counts[SUMMARY_TABLE] = build_pfas_summary(conn)
+            if progress:
+                progress(SUMMARY_TABLE, counts[SUMMARY_TABLE])
+    finally:
+        conn.close()
+    return counts
@@ -0,0 +1,283 @@
+"""
+Database Optimizer
+Index advisor for the app's hot lookups: each probe runs a lookup the way the
+app issues it (through utils.database where there is a helper for it), the
+statements it executes are captured and run through EXPLAIN QUERY PLAN, and
+any probe whose index is missing gets it. Probe indexes are composite where
+the lookup filters or reads more than one column, so a range search on the
+leading column checks the remaining filters (and, for narrow SELECTs, reads the
+result) from the index without visiting table rows. Statistics are then
+refreshed (ANALYZE, PRAGMA optimize) and every probe is timed again.
+"""
+import re
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils import database as db
+from utils.common import quote_identifier
+from utils.schema_catalog import get_catalog
+
+DEFAULT_REPEAT = 3
+# Rows ANALYZE samples per index (0 = all); keeps ANALYZE fast on large tables
+DEFAULT_ANALYSIS_LIMIT = 1000
+
+MZ_WINDOW = 0.005   # half-width (Da) of the probe m/z ranges
+RT_WINDOW = 0.01    # half-width (min) of the probe retention time ranges
+
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)", re.IGNORECASE)
+_COVERED = re.compile(r"^SEARCH (?:TABLE )?(\w+) USING (?:COVERING INDEX|INTEGER PRIMARY KEY)", re.IGNORECASE)
+_NOT_ALIASES = {"WHERE", "ON", "JOIN", "LEFT", "INNER", "CROSS", "NATURAL", "ORDER", "GROUP",
+                "LIMIT", "USING", "UNION", "INDEXED", "NOT", "WINDOW", "HAVING"}
+
+
+@dataclass(frozen=True)
+class Probe:
+    """A hot lookup on table.column and the index that serves it."""
+    name: str
+    table: str
+    column: str
+    index_columns: Tuple[str, ...]
+    run: Callable[..., Any]  # (conn, representative value of column, *of sample_columns)
+    sample_columns: Tuple[str, ...] = ()  # further columns sampled from the same row
+
+
+# Composite indexes: (precursor_mz, rt_mean, pfas_id) answers m/z + RT windows and
+# candidate-id lookups from the index alone; (fixedmass, name) covers the id/name
+# exact-mass lookup (id is the rowid, stored in every index).
+PROBES: Tuple[Probe, ...] = (
+    Probe("get_ms1_by_peak (scans of a peak)", "ms_data", "peak_id", ("peak_id", "scantime"),
+          lambda conn, v: db.fetch_peak_scans(conn, [v])),
+    Probe("search_pfas by m/z", "pfas_summary", "precursor_mz", ("precursor_mz", "rt_mean", "pfas_id"),
+          lambda conn, v: db.search_pfas(conn, mz_range=(v - MZ_WINDOW, v + MZ_WINDOW))),
+    Probe("search_pfas by m/z and RT", "pfas_summary", "precursor_mz", ("precursor_mz", "rt_mean", "pfas_id"),
+          lambda conn, v, rt: db.search_pfas(conn, mz_range=(v - MZ_WINDOW, v + MZ_WINDOW),
+                                             rt_range=(rt - RT_WINDOW, rt + RT_WINDOW)),
+          sample_columns=("rt_mean",)),
+    Probe("library candidates by m/z and RT", "pfas_summary", "precursor_mz", ("precursor_mz", "rt_mean", "pfas_id"),
+          lambda conn, v, rt: conn.execute(
+              "SELECT pfas_id FROM pfas_summary WHERE precursor_mz BETWEEN ? AND ? AND rt_mean BETWEEN ? AND ?",
+              (v - MZ_WINDOW, v + MZ_WINDOW, rt - RT_WINDOW, rt + RT_WINDOW)
+          ).fetchall(),
+          sample_columns=("rt_mean",)),
+    Probe("search_pfas by RT", "pfas_summary", "rt_mean", ("rt_mean",),
+          lambda conn, v: db.search_pfas(conn, rt_range=(v - RT_WINDOW, v + RT_WINDOW))),
+    Probe("compounds by exact mass", "compounds", "fixedmass", ("fixedmass", "name"),
+          lambda conn, v: conn.execute(
+              "SELECT id, name FROM compounds WHERE fixedmass BETWEEN ? AND ?", (v - MZ_WINDOW, v + MZ_WINDOW)
+          ).fetchall()),
+    Probe("compound by name", "compounds", "name", ("name",),
+          lambda conn, v: conn.execute("SELECT * FROM compounds WHERE name = ?", (v,)).fetchall()),
+    Probe("peaks by precursor m/z", "peaks", "precursor_mz", ("precursor_mz",),
+          lambda conn, v: conn.execute(
+              "SELECT id FROM peaks WHERE precursor_mz BETWEEN ? AND ?", (v - MZ_WINDOW, v + MZ_WINDOW)
+          ).fetchall()),
+)
+
+
+@dataclass
+class ProbeResult:
+    name: str
+    table: str
+    before_ms: float
+    after_ms: Optional[float] = None
+    plan_before: List[str] = field(default_factory=list)
+    plan_after: List[str] = field(default_factory=list)
+    index: Optional[str] = None  # index created for this probe
+    full_scan: bool = False      # the lookup read its whole table before optimizing
+
+
+@dataclass
+class OptimizeReport:
+    probes: List[ProbeResult] = field(default_factory=list)
+    created: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)  # probes whose table / column is missing
+    analyze_s: float = 0.0
+
+
+# ============================================================================
+# Probing
+# ============================================================================
+
+def index_name(table: str, columns: Tuple[str, ...]) -> str:
+    return f"ix_{table}_{'_'.join(columns)}"
+
+
+def _sample_row(conn: sqlite3.Connection, table: str, columns: Tuple[str, ...]) -> Optional[Tuple]:
+    """Non-null values of the columns from one row in the middle of the table (rowid bounds are O(1))."""
+    catalog = get_catalog(conn)
+    t = quote_identifier(table)
+    cols = ", ".join(quote_identifier(c) for c in columns)
+    not_null = " AND ".join(f"{quote_identifier(c)} IS NOT NULL" for c in columns)
+    if catalog.object_type(table) == "table" and table not in catalog.without_rowid:
+        row = conn.execute(
+            f"SELECT {cols} FROM {t} WHERE rowid >= (SELECT (MIN(rowid) + MAX(rowid)) / 2 FROM {t}) "
+            f"AND {not_null} LIMIT 1"
+        ).fetchone()
+        if row:
+            return tuple(row)
+    row = conn.execute(f"SELECT {cols} FROM {t} WHERE {not_null} LIMIT 1").fetchone()
+    return tuple(row) if row else None
+
+
+def _run_traced(conn: sqlite3.Connection, probe: Probe, values: Tuple) -> Tuple[float, List[str]]:
+    """Run a probe once; returns (seconds, statements it executed)."""
+    statements: List[str] = []
+    conn.set_trace_callback(statements.append)
+    try:
+        start = time.perf_counter()
+        probe.run(conn, *values)
+        elapsed = time.perf_counter() - start
+    finally:
+        conn.set_trace_callback(None)
+    return elapsed, statements
+
+
+def _time_probe(conn: sqlite3.Connection, probe: Probe, values: Tuple, repeat: int) -> Tuple[float, List[str]]:
+    """Best of `repeat` runs (ms) and the statements that touch the probe's table."""
+    best, touching = float("inf"), []
+    for _ in range(max(1, repeat)):
+        elapsed, statements = _run_traced(conn, probe, values)
+        best = min(best, elapsed)
+        touching = [s for s in statements if re.search(rf"\b{re.escape(probe.table)}\b", s)
+                    and s.lstrip().upper().startswith(("SELECT", "WITH"))]
+    return best * 1000, touching
+
+
+def query_plan(conn: sqlite3.Connection, statement: str) -> List[str]:
+    """EXPLAIN QUERY PLAN details of a statement (with its values inlined)."""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+
+
+def scanned_tables(plan: List[str]) -> List[str]:
+    """Tables a plan reads in full (SCAN without an index)."""
+    return [m.group(1) for m in (_SCAN.match(line.strip()) for line in plan) if m]
+
+
+def _names_of(statement: str, table: str) -> set:
+    """The table's name and any alias it has in a statement (plans report aliases)."""
+    names = {table}
+    for match in re.finditer(rf"\b{re.escape(table)}\s+(?:AS\s+)?(\w+)", statement, re.IGNORECASE):
+        if match.group(1).upper() not in _NOT_ALIASES:
+            names.add(match.group(1))
+    return names
+
+
+def covered_tables(plan: List[str]) -> List[str]:
+    """Tables a plan reads from a covering index or by rowid only."""
+    return [m.group(1) for m in (_COVERED.match(line.strip()) for line in plan) if m]
+
+
+def _plans(conn: sqlite3.Connection, statements: List[str], table: str) -> Tuple[List[str], bool, bool]:
+    """
+    Plans of the statements, whether any of them scans `table` in full and
+    whether every one of them reads it from a covering index.
+    """
+    lines, scans, covered = [], False, bool(statements)
+    for statement in statements:
+        plan = query_plan(conn, statement)
+        lines.extend(plan)
+        names = _names_of(statement, table)
+        scans |= bool(set(scanned_tables(plan)) & names)
+        covered &= bool(set(covered_tables(plan)) & names)
+    return lines, scans, covered
+
+
+def _has_index(conn: sqlite3.Connection, table: str, columns: Tuple[str, ...]) -> bool:
+    """Whether an index (or the primary key) of the table starts with these columns."""
+    wanted = list(columns)
+    for _, name, *_ in conn.execute(f"PRAGMA index_list({quote_identifier(table)})").fetchall():
+        info = conn.execute(f"PRAGMA index_info({quote_identifier(name)})").fetchall()
+        if [row[2] for row in info][:len(wanted)] == wanted:
+            return True
+    return get_catalog(conn).primary_key(table)[:len(wanted)] == wanted
+
+
+# ============================================================================
+# Optimize
+# ============================================================================
+
+def optimize_database(
+    conn: sqlite3.Connection,
+    probes: Tuple[Probe, ...] = PROBES,
+    repeat: int = DEFAULT_REPEAT,
+    analysis_limit: int = DEFAULT_ANALYSIS_LIMIT,
+    apply: bool = True,
+    progress: Optional[Callable[[str], None]] = None
+) -> OptimizeReport:
+    """
+    Time the hot-lookup probes, create each probe's index unless an index
+    already starts with its columns or the lookup is already answered from a
+    covering index, refresh planner statistics and time the probes again.
+
+    Args:
+        conn: Writable connection
+        repeat: Runs per probe timing (the best is reported)
+        analysis_limit: PRAGMA analysis_limit for ANALYZE (0 = read every row)
+        apply: False only reports the plans and the indexes that would be created
+        progress: Optional callable receiving a status line
+
+    Returns:
+        OptimizeReport with per-probe timings and plans and the indexes created
+    """
+    report = OptimizeReport()
+    catalog = get_catalog(conn)
+    planned: Dict[Tuple[str, Tuple[str, ...]], List[ProbeResult]] = {}
+    active = []
+
+    for probe in probes:
+        sampled = (probe.column, *probe.sample_columns)
+        if catalog.object_type(probe.table) != "table" or not all(
+            c in catalog.column_names(probe.table) for c in (*sampled, *probe.index_columns)
+        ):
+            report.skipped.append(probe.name)
+            continue
+        values = _sample_row(conn, probe.table, sampled)
+        if values is None:
+            report.skipped.append(probe.name)
+            continue
+        if progress:
+            progress(f"Probing {probe.name}")
+        before_ms, statements = _time_probe(conn, probe, values, repeat)
+        plan, scans, covered = _plans(conn, statements, probe.table)
+        result = ProbeResult(probe.name, probe.table, before_ms, plan_before=plan, full_scan=scans)
+        report.probes.append(result)
+        active.append((probe, values, result))
+        if not covered and not _has_index(conn, probe.table, probe.index_columns):
+            planned.setdefault((probe.table, probe.index_columns), []).append(result)
+
+    if not apply:
+        for (table, columns), results in planned.items():
+            for result in results:
+                result.index = index_name(table, columns)
+        return report
+
+    for (table, columns), results in planned.items():
+        name = index_name(table, columns)
+        if progress:
+            progress(f"Creating {name}")
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON {quote_identifier(table)} "
+            f"({', '.join(quote_identifier(c) for c in columns)})"
+        )
+        conn.commit()
+        report.created.append(name)
+        for result in results:
+            result.index = name
+
+    if progress:
+        progress("Analyzing")
+    start = time.perf_counter()
+    conn.execute(f"PRAGMA analysis_limit={int(analysis_limit)}")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    report.analyze_s = time.perf_counter() - start
+
+    for probe, values, result in active:
+        if progress:
+            progress(f"Re-timing {probe.name}")
+        result.after_ms, statements = _time_probe(conn, probe, values, repeat)
+        result.plan_after = _plans(conn, statements, probe.table)[0]
+    return report
@@ -0,0 +1,203 @@
+"""
+SQLite Connection Pool
+Gives every thread (i.e. every Streamlit script run) its own read-only connection
+to the database instead of one connection shared across all sessions, so
+concurrent users read in parallel and never interleave cursors.
+"""
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+# Read-side tuning applied to every pooled connection
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024   # bytes of the file mapped into memory
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024      # page cache per connection
+HEALTH_CHECK_INTERVAL = 30.0            # seconds between liveness checks of a connection
+
+
+@dataclass
+class _PooledConnection:
+    conn: sqlite3.Connection
+    thread: threading.Thread
+    file_id: Optional[Tuple[int, int]]
+    checked_at: float
+
+
+def _file_id(path: Path) -> Optional[Tuple[int, int]]:
+    """(device, inode) of the database file; changes when the file is replaced."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def _plain_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+    """Cursor for the pool's own housekeeping, kept out of any query instrumentation."""
+    return sqlite3.Cursor(conn)
+
+
+def enable_wal(db_path: Path) -> bool:
+    """
+    Switch the database to WAL journaling if it is not already, so readers never
+    block (or get blocked by) a writer. This writes to the database file, so it is
+    an explicit maintenance step (optimize_db.py --wal), never done by the pool.
+    Needs write access to the file and its directory; returns False where that is
+    not available.
+    """
+    db_path = Path(db_path)
+    if not (os.access(db_path, os.W_OK) and os.access(db_path.parent, os.W_OK)):
+        return False
+    try:
+        conn = sqlite3.connect(str(db_path), timeout=1.0)
+        try:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if str(mode).lower() != "wal":
+                mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            return str(mode).lower() == "wal"
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+class ConnectionPool:
+    """
+    One read-only connection per thread for a single database file.
+
+    Connections are opened lazily on first use in a thread, health-checked when
+    they have been idle for health_check_interval seconds (and reopened if the
+    check fails or the file was replaced), and closed once their thread has exited.
+    """
+
+    def __init__(
+        self,
+        db_path: Any,
+        mmap_size: int = DEFAULT_MMAP_SIZE,
+        cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL,
+        factory: type = sqlite3.Connection
+    ):
+        self.db_path = Path(db_path).resolve()
+        self.factory = factory  # connection class, e.g. query_log.InstrumentedConnection
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Lock()
+        self._entries: Dict[int, _PooledConnection] = {}
+        # Dedicated connection that only answers change_token()
+        self._watch_lock = threading.Lock()
+        self._watcher: Optional[_PooledConnection] = None
+        self._counters = {
+            "acquired": 0,
+            "opened": 0,
+            "closed": 0,
+            "health_checks": 0,
+            "health_failures": 0,
+        }
+
+    def _open(self) -> sqlite3.Connection:
+        if not self.db_path.exists():
+            # mode=ro would fail anyway; raise the clearer error
+            raise sqlite3.OperationalError(f"database not found: {self.db_path}")
+        # Owned by one thread, but closed by whichever thread reaps it
+        conn = sqlite3.connect(
+            self.db_path.as_uri() + "?mode=ro", uri=True, check_same_thread=False,
+            factory=self.factory
+        )
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        cursor = _plain_cursor(conn)
+        cursor.execute("PRAGMA query_only = ON")
+        cursor.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size = {-int(self.cache_size_kib)}")
+        return conn
+
+    def _healthy(self, entry: _PooledConnection) -> bool:
+        self._counters["health_checks"] += 1
+        if entry.file_id != _file_id(self.db_path):
+            return False
+        try:
+            _plain_cursor(entry.conn).execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _close(self, entry: _PooledConnection) -> None:
+        try:
+            entry.conn.close()
+        except sqlite3.Error:
+            pass
+        self._counters["closed"] += 1
+
+    def _reap(self) -> None:
+        """Close connections whose owning thread has exited (caller holds the lock)."""
+        for ident, entry in list(self._entries.items()):
+            if not entry.thread.is_alive():
+                del self._entries[ident]
+                self._close(entry)
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening or replacing it as needed."""
+        thread = threading.current_thread()
+        ident = threading.get_ident()
+        now = time.monotonic()
+        with self._lock:
+            self._counters["acquired"] += 1
+            entry = self._entries.get(ident)
+            if entry is not None and entry.thread is not thread:
+                # Thread id reused by a new thread; the old owner is gone
+                del self._entries[ident]
+                self._close(entry)
+                entry = None
+            if entry is not None and now - entry.checked_at >= self.health_check_interval:
+                if self._healthy(entry):
+                    entry.checked_at = now
+                else:
+                    self._counters["health_failures"] += 1
+                    del self._entries[ident]
+                    self._close(entry)
+                    entry = None
+            if entry is None:
+                self._reap()
+                entry = _PooledConnection(self._open(), thread, _file_id(self.db_path), now)
+                self._entries[ident] = entry
+                self._counters["opened"] += 1
+            return entry.conn
+
+    def change_token(self) -> Tuple[Any, int]:
+        """
+        Token that changes whenever the database content changes: the file identity
+        plus PRAGMA data_version of a connection that never writes (data_version
+        moves when any other connection commits). Comparable across threads.
+        """
+        with self._watch_lock:
+            file_id = _file_id(self.db_path)
+            if self._watcher is None or self._watcher.file_id != file_id:
+                if self._watcher is not None:
+                    self._close(self._watcher)
+                self._watcher = _PooledConnection(self._open(), threading.current_thread(), file_id, time.monotonic())
+            return (file_id, _plain_cursor(self._watcher.conn).execute("PRAGMA data_version").fetchone()[0])
+
+    def close_all(self) -> None:
+        with self._watch_lock:
+            if self._watcher is not None:
+                self._close(self._watcher)
+                self._watcher = None
+        with self._lock:
+            for entry in self._entries.values():
+                self._close(entry)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool metrics: open connections plus lifetime counters."""
+        with self._lock:
+            self._reap()
+            return {
+                "db_path": str(self.db_path),
+                "open": len(self._entries),
+                **self._counters,
+            }
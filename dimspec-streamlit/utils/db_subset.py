@@ -0,0 +1,433 @@
+"""
+Database Subsetting
+Copies a referentially consistent slice of a DIMSpec database into a new file,
+entirely inside SQLite: the source is ATTACHed and rows move with
+INSERT ... SELECT, never through Python.
+
+The slice is a connected subgraph: the selected compounds, the peaks linked to
+them (compound_fragments), every row that hangs off those peaks (ms_data,
+ms_spectra, qc_data, opt_ums_params, ...), the samples / methods / fragments
+those rows point to, and whole copies of the small lookup tables (norm_*,
+elements, contributors, ...). Foreign keys in the copy therefore resolve.
+Tables without foreign keys are filtered on a compound / peak key column
+(pfas_summary.pfas_id, ms1_peak.peak_id, ...) or, lacking one, left empty.
+"""
+import sqlite3
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from utils.common import quote_identifier
+from utils.data_processing import get_compound_family
+from utils.db_builder import apply_bulk_pragmas
+
+SOURCE_SCHEMA = "src"
+COMPOUND_TABLE = "compounds"
+PEAK_TABLE = "peaks"
+PEAK_LINK_TABLE = "compound_fragments"
+
+# Tables whose rows are copied only when a copied row references them
+# (a sample is kept for its peaks, not every peak of a kept sample)
+PARENT_TABLES = (
+    "samples", "ms_methods", "conversion_software_peaks_linkage",
+    "annotated_fragments", "norm_fragments",
+)
+
+# Small lookup tables copied whole, with the tables whose foreign keys only point
+# to them (isotopes, contributors, carrier_mixes, ...)
+REFERENCE_PREFIXES = ("norm_",)
+REFERENCE_TABLES = ("config", "elements", "affiliations", "carrier_mix_collections", "version_history")
+
+# Key columns that tie a table without foreign keys to kept rows, most selective first
+KEY_COLUMNS = (
+    ("peak_id", PEAK_TABLE, "id"),
+    ("compound_id", COMPOUND_TABLE, "id"),
+    ("pfas_id", COMPOUND_TABLE, "id"),
+)
+
+# Tables created empty in the subset
+EMPTY_TABLES = ("logs",)
+
+DEFAULT_SAMPLE_SIZE = 200
+
+Progress = Optional[Callable[[str, int], None]]
+
+
+@dataclass
+class SubsetResult:
+    """Rows copied per table and foreign key violations found in the copy."""
+    rows: Dict[str, int] = field(default_factory=dict)
+    fk_violations: Dict[str, int] = field(default_factory=dict)
+    unmatched: List[str] = field(default_factory=list)  # requested compounds not found
+    skipped: List[str] = field(default_factory=list)    # tables left empty (no way to subset them)
+
+
+# ============================================================================
+# Schema Helpers
+# ============================================================================
+
+def _src(table: str) -> str:
+    return f"{SOURCE_SCHEMA}.{quote_identifier(table)}"
+
+
+def _rank(seed: int, key) -> int:
+    """Deterministic pseudo-random order key (SQLite's random() cannot be seeded)."""
+    return zlib.crc32(f"{seed}:{key}".encode())
+
+
+def _foreign_keys(conn: sqlite3.Connection, table: str) -> List[Tuple[str, str, str]]:
+    """Single-column foreign keys of a source table as (column, parent, parent column)."""
+    rows = conn.execute(f"PRAGMA {SOURCE_SCHEMA}.foreign_key_list({quote_identifier(table)})").fetchall()
+    widths: Dict[int, int] = {}
+    for row in rows:
+        widths[row[0]] = widths.get(row[0], 0) + 1
+    keys = []
+    for fk_id, _, parent, column, parent_column, *_ in rows:
+        if widths[fk_id] != 1:
+            continue
+        if parent_column is None:
+            pk = [r[1] for r in conn.execute(f"PRAGMA {SOURCE_SCHEMA}.table_info({quote_identifier(parent)})") if r[5]]
+            parent_column = pk[0] if len(pk) == 1 else "rowid"
+        keys.append((column, parent, parent_column))
+    return keys
+
+
+def _schema_objects(conn: sqlite3.Connection) -> List[Tuple[str, str, str]]:
+    """(type, name, sql) of the source's user objects, in creation order."""
+    return conn.execute(
+        f"SELECT type, name, sql FROM {SOURCE_SCHEMA}.sqlite_master "
+        "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+    ).fetchall()
+
+
+def _create_tables(conn: sqlite3.Connection, objects) -> Tuple[List[str], List[str]]:
+    """
+    Create the source's tables (virtual ones too) in the target.
+
+    Returns:
+        (tables to fill, virtual tables); shadow tables a virtual table creates
+        for itself are neither
+    """
+    tables, virtual = [], []
+    existing = set()
+    for kind, name, sql in objects:
+        if kind != "table" or name in existing:
+            continue
+        conn.execute(sql)
+        if sql.lstrip().upper().startswith("CREATE VIRTUAL"):
+            virtual.append(name)
+        else:
+            tables.append(name)
+        existing = {r[0] for r in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+    shadow = existing - set(tables) - set(virtual)
+    return [t for t in tables if t not in shadow], virtual
+
+
+def _is_lookup(table: str) -> bool:
+    return table in REFERENCE_TABLES or table.startswith(REFERENCE_PREFIXES)
+
+
+def _classify(conn: sqlite3.Connection, tables: Sequence[str]) -> Dict[str, List[str]]:
+    """
+    Sort tables by how their rows are chosen:
+      'child'     - reference a compound / peak (or such a child): rows of kept parents
+      'parent'    - PARENT_TABLES: rows referenced by copied rows
+      'detail'    - reference a parent table only (sample_aliases, ...)
+      'reference' - lookup tables (REFERENCE_TABLES, norm_*) and tables whose
+                    foreign keys only point to them, copied whole
+      'keyed'     - no foreign keys but a KEY_COLUMNS column: rows of kept compounds / peaks
+      'excluded'  - anything else, left empty
+    Child tables are listed parents-first.
+    """
+    fks = {t: _foreign_keys(conn, t) for t in tables}
+    driven = {COMPOUND_TABLE, PEAK_TABLE}
+    parents = [t for t in PARENT_TABLES if t in fks]
+    children: List[str] = []
+    grew = True
+    while grew:
+        grew = False
+        for table in tables:
+            if table in driven or table in parents or table in children:
+                continue
+            if any(p in driven or p in children for _, p, _ in fks[table]):
+                children.append(table)
+                grew = True
+    details: List[str] = []
+    grew = True
+    while grew:
+        grew = False
+        for table in tables:
+            if table in driven or table in parents or table in children or table in details:
+                continue
+            if any(p in parents or p in details for _, p, _ in fks[table]):
+                details.append(table)
+                grew = True
+    sorted_children = []
+    while len(sorted_children) < len(children):
+        for table in children:
+            if table not in sorted_children and all(
+                p not in children or p in sorted_children or p == table for _, p, _ in fks[table]
+            ):
+                sorted_children.append(table)
+    subset = driven | set(parents) | set(children) | set(details)
+    reference = [t for t in tables if t not in subset and _is_lookup(t)]
+    grew = True
+    while grew:
+        grew = False
+        for table in tables:
+            if table in subset or table in reference or not fks[table]:
+                continue
+            if all(p in reference or p == table for _, p, _ in fks[table]):
+                reference.append(table)
+                grew = True
+    keyed: Dict[str, Tuple[str, str, str]] = {}
+    excluded = []
+    for table in tables:
+        if table in subset or table in reference:
+            continue
+        columns = {r[1] for r in conn.execute(f"PRAGMA {SOURCE_SCHEMA}.table_info({quote_identifier(table)})")}
+        key = next((k for k in KEY_COLUMNS if k[0] in columns), None)
+        if key and not fks[table]:
+            keyed[table] = key
+        else:
+            excluded.append(table)
+    return {
+        "child": sorted_children,
+        "parent": parents,
+        "detail": details,
+        "reference": [t for t in tables if t in reference],
+        "keyed": keyed,
+        "excluded": excluded,
+        "fks": fks,
+    }
+
+
+def _kept(column: str, parent: str, parent_column: str) -> str:
+    """Condition that a source row's foreign key is null or already copied."""
+    return (f"({quote_identifier(column)} IS NULL OR {quote_identifier(column)} IN "
+            f"(SELECT {quote_identifier(parent_column)} FROM main.{quote_identifier(parent)}))")
+
+
+# ============================================================================
+# Compound Selection
+# ============================================================================
+
+def _peak_links(conn: sqlite3.Connection, tables: Sequence[str]) -> str:
+    """
+    Query of the source's (compound_id, peak_id) pairs: compound_fragments when
+    the source has it, else peaks.compound_id.
+    """
+    if PEAK_LINK_TABLE in tables:
+        return f"SELECT DISTINCT compound_id, peak_id FROM {_src(PEAK_LINK_TABLE)}"
+    peak_columns = {r[1] for r in conn.execute(f"PRAGMA {SOURCE_SCHEMA}.table_info({PEAK_TABLE})")}
+    if "compound_id" in peak_columns:
+        return f"SELECT compound_id, id AS peak_id FROM {_src(PEAK_TABLE)} WHERE compound_id IS NOT NULL"
+    raise ValueError(f"source does not link peaks to compounds ({PEAK_LINK_TABLE})")
+
+
+def _select_compounds(
+    conn: sqlite3.Connection,
+    compounds: Optional[Sequence[Union[int, str]]],
+    families: Optional[Sequence[str]],
+    sample: Optional[int],
+    seed: int,
+    require_peaks: bool,
+    links: str
+) -> List[str]:
+    """
+    Fill temp.subset_compounds with the selected compound ids.
+
+    Args:
+        links: Query of (compound_id, peak_id) pairs (see _peak_links), used by
+            require_peaks
+
+    Returns:
+        Requested compounds that matched nothing
+    """
+    conn.execute("CREATE TEMP TABLE subset_compounds (id INTEGER PRIMARY KEY)")
+    unmatched = []
+
+    if compounds:
+        aliases = conn.execute(
+            f"SELECT 1 FROM {SOURCE_SCHEMA}.sqlite_master WHERE type = 'table' AND name = 'compound_aliases'"
+        ).fetchone()
+        for value in compounds:
+            text = str(value).strip()
+            query = f"SELECT id FROM {_src(COMPOUND_TABLE)} WHERE CAST(id AS TEXT) = ? OR lower(name) = lower(?)"
+            params = [text, text]
+            if aliases:
+                query += f" UNION SELECT compound_id FROM {_src('compound_aliases')} WHERE lower(alias) = lower(?)"
+                params.append(text)
+            cursor = conn.execute(f"INSERT OR IGNORE INTO temp.subset_compounds {query}", params)
+            if cursor.rowcount == 0 and not conn.execute(query, params).fetchone():
+                unmatched.append(text)
+
+    if families or sample:
+        where = []
+        params: List = []
+        if families:
+            where.append(f"pfas_family(name) IN ({', '.join('?' * len(families))})")
+            params.extend(families)
+        if require_peaks:
+            where.append(f"id IN (SELECT compound_id FROM ({links}))")
+        candidates = (f"SELECT id, pfas_family(name) AS family FROM {_src(COMPOUND_TABLE)}"
+                      + (f" WHERE {' AND '.join(where)}" if where else ""))
+        if sample:
+            # Stratified: each family keeps its share of the sample (at least one compound)
+            total = conn.execute(f"SELECT COUNT(*) FROM ({candidates})", params).fetchone()[0]
+            query = f"""
+                SELECT id FROM (
+                    SELECT id,
+                           ROW_NUMBER() OVER (PARTITION BY family ORDER BY subset_rank(?, id)) AS n,
+                           COUNT(*) OVER (PARTITION BY family) AS family_size
+                    FROM ({candidates})
+                )
+                WHERE n <= MAX(1, ROUND(? * family_size / MAX(?, 1)))
+            """
+            params = [seed, *params, int(sample), float(total)]
+        else:
+            query = f"SELECT id FROM ({candidates})"
+        conn.execute(f"INSERT OR IGNORE INTO temp.subset_compounds {query}", params)
+    return unmatched
+
+
+# ============================================================================
+# Extraction
+# ============================================================================
+
+def extract_subset(
+    source: Union[str, Path],
+    target: Union[str, Path],
+    compounds: Optional[Sequence[Union[int, str]]] = None,
+    families: Optional[Sequence[str]] = None,
+    sample: Optional[int] = None,
+    max_peaks_per_compound: Optional[int] = None,
+    seed: int = 0,
+    require_peaks: bool = True,
+    progress: Progress = None
+) -> SubsetResult:
+    """
+    Write the subgraph of `source` around the selected compounds to `target`
+    (replaced if it exists), with the source's schema, indexes, views and triggers.
+
+    Args:
+        source: DIMSpec SQLite database
+        target: New database file
+        compounds: Compound ids, names or aliases to include
+        families: Include every compound of these families (see PFAS_FAMILIES)
+        sample: Instead of whole families, a random sample of about this many
+            compounds, stratified by family (within `families` if given)
+        max_peaks_per_compound: Keep at most this many (randomly chosen) peaks per compound
+        seed: Seed for the random choices; the same seed gives the same subset
+        require_peaks: Family / sample selection skips compounds without peaks
+        progress: Optional callable receiving (table, rows copied)
+
+    Returns:
+        SubsetResult with per-table row counts and any foreign key violations
+    """
+    source, target = Path(source).resolve(), Path(target).resolve()
+    if not source.exists():
+        raise ValueError(f"source database not found at {source}")
+    if source == target:
+        raise ValueError("target must differ from the source database")
+    if not (compounds or families or sample):
+        raise ValueError("select compounds by list, family or sample")
+
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        Path(str(target) + suffix).unlink(missing_ok=True)
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(target.as_uri(), uri=True)
+    result = SubsetResult()
+    try:
+        apply_bulk_pragmas(conn)
+        conn.execute(f"ATTACH DATABASE ? AS {SOURCE_SCHEMA}", (source.as_uri() + "?mode=ro",))
+        conn.create_function("pfas_family", 1, get_compound_family, deterministic=True)
+        conn.create_function("subset_rank", 2, _rank, deterministic=True)
+
+        objects = _schema_objects(conn)
+        tables, virtual = _create_tables(conn, objects)
+        for required in (COMPOUND_TABLE, PEAK_TABLE):
+            if required not in tables:
+                raise ValueError(f"source has no '{required}' table")
+        plan = _classify(conn, tables)
+        fks = plan["fks"]
+
+        def copy(table: str, where: str = "", params: Sequence = (), dedupe: bool = False) -> int:
+            sql = f"INSERT INTO main.{quote_identifier(table)} SELECT * FROM {_src(table)}"
+            if where:
+                sql += f" WHERE {where}"
+            if dedupe:
+                sql += f" EXCEPT SELECT * FROM main.{quote_identifier(table)}"
+            added = conn.execute(sql, params).rowcount
+            if progress and (added or table not in result.rows):
+                progress(table, result.rows.get(table, 0) + added)
+            result.rows[table] = result.rows.get(table, 0) + added
+            return added
+
+        # 1. Reference tables, whole
+        for table in plan["reference"]:
+            if table in EMPTY_TABLES:
+                result.rows[table] = 0
+            else:
+                copy(table)
+
+        # 2. Compounds, then their peaks
+        links = _peak_links(conn, tables)
+        result.unmatched = _select_compounds(conn, compounds, families, sample, seed, require_peaks, links)
+        copy(COMPOUND_TABLE, "id IN (SELECT id FROM temp.subset_compounds)")
+        links = f"SELECT compound_id, peak_id FROM ({links}) WHERE compound_id IN (SELECT id FROM main.{COMPOUND_TABLE})"
+        params: List = []
+        if max_peaks_per_compound:
+            links = (f"SELECT compound_id, peak_id FROM (SELECT compound_id, peak_id, ROW_NUMBER() OVER "
+                     f"(PARTITION BY compound_id ORDER BY subset_rank(?, peak_id)) AS n FROM ({links})) WHERE n <= ?")
+            params = [seed, int(max_peaks_per_compound)]
+        copy(PEAK_TABLE, f"id IN (SELECT peak_id FROM ({links}))", params)
+
+        # 3. Rows hanging off the kept compounds / peaks (ms_data, ms_spectra, ...)
+        driven = {COMPOUND_TABLE, PEAK_TABLE, *plan["child"]}
+        for table in plan["child"]:
+            keys = [_kept(c, p, pc) for c, p, pc in fks[table] if p in driven and p != table]
+            copy(table, " AND ".join(keys))
+        for table, (column, parent, parent_column) in plan["keyed"].items():
+            copy(table, f"{quote_identifier(column)} IN (SELECT {quote_identifier(parent_column)} FROM main.{quote_identifier(parent)})")
+        result.skipped = list(plan["excluded"])
+        for table in plan["excluded"]:
+            result.rows[table] = 0
+
+        # 4. Parents referenced by copied rows and their details, until nothing is added
+        added = True
+        while added:
+            added = False
+            for parent in plan["parent"]:
+                for table in tables:
+                    for column, ref, ref_column in fks[table]:
+                        if ref != parent or table in plan["reference"]:
+                            continue
+                        added |= copy(parent, (
+                            f"{quote_identifier(ref_column)} IN (SELECT {quote_identifier(column)} FROM main.{quote_identifier(table)}) "
+                            f"AND {quote_identifier(ref_column)} NOT IN (SELECT {quote_identifier(ref_column)} FROM main.{quote_identifier(parent)})"
+                        )) > 0
+            for table in plan["detail"]:
+                keys = [_kept(c, p, pc) for c, p, pc in fks[table]
+                        if p in plan["parent"] or (p in plan["detail"] and p != table)]
+                added |= copy(table, " AND ".join(keys), dedupe=True) > 0
+        conn.commit()
+
+        # 5. Indexes, views and triggers (after the rows, so triggers do not fire)
+        for kind, name, sql in objects:
+            if kind in ("index", "view", "trigger"):
+                conn.execute(sql)
+        for name in virtual:
+            sql = next(s for k, n, s in objects if n == name)
+            if "USING FTS" in sql.upper():
+                conn.execute(f"INSERT INTO main.{quote_identifier(name)}({quote_identifier(name)}) VALUES ('rebuild')")
+        conn.commit()
+
+        for table, *_ in conn.execute("PRAGMA main.foreign_key_check").fetchall():
+            result.fk_violations[table] = result.fk_violations.get(table, 0) + 1
+        conn.execute(f"DETACH DATABASE {SOURCE_SCHEMA}")
+    finally:
+        conn.close()
+    return result
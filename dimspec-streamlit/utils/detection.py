@@ -5,13 +5,18 @@ Handles candidate filtering, similarity calculation, and family prediction.
 """
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from typing import List, Dict, Any, Tuple, Optional
 from utils import data_processing as dp
+from utils import scoring as sc
+from utils import spectral_comparison as scmp
+from utils.library_index import PrecursorIndex
 
 # --- Constants ---
 DEFAULT_MZ_TOLERANCE_PPM = 5.0  # PPM
 DEFAULT_RT_MARGIN = 0.5         # Minutes
 COSINE_SIMILARITY_THRESHOLD = 0.8  # Threshold for "Unknown" tagging
+TOP_N_CANDIDATES = 10              # Candidates kept for classification context
 
 def calculate_similarity(
     input_fp: np.ndarray,
@@ -47,33 +52,72 @@ def generate_fingerprint_vector(
     bin_size: float = 1.0
 ) -> np.ndarray:
     """
-    Wrapper around data_processing binning to return pure numpy array for fast calc.
+    Binned fingerprint as a pure numpy array for fast calc.
     """
-    # Use existing binning logic
-    df_fp = dp.bin_spectrum_fingerprint(
-        mz_list, intensity_list, mz_min, mz_max, bin_size
-    )
+    intensities = dp.bin_spectrum_array(mz_list, intensity_list, mz_min, mz_max, bin_size)
     # Normalize (L2 or Max) - User mentioned Max=1 or Total=1. 
     # Let's use simple Max=1 scaling for now as it's robust for varying concentrations.
-    intensities = df_fp['intensity'].values
     max_val = np.max(intensities) if len(intensities) > 0 else 0
     if max_val > 0:
         return intensities / max_val
     return intensities
 
+def generate_fingerprint_matrix(
+    mz_values: np.ndarray,
+    int_values: np.ndarray,
+    offsets: np.ndarray,
+    mz_min: float = 50.0,
+    mz_max: float = 1200.0,
+    bin_size: float = 1.0
+) -> np.ndarray:
+    """
+    Batch generate_fingerprint_vector: ragged spectra (see dp.pack_ragged) -> one
+    Max=1 normalized fingerprint row per spectrum.
+    """
+    matrix = dp.bin_spectra_batch(mz_values, int_values, offsets, mz_min, mz_max, bin_size)
+    max_vals = matrix.max(axis=1, keepdims=True) if matrix.shape[1] else np.zeros((len(matrix), 1))
+    np.divide(matrix, max_vals, out=matrix, where=max_vals > 0)
+    return matrix
+
+def generate_fingerprint_sparse(
+    mz_values: np.ndarray,
+    int_values: np.ndarray,
+    offsets: np.ndarray,
+    mz_min: float = 50.0,
+    mz_max: float = 1200.0,
+    bin_size: float = 1.0
+) -> sparse.csr_matrix:
+    """
+    generate_fingerprint_matrix as a CSR matrix (Max=1 per row), for library building.
+    """
+    matrix = dp.bin_spectra_sparse(mz_values, int_values, offsets, mz_min, mz_max, bin_size)
+    matrix.eliminate_zeros()
+    if matrix.nnz:
+        row_max = matrix.max(axis=1).toarray().ravel()
+        row_max[row_max <= 0] = 1.0
+        matrix.data /= np.repeat(row_max, np.diff(matrix.indptr))
+    return matrix
+
 def filter_candidates_fast(
     library_df: pd.DataFrame,
     input_mz: float,
     input_rt: float = None,
     mz_tolerance_ppm: float = DEFAULT_MZ_TOLERANCE_PPM,
-    rt_margin: float = DEFAULT_RT_MARGIN
+    rt_margin: float = DEFAULT_RT_MARGIN,
+    index: Optional[PrecursorIndex] = None
 ) -> pd.DataFrame:
     """
     Fast filtering of library based on m/z and RT.
     library_df must have 'precursor_mz' and optionally 'rt_mean'.
+    With a PrecursorIndex built from library_df, the ppm window is a binary search
+    and only the hits are materialized.
     """
     if library_df.empty:
         return library_df
+    
+    if index is not None:
+        positions = index.query(input_mz, input_rt, mz_tolerance_ppm, rt_margin)
+        return library_df.iloc[positions]
         
     # 1. m/z Filter (PPM)
     # abs(measured - theoretical) / theoretical * 1e6 <= ppm
@@ -134,6 +178,24 @@ def predict_family_rule_based(
         
     return "Unknown", 0.0
 
+def default_similarity_engine(library_df: pd.DataFrame) -> Optional[sc.SimilarityEngine]:
+    """
+    Engine to score a library_df passed without one: None if it carries dense
+    'fingerprint' vectors, the app library's engine if it is load_library_data()
+    output ('fp_row' column). Anything else cannot be scored (ValueError).
+    """
+    if 'fingerprint' in library_df.columns:
+        return None
+    if 'fp_row' not in library_df.columns:
+        raise ValueError(
+            "scoring spectra needs an engine (pfas_library.load_similarity_engine), a matcher "
+            "(pfas_library.load_accurate_mass_matcher), a 'fingerprint' column or load_library_data() rows"
+        )
+    from utils import pfas_library
+
+    return pfas_library.load_similarity_engine()
+
+
 def analyze_peak(
     library_df: pd.DataFrame,
     input_mz: float,
@@ -141,40 +203,68 @@ def analyze_peak(
     spectrum_mz: List[float] = None,
     spectrum_int: List[float] = None,
     mz_tolerance: float = DEFAULT_MZ_TOLERANCE_PPM,
-    rt_margin: float = DEFAULT_RT_MARGIN
+    rt_margin: float = DEFAULT_RT_MARGIN,
+    engine: Optional[sc.SimilarityEngine] = None,
+    index: Optional[PrecursorIndex] = None,
+    top_k: int = TOP_N_CANDIDATES,
+    matcher: Optional[scmp.AccurateMassMatcher] = None
 ) -> Dict[str, Any]:
     """
     Main Pipeline: Filter -> Rank -> Classify -> Tag Unknown
+    
+    Args:
+        engine: Library fingerprint matrix (pfas_library.load_similarity_engine).
+                Without it (or a matcher), load_library_data() rows are scored with
+                the app library's engine and a dense 'fingerprint' column by stacking
+                the candidate rows per call; any other library_df raises ValueError
+                for a spectrum rather than ranking every candidate at similarity 0.
+        index: Sorted precursor index (pfas_library.load_precursor_index)
+        top_k: Number of ranked candidates returned and used for classification
+        matcher: Library peak lists (pfas_library.load_accurate_mass_matcher). When
+                 given, candidates are scored by ppm-paired dot product instead of
+                 binned cosine: 'similarity' is dp, 'reverse_similarity' rdp.
     """
     # 1. Filter Candidates
     candidates = filter_candidates_fast(
-        library_df, input_mz, input_rt, mz_tolerance, rt_margin
+        library_df, input_mz, input_rt, mz_tolerance, rt_margin, index=index
     )
+    has_spectrum = spectrum_mz is not None and spectrum_int is not None and len(spectrum_mz) > 0
     
     # 2. Rank by Similarity (if spectrum provided)
     # If no spectrum, rank by mass error
-    candidates['similarity'] = 0.0
-    candidates['mz_error_ppm'] = np.abs(candidates['precursor_mz'] - input_mz) / candidates['precursor_mz'] * 1e6
+    precursor = candidates['precursor_mz'].to_numpy(dtype=np.float64)
+    mz_error_ppm = np.abs(precursor - input_mz) / precursor * 1e6
+    similarity = np.zeros(len(candidates), dtype=np.float64)
+    reverse = None
     
-    if spectrum_mz and spectrum_int and len(spectrum_mz) > 0:
-        # Generate input fingerprint
-        input_fp = generate_fingerprint_vector(spectrum_mz, spectrum_int)
-        
-        # Calculate similarity for each candidate
-        def calc_sim_row(row):
-            if row['fingerprint'] is not None:
-                return calculate_similarity(input_fp, row['fingerprint'])
-            return 0.0
-            
-        candidates['similarity'] = candidates.apply(calc_sim_row, axis=1)
-        # Sort by similarity desc, then mass error asc
-        candidates = candidates.sort_values(by=['similarity', 'mz_error_ppm'], ascending=[False, True])
+    if has_spectrum and not candidates.empty and matcher is not None:
+        # Pair ions of all candidates by accurate mass in one pass
+        similarity, reverse = matcher.score(spectrum_mz, spectrum_int, sc.library_rows(library_df, candidates))
+        order = sc.top_k_order(similarity, mz_error_ppm, top_k)
+    elif has_spectrum and not candidates.empty:
+        # Score all candidates with one matrix-vector product
+        if engine is None:
+            engine = default_similarity_engine(library_df)
+        if engine is not None:
+            rows = sc.library_rows(library_df, candidates)
+        else:
+            engine = sc.SimilarityEngine.from_fingerprints(candidates['fingerprint'])
+            rows = np.arange(len(candidates))
+        # Generate input fingerprint with the library's binning
+        input_fp = generate_fingerprint_vector(spectrum_mz, spectrum_int, **engine.bin_params)
+        similarity = engine.score(input_fp, rows)
+        # Similarity desc, then mass error asc
+        order = sc.top_k_order(similarity, mz_error_ppm, top_k)
     else:
-        # Sort by mass error only
-        candidates = candidates.sort_values(by=['mz_error_ppm'], ascending=True)
+        # Mass error only
+        order = sc.top_k_order(-mz_error_ppm, np.zeros(len(candidates)), top_k)
         
     # Limit Top-N for downstream classification
-    top_n = candidates.head(10) # take top 10 for prediction context
+    top_n = candidates.iloc[order].copy()
+    top_n['similarity'] = similarity[order]
+    if reverse is not None:
+        top_n['reverse_similarity'] = reverse[order]
+    top_n['mz_error_ppm'] = mz_error_ppm[order]
     
     # 3. Classify (Rule Based)
     predicted_class, class_conf = predict_family_rule_based(top_n)
@@ -188,7 +278,7 @@ def analyze_peak(
     is_unknown = False
     status_label = "Confirmed Match"
     
-    if spectrum_mz:
+    if has_spectrum:
         # Spectrum mode
         best_sim = top_n.iloc[0]['similarity'] if not top_n.empty else 0.0
         if best_sim < COSINE_SIMILARITY_THRESHOLD:
@@ -0,0 +1,254 @@
+"""
+Streaming Export
+Writes whole tables or query results to CSV, gzipped CSV, Parquet or XLSX chunk by
+chunk, so exporting ms_data or peaks never needs the full result in memory.
+"""
+import gzip
+import io
+import sqlite3
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from utils import data_processing as dp
+from utils import database as db
+from utils.common import quote_identifier
+from utils.schema_catalog import get_catalog
+
+EXPORT_CHUNK_SIZE = 50000
+EXCEL_MAX_ROWS = 1_048_576  # per sheet, including the header row
+
+# Format -> (file suffix, MIME type)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "xlsx": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+Destination = Union[str, Path, BinaryIO]
+
+
+def export_format_for(path: Union[str, Path]) -> str:
+    """Export format implied by a file name (defaults to csv)."""
+    name = str(path).lower()
+    for fmt, (suffix, _) in sorted(EXPORT_FORMATS.items(), key=lambda kv: -len(kv[1][0])):
+        if name.endswith(suffix):
+            return fmt
+    return "csv"
+
+
+# ============================================================================
+# Readers
+# ============================================================================
+
+def iter_query_chunks(
+    conn: sqlite3.Connection,
+    query: str,
+    params: Optional[Sequence[Any]] = None,
+    chunksize: int = EXPORT_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """Run a query and yield its result as DataFrames of at most chunksize rows."""
+    yield from pd.read_sql_query(query, conn, params=params, chunksize=chunksize)
+
+
+def iter_table_chunks(
+    conn: sqlite3.Connection,
+    table_name: str,
+    chunksize: int = EXPORT_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield a whole table or view in chunks. Tables are read in key order
+    (keyset pages), views with a single streaming cursor.
+    """
+    if db.get_seek_columns(conn, table_name) is None:
+        yield from iter_query_chunks(conn, f"SELECT * FROM {quote_identifier(table_name)}", chunksize=chunksize)
+        return
+    cursor = None
+    while True:
+        page, cursor = db.get_table_page(conn, table_name, limit=chunksize, after=cursor)
+        if len(page):
+            yield page
+        if cursor is None:
+            break
+
+
+# ============================================================================
+# Writers
+# ============================================================================
+
+def _open_binary(dest: Destination, mode: str = "wb"):
+    """(file object, should_close) for a path or an already open binary stream."""
+    if isinstance(dest, (str, Path)):
+        return open(dest, mode), True
+    return dest, False
+
+
+def _write_csv(chunks: Iterable[pd.DataFrame], out: BinaryIO, compress: bool, on_chunk) -> int:
+    raw = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    rows = 0
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk = dp.format_for_export(chunk, copy=False)
+            chunk.to_csv(text, index=False, header=(i == 0))
+            rows += len(chunk)
+            on_chunk(rows)
+        text.flush()
+    finally:
+        # Detach so closing the wrapper does not close the caller's stream
+        text.detach()
+        if compress:
+            raw.close()
+    return rows
+
+
+def _arrow_schema(first: pd.DataFrame, column_types: Optional[Dict[str, str]]):
+    """Parquet schema: SQLite declared types where known, else inferred from the first chunk."""
+    import pyarrow as pa
+
+    def declared(col: str):
+        decl = (column_types or {}).get(col, "").upper()
+        if "INT" in decl:
+            return pa.int64()
+        if any(t in decl for t in ("REAL", "FLOA", "DOUB")):
+            return pa.float64()
+        if any(t in decl for t in ("CHAR", "CLOB", "TEXT")):
+            return pa.string()
+        if "BLOB" in decl:
+            return pa.binary()
+        return None
+
+    inferred = pa.Schema.from_pandas(first, preserve_index=False)
+    fields = []
+    for field in inferred:
+        arrow_type = declared(field.name) or field.type
+        if pa.types.is_null(arrow_type):
+            # All NULL in the first chunk: strings are the safe container
+            arrow_type = pa.string()
+        fields.append(pa.field(field.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _write_parquet(
+    chunks: Iterable[pd.DataFrame],
+    out: BinaryIO,
+    column_types: Optional[Dict[str, str]],
+    on_chunk
+) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)") from e
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = _arrow_schema(chunk, column_types)
+                writer = pq.ParquetWriter(out, schema)
+            # SQLite columns are loosely typed; stringify strays in string columns
+            for field in schema:
+                if pa.types.is_string(field.type) and chunk[field.name].dtype == object:
+                    col = chunk[field.name]
+                    chunk[field.name] = col.where(col.isna(), col.astype(str))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+            on_chunk(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def _write_xlsx(chunks: Iterable[pd.DataFrame], out: BinaryIO, on_chunk) -> int:
+    from openpyxl import Workbook
+
+    # write_only keeps just the current row in memory; rows stream to a temp file
+    wb = Workbook(write_only=True)
+    ws = None
+    sheet_rows = 0
+    header: List[str] = []
+    rows = 0
+    for chunk in chunks:
+        chunk = dp.format_for_export(chunk, copy=False)
+        if not header:
+            header = [str(c) for c in chunk.columns]
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if ws is None or sheet_rows >= EXCEL_MAX_ROWS:
+                # Excel caps a sheet at ~1M rows: continue on a new sheet
+                ws = wb.create_sheet(f"Sheet{len(wb.worksheets) + 1}")
+                ws.append(header)
+                sheet_rows = 1
+            ws.append([v.item() if isinstance(v, np.generic) else v for v in row])
+            sheet_rows += 1
+        rows += len(chunk)
+        on_chunk(rows)
+    if ws is None:
+        wb.create_sheet("Sheet1")
+    wb.save(out)
+    return rows
+
+
+def write_chunks(
+    chunks: Iterable[pd.DataFrame],
+    dest: Destination,
+    fmt: str = "csv",
+    column_types: Optional[Dict[str, str]] = None,
+    progress: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Write DataFrame chunks to dest incrementally.
+
+    Args:
+        chunks: Iterable of DataFrames with identical columns
+        dest: File path or writable binary stream
+        fmt: One of EXPORT_FORMATS
+        column_types: Declared SQLite column types (used for the Parquet schema)
+        progress: Called with the running row count after each chunk
+
+    Returns:
+        Number of rows written
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}' (choose from {list(EXPORT_FORMATS)})")
+    on_chunk = progress or (lambda n: None)
+    out, should_close = _open_binary(dest)
+    try:
+        if fmt in ("csv", "csv.gz"):
+            return _write_csv(chunks, out, fmt == "csv.gz", on_chunk)
+        if fmt == "parquet":
+            return _write_parquet(chunks, out, column_types, on_chunk)
+        return _write_xlsx(chunks, out, on_chunk)
+    finally:
+        if should_close:
+            out.close()
+
+
+def export_table(
+    conn: sqlite3.Connection,
+    table_name: str,
+    dest: Destination,
+    fmt: Optional[str] = None,
+    chunksize: int = EXPORT_CHUNK_SIZE,
+    progress: Optional[Callable[[int], None]] = None
+) -> int:
+    """
+    Stream a whole table or view to a file (format from fmt or the file name).
+    Memory use is bounded by chunksize rows.
+
+    Returns:
+        Number of rows written
+    """
+    if fmt is None:
+        fmt = export_format_for(dest) if isinstance(dest, (str, Path)) else "csv"
+    column_types = get_catalog(conn).column_types(table_name)
+    return write_chunks(
+        iter_table_chunks(conn, table_name, chunksize), dest, fmt,
+        column_types=column_types, progress=progress
+    )
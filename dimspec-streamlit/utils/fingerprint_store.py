@@ -0,0 +1,615 @@
+"""
+Persistent Library Fingerprint Store
+Keeps the binned reference fingerprints on disk as a memory-mapped sparse (CSR)
+matrix plus an id index, keyed to the database contents so restarts (and extra server replicas)
+open the library without re-binning every spectrum. Compounds with stored consensus
+spectra (see utils/ums.py) are fingerprinted from those, pooled over their peaks.
+The unbinned peak lists of the same spectra are kept alongside (packed, one ragged
+row per compound) for accurate-mass matching.
+Every write goes to a new version directory that a pointer file then names, so
+readers in other processes see either the old or the new store, never a mix.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from utils import database as db
+from utils import data_processing as dp
+from utils import detection as det
+from utils import spectral_comparison as scmp
+from utils import ums
+from utils.common import connect_readonly, pool_workers
+from utils.config import BASE_DIR, FINGERPRINT_BIN_SIZE
+
+# Bump when the fingerprint definition or layout changes so existing artifacts are rebuilt.
+STORE_FORMAT_VERSION = 6
+FINGERPRINT_PARAMS = {"mz_min": 50.0, "mz_max": 1200.0, "bin_size": FINGERPRINT_BIN_SIZE}
+FINGERPRINT_DTYPE = np.float32
+
+# Stored as CSR: spectra have a few dozen peaks against 1000+ bins.
+CACHE_DIR = BASE_DIR / "data" / "cache"
+DATA_FILE = "fp_data.npy"
+INDICES_FILE = "fp_indices.npy"
+INDPTR_FILE = "fp_indptr.npy"
+IDS_FILE = "compound_ids.npy"
+SOURCES_FILE = "sources.npy"
+PEAK_MZ_FILE = "peak_mz.npy"
+PEAK_INT_FILE = "peak_int.npy"
+PEAK_OFFSETS_FILE = "peak_offsets.npy"
+META_FILE = "meta.json"
+# Each write goes to a new version directory; this file names the current one.
+POINTER_FILE = "CURRENT"
+VERSION_PREFIX = "v-"       # + publish time (fixed-width hex ns)
+STAGING_PREFIX = "tmp-"     # version being written
+STAGING_MAX_AGE_S = 3600    # staging directories older than this were abandoned
+VERSION_GRACE_S = 60        # a version published this recently may still be being opened
+
+PARALLEL_MIN_SPECTRA = 2000
+FETCH_CHUNK = 500
+
+# Per-compound source row: (representative ms_data id, highest peak_ums id,
+# number of peak_ums rows, checksum of the representative scan's spectrum text)
+SOURCE_COLUMNS = 4
+
+
+@dataclass
+class FingerprintStore:
+    """
+    Fingerprint CSR matrix (one row per compound) with its compound id index and
+    the source each fingerprint was binned from (SOURCE_COLUMNS per row, see
+    select_library_spectra).
+    Row i's peak list is peak_mz/peak_int[peak_offsets[i]:peak_offsets[i+1]], sorted
+    by m/z with intensities summing to 1 (see spectral_comparison.pack_spectra).
+    """
+    compound_ids: np.ndarray
+    sources: np.ndarray
+    matrix: sparse.csr_matrix
+    key: Dict[str, Any]
+    peak_mz: np.ndarray
+    peak_int: np.ndarray
+    peak_offsets: np.ndarray
+
+    def row_map(self) -> Dict[int, int]:
+        """compound_id -> matrix row."""
+        return {int(cid): i for i, cid in enumerate(self.compound_ids)}
+
+
+def n_bins(params: Dict[str, float] = FINGERPRINT_PARAMS) -> int:
+    return len(np.arange(params["mz_min"], params["mz_max"] + params["bin_size"], params["bin_size"])) - 1
+
+
+def fingerprint_spectra(
+    mz_arrays: List[np.ndarray],
+    int_arrays: List[np.ndarray],
+    params: Dict[str, float] = FINGERPRINT_PARAMS
+) -> sparse.csr_matrix:
+    """Binned, max-normalized (Max=1) fingerprints of many spectra, one CSR row each."""
+    mz_values, offsets = dp.pack_ragged(mz_arrays)
+    int_values, _ = dp.pack_ragged(int_arrays)
+    return det.generate_fingerprint_sparse(mz_values, int_values, offsets, **params)
+
+
+# ============================================================================
+# Keying / Invalidation
+# ============================================================================
+
+def select_library_spectra(conn: sqlite3.Connection) -> Dict[str, np.ndarray]:
+    """
+    Pick the spectrum source of each compound: its MS1 consensus spectra (peak_ums)
+    when any are stored, else a representative ms_data row (lowest ms_data id).
+    Peaks are tied to compounds by database.compound_peak_links.
+
+    Returns:
+        compound_ids ordered by compound id, and sources: (n, SOURCE_COLUMNS) int64
+        rows of (representative ms_data id, highest peak_ums id or -1, peak_ums row
+        count, spectrum checksum). A source changes whenever a compound gains or
+        loses spectra or its representative scan is edited in place (peak_ums rows
+        are re-inserted under new ids by their triggers when their scans change).
+    """
+    links = db.compound_peak_links(conn)
+    if links is None:
+        return {"compound_ids": np.empty(0, np.int64), "sources": np.empty((0, SOURCE_COLUMNS), np.int64)}
+    ums_join = ""
+    ums_cols = "-1, 0"
+    if ums.has_ums_table(conn):
+        ums_join = f"""
+        LEFT JOIN (
+            SELECT l.compound_id, MAX(u.id) AS max_id, COUNT(*) AS n
+            FROM {ums.UMS_TABLE} u JOIN ({links}) l ON l.peak_id = u.peak_id
+            WHERE u.ms_n = 1 AND u.n_ions > 0
+            GROUP BY l.compound_id
+        ) u ON u.compound_id = r.compound_id
+        """
+        ums_cols = "COALESCE(u.max_id, -1), COALESCE(u.n, 0)"
+    conn.create_function("spectrum_checksum", 2, spectrum_checksum, deterministic=True)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT r.compound_id, r.ms_data_id, {ums_cols},
+               spectrum_checksum(m.measured_mz, m.measured_intensity)
+        FROM (
+            SELECT l.compound_id, MIN(m.id) AS ms_data_id
+            FROM ({links}) l
+            JOIN ms_data m ON l.peak_id = m.peak_id
+            GROUP BY l.compound_id
+        ) r
+        JOIN ms_data m ON m.id = r.ms_data_id
+        {ums_join}
+        ORDER BY r.compound_id
+    """)
+    rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, SOURCE_COLUMNS + 1)
+    return {"compound_ids": rows[:, 0].copy(), "sources": rows[:, 1:].copy()}
+
+
+def spectrum_checksum(mz_text: Any, intensity_text: Any) -> int:
+    """Signed 64-bit digest of an ms_data row's measured_mz / measured_intensity."""
+    digest = hashlib.blake2b(digest_size=8)
+    for value in (mz_text, intensity_text):
+        digest.update(value if isinstance(value, bytes) else str(value).encode("utf-8"))
+        digest.update(b"\0")
+    return int.from_bytes(digest.digest(), "little", signed=True)
+
+
+def compute_store_key(
+    conn: sqlite3.Connection,
+    selection: Dict[str, np.ndarray],
+    params: Dict[str, float] = FINGERPRINT_PARAMS
+) -> Dict[str, Any]:
+    """
+    Key identifying the database state an artifact was built from.
+    The content hash covers which spectra represent each compound and the
+    checksum of each representative scan's spectrum.
+    """
+    cursor = conn.cursor()
+    schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+    max_ms_data_id = cursor.execute("SELECT MAX(id) FROM ms_data").fetchone()[0]
+    packed = db.has_packed_spectra(conn)
+
+    digest = hashlib.sha1()
+    digest.update(selection["compound_ids"].tobytes())
+    digest.update(np.ascontiguousarray(selection["sources"]).tobytes())
+    return {
+        "format_version": STORE_FORMAT_VERSION,
+        "params": params,
+        "schema_version": schema_version,
+        "max_ms_data_id": max_ms_data_id,
+        "packed_source": packed,
+        "content_hash": digest.hexdigest(),
+    }
+
+
+def store_dir_for(db_path: Path, cache_dir: Path = CACHE_DIR) -> Path:
+    """Artifact directory for a database file (one per resolved path)."""
+    db_path = Path(db_path).resolve()
+    tag = hashlib.sha1(str(db_path).encode("utf-8")).hexdigest()[:10]
+    return Path(cache_dir) / f"{db_path.stem}-{tag}"
+
+
+def current_version_dir(store_dir: Path) -> Optional[Path]:
+    """Version directory the pointer file names; None if there is none yet."""
+    try:
+        name = (Path(store_dir) / POINTER_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if not name.startswith(VERSION_PREFIX) or Path(name).name != name:
+        return None
+    return Path(store_dir) / name
+
+
+def read_store_meta(version_dir: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(Path(version_dir) / META_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ============================================================================
+# Build / Load
+# ============================================================================
+
+def _spectrum_query(packed: bool, n_ids: int) -> str:
+    placeholders = ",".join("?" * n_ids)
+    if packed:
+        return f"""
+        SELECT m.id, pk.dtype,
+               CASE WHEN pk.ms_data_id IS NULL THEN m.measured_mz ELSE pk.mz END,
+               CASE WHEN pk.ms_data_id IS NULL THEN m.measured_intensity ELSE pk.intensity END
+        FROM ms_data m
+        LEFT JOIN {db.PACKED_SPECTRA_TABLE} pk ON pk.ms_data_id = m.id
+        WHERE m.id IN ({placeholders})
+        """
+    return f"""
+    SELECT id, NULL, measured_mz, measured_intensity
+    FROM ms_data WHERE id IN ({placeholders})
+    """
+
+
+def _ums_query(links: str, n_ids: int) -> str:
+    return f"""
+    SELECT l.compound_id, u.id, u.n_scans, u.mz, u.mz_u, u.intensity, u.intensity_u, u.n
+    FROM {ums.UMS_TABLE} u
+    JOIN ({links}) l ON l.peak_id = u.peak_id
+    WHERE u.ms_n = 1 AND u.n_ions > 0 AND l.compound_id IN ({",".join("?" * n_ids)})
+    ORDER BY l.compound_id, u.id
+    """
+
+
+def _fingerprint_rows(
+    db_path: str,
+    compound_ids: List[int],
+    sources: List[Tuple[int, ...]],
+    packed: bool,
+    params: Dict[str, float]
+) -> Tuple[sparse.csr_matrix, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Worker: fingerprint a block of compounds into a CSR block (one row per compound,
+    empty where no spectrum could be read) plus their packed peak lists. Compounds
+    with consensus spectra use their pooled UMS, the rest their representative
+    ms_data row.
+    """
+    conn = connect_readonly(db_path)
+    mz_arrays: List[np.ndarray] = [np.empty(0)] * len(compound_ids)
+    int_arrays: List[np.ndarray] = [np.empty(0)] * len(compound_ids)
+    try:
+        consensus = [i for i, src in enumerate(sources) if src[2] > 0]
+        links = db.compound_peak_links(conn) if consensus else None
+        for start in range(0, len(consensus), FETCH_CHUNK):
+            chunk = consensus[start:start + FETCH_CHUNK]
+            position = {compound_ids[i]: i for i in chunk}
+            spectra: Dict[int, List[Any]] = {}
+            cursor = conn.execute(_ums_query(links, len(chunk)), list(position))
+            for cid, ums_id, *row in cursor:
+                if ums_id <= sources[position[cid]][1]:
+                    spectra.setdefault(cid, []).append(ums.ums_from_row(row))
+            for cid, ums_list in spectra.items():
+                pooled = ums.pool_ums(ums_list)
+                mz_arrays[position[cid]] = pooled["mz"].to_numpy()
+                int_arrays[position[cid]] = pooled["int"].to_numpy()
+
+        single = [i for i, src in enumerate(sources) if src[2] == 0]
+        for start in range(0, len(single), FETCH_CHUNK):
+            rows = single[start:start + FETCH_CHUNK]
+            position = {sources[i][0]: i for i in rows}
+            chunk = list(position)
+            cursor = conn.execute(_spectrum_query(packed, len(chunk)), chunk)
+            for ms_id, dtype, mz_raw, int_raw in cursor:
+                try:
+                    if dtype is not None:
+                        mz = db.unpack_array(mz_raw, dtype)
+                        inten = db.unpack_array(int_raw, dtype)
+                    else:
+                        mz = db.parse_spectrum_text(mz_raw)
+                        inten = db.parse_spectrum_text(int_raw)
+                except ValueError:
+                    continue
+                if len(mz) != len(inten):
+                    continue
+                mz_arrays[position[ms_id]] = mz
+                int_arrays[position[ms_id]] = inten
+    finally:
+        conn.close()
+    peaks = scmp.pack_spectra(list(zip(mz_arrays, int_arrays)))
+    return fingerprint_spectra(mz_arrays, int_arrays, params), peaks
+
+
+def _save_array(path: Path, values: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.save(f, values)
+
+
+def build_fingerprint_store(
+    conn: sqlite3.Connection,
+    db_path: Path,
+    cache_dir: Path = CACHE_DIR,
+    workers: Optional[int] = None,
+    selection: Optional[Dict[str, np.ndarray]] = None,
+    key: Optional[Dict[str, Any]] = None,
+    params: Dict[str, float] = FINGERPRINT_PARAMS
+) -> FingerprintStore:
+    """
+    Fingerprint every library spectrum and write the artifact atomically.
+
+    Args:
+        conn: Connection used to select spectra and compute the key
+        db_path: Database file (workers open their own connections to it)
+        cache_dir: Root directory for artifacts
+        workers: Process count; None uses all cores for large libraries, 1 stays in-process
+        params: Binning (mz_min, mz_max, bin_size)
+    """
+    if selection is None:
+        selection = select_library_spectra(conn)
+    if key is None:
+        key = compute_store_key(conn, selection, params)
+
+    matrix, peaks = _fingerprint_selection(
+        db_path, selection["compound_ids"], selection["sources"], key, workers, params
+    )
+    return _write_store(
+        store_dir_for(db_path, cache_dir), selection["compound_ids"], selection["sources"], matrix, peaks, key
+    )
+
+
+def _fingerprint_selection(
+    db_path: Path,
+    compound_ids: np.ndarray,
+    sources: np.ndarray,
+    key: Dict[str, Any],
+    workers: Optional[int],
+    params: Dict[str, float]
+) -> Tuple[sparse.csr_matrix, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Fingerprint the given compounds (in order), in parallel for large batches."""
+    compound_ids = np.asarray(compound_ids).tolist()
+    sources = [tuple(src) for src in np.asarray(sources).reshape(-1, SOURCE_COLUMNS).tolist()]
+    n = len(compound_ids)
+    workers = pool_workers(n, PARALLEL_MIN_SPECTRA, workers)
+    db_file = str(Path(db_path).resolve())
+    packed = key["packed_source"]
+
+    if workers > 1 and n > 0:
+        block = -(-n // workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_fingerprint_rows, db_file, compound_ids[s:s + block], sources[s:s + block],
+                            packed, params)
+                for s in range(0, n, block)
+            ]
+            blocks = [f.result() for f in futures]
+        matrix = sparse.vstack([m for m, _ in blocks], format="csr")
+        peaks = _concat_peaks([p for _, p in blocks])
+    else:
+        matrix, peaks = _fingerprint_rows(db_file, compound_ids, sources, packed, params)
+    return _as_store_csr(matrix, n, n_bins(params)), peaks
+
+
+def _concat_peaks(parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Concatenate packed peak lists (mz, intensity, offsets) row-wise."""
+    offsets = [np.zeros(1, dtype=np.int64)]
+    base = 0
+    for _, _, part_offsets in parts:
+        offsets.append(base + part_offsets[1:])
+        base += part_offsets[-1]
+    return (
+        np.concatenate([np.empty(0, dtype=np.float64)] + [mz for mz, _, _ in parts]),
+        np.concatenate([np.empty(0, dtype=np.float64)] + [inten for _, inten, _ in parts]),
+        np.concatenate(offsets).astype(np.int64),
+    )
+
+
+def _switch_version(store_dir: Path, name: str) -> None:
+    """Point readers at version `name` with one atomic file replace."""
+    tmp = store_dir / f"{POINTER_FILE}.{uuid.uuid4().hex}"
+    tmp.write_text(name, encoding="utf-8")
+    for attempt in range(5):
+        try:
+            os.replace(tmp, store_dir / POINTER_FILE)
+            return
+        except PermissionError:
+            # Windows: a reader has the pointer open for a moment
+            if attempt == 4:
+                tmp.unlink(missing_ok=True)
+                raise
+            time.sleep(0.05)
+
+
+def _published_at(name: str) -> float:
+    """Publish time (epoch seconds) encoded in a version directory name; 0 if unreadable."""
+    try:
+        return int(name[len(VERSION_PREFIX):len(VERSION_PREFIX) + 16], 16) / 1e9
+    except ValueError:
+        return 0.0
+
+
+def _remove_old_versions(store_dir: Path, keep: Tuple[str, ...]) -> None:
+    """
+    Delete versions other than `keep` (the one just written and the one it
+    replaced, which a reader may still be opening) and whatever the pointer names
+    now (another writer may have switched it since), once they are older than
+    VERSION_GRACE_S; also abandoned staging directories. Files another snapshot
+    still memory-maps cannot be deleted on Windows; they stay until a later write.
+    """
+    current = current_version_dir(store_dir)
+    keep = set(keep) | ({current.name} if current is not None else set())
+    now = time.time()
+    for path in store_dir.iterdir():
+        if not path.is_dir():
+            continue
+        if path.name.startswith(VERSION_PREFIX) and path.name not in keep:
+            if now - _published_at(path.name) > VERSION_GRACE_S:
+                shutil.rmtree(path, ignore_errors=True)
+        elif path.name.startswith(STAGING_PREFIX):
+            try:
+                abandoned = now - path.stat().st_mtime > STAGING_MAX_AGE_S
+            except OSError:
+                continue
+            if abandoned:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_store(
+    store_dir: Path,
+    compound_ids: np.ndarray,
+    sources: np.ndarray,
+    matrix: sparse.csr_matrix,
+    peaks: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    key: Dict[str, Any]
+) -> FingerprintStore:
+    """
+    Write the artifact into a new version directory, switch the pointer file to it
+    and reopen it memory-mapped. A version is never modified once written, so a
+    reader always sees one complete version, and files a snapshot maps are never
+    replaced underneath it.
+    """
+    store_dir.mkdir(parents=True, exist_ok=True)
+    suffix = uuid.uuid4().hex[:8]
+    staging_dir = store_dir / f"{STAGING_PREFIX}{suffix}"
+    staging_dir.mkdir()
+    n = matrix.shape[0]
+    arrays = {
+        DATA_FILE: matrix.data,
+        INDICES_FILE: matrix.indices,
+        INDPTR_FILE: matrix.indptr,
+        IDS_FILE: np.asarray(compound_ids, dtype=np.int64),
+        SOURCES_FILE: np.asarray(sources, dtype=np.int64).reshape(-1, SOURCE_COLUMNS),
+        PEAK_MZ_FILE: np.asarray(peaks[0], dtype=np.float64),
+        PEAK_INT_FILE: np.asarray(peaks[1], dtype=np.float64),
+        PEAK_OFFSETS_FILE: np.asarray(peaks[2], dtype=np.int64),
+    }
+    for name, values in arrays.items():
+        _save_array(staging_dir / name, values)
+    with open(staging_dir / META_FILE, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "rows": n, "n_bins": matrix.shape[1], "nnz": int(matrix.nnz)}, f, indent=2)
+
+    previous = current_version_dir(store_dir)
+    version_dir = store_dir / f"{VERSION_PREFIX}{time.time_ns():016x}-{suffix}"
+    os.replace(staging_dir, version_dir)
+    store = open_fingerprint_store(version_dir, key)
+    _switch_version(store_dir, version_dir.name)
+    _remove_old_versions(store_dir, keep=(version_dir.name,) + ((previous.name,) if previous else ()))
+    return store
+
+
+def _as_store_csr(matrix: sparse.spmatrix, n_rows: int, n_cols: int) -> sparse.csr_matrix:
+    """Canonical CSR with the on-disk dtypes (float32 data, shared index dtype)."""
+    matrix = sparse.csr_matrix(matrix, shape=(n_rows, n_cols))
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    return sparse.csr_matrix(
+        (matrix.data.astype(FINGERPRINT_DTYPE),
+         matrix.indices.astype(index_dtype),
+         matrix.indptr.astype(index_dtype)),
+        shape=(n_rows, n_cols)
+    )
+
+
+def open_fingerprint_store(version_dir: Path, key: Dict[str, Any]) -> FingerprintStore:
+    """Memory-map one version of an artifact (no validation beyond shape)."""
+    version_dir = Path(version_dir)
+    meta = read_store_meta(version_dir) or {}
+    compound_ids = np.load(version_dir / IDS_FILE)
+    sources = np.load(version_dir / SOURCES_FILE)
+    matrix = sparse.csr_matrix(
+        (np.load(version_dir / DATA_FILE, mmap_mode="r"),
+         np.load(version_dir / INDICES_FILE, mmap_mode="r"),
+         np.load(version_dir / INDPTR_FILE, mmap_mode="r")),
+        shape=(len(compound_ids), meta.get("n_bins", n_bins(key["params"]))),
+        copy=False
+    )
+    return FingerprintStore(
+        compound_ids=compound_ids, sources=sources, matrix=matrix, key=key,
+        peak_mz=np.load(version_dir / PEAK_MZ_FILE, mmap_mode="r"),
+        peak_int=np.load(version_dir / PEAK_INT_FILE, mmap_mode="r"),
+        peak_offsets=np.load(version_dir / PEAK_OFFSETS_FILE),
+    )
+
+
+def load_fingerprint_store(
+    conn: sqlite3.Connection,
+    db_path: Path,
+    cache_dir: Path = CACHE_DIR,
+    workers: Optional[int] = None,
+    force: bool = False,
+    params: Dict[str, float] = FINGERPRINT_PARAMS
+) -> FingerprintStore:
+    """
+    Open the on-disk fingerprint artifact for a database, rebuilding it when stale.
+    """
+    selection = select_library_spectra(conn)
+    key = compute_store_key(conn, selection, params)
+    version_dir = current_version_dir(store_dir_for(db_path, cache_dir))
+
+    if not force and version_dir is not None:
+        meta = read_store_meta(version_dir)
+        if meta and meta.get("key") == json.loads(json.dumps(key)):
+            try:
+                return open_fingerprint_store(version_dir, key)
+            except (OSError, ValueError):
+                pass
+        if meta and _can_update(meta.get("key"), key):
+            # Stale but compatible: only bin the spectra that are new or changed
+            try:
+                previous = open_fingerprint_store(version_dir, meta["key"])
+                return update_fingerprint_store(
+                    conn, db_path, previous, cache_dir, workers=workers, selection=selection, key=key
+                )[0]
+            except (OSError, ValueError, KeyError):
+                pass
+    return build_fingerprint_store(
+        conn, db_path, cache_dir, workers=workers, selection=selection, key=key, params=params
+    )
+
+
+def _can_update(old_key: Optional[Dict[str, Any]], new_key: Dict[str, Any]) -> bool:
+    """An artifact can be updated in place if it was binned the same way."""
+    if not old_key:
+        return False
+    return (old_key.get("format_version") == new_key["format_version"]
+            and old_key.get("params") == json.loads(json.dumps(new_key["params"])))
+
+
+def update_fingerprint_store(
+    conn: sqlite3.Connection,
+    db_path: Path,
+    store: FingerprintStore,
+    cache_dir: Path = CACHE_DIR,
+    workers: Optional[int] = None,
+    selection: Optional[Dict[str, np.ndarray]] = None,
+    key: Optional[Dict[str, Any]] = None
+) -> Tuple[FingerprintStore, np.ndarray]:
+    """
+    Bring an existing store up to date by fingerprinting only the compounds whose
+    spectrum source is new or changed (see select_library_spectra), including
+    representative scans edited in place; other rows are copied. Consensus rows
+    edited by hand (not through ms_data) are not detected; rebuild with
+    force=True after such edits.
+
+    Returns:
+        (store, kept_rows): rows of the old store that were kept, in order; they
+        form the first len(kept_rows) rows of the new store, followed by the
+        newly fingerprinted compounds in compound id order.
+    """
+    params = store.key["params"]
+    if selection is None:
+        selection = select_library_spectra(conn)
+    if key is None:
+        key = compute_store_key(conn, selection, params)
+    if key == store.key:
+        return store, np.arange(len(store.compound_ids))
+
+    old_sources = dict(zip(store.compound_ids.tolist(), map(tuple, store.sources.tolist())))
+    new_sources = dict(zip(selection["compound_ids"].tolist(), map(tuple, selection["sources"].tolist())))
+    kept_rows = np.array([
+        i for i, cid in enumerate(store.compound_ids.tolist())
+        if new_sources.get(cid) == old_sources[cid]
+    ], dtype=np.int64)
+    fresh = np.array(sorted(cid for cid, src in new_sources.items() if old_sources.get(cid) != src),
+                     dtype=np.int64)
+    fresh_sources = np.array([new_sources[cid] for cid in fresh.tolist()],
+                             dtype=np.int64).reshape(-1, SOURCE_COLUMNS)
+
+    fresh_matrix, fresh_peaks = _fingerprint_selection(db_path, fresh, fresh_sources, key, workers, params)
+    matrix = _as_store_csr(
+        sparse.vstack([store.matrix[kept_rows], fresh_matrix], format="csr"),
+        len(kept_rows) + len(fresh), store.matrix.shape[1]
+    )
+    positions, kept_offsets = dp.ragged_positions(store.peak_offsets, kept_rows)
+    peaks = _concat_peaks([
+        (np.asarray(store.peak_mz)[positions], np.asarray(store.peak_int)[positions], kept_offsets),
+        fresh_peaks,
+    ])
+    new_store = _write_store(
+        store_dir_for(db_path, cache_dir),
+        np.concatenate([store.compound_ids[kept_rows], fresh]),
+        np.concatenate([store.sources[kept_rows], fresh_sources]),
+        matrix, peaks, key
+    )
+    return new_store, kept_rows
@@ -0,0 +1,598 @@
+"""
+JSON Import
+Bulk loader for NTA Method Reporting Tool JSON files (one file per compound peak,
+e.g. example/PFAC30PAR_PFCA2_mzML_cmpd*.JSON): the sample, conversion settings,
+peak, ms_data, opt_ums_params, instrument_properties, qc_methods, qc_data and
+compound nodes of full_import (R/NIST_import_routines.R).
+
+Files are parsed in worker processes into plain rows. Normalization values
+(norm_* tables, contributors, compounds) are resolved from dictionaries loaded
+once per run; a batch of files is written with executemany inside a single
+transaction, with sample and peak ids assigned up front so child rows need no
+per-row round trip.
+"""
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from utils.common import pool_workers
+from utils.schema_catalog import get_catalog
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_GENERATION_TYPE = "empirical"
+DEFAULT_BATCH_SIZE = 200  # files per transaction
+
+PARALLEL_MIN_FILES = 16
+
+# (table, column) -> normalization table holding the controlled value
+NORMALIZED_COLUMNS = {
+    ("samples", "sample_class_id"): "norm_sample_classes",
+    ("samples", "sample_contributor"): "contributors",
+    ("samples", "generation_type"): "norm_generation_type",
+    ("samples", "sample_solvent"): "norm_carriers",
+    ("peaks", "ion_state"): "norm_ion_states",
+    ("peaks", "identification_confidence"): "norm_peak_confidence",
+    ("qc_methods", "name"): "norm_qc_methods_name",
+    ("qc_methods", "reference"): "norm_qc_methods_reference",
+    ("compounds", "source_type"): "norm_source_types",
+}
+
+# massspectrometry entries stored per peak in instrument_properties, with units
+INSTRUMENT_PROPERTIES = {
+    "isowidth": "Da",
+    "msaccuracy": "ppm",
+    "msminerror": None,
+    "ms1resolution": None,
+    "ms2resolution": None,
+}
+
+# An existing peak with the same values is the same import (re-runs skip it)
+PEAK_KEY = ("sample_id", "precursor_mz", "rt_centroid")
+NIST_ALIAS_PREFIX = "NISTPFAS"
+
+ImportPaths = Iterable[Union[str, Path]]
+
+
+@dataclass
+class IngestResult:
+    """Counts for one ingest run; errors are 'file: reason' for skipped files."""
+    files: int = 0
+    samples: int = 0
+    peaks: int = 0
+    scans: int = 0
+    duplicates: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+# ============================================================================
+# Parsing (runs in worker processes)
+# ============================================================================
+
+def _key(values: Iterable[Any]) -> Tuple:
+    """Lookup key that matches values read back from the database (TEXT affinity stores ids as text)."""
+    return tuple(None if v is None else str(v) for v in values)
+
+
+def _blank(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _text(value: Any) -> Optional[str]:
+    """Value as stored in text columns (booleans as R writes them)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    return str(value)
+
+
+def _number(value: Any) -> Optional[float]:
+    return None if _blank(value) else float(value)
+
+
+def _datetime(value: Any) -> Optional[str]:
+    """ISO 8601 timestamp (e.g. '2021-01-27T00:17:29Z') as UTC 'YYYY-MM-DD HH:MM:SS'."""
+    if _blank(value):
+        return None
+    try:
+        stamp = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return str(value)
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(timezone.utc)
+    return stamp.strftime(DATETIME_FORMAT)
+
+
+def _records(node: Any) -> List[Dict[str, Any]]:
+    """A JSON node as a flat list of records (objects may come nested in lists)."""
+    if node is None:
+        return []
+    if isinstance(node, dict):
+        return [node]
+    records = []
+    for item in node:
+        records.extend(_records(item))
+    return records
+
+
+def _flat_values(node: Any) -> List[Any]:
+    """Flatten a list-of-strings node (msconvertsettings)."""
+    if node is None:
+        return []
+    if isinstance(node, (list, tuple)):
+        values = []
+        for item in node:
+            values.extend(_flat_values(item))
+        return values
+    return [node]
+
+
+def _qc_data(node: Any) -> List[Tuple[str, str, str, str]]:
+    """
+    qc checks in long form (applies_to, parameter, name, value) as in
+    resolve_qc_data_NTAMRT: a parameter checked once applies to the 'peak',
+    repeated checks to 'fragment_1'... in measured m/z order.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in _records(node):
+        groups.setdefault(_text(record.get("parameter")), []).append(record)
+    rows = []
+    for parameter, records in groups.items():
+        records = sorted(
+            records,
+            key=lambda r: (r.get("measuredmz") is None, _text(r.get("measuredmz")) or "")
+        )
+        for i, record in enumerate(records, start=1):
+            applies_to = "peak" if len(records) == 1 else f"fragment_{i}"
+            for name, value in record.items():
+                if name == "parameter" or value is None:
+                    continue
+                rows.append((applies_to, parameter, "qc_pass" if name == "result" else name, _text(value)))
+    return rows
+
+
+def parse_import_file(path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Rows for one compound import file, with normalized values still as text.
+
+    Raises:
+        ValueError: If the file is not a single-peak import (or not JSON)
+    """
+    with open(path, encoding="utf-8") as f:
+        obj = json.load(f)
+    if not isinstance(obj, dict) or "sample" not in obj:
+        raise ValueError("no 'sample' node")
+    peaks = _records(obj.get("peak"))
+    if len(peaks) != 1:
+        raise ValueError(f"expected one 'peak' record, found {len(peaks)}")
+    peak = peaks[0]
+    sample = obj["sample"]
+    chromatography = obj.get("chromatography") or {}
+    massspec = obj.get("massspectrometry") or {}
+
+    ms_data = []
+    for scan in _records(obj.get("msdata")):
+        if _blank(scan.get("measured_mz")) or _blank(scan.get("measured_intensity")):
+            continue
+        base_ion = scan.get("baseion", scan.get("base_ion"))
+        ms_data.append({
+            "ms_n": int(scan["ms_n"]),
+            "scantime": float(scan["scantime"]),
+            "base_ion": _number(base_ion),
+            "base_int": _number(scan.get("base_int")) or 0.0,
+            "measured_mz": str(scan["measured_mz"]),
+            "measured_intensity": str(scan["measured_intensity"]),
+        })
+
+    compounds = _records(obj.get("compounddata"))
+    return {
+        "file": str(path),
+        "settings": tuple(str(s) for s in _flat_values(obj.get("msconvertsettings"))),
+        "sample": {
+            "mzml_name": sample.get("name"),
+            "description": sample.get("description"),
+            "sample_class_id": sample.get("sample_class"),
+            "source_citation": None if _blank(sample.get("source")) else sample.get("source"),
+            "sample_contributor": sample.get("data_generator"),
+            "generated_on": _datetime(sample.get("starttime")),
+            "ms_methods_id": None,
+            "sample_solvent": chromatography.get("ssolvent"),
+        },
+        "peak": {
+            "num_points": sum(1 for scan in ms_data if scan["ms_n"] == 1),
+            "precursor_mz": _number(peak.get("mz")),
+            "ion_state": peak.get("ionstate"),
+            "rt_start": _number(peak.get("peak_starttime")),
+            "rt_centroid": _number(peak.get("rt")),
+            "rt_end": _number(peak.get("peak_endtime")),
+            "identification_confidence": peak.get("confidence"),
+        },
+        "ms_data": ms_data,
+        "opt_ums_params": [
+            {
+                "mslevel": int(p["mslevel"]),
+                **{k: _number(p.get(k)) for k in ("correl", "ph", "freq", "masserror", "minerror")},
+                "n": None if _blank(p.get("n")) else int(p["n"]),
+            }
+            for p in _records(obj.get("opt_ums_params")) if not _blank(p.get("mslevel"))
+        ],
+        "instrument_properties": [
+            {"name": name, "value": _text(massspec[name]), "value_unit": unit}
+            for name, unit in INSTRUMENT_PROPERTIES.items() if not _blank(massspec.get(name))
+        ],
+        "qc_methods": [
+            {
+                "name": m.get("name"),
+                "value": int(bool(m.get("value"))),
+                "reference": None if _blank(m.get("source")) else m.get("source"),
+            }
+            for m in _records(obj.get("qcmethod")) if not _blank(m.get("name"))
+        ],
+        "qc_data": _qc_data(obj.get("qc")),
+        "compound": compounds[0] if compounds else None,
+    }
+
+
+def _parse_safe(path: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """Worker: (path, parsed, None) or (path, None, reason)."""
+    try:
+        return path, parse_import_file(path), None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return path, None, str(e) or type(e).__name__
+
+
+def _parse_all(paths: List[str], workers: Optional[int]) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """Parsed files in input order; parsing runs ahead of the writer in a pool."""
+    workers = pool_workers(len(paths), PARALLEL_MIN_FILES, workers)
+    if workers <= 1:
+        for path in paths:
+            yield _parse_safe(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_parse_safe, paths, chunksize=max(1, len(paths) // (workers * 8)))
+
+
+# ============================================================================
+# Normalization lookups
+# ============================================================================
+
+class NormCache:
+    """
+    Controlled-vocabulary ids of normalization tables, loaded once per table.
+    Any text column of a row matches (case-insensitive), so norm_peak_confidence
+    resolves by import_text or confidence and contributors by username or contact.
+    Values missing from a table with a 'name' column are added, as
+    resolve_normalization_value does.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.catalog = get_catalog(conn)
+        self._maps: Dict[str, Dict[str, int]] = {}
+
+    def _load(self, table: str) -> Dict[str, int]:
+        if table not in self._maps:
+            columns = self.catalog.column_names(table)
+            lookup: Dict[str, int] = {}
+            if "id" in columns:
+                others = [c for c in columns if c != "id"]
+                for row in self.conn.execute(f"SELECT id, {', '.join(others)} FROM {table}"):
+                    for value in row[1:]:
+                        if isinstance(value, str) and value.strip():
+                            lookup.setdefault(value.strip().lower(), row[0])
+            self._maps[table] = lookup
+        return self._maps[table]
+
+    def resolve(self, table: str, value: Any) -> Any:
+        """
+        Id of `value` in `table` (added if possible); None if it cannot be
+        resolved. Values pass through unchanged when the table does not exist.
+        """
+        if _blank(value):
+            return None
+        if self.catalog.object_type(table) != "table":
+            return value
+        lookup = self._load(table)
+        key = str(value).strip().lower()
+        if key not in lookup and "name" in self.catalog.column_names(table):
+            try:
+                cursor = self.conn.execute(f"INSERT INTO {table} (name) VALUES (?)", (str(value).strip(),))
+            except sqlite3.IntegrityError:
+                return None
+            lookup[key] = cursor.lastrowid
+        return lookup.get(key)
+
+
+class CompoundCache:
+    """
+    compounds.id by NIST id alias (NISTPFAS000123) or name, as resolve_compounds
+    matches them; unknown compounds are added.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, norms: NormCache):
+        self.conn = conn
+        self.norms = norms
+        catalog = norms.catalog
+        self.columns = catalog.column_names("compounds")
+        self._lookup: Dict[str, int] = {}
+        if catalog.object_type("compound_aliases") == "table":
+            for alias, compound_id in conn.execute("SELECT alias, compound_id FROM compound_aliases"):
+                if isinstance(alias, str):
+                    self._lookup.setdefault(alias.strip().lower(), compound_id)
+        for compound_id, name in conn.execute("SELECT id, name FROM compounds"):
+            if isinstance(name, str):
+                self._lookup.setdefault(name.strip().lower(), compound_id)
+
+    def resolve(self, compound: Dict[str, Any]) -> Optional[int]:
+        names = [n.strip() for n in str(compound.get("name") or "").split(";") if n.strip()]
+        keys = list(names)
+        if not _blank(compound.get("id")):
+            nist_id = str(compound["id"]).upper().replace(NIST_ALIAS_PREFIX, "").lstrip("0") or "0"
+            keys.insert(0, f"{NIST_ALIAS_PREFIX}{nist_id.zfill(6)}")
+        for key in keys:
+            found = self._lookup.get(key.lower())
+            if found is not None:
+                return found
+        if not names:
+            return None
+        record = {k: v for k, v in compound.items() if k in self.columns and k != "id"}
+        record["name"] = names[0]
+        if "source_type" in record:
+            record["source_type"] = self.norms.resolve("norm_source_types", record["source_type"])
+        try:
+            cursor = self.conn.execute(
+                f"INSERT INTO compounds ({', '.join(record)}) VALUES ({', '.join('?' * len(record))})",
+                list(record.values())
+            )
+        except sqlite3.IntegrityError:
+            return None
+        self._lookup[names[0].lower()] = cursor.lastrowid
+        return cursor.lastrowid
+
+
+# ============================================================================
+# Bulk writer
+# ============================================================================
+
+class _BulkWriter:
+    """Holds the lookups of one ingest run and writes batches of parsed files."""
+
+    TABLES = (
+        "samples", "conversion_software_peaks_linkage", "conversion_software_settings",
+        "peaks", "ms_data", "opt_ums_params", "instrument_properties", "qc_methods",
+        "qc_data", "compounds", "compound_fragments",
+    )
+
+    def __init__(self, conn: sqlite3.Connection, generation_type: str):
+        self.conn = conn
+        self.generation_type = generation_type
+        catalog = get_catalog(conn)
+        self.columns = {
+            t: {c.name: c for c in catalog.columns.get(t, [])}
+            for t in self.TABLES if catalog.object_type(t) == "table"
+        }
+        if "peaks" not in self.columns or "ms_data" not in self.columns:
+            raise ValueError("Database has no peaks / ms_data tables")
+        self.has_sequence = catalog.object_type("sqlite_sequence") == "table"
+        self.norms = NormCache(conn)
+        self.compounds = CompoundCache(conn, self.norms) if (
+            "compounds" in self.columns
+            and ("compound_id" in self.columns["peaks"] or "compound_fragments" in self.columns)
+        ) else None
+        self.sample_cols = [c for c in self.columns.get("samples", {}) if c != "id"]
+        self.samples = self._existing("samples", self.sample_cols)
+        self.peak_key = [c for c in PEAK_KEY if c in self.columns["peaks"]]
+        self.peak_keys = set(self._existing("peaks", self.peak_key)) if self.peak_key else set()
+        self.linkages: Dict[Tuple[str, ...], int] = {}
+        self._stamp: Optional[datetime] = None
+
+    def _existing(self, table: str, columns: List[str]) -> Dict[Tuple, int]:
+        if table not in self.columns or not columns:
+            return {}
+        rows = self.conn.execute(f"SELECT id, {', '.join(columns)} FROM {table}")
+        return {_key(row[1:]): row[0] for row in rows}
+
+    def _last_id(self, table: str) -> int:
+        """Largest id used so far (AUTOINCREMENT never reuses deleted ids)."""
+        last = self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        if self.has_sequence:
+            seq = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+            if seq and seq[0] is not None:
+                last = max(last, seq[0])
+        return last
+
+    def _check_required(self, table: str, record: Dict[str, Any], raw: Dict[str, Any]) -> None:
+        for col, value in record.items():
+            info = self.columns[table].get(col)
+            if value is None and info is not None and info.notnull and not info.pk:
+                shown = raw.get(col)
+                detail = f" '{shown}' could not be resolved" if not _blank(shown) else " is missing"
+                raise ValueError(f"{table}.{col}{detail}")
+
+    def _normalize(self, table: str, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """Record restricted to the table's columns, normalized values as ids."""
+        columns = self.columns.get(table, {})
+        record = {}
+        for col, value in raw.items():
+            if col not in columns:
+                continue
+            norm_table = NORMALIZED_COLUMNS.get((table, col))
+            record[col] = self.norms.resolve(norm_table, value) if norm_table else value
+        self._check_required(table, record, raw)
+        return record
+
+    def _linkage(self, settings: Tuple[str, ...]) -> Optional[int]:
+        """
+        conversion_software_peaks_linkage id for a set of conversion settings;
+        each distinct set in a run gets its own timestamp, one second apart.
+        """
+        if "conversion_software_peaks_linkage" not in self.columns:
+            return None
+        if settings in self.linkages:
+            return self.linkages[settings]
+        if self._stamp is None:
+            self._stamp = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+            latest = self.conn.execute("SELECT MAX(generated_on) FROM conversion_software_peaks_linkage").fetchone()[0]
+            if latest:
+                try:
+                    self._stamp = max(self._stamp, datetime.strptime(latest, DATETIME_FORMAT) + timedelta(seconds=1))
+                except ValueError:
+                    pass
+        cursor = self.conn.execute(
+            "INSERT INTO conversion_software_peaks_linkage (generated_on) VALUES (?)",
+            (self._stamp.strftime(DATETIME_FORMAT),)
+        )
+        self._stamp += timedelta(seconds=1)
+        linkage_id = cursor.lastrowid
+        if "conversion_software_settings" in self.columns and settings:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO conversion_software_settings (linkage_id, setting_value) VALUES (?, ?)",
+                [(linkage_id, s) for s in settings]
+            )
+        self.linkages[settings] = linkage_id
+        return linkage_id
+
+    def _insert(self, table: str, records: List[Dict[str, Any]], verb: str = "INSERT") -> None:
+        if not records or table not in self.columns:
+            return
+        cols = [c for c in records[0] if c in self.columns[table]]
+        self.conn.executemany(
+            f"{verb} INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            [tuple(r[c] for c in cols) for r in records]
+        )
+
+    def write(self, batch: List[Dict[str, Any]], result: IngestResult) -> None:
+        """Write one batch of parsed files in a single transaction."""
+        conn = self.conn
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            next_sample = self._last_id("samples") + 1 if "samples" in self.columns else None
+            next_peak = self._last_id("peaks") + 1
+            rows: Dict[str, List[Dict[str, Any]]] = {t: [] for t in self.TABLES}
+            for parsed in batch:
+                try:
+                    sample = self._normalize("samples", {
+                        **parsed["sample"], "generation_type": self.generation_type
+                    })
+                    peak = self._normalize("peaks", {
+                        **parsed["peak"], "sample_id": 0, "conversion_software_peaks_linkage_id": 0
+                    })
+                    qc_methods = [self._normalize("qc_methods", m) for m in parsed["qc_methods"]]
+                except ValueError as e:
+                    result.errors.append(f"{parsed['file']}: {e}")
+                    continue
+
+                sample_id = None
+                if next_sample is not None:
+                    key = _key(sample.get(c) for c in self.sample_cols)
+                    sample_id = self.samples.get(key)
+                    if sample_id is None:
+                        sample_id = next_sample
+                        next_sample += 1
+                        self.samples[key] = sample_id
+                        rows["samples"].append({"id": sample_id, **sample})
+                        result.samples += 1
+                peak["sample_id"] = sample_id
+                peak_key = _key(peak.get(c) for c in self.peak_key)
+                if self.peak_key and peak_key in self.peak_keys:
+                    result.duplicates += 1
+                    continue
+                self.peak_keys.add(peak_key)
+                peak["conversion_software_peaks_linkage_id"] = self._linkage(parsed["settings"])
+
+                compound_id = None
+                if self.compounds is not None and parsed["compound"]:
+                    compound_id = self.compounds.resolve(parsed["compound"])
+                if "compound_id" in self.columns["peaks"]:
+                    peak["compound_id"] = compound_id
+                peak_id = next_peak
+                next_peak += 1
+                rows["peaks"].append({"id": peak_id, **peak})
+                if compound_id is not None and "compound_fragments" in self.columns:
+                    rows["compound_fragments"].append(
+                        {"peak_id": peak_id, "compound_id": compound_id, "annotated_fragment_id": None}
+                    )
+                for table in ("ms_data", "opt_ums_params", "instrument_properties"):
+                    rows[table].extend({"peak_id": peak_id, **r} for r in parsed[table])
+                rows["qc_methods"].extend({"peak_id": peak_id, **m} for m in qc_methods)
+                rows["qc_data"].extend(
+                    {"peak_id": peak_id, "applies_to": a, "parameter": p, "name": n, "value": v}
+                    for a, p, n, v in parsed["qc_data"]
+                )
+                result.peaks += 1
+                result.scans += len(parsed["ms_data"])
+
+            self._insert("samples", rows["samples"])
+            self._insert("peaks", rows["peaks"])
+            for table in ("ms_data", "opt_ums_params", "instrument_properties", "qc_methods", "qc_data"):
+                self._insert(table, rows[table], verb="INSERT OR IGNORE")
+            self._insert("compound_fragments", rows["compound_fragments"])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def ingest_json_files(
+    conn: sqlite3.Connection,
+    paths: ImportPaths,
+    workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    generation_type: str = DEFAULT_GENERATION_TYPE,
+    progress: Optional[Callable[[int], None]] = None
+) -> IngestResult:
+    """
+    Import compound JSON files (as written by the NTA Method Reporting Tool).
+    Peaks already stored for the same sample, m/z and retention time are
+    skipped, so re-running over a folder only adds new files. Files that cannot
+    be parsed or resolved (e.g. an unknown contributor) are reported in
+    IngestResult.errors and skipped. Requires a writable connection.
+
+    Args:
+        conn: Writable SQLite connection
+        paths: Import files, written in this order
+        workers: Processes parsing files (default: all cores; 1 = in this process)
+        batch_size: Files per transaction
+        generation_type: norm_generation_type of the samples
+        progress: Optional callable receiving the running count of files handled
+
+    Returns:
+        IngestResult with the number of files, new samples, peaks and scans
+    """
+    paths = [str(p) for p in paths]
+    writer = _BulkWriter(conn, generation_type)
+    result = IngestResult()
+    batch: List[Dict[str, Any]] = []
+    for path, parsed, error in _parse_all(paths, workers):
+        result.files += 1
+        if error is not None:
+            result.errors.append(f"{path}: {error}")
+        else:
+            batch.append(parsed)
+        if len(batch) >= max(1, batch_size):
+            writer.write(batch, result)
+            batch = []
+            if progress:
+                progress(result.files)
+    if batch:
+        writer.write(batch, result)
+    if progress:
+        progress(result.files)
+    return result
+
+
+def expand_import_paths(inputs: Sequence[Union[str, Path]]) -> List[Path]:
+    """Files as given, folders expanded to their .json files (sorted)."""
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            paths.extend(sorted(p for p in item.iterdir() if p.suffix.lower() == ".json"))
+        else:
+            paths.append(item)
+    return paths
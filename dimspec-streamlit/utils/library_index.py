@@ -0,0 +1,120 @@
+"""
+Library Precursor Index
+Keeps library precursor m/z values sorted so ppm windows are answered with
+np.searchsorted in O(log n + k) instead of scanning the whole column.
+"""
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+
+class PrecursorIndex:
+    """
+    Sorted view of a library's precursor m/z (and RT) addressed by row position.
+
+    Positions refer to library_df.iloc; rows with a missing precursor are not indexed.
+    """
+
+    def __init__(self, precursor_mz: np.ndarray, rt_mean: Optional[np.ndarray] = None):
+        mz = np.asarray(precursor_mz, dtype=np.float64)
+        order = np.argsort(mz, kind="stable")
+        self.order = order[~np.isnan(mz[order])]
+        self.sorted_mz = mz[self.order]
+        self.rt_mean = None if rt_mean is None else np.asarray(rt_mean, dtype=np.float64)
+        self.n_rows = len(mz)
+
+    @classmethod
+    def from_library(cls, library_df: pd.DataFrame) -> "PrecursorIndex":
+        mz = pd.to_numeric(library_df['precursor_mz'], errors='coerce').to_numpy(dtype=np.float64)
+        rt = None
+        if 'rt_mean' in library_df.columns:
+            rt = pd.to_numeric(library_df['rt_mean'], errors='coerce').to_numpy(dtype=np.float64)
+        return cls(mz, rt)
+
+    def __len__(self) -> int:
+        return len(self.sorted_mz)
+
+    def extend(self, precursor_mz: np.ndarray, rt_mean: Optional[np.ndarray] = None) -> "PrecursorIndex":
+        """
+        New index with rows appended at positions n_rows, n_rows + 1, ...
+        Only the new masses are sorted; they are merged into the existing order
+        with searchsorted instead of re-sorting the whole library.
+        """
+        new_mz = np.asarray(precursor_mz, dtype=np.float64)
+        new_order = np.argsort(new_mz, kind="stable")
+        new_order = new_order[~np.isnan(new_mz[new_order])]
+        new_sorted = new_mz[new_order]
+        # side="right" keeps existing rows ahead of equal new ones (stable, like argsort)
+        at = np.searchsorted(self.sorted_mz, new_sorted, side="right")
+
+        merged = PrecursorIndex.__new__(PrecursorIndex)
+        merged.sorted_mz = np.insert(self.sorted_mz, at, new_sorted)
+        merged.order = np.insert(self.order, at, new_order + self.n_rows)
+        merged.n_rows = self.n_rows + len(new_mz)
+        if self.rt_mean is None and rt_mean is None:
+            merged.rt_mean = None
+        else:
+            old_rt = self.rt_mean if self.rt_mean is not None else np.full(self.n_rows, np.nan)
+            add_rt = np.full(len(new_mz), np.nan) if rt_mean is None else np.asarray(rt_mean, dtype=np.float64)
+            merged.rt_mean = np.concatenate([old_rt, add_rt])
+        return merged
+
+    def window(self, input_mz: float, mz_tolerance_ppm: float) -> np.ndarray:
+        """
+        Positions whose precursor lies within ppm of input_mz, in library order.
+        Tolerance is relative to the library (theoretical) mass:
+        |library - input| <= library * ppm * 1e-6.
+        """
+        ppm_factor = mz_tolerance_ppm * 1e-6
+        # |L - q| <= L*p  <=>  q/(1+p) <= L <= q/(1-p); widen slightly for rounding,
+        # then re-check the exact condition on the k hits only.
+        lo_mz = input_mz / (1 + ppm_factor)
+        hi_mz = input_mz / (1 - ppm_factor) if ppm_factor < 1 else np.inf
+        lo = np.searchsorted(self.sorted_mz, np.nextafter(lo_mz, -np.inf), side="left")
+        hi = np.searchsorted(self.sorted_mz, np.nextafter(hi_mz, np.inf), side="right")
+        hits_mz = self.sorted_mz[lo:hi]
+        exact = np.abs(hits_mz - input_mz) <= hits_mz * ppm_factor
+        return np.sort(self.order[lo:hi][exact])
+
+    def windows(self, input_mz: np.ndarray, mz_tolerance_ppm: float):
+        """
+        Vectorized window() for many query masses at once.
+        
+        Returns:
+            (query_idx, positions): parallel arrays, one entry per (query, library row) hit
+        """
+        input_mz = np.asarray(input_mz, dtype=np.float64)
+        ppm_factor = mz_tolerance_ppm * 1e-6
+        lo_mz = input_mz / (1 + ppm_factor)
+        hi_mz = input_mz / (1 - ppm_factor) if ppm_factor < 1 else np.full_like(input_mz, np.inf)
+        lo = np.searchsorted(self.sorted_mz, np.nextafter(lo_mz, -np.inf), side="left")
+        hi = np.searchsorted(self.sorted_mz, np.nextafter(hi_mz, np.inf), side="right")
+        counts = np.maximum(hi - lo, 0)
+        query_idx = np.repeat(np.arange(len(input_mz)), counts)
+        # Offsets of each hit inside its window, then absolute sorted positions
+        starts = np.cumsum(counts) - counts
+        sorted_pos = np.repeat(lo, counts) + (np.arange(counts.sum()) - np.repeat(starts, counts))
+        hits_mz = self.sorted_mz[sorted_pos]
+        exact = np.abs(hits_mz - input_mz[query_idx]) <= hits_mz * ppm_factor
+        return query_idx[exact], self.order[sorted_pos[exact]]
+
+    def query(
+        self,
+        input_mz: float,
+        input_rt: Optional[float] = None,
+        mz_tolerance_ppm: float = 5.0,
+        rt_margin: float = 0.5
+    ) -> np.ndarray:
+        """
+        ppm window plus RT filter applied to the hits only.
+        Rows with unknown RT are kept (same rule as filter_candidates_fast).
+        """
+        positions = self.window(input_mz, mz_tolerance_ppm)
+        if input_rt is None or self.rt_mean is None or len(positions) == 0:
+            return positions
+        rt_vals = self.rt_mean[positions]
+        mask_rt = np.isnan(rt_vals) | (
+            (rt_vals >= input_rt - rt_margin) &
+            (rt_vals <= input_rt + rt_margin)
+        )
+        return positions[mask_rt]
@@ -0,0 +1,432 @@
+"""
+mzML Reader
+Streams scans out of (indexed) mzML files with constant memory, the Python side of
+R/base/mzML_base.R (mzMLtoR, gettime, getmslevel, getprecursor, getcharge).
+
+Indexed files are read through their <indexList> offsets: any scan can be fetched
+by position or id without touching the rest of the file, and an RT range is
+located by bisection. Plain mzML is streamed with iterparse, dropping each
+spectrum element once it has been handled. Binary arrays (base64, optionally
+zlib-compressed) are decoded straight into NumPy, and only for scans that pass
+the MS level / RT filters.
+"""
+import base64
+import re
+import zlib
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# PSI-MS controlled vocabulary accessions
+CV_MS_LEVEL = "MS:1000511"
+CV_SCAN_START_TIME = "MS:1000016"
+CV_SELECTED_ION_MZ = "MS:1000744"
+CV_POSITIVE_SCAN = "MS:1000130"
+CV_NEGATIVE_SCAN = "MS:1000129"
+CV_TOTAL_ION_CURRENT = "MS:1000285"
+CV_BASE_PEAK_MZ = "MS:1000504"
+CV_BASE_PEAK_INTENSITY = "MS:1000505"
+CV_MZ_ARRAY = "MS:1000514"
+CV_INTENSITY_ARRAY = "MS:1000515"
+CV_ZLIB = "MS:1000574"
+CV_NO_COMPRESSION = "MS:1000576"
+# MS-Numpress variants (alone and with zlib): recognized, but not decoded
+CV_NUMPRESS = ("MS:1002312", "MS:1002313", "MS:1002314", "MS:1002746", "MS:1002747", "MS:1002748")
+COMPRESSIONS = (CV_ZLIB, CV_NO_COMPRESSION) + CV_NUMPRESS
+UNIT_SECOND = "UO:0000010"
+UNIT_MINUTE = "UO:0000031"
+
+BINARY_DTYPES = {
+    "MS:1000521": "<f4",   # 32-bit float
+    "MS:1000523": "<f8",   # 64-bit float
+    "MS:1000519": "<i4",   # 32-bit integer
+    "MS:1000522": "<i8",   # 64-bit integer
+}
+
+READ_CHUNK = 1 << 20       # bytes per read when searching for a tag
+INDEX_TAIL = 4096          # bytes at the end of the file searched for <indexListOffset>
+
+ScanKey = Union[int, str]
+MsLevels = Optional[Union[int, Sequence[int]]]
+RtRange = Optional[Tuple[Optional[float], Optional[float]]]
+
+
+@dataclass
+class Scan:
+    """
+    One spectrum. scan_time is in minutes (as ms_data.scantime); mz and intensity
+    are float64 arrays, empty when the scan was read with decode=False.
+    """
+    index: int
+    id: str
+    ms_level: Optional[int]
+    scan_time: float
+    precursor_mz: Optional[float]
+    polarity: int                  # 1 positive, -1 negative, 0 unknown (getcharge)
+    tic: float
+    base_peak_mz: float
+    base_peak_intensity: float
+    mz: np.ndarray = field(default_factory=lambda: np.empty(0))
+    intensity: np.ndarray = field(default_factory=lambda: np.empty(0))
+
+
+# ============================================================================
+# Element Parsing
+# ============================================================================
+
+def _local(tag: str) -> str:
+    """Tag name without its XML namespace."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(elem: ET.Element, name: str) -> Optional[ET.Element]:
+    return next((c for c in elem if _local(c.tag) == name), None)
+
+
+def _path(elem: Optional[ET.Element], *names: str) -> Optional[ET.Element]:
+    for name in names:
+        if elem is None:
+            return None
+        elem = _child(elem, name)
+    return elem
+
+
+def _cv_params(elem: Optional[ET.Element]) -> Dict[str, Tuple[str, Optional[str]]]:
+    """accession -> (value, unitAccession) of the cvParams directly under elem."""
+    if elem is None:
+        return {}
+    return {
+        c.get("accession"): (c.get("value", ""), c.get("unitAccession"))
+        for c in elem if _local(c.tag) == "cvParam"
+    }
+
+
+def _float(params: Dict[str, Tuple[str, Optional[str]]], accession: str) -> float:
+    try:
+        return float(params[accession][0])
+    except (KeyError, ValueError):
+        return np.nan
+
+
+def decode_binary(text: Optional[str], dtype: str = "<f8", compression: str = CV_NO_COMPRESSION) -> np.ndarray:
+    """
+    Decode a <binary> payload (base64, optionally zlib) into a float64 array.
+
+    Raises:
+        ValueError: For compression schemes other than zlib / none (e.g. numpress)
+    """
+    raw = base64.b64decode(text or "")
+    if compression == CV_ZLIB:
+        raw = zlib.decompress(raw)
+    elif compression != CV_NO_COMPRESSION:
+        raise ValueError(f"Unsupported mzML binary compression: {compression}")
+    return np.frombuffer(raw, dtype=dtype).astype(np.float64)
+
+
+def _binary_arrays(elem: ET.Element) -> Dict[str, np.ndarray]:
+    """Decoded m/z and intensity arrays of a spectrum element (other arrays are skipped)."""
+    arrays = {}
+    array_list = _child(elem, "binaryDataArrayList")
+    for array in (array_list if array_list is not None else []):
+        if _local(array.tag) != "binaryDataArray":
+            continue
+        params = _cv_params(array)
+        kind = CV_MZ_ARRAY if CV_MZ_ARRAY in params else CV_INTENSITY_ARRAY if CV_INTENSITY_ARRAY in params else None
+        if kind is None:
+            continue
+        dtype = next((BINARY_DTYPES[acc] for acc in params if acc in BINARY_DTYPES), "<f8")
+        compression = next((acc for acc in params if acc in COMPRESSIONS), CV_NO_COMPRESSION)
+        binary = _child(array, "binary")
+        arrays[kind] = decode_binary(binary.text if binary is not None else None, dtype, compression)
+    return arrays
+
+
+def _scan_time(elem: ET.Element) -> float:
+    """Scan start time of a spectrum element, converted to minutes (gettime)."""
+    params = _cv_params(_path(elem, "scanList", "scan"))
+    value = _float(params, CV_SCAN_START_TIME)
+    if np.isfinite(value) and params[CV_SCAN_START_TIME][1] == UNIT_SECOND:
+        value /= 60.0
+    return value
+
+
+def _spectrum_meta(elem: ET.Element) -> Dict[str, object]:
+    params = _cv_params(elem)
+    ms_level = params.get(CV_MS_LEVEL, (None, None))[0]
+    precursor = _cv_params(_path(elem, "precursorList", "precursor", "selectedIonList", "selectedIon"))
+    precursor_mz = _float(precursor, CV_SELECTED_ION_MZ)
+    return {
+        "index": int(elem.get("index", -1)),
+        "id": elem.get("id", ""),
+        "ms_level": int(ms_level) if ms_level not in (None, "") else None,
+        "scan_time": _scan_time(elem),
+        "precursor_mz": precursor_mz if np.isfinite(precursor_mz) else None,
+        "polarity": 1 if CV_POSITIVE_SCAN in params else -1 if CV_NEGATIVE_SCAN in params else 0,
+        "tic": _float(params, CV_TOTAL_ION_CURRENT),
+        "base_peak_mz": _float(params, CV_BASE_PEAK_MZ),
+        "base_peak_intensity": _float(params, CV_BASE_PEAK_INTENSITY),
+    }
+
+
+def _make_scan(meta: Dict[str, object], elem: ET.Element, decode: bool) -> Scan:
+    scan = Scan(**meta)
+    if decode:
+        arrays = _binary_arrays(elem)
+        scan.mz = arrays.get(CV_MZ_ARRAY, np.empty(0))
+        scan.intensity = arrays.get(CV_INTENSITY_ARRAY, np.empty(0))
+    return scan
+
+
+def _level_filter(ms_level: MsLevels):
+    if ms_level is None:
+        return None
+    return {int(ms_level)} if np.ndim(ms_level) == 0 else {int(level) for level in ms_level}
+
+
+def _keep(meta: Dict[str, object], levels, rt_min: float, rt_max: float) -> bool:
+    if levels is not None and meta["ms_level"] not in levels:
+        return False
+    return rt_min <= meta["scan_time"] <= rt_max or not np.isfinite(meta["scan_time"])
+
+
+# ============================================================================
+# Reader
+# ============================================================================
+
+class MzMLReader:
+    """
+    Lazy reader over one mzML file; use as a context manager.
+
+        with MzMLReader(path) as reader:
+            for scan in reader.iter_scans(ms_level=1, rt_range=(4.0, 6.0)):
+                ...
+            scan = reader[10]          # by position, or reader["scan=11"] by id
+
+    The offset index of indexedmzML files is used as is; for other files it is
+    built on first random access by one pass over the raw bytes.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file: BinaryIO = open(self.path, "rb")
+        self._file.seek(0, 2)
+        self._size = self._file.tell()
+        self._offsets: Optional[np.ndarray] = None
+        self._ids: Optional[List[str]] = None
+        self._positions: Optional[Dict[str, int]] = None
+        self._times: Dict[int, float] = {}
+        self.indexed = self._read_index()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "MzMLReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # --- index -------------------------------------------------------------
+
+    def _read_index(self) -> bool:
+        """Load the spectrum offsets of an indexedmzML file; False if absent or invalid."""
+        self._file.seek(max(0, self._size - INDEX_TAIL))
+        match = re.search(rb"<indexListOffset>\s*(\d+)\s*</indexListOffset>", self._file.read())
+        if not match:
+            return False
+        start = int(match.group(1))
+        fragment = self._read_until(start, b"</indexList>")
+        try:
+            index_list = ET.fromstring(fragment)
+        except ET.ParseError:
+            return False
+        ids, offsets = [], []
+        for index in index_list:
+            if _local(index.tag) == "index" and index.get("name") == "spectrum":
+                for offset in index:
+                    ids.append(offset.get("idRef", ""))
+                    offsets.append(int(offset.text))
+        if offsets:
+            self._file.seek(offsets[0])
+            if self._file.read(len(b"<spectrum")) != b"<spectrum":
+                return False
+        self._ids, self._offsets = ids, np.asarray(offsets, dtype=np.int64)
+        return True
+
+    def _build_index(self) -> None:
+        """Offsets of every <spectrum> start tag, found by a chunked byte search."""
+        pattern = re.compile(rb'<spectrum\s[^>]*?\bid="([^"]*)"')
+        ids, offsets = [], []
+        position, carry = 0, b""
+        self._file.seek(0)
+        while True:
+            chunk = self._file.read(READ_CHUNK)
+            data = carry + chunk
+            base = position - len(carry)
+            last_end = 0
+            for match in pattern.finditer(data):
+                ids.append(match.group(1).decode("utf-8"))
+                offsets.append(base + match.start())
+                last_end = match.end()
+            if not chunk:
+                break
+            position += len(chunk)
+            # Keep a tail in case a start tag straddles the chunk boundary
+            carry = data[max(last_end, len(data) - 4096):]
+        self._ids, self._offsets = ids, np.asarray(offsets, dtype=np.int64)
+
+    def _ensure_index(self) -> None:
+        if self._offsets is None:
+            self._build_index()
+
+    @property
+    def ids(self) -> List[str]:
+        """Native ids of all spectra, in file order."""
+        self._ensure_index()
+        return list(self._ids)
+
+    def __len__(self) -> int:
+        self._ensure_index()
+        return len(self._offsets)
+
+    # --- random access -----------------------------------------------------
+
+    def _read_until(self, start: int, end_tag: bytes, end: Optional[int] = None) -> bytes:
+        """Bytes from start through the first end_tag (end bounds the read when known)."""
+        self._file.seek(start)
+        if end is not None:
+            data = self._file.read(end - start)
+            cut = data.rfind(end_tag)
+            return data[:cut + len(end_tag)] if cut >= 0 else data
+        data = b""
+        while True:
+            chunk = self._file.read(READ_CHUNK)
+            if not chunk:
+                return data
+            search_from = max(0, len(data) - len(end_tag))
+            data += chunk
+            cut = data.find(end_tag, search_from)
+            if cut >= 0:
+                return data[:cut + len(end_tag)]
+
+    def _element(self, position: int) -> ET.Element:
+        start = int(self._offsets[position])
+        end = int(self._offsets[position + 1]) if position + 1 < len(self._offsets) else None
+        return ET.fromstring(self._read_until(start, b"</spectrum>", end))
+
+    def _position(self, key: ScanKey) -> int:
+        self._ensure_index()
+        if isinstance(key, str):
+            if self._positions is None:
+                self._positions = {sid: i for i, sid in enumerate(self._ids)}
+            if key not in self._positions:
+                raise KeyError(key)
+            return self._positions[key]
+        position = int(key)
+        if position < 0:
+            position += len(self._offsets)
+        if not 0 <= position < len(self._offsets):
+            raise IndexError(key)
+        return position
+
+    def get_scan(self, key: ScanKey, decode: bool = True) -> Scan:
+        """Scan by position in the file or by native id."""
+        elem = self._element(self._position(key))
+        return _make_scan(_spectrum_meta(elem), elem, decode)
+
+    def __getitem__(self, key: ScanKey) -> Scan:
+        return self.get_scan(key)
+
+    def _time_at(self, position: int) -> float:
+        if position not in self._times:
+            self._times[position] = _scan_time(self._element(position))
+        return self._times[position]
+
+    def _first_at_or_after(self, rt: float) -> int:
+        """First position whose scan time is >= rt (scans are stored in acquisition order)."""
+        lo, hi = 0, len(self._offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            time = self._time_at(mid)
+            if np.isfinite(time) and time < rt:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # --- streaming ---------------------------------------------------------
+
+    def iter_scans(self, ms_level: MsLevels = None, rt_range: RtRange = None, decode: bool = True) -> Iterator[Scan]:
+        """
+        Yield scans lazily in file order.
+
+        Args:
+            ms_level: MS level or levels to keep (None keeps all)
+            rt_range: (min, max) scan time in minutes, either end None for open;
+                      reading stops after the last scan inside the range
+            decode: Decode the m/z and intensity arrays (False yields metadata only)
+        """
+        levels = _level_filter(ms_level)
+        rt_min, rt_max = rt_range if rt_range is not None else (None, None)
+        rt_min = -np.inf if rt_min is None else float(rt_min)
+        rt_max = np.inf if rt_max is None else float(rt_max)
+        if self._offsets is not None:
+            yield from self._iter_indexed(levels, rt_min, rt_max, decode)
+        else:
+            yield from self._iter_stream(levels, rt_min, rt_max, decode)
+
+    def _iter_indexed(self, levels, rt_min: float, rt_max: float, decode: bool) -> Iterator[Scan]:
+        start = self._first_at_or_after(rt_min) if np.isfinite(rt_min) else 0
+        for position in range(start, len(self._offsets)):
+            elem = self._element(position)
+            meta = _spectrum_meta(elem)
+            if meta["scan_time"] > rt_max:
+                break
+            if _keep(meta, levels, rt_min, rt_max):
+                yield _make_scan(meta, elem, decode)
+
+    def _iter_stream(self, levels, rt_min: float, rt_max: float, decode: bool) -> Iterator[Scan]:
+        self._file.seek(0)
+        parent = None
+        for event, elem in ET.iterparse(self._file, events=("start", "end")):
+            name = _local(elem.tag)
+            if event == "start":
+                if name == "spectrumList":
+                    parent = elem
+                continue
+            if name != "spectrum":
+                if name == "spectrumList":
+                    break
+                continue
+            meta = _spectrum_meta(elem)
+            if meta["scan_time"] > rt_max:
+                break
+            if _keep(meta, levels, rt_min, rt_max):
+                yield _make_scan(meta, elem, decode)
+            # Drop the handled spectrum so memory stays flat
+            elem.clear()
+            if parent is not None:
+                parent.remove(elem)
+
+    def scan_table(self, ms_level: MsLevels = None, rt_range: RtRange = None) -> pd.DataFrame:
+        """Metadata of the matching scans, one row each (no arrays decoded)."""
+        columns = [f for f in Scan.__dataclass_fields__ if f not in ("mz", "intensity")]
+        rows = [
+            [getattr(scan, c) for c in columns]
+            for scan in self.iter_scans(ms_level=ms_level, rt_range=rt_range, decode=False)
+        ]
+        return pd.DataFrame(rows, columns=columns)
+
+
+def read_scans(
+    path: Union[str, Path],
+    ms_level: MsLevels = None,
+    rt_range: RtRange = None
+) -> Iterator[Scan]:
+    """Stream the scans of an mzML file (see MzMLReader.iter_scans); the file closes when exhausted."""
+    with MzMLReader(path) as reader:
+        yield from reader.iter_scans(ms_level=ms_level, rt_range=rt_range)
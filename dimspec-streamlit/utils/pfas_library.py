@@ -7,117 +7,333 @@ Acts as an abstraction layer over the raw SQL tables.
 import pandas as pd
 import numpy as np
 import streamlit as st
-import json
-from typing import Optional, List
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, List, Tuple
+from scipy import sparse
 from utils import database as db
 from utils import data_processing as dp
+from utils import fingerprint_store as fs
+from utils.scoring import SimilarityEngine
+from utils.spectral_comparison import AccurateMassMatcher
+from utils.library_index import PrecursorIndex
 from utils.config import get_db_path
 
-# To simulate a pre-computed fingerprint, we will compute it on load if missing.
-# In production, this should be a stored column/table.
+logger = logging.getLogger(__name__)
 
-@st.cache_data(show_spinner="Loading PFAS Library...")
-def load_library_data() -> pd.DataFrame:
+# ============================================================================
+# Library Rows
+# ============================================================================
+
+def _library_source(conn) -> str:
+    # prioritizing pfas_summary if exists (it has rt_mean), else compounds
+    return "pfas_summary" if "pfas_summary" in db.get_tables(conn) else "compounds"
+
+
+def _fetch_library_rows(
+    conn,
+    after_id: Optional[int] = None,
+    ids: Optional[List[int]] = None
+) -> pd.DataFrame:
     """
-    Fetch all compounds and necessary metadata for detection.
-    Computes fingerprints for candidates that have spectra.
+    Fetch compounds and necessary metadata for detection, optionally only
+    those with pfas_id > after_id or with pfas_id in ids.
     """
-    conn = db.connect_db(get_db_path())
-    
-    # 1. Fetch Basic Compound Data
-    # prioritizing pfas_summary if exists (it has rt_mean), else compounds
-    # For this prototype we will try to join meaningful columns
-    
-    # Check if pfas_summary exists
-    tables = db.get_tables(conn)
-    
-    if "pfas_summary" in tables:
+    conditions, params = [], []
+    if _library_source(conn) == "pfas_summary":
         # Ideally this view has everything: name, formula, precursor_mz, rt_mean
-        query = """
-        SELECT * FROM pfas_summary
-        """
-        try:
-            df = pd.read_sql_query(query, conn)
-        except Exception:
-            df = pd.DataFrame()
+        query = "SELECT * FROM pfas_summary"
+        id_col = "pfas_id"
     else:
         # Fallback to compounds table
         # We need rt information. If not in compounds, we are in trouble for RT filter.
-        # Let's assume compounds has what we need or we mock it.
         # Based on inspection: compounds has 'fixedmass'.
         query = """
         SELECT id as pfas_id, name, formula, fixedmass as precursor_mz, additional 
         FROM compounds
         """
-        df = pd.read_sql_query(query, conn)
-        # Mock RT if missing (so pipeline doesn't crash, but filtering won't work well)
-        if 'rt_mean' not in df.columns:
-            df['rt_mean'] = np.nan
-            
-    # 2. Add Family/Class Info
+        id_col = "id"
+    if after_id is not None:
+        conditions.append(f"{id_col} > ?")
+        params.append(after_id)
+    if ids is not None:
+        conditions.append(f"{id_col} IN ({','.join('?' * len(ids))})")
+        params.extend(ids)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    try:
+        df = pd.read_sql_query(query, conn, params=params)
+    except Exception:
+        df = pd.DataFrame()
+
+    # Mock RT if missing (so pipeline doesn't crash, but filtering won't work well)
+    if 'rt_mean' not in df.columns:
+        df['rt_mean'] = np.nan
+    # Add Family/Class Info
     # Use our helper to infer class if not present in DB
     if 'Family' not in df.columns:
-        from utils.data_processing import get_compound_family
-        df['Family'] = df['name'].apply(get_compound_family)
-        
-    # 3. Fetch/Compute Fingerprints
-    # This is expensive. For prototype, we might only do it for a subset or 
-    # check if 'ms_data' has linked entries.
-    
-    # Let's fetch all ms_data aggregated by peak -> compound
-    # Since linking compounds-peaks is hard without explicit schema knowledge of this specific DB version,
-    # We will try a standard join: compounds.id -> peaks.compound_id -> ms_data.peak_id
-    
-    # Check if peaks has compound_id
-    peak_cols = db.get_column_names(conn, 'peaks')
-    
-    df['fingerprint'] = None
-    df['has_spectrum'] = False
-    
-    if 'compound_id' in peak_cols:
-        # Heavy query: Get one representative spectrum per compound
-        # LIMIT 1 per compound to save time
-        spec_query = """
-        SELECT p.compound_id, m.measured_mz, m.measured_intensity
-        FROM peaks p
-        JOIN ms_data m ON p.id = m.peak_id
-        GROUP BY p.compound_id
-        """
+        df['Family'] = df['name'].apply(dp.get_compound_family) if 'name' in df.columns else "Other"
+    return df
+
+
+def _attach_fingerprint_rows(df: pd.DataFrame, store: Optional[fs.FingerprintStore]) -> pd.DataFrame:
+    """
+    Row number of each compound in the fingerprint store ('fp_row', -1 = no spectrum).
+    Link: compounds.id -> compound_fragments / peaks.compound_id -> ms_data.peak_id
+    """
+    df['fp_row'] = -1
+    if store is not None and len(store.compound_ids) > 0 and len(df):
+        df['fp_row'] = df['pfas_id'].map(store.row_map()).fillna(-1).astype(int)
+    df['has_spectrum'] = df['fp_row'] >= 0
+    return df
+
+
+def _read_watermark(conn) -> Dict[str, Tuple[Optional[int], int]]:
+    """(max id, row count) of every table the library is derived from."""
+    tables = db.get_tables(conn)
+    watermark = {}
+    for table in WATERMARK_TABLES:
+        if table in tables:
+            cursor = conn.execute(f"SELECT MAX(id), COUNT(*) FROM {table}")
+            max_id, count = cursor.fetchone()
+            watermark[table] = (max_id, count)
+    return watermark
+
+
+def _appended_only(conn, table: str, old: Tuple[Optional[int], int], new: Tuple[Optional[int], int]) -> bool:
+    """True if every row change since `old` is an insert above the old max id."""
+    if old == new:
+        return True
+    old_max, old_count = old
+    cursor = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE id > ?", (old_max if old_max is not None else -1,))
+    return new[1] == old_count + cursor.fetchone()[0]
+
+
+# ============================================================================
+# Reference Library (incrementally refreshed)
+# ============================================================================
+
+# Tables whose max(id)/count form the refresh watermark
+WATERMARK_TABLES = ("compounds", "peaks", "ms_data", "peak_ums")
+
+# Identity of a pfas_summary row: one compound can have several (one per name / precursor m/z)
+SUMMARY_ROW_KEY = ("pfas_id", "name", "precursor_mz")
+
+
+@dataclass(frozen=True)
+class LibrarySnapshot:
+    """
+    One consistent state of the reference library: df rows, index positions and
+    engine/matcher rows (via df['fp_row']) all refer to the same data. Treat as read-only.
+    """
+    df: pd.DataFrame
+    store: Optional[fs.FingerprintStore]
+    engine: SimilarityEngine
+    matcher: AccurateMassMatcher
+    index: PrecursorIndex
+    watermark: Dict[str, Tuple[Optional[int], int]]
+    token: Any
+
+
+class ReferenceLibrary:
+    """
+    In-memory reference library for one database that follows the database as
+    reference standards are appended.
+
+    Each snapshot() checks the pool's change token; when the database changed and
+    every change is an append above the watermark (max id per table), only new
+    compounds are fetched, only new/changed spectra are fingerprinted, and they are
+    merged into the frame, engine, matcher and index. Anything else (deletes, id reuse)
+    falls back to a full load. In-place edits of existing rows do not move the
+    watermark, so a running app keeps its snapshot; restart it after those (the
+    fingerprint store re-bins edited representative scans on the next full load).
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path).resolve()
+        self._lock = threading.Lock()
+        self._snapshot: Optional[LibrarySnapshot] = None
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    def snapshot(self) -> LibrarySnapshot:
+        conn = db.connect_db(self.db_path)
+        token = db.get_pool(str(self.db_path)).change_token()
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.token == token:
+                return snap
+            with st.spinner("Loading PFAS Library..."):
+                watermark = _read_watermark(conn)
+                new_snap = None
+                if snap is not None:
+                    try:
+                        new_snap = self._refresh(conn, snap, watermark, token)
+                    except (sqlite3.Error, OSError) as e:
+                        logger.warning("Incremental library refresh failed, reloading: %s", e)
+                if new_snap is None:
+                    new_snap = self._load(conn, watermark, token)
+                    self.full_loads += 1
+                else:
+                    self.incremental_loads += 1
+            self._snapshot = new_snap
+            return new_snap
+
+    def _load(self, conn, watermark, token) -> LibrarySnapshot:
+        """Full load: every compound row, the whole fingerprint store, a new index."""
+        df = _fetch_library_rows(conn)
         try:
-            specs = pd.read_sql_query(spec_query, conn)
-            
-            # Map specs to library df
-            # We need to parse strings to lists and compute fingerprint
-            # Optimize: Pre-compute map
-            spec_map = {}
-            for idx, row in specs.iterrows():
-                try:
-                    c_id = row['compound_id']
-                    mz = [float(x) for x in str(row['measured_mz']).split()]
-                    inten = [float(x) for x in str(row['measured_intensity']).split()]
-                    
-                    # Compute normalized fingerprint vector (numpy)
-                    # Use standard bins (50-1200, size 1)
-                    fp_df = dp.bin_spectrum_fingerprint(mz, inten, mz_min=50.0, mz_max=1200.0, bin_size=1.0)
-                    
-                    # Normalize Max=1
-                    vals = fp_df['intensity'].values
-                    m = np.max(vals)
-                    if m > 0: vals = vals / m
-                    
-                    spec_map[c_id] = vals
-                except:
-                    continue
-                    
-            # Assign to main DF
-            # Note: storing numpy array in pandas cell is fine
-            df['fingerprint'] = df['pfas_id'].map(spec_map)
-            df['has_spectrum'] = df['fingerprint'].notna()
-            
-        except Exception as e:
-            # st.warning(f"Could not load spectra: {e}")
-            pass
-            
-    # Do not close cached conn
+            store = fs.load_fingerprint_store(conn, self.db_path)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            logger.warning("Could not load library spectra: %s", e)
+            st.warning(f"Could not load library spectra, matching by m/z and RT only: {e}")
+            store = None
+        df = _attach_fingerprint_rows(df, store)
+        if store is not None:
+            engine = SimilarityEngine(store.matrix, bin_params=store.key["params"])
+            matcher = AccurateMassMatcher.from_store(store)
+        else:
+            empty = sparse.csr_matrix((0, fs.n_bins()), dtype=np.float32)
+            engine = SimilarityEngine(empty, bin_params=fs.FINGERPRINT_PARAMS)
+            matcher = AccurateMassMatcher(np.empty(0), np.empty(0), np.zeros(1, dtype=np.int64))
+        return LibrarySnapshot(df, store, engine, matcher, PrecursorIndex.from_library(df), watermark, token)
+
+    def _refresh(self, conn, snap: LibrarySnapshot, watermark, token) -> Optional[LibrarySnapshot]:
+        """Merge appended rows into snap; None if the changes are not append-only."""
+        if set(watermark) != set(snap.watermark):
+            return None
+        for table, mark in watermark.items():
+            if not _appended_only(conn, table, snap.watermark[table], mark):
+                return None
+
+        df = snap.df.copy()
+        old_compound_max = snap.watermark.get("compounds", (None, 0))[0]
+        new_rows = _fetch_library_rows(conn, after_id=old_compound_max)
+
+        # pfas_summary rows aggregate peaks (e.g. rt_mean): re-read compounds that got new peaks
+        changed_positions = np.empty(0, dtype=np.int64)
+        if _library_source(conn) == "pfas_summary":
+            affected = set()
+            links = db.compound_peak_links(conn)
+            if links and "peaks" in watermark and watermark["peaks"] != snap.watermark["peaks"]:
+                cursor = conn.execute(
+                    f"SELECT DISTINCT compound_id FROM ({links}) WHERE peak_id > ?",
+                    (snap.watermark["peaks"][0] or -1,)
+                )
+                affected.update(row[0] for row in cursor.fetchall())
+            if links and "ms_data" in watermark and watermark["ms_data"] != snap.watermark["ms_data"]:
+                cursor = conn.execute(f"""
+                    SELECT DISTINCT l.compound_id FROM ms_data m JOIN ({links}) l ON l.peak_id = m.peak_id
+                    WHERE m.id > ?
+                """, (snap.watermark["ms_data"][0] or -1,))
+                affected.update(row[0] for row in cursor.fetchall())
+            affected_ids = sorted(affected.intersection(df['pfas_id']))
+            if affected_ids:
+                updated = _fetch_library_rows(conn, ids=affected_ids)
+                # Pair re-read rows with the rows they replace by row identity, not by
+                # pfas_id alone: a compound can have several summary rows
+                keys = [c for c in SUMMARY_ROW_KEY if c in df.columns and c in updated.columns]
+                mask = df['pfas_id'].isin(affected_ids).to_numpy()
+                old_rows = df.loc[mask, keys].assign(_pos=np.flatnonzero(mask))
+                if old_rows.duplicated(keys).any() or updated.duplicated(keys).any():
+                    return None
+                pairs = updated[keys].assign(_new=np.arange(len(updated))).merge(old_rows, on=keys, how="left")
+                matched = pairs['_pos'].notna().to_numpy()
+                if matched.sum() != len(old_rows):
+                    return None  # a summary row went away
+                changed_positions = pairs['_pos'].to_numpy()[matched].astype(np.int64)
+                source_rows = pairs['_new'].to_numpy()[matched]
+                for col in updated.columns:
+                    if col in df.columns:
+                        df.iloc[changed_positions, df.columns.get_loc(col)] = updated[col].to_numpy()[source_rows]
+                # New summary rows of existing compounds are appended like new compounds
+                if not matched.all():
+                    new_rows = pd.concat(
+                        [updated.iloc[pairs['_new'].to_numpy()[~matched]], new_rows], ignore_index=True
+                    )
+
+        n_old = len(df)
+        if len(new_rows):
+            df = pd.concat([df, new_rows[[c for c in df.columns if c in new_rows.columns]]], ignore_index=True)
+
+        # Fingerprints: bin only spectra that are new (or whose representative changed)
+        store, engine, matcher = snap.store, snap.engine, snap.matcher
+        if snap.store is not None and any(
+            watermark.get(table) != snap.watermark.get(table) for table in ("ms_data", "peaks", "peak_ums")
+        ):
+            store, kept_rows = fs.update_fingerprint_store(conn, self.db_path, snap.store)
+            engine = snap.engine.merge(kept_rows, store.matrix[len(kept_rows):])
+            first_new = store.peak_offsets[len(kept_rows)]
+            matcher = snap.matcher.merge(
+                kept_rows, store.peak_mz[first_new:], store.peak_int[first_new:],
+                store.peak_offsets[len(kept_rows):] - first_new
+            )
+        df = _attach_fingerprint_rows(df, store)
+
+        # Index: append new rows; re-sort only if an existing precursor moved
+        old_mz = pd.to_numeric(snap.df['precursor_mz'], errors='coerce').to_numpy(dtype=np.float64)
+        cur_mz = pd.to_numeric(df['precursor_mz'], errors='coerce').to_numpy(dtype=np.float64)[:n_old]
+        if not np.array_equal(old_mz, cur_mz, equal_nan=True):
+            index = PrecursorIndex.from_library(df)
+        else:
+            added = df.iloc[n_old:]
+            index = snap.index.extend(
+                pd.to_numeric(added['precursor_mz'], errors='coerce').to_numpy(dtype=np.float64),
+                pd.to_numeric(added['rt_mean'], errors='coerce').to_numpy(dtype=np.float64)
+                if 'rt_mean' in added.columns else None
+            )
+            if len(changed_positions) and index.rt_mean is not None and 'rt_mean' in df.columns:
+                index.rt_mean[changed_positions] = pd.to_numeric(
+                    df['rt_mean'].iloc[changed_positions], errors='coerce'
+                ).to_numpy(dtype=np.float64)
+        return LibrarySnapshot(df, store, engine, matcher, index, watermark, token)
+
+
+@st.cache_resource(show_spinner=False)
+def get_reference_library(db_path: str) -> ReferenceLibrary:
+    """Process-wide ReferenceLibrary for a database file."""
+    return ReferenceLibrary(Path(db_path))
+
+
+def load_reference_library(db_path: Optional[str] = None) -> LibrarySnapshot:
+    """
+    Current library snapshot (rows, similarity engine and precursor index that
+    belong together), refreshed incrementally when the database has grown.
     
-    return df
+    Args:
+        db_path: Database file (default: the app database from config)
+    """
+    db_path = Path(db_path) if db_path else get_db_path()
+    return get_reference_library(str(Path(db_path).resolve())).snapshot()
+
+
+def load_library_data(db_path: Optional[str] = None) -> pd.DataFrame:
+    """
+    Fetch all compounds and necessary metadata for detection.
+    Rows carry 'fp_row' into the fingerprint store (-1 = none) and 'has_spectrum'.
+    """
+    return load_reference_library(db_path).df
+
+
+def load_similarity_engine(db_path: Optional[str] = None) -> SimilarityEngine:
+    """
+    L2-normalized sparse library fingerprint matrix for analyze_peak.
+    Rows line up with the 'fp_row' column of load_library_data().
+    """
+    return load_reference_library(db_path).engine
+
+
+def load_accurate_mass_matcher(db_path: Optional[str] = None) -> AccurateMassMatcher:
+    """
+    Library peak lists for ppm-tolerance matching in analyze_peak.
+    Rows line up with the 'fp_row' column of load_library_data().
+    """
+    return load_reference_library(db_path).matcher
+
+
+def load_precursor_index(db_path: Optional[str] = None) -> PrecursorIndex:
+    """Sorted precursor m/z index over load_library_data() rows."""
+    return load_reference_library(db_path).index
@@ -0,0 +1,313 @@
+"""
+Query Instrumentation
+Connection / cursor classes that time every statement (execute plus the fetches
+that drain it) and count the rows it returned. Statements are aggregated per
+Streamlit session for the sidebar diagnostics panel; statements slower than
+SLOW_QUERY_MS are written with their EXPLAIN QUERY PLAN to a rolling JSON-lines
+log on disk.
+
+Pooled connections use these classes when QUERY_LOG_ENABLED is set (see
+database.get_pool); scripts that open their own connections are not affected.
+"""
+import json
+import logging
+import logging.handlers
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from utils.config import (
+    SLOW_QUERY_LOG, SLOW_QUERY_LOG_BACKUPS, SLOW_QUERY_LOG_MAX_BYTES, SLOW_QUERY_MS
+)
+
+MAX_SESSIONS = 64           # sessions whose statistics are kept (least recently active dropped)
+MAX_STATEMENTS = 500        # distinct statements kept per session
+MAX_PARAMS_CHARS = 200      # parameters are truncated to this in the slow-query log
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+@dataclass
+class StatementStats:
+    sql: str
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    slow: int = 0
+    errors: int = 0
+
+
+def normalize_sql(sql: str) -> str:
+    """One key per statement shape: whitespace collapsed, IN (?, ?, ...) lists folded."""
+    return _PLACEHOLDER_LIST.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())
+
+
+def _session_id() -> str:
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else ""
+
+
+def _explain(conn: sqlite3.Connection, sql: str, params: Any) -> List[str]:
+    """EXPLAIN QUERY PLAN of a statement, through a plain (uninstrumented) cursor."""
+    try:
+        return [row[-1] for row in sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    except sqlite3.Error:
+        return []
+
+
+# ============================================================================
+# Statistics and Slow-Query Log
+# ============================================================================
+
+class QueryLog:
+    """Per-session statement statistics plus the rolling slow-query log."""
+
+    def __init__(
+        self,
+        slow_ms: float = SLOW_QUERY_MS,
+        path: Optional[Path] = SLOW_QUERY_LOG,
+        max_bytes: int = SLOW_QUERY_LOG_MAX_BYTES,
+        backups: int = SLOW_QUERY_LOG_BACKUPS
+    ):
+        self.slow_ms = slow_ms
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Dict[str, StatementStats]]" = OrderedDict()
+        self._logger: Optional[logging.Logger] = None
+        self._log_failed = False
+
+    def _slow_logger(self) -> Optional[logging.Logger]:
+        """Logger writing to the rotating file, created on the first slow statement."""
+        if self._logger is None and not self._log_failed and self.path is not None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+                )
+            except OSError:
+                self._log_failed = True  # read-only deployment: keep the in-memory statistics only
+                return None
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger(f"{__name__}.slow.{id(self)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def record(
+        self,
+        conn: sqlite3.Connection,
+        sql: str,
+        params: Any,
+        seconds: float,
+        rows: int,
+        error: Optional[str] = None
+    ) -> None:
+        ms = seconds * 1000
+        key = normalize_sql(sql)
+        session = _session_id()
+        slow = ms >= self.slow_ms
+        with self._lock:
+            stats = self._sessions.get(session)
+            if stats is None:
+                stats = self._sessions[session] = {}
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session)
+            entry = stats.get(key)
+            if entry is None:
+                if len(stats) >= MAX_STATEMENTS:
+                    entry = StatementStats(key)  # counted nowhere once the session is full
+                else:
+                    entry = stats[key] = StatementStats(key)
+            entry.calls += 1
+            entry.total_ms += ms
+            entry.max_ms = max(entry.max_ms, ms)
+            entry.rows += rows
+            entry.slow += slow
+            entry.errors += error is not None
+        if slow:
+            logger = self._slow_logger()
+            if logger is not None:
+                logger.info(json.dumps({
+                    "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "session": session,
+                    "ms": round(ms, 2),
+                    "rows": rows,
+                    "sql": key,
+                    "params": repr(params)[:MAX_PARAMS_CHARS],
+                    "plan": _explain(conn, sql, params) if error is None else [],
+                    "error": error,
+                }))
+
+    def session_stats(self, session: Optional[str] = None) -> List[StatementStats]:
+        """Statements of a session (default: the current one), slowest total first."""
+        session = _session_id() if session is None else session
+        with self._lock:
+            stats = list(self._sessions.get(session, {}).values())
+        return sorted(stats, key=lambda s: s.total_ms, reverse=True)
+
+    def reset_session(self, session: Optional[str] = None) -> None:
+        session = _session_id() if session is None else session
+        with self._lock:
+            self._sessions.pop(session, None)
+
+
+QUERY_LOG = QueryLog()
+
+
+# ============================================================================
+# Instrumented Connection
+# ============================================================================
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement to QUERY_LOG once it is drained, closed,
+    replaced by the next execute or garbage collected. Latency is the time spent
+    inside execute and the fetches, not the caller's work between rows.
+    """
+    _pending = None  # [sql, params, seconds, rows]
+
+    def _finish(self, error: Optional[str] = None) -> None:
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            QUERY_LOG.record(self.connection, *pending, error=error)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except sqlite3.Error as e:
+            self._pending = [sql, parameters, time.perf_counter() - start, 0]
+            self._finish(error=str(e))
+            raise
+        self._pending = [sql, parameters, time.perf_counter() - start, 0]
+        if self.description is None:
+            self._finish()  # no result rows (DDL / DML / PRAGMA without output)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, (), time.perf_counter() - start, 0]
+            self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            if row is None:
+                self._finish()
+            else:
+                self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            self._pending[3] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            self._pending[3] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - start
+                self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - start
+            self._pending[3] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors (including execute shortcuts) are instrumented."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+# ============================================================================
+# Sidebar Diagnostics
+# ============================================================================
+
+def render_query_diagnostics(top: int = 10) -> None:
+    """Sidebar expander with the current session's most expensive statements."""
+    stats = QUERY_LOG.session_stats()
+    with st.sidebar.expander("🩺 Query diagnostics", expanded=False):
+        if not stats:
+            st.caption("No database queries in this session yet.")
+            return
+        total_ms = sum(s.total_ms for s in stats)
+        slow = sum(s.slow for s in stats)
+        st.caption(
+            f"{sum(s.calls for s in stats):,} queries, {total_ms / 1000:.2f} s in the database; "
+            f"{slow:,} over {QUERY_LOG.slow_ms:.0f} ms"
+        )
+        st.dataframe(pd.DataFrame([{
+            "statement": s.sql if len(s.sql) <= 120 else s.sql[:117] + "...",
+            "calls": s.calls,
+            "total ms": round(s.total_ms, 1),
+            "mean ms": round(s.total_ms / s.calls, 2),
+            "max ms": round(s.max_ms, 1),
+            "rows": s.rows,
+            "slow": s.slow,
+        } for s in stats[:top]]), hide_index=True, use_container_width=True)
+        if QUERY_LOG.path is not None and slow:
+            st.caption(f"Slow statements and their plans: `{QUERY_LOG.path}`")
+        if st.button("Reset", key="query_diagnostics_reset"):
+            QUERY_LOG.reset_session()
+            st.rerun()
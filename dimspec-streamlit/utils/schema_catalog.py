@@ -0,0 +1,134 @@
+"""
+Schema Catalog
+Tables, views, columns and column types of a database, read once and reused by the
+database helpers until PRAGMA schema_version (or the file itself) changes, so
+interactive queries do not pay for sqlite_master / PRAGMA table_info round-trips.
+"""
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.common import quote_identifier
+
+_WITHOUT_ROWID = re.compile(r"\bWITHOUT\s+ROWID\b", re.IGNORECASE)
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    type: str
+    notnull: bool
+    pk: int  # position in the primary key (0 = not part of it)
+
+
+@dataclass
+class SchemaCatalog:
+    """Snapshot of a database schema at one schema_version."""
+    schema_version: int
+    objects: Dict[str, str] = field(default_factory=dict)          # name -> 'table' / 'view'
+    columns: Dict[str, List[ColumnInfo]] = field(default_factory=dict)
+    without_rowid: set = field(default_factory=set)
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection) -> "SchemaCatalog":
+        cursor = conn.cursor()
+        schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+        catalog = cls(schema_version=schema_version)
+        cursor.execute("""
+            SELECT name, type, sql FROM sqlite_master
+            WHERE type IN ('table', 'view')
+            ORDER BY name
+        """)
+        for name, obj_type, sql in cursor.fetchall():
+            catalog.objects[name] = obj_type
+            if obj_type == 'table' and sql and _WITHOUT_ROWID.search(sql):
+                catalog.without_rowid.add(name)
+        try:
+            # One round-trip for every object's columns
+            cursor.execute("""
+                SELECT m.name, p.name, p.type, p."notnull", p.pk
+                FROM sqlite_master m, pragma_table_info(m.name) p
+                WHERE m.type IN ('table', 'view')
+                ORDER BY m.name, p.cid
+            """)
+            for obj, col, col_type, notnull, pk in cursor.fetchall():
+                catalog.columns.setdefault(obj, []).append(
+                    ColumnInfo(col, col_type or "", bool(notnull), pk)
+                )
+        except sqlite3.Error:
+            # A broken view fails the joined query; fall back to one object at a time
+            catalog.columns.clear()
+            for obj in catalog.objects:
+                try:
+                    rows = cursor.execute(f"PRAGMA table_info({quote_identifier(obj)})").fetchall()
+                except sqlite3.Error:
+                    continue
+                catalog.columns[obj] = [
+                    ColumnInfo(r[1], r[2] or "", bool(r[3]), r[5]) for r in rows
+                ]
+        return catalog
+
+    def has(self, name: str) -> bool:
+        return name in self.objects
+
+    def object_type(self, name: str) -> Optional[str]:
+        return self.objects.get(name)
+
+    def names(self) -> List[str]:
+        """Tables and views, excluding SQLite internals."""
+        return [n for n in self.objects if not n.startswith("sqlite_")]
+
+    def column_names(self, name: str) -> List[str]:
+        return [c.name for c in self.columns.get(name, [])]
+
+    def column_types(self, name: str) -> Dict[str, str]:
+        return {c.name: c.type for c in self.columns.get(name, [])}
+
+    def primary_key(self, name: str) -> List[str]:
+        pk = sorted((c.pk, c.name) for c in self.columns.get(name, []) if c.pk > 0)
+        return [col for _, col in pk]
+
+
+# One catalog per database file, shared by every connection to it
+_CATALOGS: Dict[str, Tuple[Any, SchemaCatalog]] = {}
+_CATALOG_LOCK = threading.Lock()
+
+
+def main_db_file(conn: sqlite3.Connection) -> Optional[str]:
+    """Resolved path of the connection's main database (None for in-memory)."""
+    for row in conn.execute("PRAGMA database_list").fetchall():
+        if row[1] == 'main' and row[2]:
+            return str(Path(row[2]).resolve())
+    return None
+
+
+def _file_id(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+
+def get_catalog(conn: sqlite3.Connection) -> SchemaCatalog:
+    """
+    Schema catalog for the connection's database. Costs two cheap PRAGMAs
+    (database_list, schema_version) when the cached catalog is current;
+    in-memory databases are not cached.
+    """
+    db_file = main_db_file(conn)
+    if db_file is None:
+        return SchemaCatalog.load(conn)
+    token = (conn.execute("PRAGMA schema_version").fetchone()[0], _file_id(db_file))
+    with _CATALOG_LOCK:
+        cached = _CATALOGS.get(db_file)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    catalog = SchemaCatalog.load(conn)
+    with _CATALOG_LOCK:
+        _CATALOGS[db_file] = (token, catalog)
+    return catalog
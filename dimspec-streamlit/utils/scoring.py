@@ -0,0 +1,214 @@
+"""
+Similarity Scoring Engine
+Scores a query fingerprint against many library fingerprints at once. The
+library CSR matrix is used as given (memory-mapped from the fingerprint store,
+never copied); cosine similarity is one sparse product scaled by precomputed
+inverse row norms.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from typing import Any, Dict, Optional, Sequence, Union
+
+
+def row_norms(matrix: sparse.csr_matrix) -> np.ndarray:
+    """L2 norm of every CSR row, computed from the nonzeros alone."""
+    n_rows = matrix.shape[0]
+    seg = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+    squares = np.square(np.asarray(matrix.data, dtype=np.float64))
+    return np.sqrt(np.bincount(seg, weights=squares, minlength=n_rows))
+
+
+def _inverse(norms: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore"):
+        return np.where(norms > 0, 1.0 / norms, 0.0)
+
+
+def _as_csr(matrix: Any) -> sparse.csr_matrix:
+    """CSR view of a sparse matrix (shares its arrays) or a float32 CSR of anything else."""
+    if sparse.issparse(matrix) and matrix.format == "csr":
+        return sparse.csr_matrix(matrix, copy=False)
+    return sparse.csr_matrix(matrix, dtype=np.float32)
+
+
+class SimilarityEngine:
+    """
+    Cosine similarity against a fixed set of library fingerprints, held as a
+    scipy.sparse CSR matrix with the inverse L2 norm of each row. The matrix's
+    data / indices / indptr arrays are kept as they are, so a memory-mapped
+    fingerprint store stays on disk.
+
+    Rows are addressed by position; -1 marks "no fingerprint" and scores 0.
+    bin_params records how the library was binned so queries are binned the same way.
+    """
+
+    def __init__(self, matrix: Any, bin_params: Optional[Dict[str, float]] = None):
+        self.matrix = _as_csr(matrix)
+        self.inv_norms = _inverse(row_norms(self.matrix))
+        self.bin_params = dict(bin_params) if bin_params else {}
+
+    @classmethod
+    def from_fingerprints(
+        cls,
+        fingerprints: Sequence[Any],
+        bin_params: Optional[Dict[str, float]] = None
+    ) -> "SimilarityEngine":
+        """
+        Build from a sequence of dense fingerprint vectors (None for missing).
+        Missing entries become empty rows, so row i still matches position i.
+        """
+        fingerprints = list(fingerprints)
+        width = next((len(fp) for fp in fingerprints if fp is not None), 0)
+        fingerprints = [fp if fp is not None and len(fp) == width else None for fp in fingerprints]
+        return cls(_stack_rows(fingerprints, width), bin_params)
+
+    def merge(self, kept_rows: np.ndarray, new_matrix: Any) -> "SimilarityEngine":
+        """
+        Engine over self.matrix[kept_rows] followed by new_matrix (raw fingerprints).
+        Norms of kept rows are reused, so only the new rows are measured.
+        """
+        kept_rows = np.asarray(kept_rows, dtype=np.int64)
+        new_matrix = _as_csr(new_matrix)
+        engine = SimilarityEngine.__new__(SimilarityEngine)
+        engine.matrix = sparse.vstack([self.matrix[kept_rows], new_matrix], format="csr")
+        engine.inv_norms = np.concatenate([self.inv_norms[kept_rows], _inverse(row_norms(new_matrix))])
+        engine.bin_params = dict(self.bin_params)
+        return engine
+
+    @property
+    def n_bins(self) -> int:
+        return self.matrix.shape[1]
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the CSR arrays and row norms."""
+        return (self.matrix.data.nbytes + self.matrix.indices.nbytes
+                + self.matrix.indptr.nbytes + self.inv_norms.nbytes)
+
+    def normalize_query(self, query_fp: Any) -> Optional[sparse.csr_matrix]:
+        """Unit-length query as a 1-row CSR aligned to the library bins, or None if it is empty."""
+        q = self.normalize_queries([query_fp])
+        return q if q.nnz else None
+
+    def score(self, query_fp: Any, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of the query against the given library rows.
+
+        Args:
+            query_fp: Query fingerprint (binned with self.bin_params), dense or 1-row sparse
+            rows: Library row numbers to score (-1 = no fingerprint); None scores all rows
+        """
+        if rows is None:
+            rows = np.arange(self.matrix.shape[0])
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = np.zeros(len(rows), dtype=np.float64)
+        q = self.normalize_query(query_fp) if self.n_bins else None
+        if q is None:
+            return scores
+        valid = rows >= 0
+        if valid.any():
+            r = rows[valid]
+            scores[valid] = (self.matrix[r] @ q.T).toarray().ravel() * self.inv_norms[r]
+        return scores
+
+    def normalize_queries(self, query_fps: Union[Sequence[Optional[Any]], sparse.spmatrix]) -> sparse.csr_matrix:
+        """
+        Queries as a unit-row CSR matrix aligned to the library bins (missing or
+        empty queries become empty rows). Accepts a sparse matrix (one query per
+        row, e.g. detection.generate_fingerprint_sparse) or a sequence of vectors.
+        """
+        if sparse.issparse(query_fps):
+            queries = sparse.csr_matrix(query_fps, dtype=np.float32, copy=True)
+        else:
+            queries = _stack_rows(list(query_fps), self.n_bins)
+        if queries.shape[1] != self.n_bins:
+            queries = queries[:, :self.n_bins] if queries.shape[1] > self.n_bins else sparse.hstack(
+                [queries, sparse.csr_matrix((queries.shape[0], self.n_bins - queries.shape[1]), dtype=np.float32)],
+                format="csr"
+            )
+        queries.eliminate_zeros()
+        queries.data *= np.repeat(_inverse(row_norms(queries)), np.diff(queries.indptr)).astype(np.float32)
+        return queries
+
+    def score_pairs(
+        self,
+        queries: sparse.csr_matrix,
+        query_idx: np.ndarray,
+        rows: np.ndarray,
+        block: int = 65536
+    ) -> np.ndarray:
+        """
+        Cosine similarity for many (query, library row) pairs.
+        Only nonzeros are touched: each block of pairs is the row sums of the
+        element-wise product of the gathered library and query rows.
+
+        Args:
+            queries: Unit-row query matrix from normalize_queries
+            query_idx: Query row per pair
+            rows: Library row per pair (-1 = no fingerprint)
+            block: Pairs per block, bounding the temporary gather size
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        query_idx = np.asarray(query_idx, dtype=np.int64)
+        scores = np.zeros(len(rows), dtype=np.float64)
+        if not self.n_bins:
+            return scores
+        queries = sparse.csr_matrix(queries)
+        for start in range(0, len(rows), block):
+            pair = np.arange(start, min(start + block, len(rows)))
+            pair = pair[rows[pair] >= 0]
+            if len(pair) == 0:
+                continue
+            r = rows[pair]
+            products = self.matrix[r].multiply(queries[query_idx[pair]])
+            scores[pair] = np.asarray(products.sum(axis=1)).ravel() * self.inv_norms[r]
+        return scores
+
+
+def _stack_rows(vectors: Sequence[Optional[Any]], width: int) -> sparse.csr_matrix:
+    """One float32 CSR row per vector, padded / cut to width; None or misfit vectors become empty rows."""
+    rows = []
+    for v in vectors:
+        if v is None:
+            rows.append(sparse.csr_matrix((1, width), dtype=np.float32))
+            continue
+        row = sparse.csr_matrix(v, dtype=np.float32) if sparse.issparse(v) else sparse.csr_matrix(
+            np.asarray(v, dtype=np.float32).reshape(1, -1))
+        if row.shape[1] > width:
+            row = row[:, :width]
+        elif row.shape[1] < width:
+            row = sparse.csr_matrix((row.data, row.indices, row.indptr), shape=(1, width))
+        rows.append(row)
+    if not rows:
+        return sparse.csr_matrix((0, width), dtype=np.float32)
+    return sparse.vstack(rows, format="csr")
+
+
+def top_k_order(primary_desc: np.ndarray, secondary_asc: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k best items: highest primary first, ties by lowest secondary.
+    Uses argpartition to avoid sorting everything; items tied with the k-th
+    primary value join the final sort so tie-breaking stays exact.
+    """
+    n = len(primary_desc)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if n > k:
+        kth = primary_desc[np.argpartition(-primary_desc, k - 1)[k - 1]]
+        pool = np.flatnonzero(primary_desc >= kth)
+    else:
+        pool = np.arange(n)
+    order = np.lexsort((secondary_asc[pool], -primary_desc[pool]))
+    return pool[order[:k]]
+
+
+def library_rows(library_df: pd.DataFrame, candidates: pd.DataFrame) -> np.ndarray:
+    """
+    Engine row numbers for candidate rows, from the 'fp_row' column that
+    load_library_data attaches (frame positions are not engine rows).
+    """
+    if 'fp_row' not in candidates.columns:
+        raise ValueError(
+            "library rows carry no 'fp_row'; use pfas_library.load_library_data, or map "
+            "pfas_id through FingerprintStore.row_map()"
+        )
+    return candidates['fp_row'].to_numpy(dtype=np.int64)
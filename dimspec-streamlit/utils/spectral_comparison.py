@@ -0,0 +1,513 @@
+"""
+Spectral Comparison
+Dot-product match scores between (uncertainty) mass spectra and their bootstrap
+distributions, ported from R/spectral_analysis/spectral_comparison.R (compare_ms,
+bootstrap_compare_ms, dotprod, overlap). All bootstrap resamples of a chunk are
+drawn as one random matrix and scored together with array operations, and the
+resampling stops early once the confidence interval has settled. AccurateMassMatcher
+applies the same ppm-paired dot product to whole candidate lists of the library.
+"""
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from utils import data_processing as dp
+from utils import ums
+
+DEFAULT_MZ_WEIGHT = 1.0          # m in dotprod
+DEFAULT_INT_WEIGHT = 0.5         # n in dotprod
+DEFAULT_BOOTSTRAP_RUNS = 10000   # upper bound; early stopping usually ends far sooner
+BOOTSTRAP_CHUNK = 250            # resamples scored per array operation
+BOOTSTRAP_MIN_RUNS = 1000        # never stop before this many resamples
+BOOTSTRAP_CI = 0.95
+BOOTSTRAP_CI_TOLERANCE = 0.002   # stop once the CI bounds move less than this between rounds
+
+Pair = Union[float, Sequence[float]]
+
+
+def _pair(value: Pair) -> Tuple[float, float]:
+    if np.ndim(value) == 0:
+        return float(value), float(value)
+    first, second = value
+    return float(first), float(second)
+
+
+def _overlap_sums(
+    lo_a: np.ndarray, hi_a: np.ndarray,
+    lo_b: np.ndarray, hi_b: np.ndarray,
+    values_b: Sequence[np.ndarray]
+) -> Tuple[np.ndarray, ...]:
+    """
+    For every ion of a, the number of ions of b whose window overlaps it and the
+    sums of values_b over those ions; all arrays are (R, n) with one row per resample.
+
+    The overlapping ions of b are those with lo_b <= hi_a less those with
+    hi_b < lo_a (a subset of the first), so both come from cumulative sums along
+    b sorted by lo_b and by hi_b, located with one searchsorted each over all rows
+    (rows are offset by `span` into a single sorted key, as in AccurateMassMatcher).
+    Time and memory grow with R * (n_a + n_b), not R * n_a * n_b.
+    """
+    rows, n_b = lo_b.shape
+    base = min(lo_a.min(), lo_b.min())
+    span = max(hi_a.max(), hi_b.max()) - base + 1.0
+    offset = np.arange(rows)[:, None] * span - base
+    first = np.arange(rows)[:, None] * (n_b + 1)
+
+    def below(bounds: np.ndarray, probe: np.ndarray, side: str) -> Tuple[np.ndarray, ...]:
+        # Counts and sums of the ions of b with bounds < probe ('left') or <= probe ('right')
+        order = np.argsort(bounds, axis=1, kind="stable")
+        keys = (np.take_along_axis(bounds, order, axis=1) + offset).ravel()
+        count = np.searchsorted(keys, (probe + offset).ravel(), side=side).reshape(probe.shape)
+        count -= np.arange(rows)[:, None] * n_b
+        at = (first + count).ravel()
+        sums = []
+        for values in values_b:
+            cumulative = np.zeros((rows, n_b + 1))
+            np.cumsum(np.take_along_axis(values, order, axis=1), axis=1, out=cumulative[:, 1:])
+            sums.append(cumulative.ravel()[at].reshape(probe.shape))
+        return (count, *sums)
+
+    inside = below(lo_b, hi_a, "right")
+    before = below(hi_b, lo_a, "left")
+    return tuple(i - b for i, b in zip(inside, before))
+
+
+def _scores(
+    mz1: np.ndarray, int1: np.ndarray,
+    mz2: np.ndarray, int2: np.ndarray,
+    error: Tuple[float, float], minerror: Tuple[float, float],
+    m: float, n: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Forward (dp) and reverse (rdp) dot products for R paired spectra at once.
+    mz1/int1 are (R, n1), mz2/int2 are (R, n2); returns two (R,) arrays.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        i1 = int1 / int1.sum(axis=1, keepdims=True)
+        i2 = int2 / int2.sum(axis=1, keepdims=True)
+    tol1 = ums.mass_tolerance(mz1, error[0], minerror[0])
+    tol2 = ums.mass_tolerance(mz2, error[1], minerror[1])
+    lo1, hi1 = mz1 - tol1, mz1 + tol1
+    lo2, hi2 = mz2 - tol2, mz2 + tol2
+
+    def dotprod(ma, ia, lo_a, hi_a, mb, ib, lo_b, hi_b):
+        # overlap(): each ion of a is paired with the mean m/z and summed intensity
+        # of the ions of b whose windows intersect its own
+        count, mz_sum, int_sum = _overlap_sums(lo_a, hi_a, lo_b, hi_b, (mb, ib))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m_paired = np.where(count > 0, mz_sum / count, 0.0)
+        i_paired = np.where(count > 0, np.maximum(int_sum, 0.0), 0.0)
+        w1 = ma ** m * ia ** n
+        w2 = m_paired ** m * i_paired ** n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (w1 * w2).sum(axis=1) ** 2 / ((w1 ** 2).sum(axis=1) * (w2 ** 2).sum(axis=1))
+
+    fwd = dotprod(mz1, i1, lo1, hi1, mz2, i2, lo2, hi2)
+    rev = dotprod(mz2, i2, lo2, hi2, mz1, i1, lo1, hi1)
+    return fwd, rev
+
+
+def compare_ms(
+    ms1: pd.DataFrame,
+    ms2: pd.DataFrame,
+    error: Pair = (ums.DEFAULT_MASS_ERROR_PPM, ums.DEFAULT_MASS_ERROR_PPM),
+    minerror: Pair = (ums.DEFAULT_MIN_ERROR, ums.DEFAULT_MIN_ERROR),
+    m: float = DEFAULT_MZ_WEIGHT,
+    n: float = DEFAULT_INT_WEIGHT
+) -> Dict[str, float]:
+    """
+    Dot product (dp) and reverse dot product (rdp) of two spectra with 'mz' and
+    'int' columns; NaN when either spectrum is empty.
+    """
+    if len(ms1) == 0 or len(ms2) == 0:
+        return {"dp": np.nan, "rdp": np.nan}
+    fwd, rev = _scores(
+        ms1["mz"].to_numpy(dtype=np.float64)[None, :], ms1["int"].to_numpy(dtype=np.float64)[None, :],
+        ms2["mz"].to_numpy(dtype=np.float64)[None, :], ms2["int"].to_numpy(dtype=np.float64)[None, :],
+        _pair(error), _pair(minerror), m, n
+    )
+    return {"dp": float(fwd[0]), "rdp": float(rev[0])}
+
+
+# ============================================================================
+# Bootstrap
+# ============================================================================
+
+@dataclass
+class BootstrapResult:
+    """Bootstrap distribution of match scores for one pair of spectra."""
+    dp: np.ndarray
+    rdp: np.ndarray
+    ci: float
+    converged: bool
+
+    @property
+    def runs(self) -> int:
+        return len(self.dp)
+
+    def interval(self, which: str = "dp") -> Tuple[float, float]:
+        """Central confidence interval of dp or rdp."""
+        values = getattr(self, which)
+        alpha = (1 - self.ci) / 2
+        low, high = np.nanquantile(values, [alpha, 1 - alpha]) if np.isfinite(values).any() else (np.nan, np.nan)
+        return float(low), float(high)
+
+    def summary(self) -> pd.DataFrame:
+        """Quartiles of dp and rdp (dp_summary of bootstrap_compare_ms)."""
+        probs = [0.0, 0.25, 0.5, 0.75, 1.0]
+        def quartiles(values):
+            return np.nanquantile(values, probs) if np.isfinite(values).any() else np.full(len(probs), np.nan)
+        return pd.DataFrame({"dp": quartiles(self.dp), "rdp": quartiles(self.rdp)},
+                            index=[f"{int(p * 100)}%" for p in probs])
+
+
+def _as_ums(spectrum: pd.DataFrame) -> Tuple[np.ndarray, ...]:
+    """Means and standard deviations of a spectrum; missing uncertainties count as 0."""
+    def column(name):
+        if name not in spectrum.columns:
+            return np.zeros(len(spectrum))
+        return np.nan_to_num(spectrum[name].to_numpy(dtype=np.float64))
+    return column("mz"), column("mz_u"), column("int"), column("int_u")
+
+
+def _resample_chunk(
+    rng: np.random.Generator,
+    size: int,
+    spectra: Tuple[Tuple[np.ndarray, ...], Tuple[np.ndarray, ...]],
+    error: Tuple[float, float],
+    minerror: Tuple[float, float],
+    m: float,
+    n: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Score `size` resamples: every m/z and intensity drawn as N(mean, sd), floored at 0."""
+    drawn = []
+    for mz, mz_u, inten, inten_u in spectra:
+        noise = rng.standard_normal((2, size, len(mz)))
+        drawn.append((
+            np.maximum(mz[None, :] + noise[0] * mz_u[None, :], 0.0),
+            np.maximum(inten[None, :] + noise[1] * inten_u[None, :], 0.0),
+        ))
+    (mz1, int1), (mz2, int2) = drawn
+    return _scores(mz1, int1, mz2, int2, error, minerror, m, n)
+
+
+def bootstrap_compare_ms(
+    ms1: pd.DataFrame,
+    ms2: pd.DataFrame,
+    error: Pair = (ums.DEFAULT_MASS_ERROR_PPM, ums.DEFAULT_MASS_ERROR_PPM),
+    minerror: Pair = (ums.DEFAULT_MIN_ERROR, ums.DEFAULT_MIN_ERROR),
+    m: float = DEFAULT_MZ_WEIGHT,
+    n: float = DEFAULT_INT_WEIGHT,
+    runs: int = DEFAULT_BOOTSTRAP_RUNS,
+    chunk_size: int = BOOTSTRAP_CHUNK,
+    workers: int = 1,
+    ci: float = BOOTSTRAP_CI,
+    tolerance: Optional[float] = BOOTSTRAP_CI_TOLERANCE,
+    min_runs: int = BOOTSTRAP_MIN_RUNS,
+    seed: Optional[int] = None
+) -> BootstrapResult:
+    """
+    Bootstrap distribution of dp/rdp between two uncertainty mass spectra.
+
+    Resamples are scored chunk_size at a time; `workers` chunks run side by side
+    on threads per round (NumPy releases the GIL in the array work). After each
+    round past min_runs, sampling stops when both bounds of the dp confidence
+    interval moved less than `tolerance` (None always draws all `runs`).
+
+    Args:
+        ms1, ms2: Spectra with mz, int and optionally mz_u, int_u columns (see utils.ums)
+        seed: Seed for reproducible draws (each chunk gets its own stream)
+    """
+    if len(ms1) == 0 or len(ms2) == 0:
+        return BootstrapResult(np.full(0, np.nan), np.full(0, np.nan), ci, False)
+    spectra = (_as_ums(ms1), _as_ums(ms2))
+    error, minerror = _pair(error), _pair(minerror)
+    workers = max(1, int(workers))
+    streams = np.random.SeedSequence(seed)
+
+    dp_parts, rdp_parts = [], []
+    drawn = 0
+    previous = None
+    converged = False
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while drawn < runs:
+            sizes = []
+            for _ in range(workers):
+                size = min(chunk_size, runs - drawn - sum(sizes))
+                if size > 0:
+                    sizes.append(size)
+            rngs = [np.random.default_rng(s) for s in streams.spawn(len(sizes))]
+            args = [(rng, size, spectra, error, minerror, m, n) for rng, size in zip(rngs, sizes)]
+            if executor is not None:
+                results = list(executor.map(lambda a: _resample_chunk(*a), args))
+            else:
+                results = [_resample_chunk(*a) for a in args]
+            for fwd, rev in results:
+                dp_parts.append(fwd)
+                rdp_parts.append(rev)
+            drawn += sum(sizes)
+
+            if tolerance is not None and drawn >= min_runs:
+                current = BootstrapResult(np.concatenate(dp_parts), np.concatenate(rdp_parts), ci, False).interval()
+                if previous is not None and np.all(np.abs(np.subtract(current, previous)) < tolerance):
+                    converged = True
+                    break
+                previous = current
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return BootstrapResult(np.concatenate(dp_parts), np.concatenate(rdp_parts), ci, converged)
+
+
+# ============================================================================
+# Accurate-Mass Library Matching
+# ============================================================================
+
+def _normalize_segments(intensity: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Intensities divided by the total of their spectrum (empty spectra stay empty)."""
+    seg = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    total = np.bincount(seg, weights=intensity, minlength=len(offsets) - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nan_to_num(intensity / total[seg])
+
+
+def pack_spectra(
+    spectra: Sequence[Optional[Tuple[Sequence[float], Sequence[float]]]]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pack (mz, intensity) spectra for AccurateMassMatcher: ions with a finite m/z and
+    positive intensity, sorted by m/z within each spectrum, intensities summing to 1.
+    None entries become empty spectra.
+
+    Returns:
+        (mz, intensity, offsets) with spectrum i at [offsets[i]:offsets[i+1]]
+    """
+    mz_arrays, int_arrays = [], []
+    for spectrum in spectra:
+        mz, inten = (np.empty(0), np.empty(0)) if spectrum is None else spectrum
+        mz = np.asarray(mz, dtype=np.float64)
+        inten = np.asarray(inten, dtype=np.float64)
+        keep = np.isfinite(mz) & np.isfinite(inten) & (inten > 0) if len(mz) == len(inten) else np.zeros(0, bool)
+        order = np.argsort(mz[keep], kind="stable")
+        mz_arrays.append(mz[keep][order])
+        int_arrays.append(inten[keep][order])
+    mz_values, offsets = dp.pack_ragged(mz_arrays)
+    int_values, _ = dp.pack_ragged(int_arrays)
+    return mz_values, _normalize_segments(int_values, offsets), offsets
+
+
+class AccurateMassMatcher:
+    """
+    Accurate-mass spectral matching against the library peak lists, the
+    high-resolution counterpart of scoring.SimilarityEngine.
+
+    Ions pair when their ppm/minerror windows overlap (as in compare_ms), each with
+    its nearest counterpart, and pairs are scored with dotprod(m, n). All library
+    ions of the scored rows are concatenated and merged into the sorted query ions
+    with one searchsorted pass; dp/rdp then fall out of per-row segment sums, so
+    no pair of spectra is visited in Python.
+
+    Rows are addressed by position like SimilarityEngine; -1 marks "no spectrum"
+    and scores 0.
+    """
+
+    def __init__(
+        self,
+        mz: np.ndarray,
+        intensity: np.ndarray,
+        offsets: np.ndarray,
+        masserror: float = ums.DEFAULT_MASS_ERROR_PPM,
+        minerror: float = ums.DEFAULT_MIN_ERROR,
+        m: float = DEFAULT_MZ_WEIGHT,
+        n: float = DEFAULT_INT_WEIGHT
+    ):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.mz = np.asarray(mz, dtype=np.float64)
+        self.intensity = _normalize_segments(np.asarray(intensity, dtype=np.float64), self.offsets)
+        self.masserror, self.minerror, self.m, self.n = masserror, minerror, m, n
+        # Sum of squared ion weights per row: the library side of both denominators
+        seg = np.repeat(np.arange(self.n_rows), np.diff(self.offsets))
+        self._weight_ss = np.bincount(seg, weights=self._weights(self.mz, self.intensity) ** 2,
+                                      minlength=self.n_rows)
+
+    @classmethod
+    def from_store(cls, store: Any, **params: float) -> "AccurateMassMatcher":
+        """Matcher over the peak lists of a fingerprint_store.FingerprintStore."""
+        return cls(store.peak_mz, store.peak_int, store.peak_offsets, **params)
+
+    def merge(
+        self,
+        kept_rows: np.ndarray,
+        mz: np.ndarray,
+        intensity: np.ndarray,
+        offsets: np.ndarray
+    ) -> "AccurateMassMatcher":
+        """Matcher over self's kept_rows followed by new peak lists (same layout as __init__)."""
+        positions, kept_offsets = dp.ragged_positions(self.offsets, kept_rows)
+        return AccurateMassMatcher(
+            np.concatenate([self.mz[positions], np.asarray(mz, dtype=np.float64)]),
+            np.concatenate([self.intensity[positions], _normalize_segments(
+                np.asarray(intensity, dtype=np.float64), np.asarray(offsets, dtype=np.int64))]),
+            np.concatenate([kept_offsets, kept_offsets[-1] + np.asarray(offsets, dtype=np.int64)[1:]]),
+            self.masserror, self.minerror, self.m, self.n
+        )
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.offsets) - 1
+
+    def memory_bytes(self) -> int:
+        return self.mz.nbytes + self.intensity.nbytes + self.offsets.nbytes + self._weight_ss.nbytes
+
+    def _weights(self, mz: np.ndarray, intensity: np.ndarray) -> np.ndarray:
+        return mz ** self.m * intensity ** self.n
+
+    def score(
+        self,
+        spectrum_mz: Sequence[float],
+        spectrum_int: Sequence[float],
+        rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Forward (dp) and reverse (rdp) dot products of one query spectrum against
+        the given library rows (None scores all rows).
+        """
+        if rows is None:
+            rows = np.arange(self.n_rows)
+        rows = np.asarray(rows, dtype=np.int64)
+        queries = pack_spectra([(spectrum_mz, spectrum_int)])
+        return self.score_pairs(queries, np.zeros(len(rows), dtype=np.int64), rows)
+
+    def score_pairs(
+        self,
+        queries: Tuple[np.ndarray, np.ndarray, np.ndarray],
+        query_idx: np.ndarray,
+        rows: np.ndarray,
+        block: int = 65536
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        dp and rdp for many (query, library row) pairs.
+
+        Args:
+            queries: Packed query spectra from pack_spectra
+            query_idx: Query per pair
+            rows: Library row per pair (-1 = no spectrum)
+            block: Pairs per block, bounding the temporary gather size
+        """
+        q_mz, q_int, q_offsets = queries
+        rows = np.asarray(rows, dtype=np.int64)
+        query_idx = np.asarray(query_idx, dtype=np.int64)
+        dp_out = np.zeros(len(rows), dtype=np.float64)
+        rdp_out = np.zeros(len(rows), dtype=np.float64)
+        if len(q_mz) == 0 or len(self.mz) == 0:
+            return dp_out, rdp_out
+
+        # Queries sorted by (query, m/z) as one key, so a single searchsorted covers them all
+        q_seg = np.repeat(np.arange(len(q_offsets) - 1), np.diff(q_offsets))
+        span = np.ceil(max(q_mz.max(), self.mz.max())) + 1.0
+        q_key = q_seg * span + q_mz
+        q_tol = ums.mass_tolerance(q_mz, self.masserror, self.minerror)
+        q_weight = self._weights(q_mz, q_int)
+        q_weight_ss = np.bincount(q_seg, weights=q_weight ** 2, minlength=len(q_offsets) - 1)
+
+        valid = (rows >= 0) & (np.diff(q_offsets)[query_idx] > 0)
+        for start in range(0, len(rows), block):
+            pair = np.arange(start, min(start + block, len(rows)))
+            pair = pair[valid[pair]]
+            if len(pair) == 0:
+                continue
+            positions, lib_offsets = dp.ragged_positions(self.offsets, rows[pair])
+            if len(positions) == 0:
+                continue
+            seg = np.repeat(np.arange(len(pair)), np.diff(lib_offsets))
+            lib_mz, lib_int = self.mz[positions], self.intensity[positions]
+            query = query_idx[pair][seg]
+
+            # Nearest query ion of each library ion, kept if the two windows overlap
+            pos = np.searchsorted(q_key, query * span + lib_mz)
+            lo, hi = q_offsets[query], q_offsets[query + 1] - 1
+            right = np.clip(pos, lo, hi)
+            left = np.clip(pos - 1, lo, hi)
+            nearest = np.where(np.abs(q_mz[left] - lib_mz) <= np.abs(q_mz[right] - lib_mz), left, right)
+            hit = np.abs(q_mz[nearest] - lib_mz) <= (
+                q_tol[nearest] + ums.mass_tolerance(lib_mz, self.masserror, self.minerror)
+            )
+
+            # Reverse: every library ion against its paired query ion (0 if unpaired)
+            lib_weight = self._weights(lib_mz, lib_int)
+            paired_q = np.where(hit, q_weight[nearest], 0.0)
+            dot = np.bincount(seg, weights=lib_weight * paired_q, minlength=len(pair))
+            paired_ss = np.bincount(seg, weights=paired_q ** 2, minlength=len(pair))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                rdp_out[pair] = np.nan_to_num(dot ** 2 / (self._weight_ss[rows[pair]] * paired_ss))
+
+            # Forward: every query ion against the mean m/z and summed intensity of its library ions
+            group, inverse = np.unique(seg[hit] * len(q_mz) + nearest[hit], return_inverse=True)
+            count = np.bincount(inverse)
+            paired_lib = self._weights(
+                np.bincount(inverse, weights=lib_mz[hit]) / count,
+                np.bincount(inverse, weights=lib_int[hit])
+            )
+            group_pair, group_q = group // len(q_mz), group % len(q_mz)
+            dot = np.bincount(group_pair, weights=q_weight[group_q] * paired_lib, minlength=len(pair))
+            paired_ss = np.bincount(group_pair, weights=paired_lib ** 2, minlength=len(pair))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                dp_out[pair] = np.nan_to_num(dot ** 2 / (q_weight_ss[query_idx[pair]] * paired_ss))
+        return dp_out, rdp_out
+
+
+# ============================================================================
+# Detector Support
+# ============================================================================
+
+def query_spectrum(mz: Sequence[float], intensity: Sequence[float]) -> pd.DataFrame:
+    """A measured single-scan spectrum as a UMS without uncertainty."""
+    mz = np.asarray(mz, dtype=np.float64)
+    spectrum = pd.DataFrame({
+        "mz": mz, "mz_u": np.zeros(len(mz)),
+        "int": np.asarray(intensity, dtype=np.float64), "int_u": np.zeros(len(mz)),
+        "n": np.ones(len(mz), dtype=np.int64),
+    })
+    spectrum.attrs["numscans"] = 1
+    return spectrum
+
+
+def bootstrap_candidates(
+    conn: sqlite3.Connection,
+    candidates: pd.DataFrame,
+    spectrum_mz: Sequence[float],
+    spectrum_int: Sequence[float],
+    top: int = 3,
+    **bootstrap_args: Any
+) -> pd.DataFrame:
+    """
+    Bootstrap match-score intervals of a measured spectrum against the consensus
+    spectra of the first `top` candidates (by their 'pfas_id').
+
+    Returns:
+        candidates with dp/rdp, their interval bounds (dp_low, dp_high, rdp_low,
+        rdp_high) and bootstrap_runs (NaN where a candidate has no consensus
+        spectrum or was not evaluated)
+    """
+    columns = ["dp", "dp_low", "dp_high", "rdp", "rdp_low", "rdp_high", "bootstrap_runs"]
+    out = candidates.copy()
+    for col in columns:
+        out[col] = np.nan
+    if out.empty or len(spectrum_mz) == 0:
+        return out
+    query = query_spectrum(spectrum_mz, spectrum_int)
+    for pos in range(min(top, len(out))):
+        reference = ums.get_compound_ums(conn, int(out.iloc[pos]["pfas_id"]))
+        if reference is None or reference.empty:
+            continue
+        result = bootstrap_compare_ms(query, reference, **bootstrap_args)
+        scores = compare_ms(query, reference)
+        out.iloc[pos, out.columns.get_indexer(columns)] = [
+            scores["dp"], *result.interval("dp"), scores["rdp"], *result.interval("rdp"), result.runs
+        ]
+    return out
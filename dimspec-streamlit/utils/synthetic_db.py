@@ -0,0 +1,441 @@
+"""
+Synthetic DIMSpec Database
+Writes a schema-compatible database of made-up PFAS reference standards at any
+scale, for benchmarks and load tests. The schema and the shared reference data
+(norm_* tables, contributors) come from the DIMSpec build scripts in config/;
+compounds follow the homologous series of the PFAS families the app knows
+(names, formulas and monoisotopic masses are consistent), and every peak gets
+MS1 scans with a chromatographic profile: [M-H]- precursor, isotopes,
+family-specific in-source fragments and noise ions, with ppm-level m/z jitter.
+
+The output is deterministic for a given seed and size.
+"""
+import csv
+import shlex
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from utils.config import BASE_DIR
+from utils.db_builder import (
+    SUMMARY_DDL, SUMMARY_INDEXED_COLUMNS, SUMMARY_TABLE, apply_bulk_pragmas
+)
+
+# Directory the DIMSpec build scripts resolve their paths against ("config/...")
+DIMSPEC_ROOT = BASE_DIR.parent
+SCHEMA_SCRIPTS = ("config/build.sql", "config/populate_common.sql")
+# PFAS project vocabularies the generated rows refer to
+REFERENCE_CSVS = (
+    ("config/data/pfas/norm_sample_classes.csv", "norm_sample_classes"),
+    ("config/data/pfas/norm_peak_confidence.csv", "norm_peak_confidence"),
+)
+
+DEFAULT_COMPOUNDS = 1000
+DEFAULT_PEAKS_PER_COMPOUND = 4
+DEFAULT_SCANS_PER_PEAK = 25
+BATCH_ROWS = 20_000  # ms_data rows per executemany
+
+PROTON = 1.00727646688
+ELECTRON = 0.00054858
+C13_SHIFT = 1.0033548
+S34_SHIFT = 1.9957959
+MASSES = {
+    "C": 12.0, "H": 1.00782503207, "F": 18.99840322, "N": 14.0030740048,
+    "O": 15.99491461956, "P": 30.97376163, "S": 31.97207100,
+}
+HILL_ORDER = ("C", "H", "F", "N", "O", "P", "S")
+
+ALKANES = {
+    3: "propan", 4: "butan", 5: "pentan", 6: "hexan", 7: "heptan", 8: "octan", 9: "nonan",
+    10: "decan", 11: "undecan", 12: "dodecan", 13: "tridecan", 14: "tetradecan",
+}
+
+# Fixed values written to the method / provenance columns
+SOURCE_TYPE = 4                 # norm_source_types: In Silico
+GENERATION_TYPE = 2             # norm_generation_type: in silico
+ION_STATE = 8                   # norm_ion_states: [M-H]-
+SAMPLE_CLASS = 1                # norm_sample_classes: analytical standard
+CONFIDENCE = 2                  # norm_peak_confidence: confirmed by reference standard
+GENERATED_ON = "2000-01-01 00:00:00"
+PEAKS_PER_SAMPLE = 20
+
+Progress = Optional[Callable[[str, int], None]]
+
+
+# ============================================================================
+# Compound Families
+# ============================================================================
+
+def _ion(elements: Dict[str, int]) -> float:
+    """m/z of a singly charged anion with this composition."""
+    return sum(MASSES[e] * n for e, n in elements.items()) + ELECTRON
+
+
+@dataclass(frozen=True)
+class Family:
+    """A homologous series: name and formula per chain length, and its MS1 ions."""
+    name: Callable[[int], str]
+    elements: Callable[[int], Dict[str, int]]
+    chains: Tuple[int, ...]
+    weight: float
+    losses: Tuple[float, ...] = ()          # neutral losses from [M-H]- (Da)
+    ions: Tuple[float, ...] = ()            # diagnostic low-mass anions (m/z)
+    perfluoroalkyl: bool = False            # CnF2n+1- fragment series
+    h_substituted: bool = False             # may carry an H in place of an F ("7H-...")
+
+
+FAMILIES: Tuple[Family, ...] = (
+    Family(lambda n: f"Perfluoro{ALKANES[n]}oic acid",
+           lambda n: {"C": n, "H": 1, "F": 2 * n - 1, "O": 2},
+           tuple(range(4, 15)), 0.25, losses=(43.98983,), perfluoroalkyl=True, h_substituted=True),
+    Family(lambda n: f"Perfluoro{ALKANES[n]}esulfonic acid",
+           lambda n: {"C": n, "H": 1, "F": 2 * n + 1, "O": 3, "S": 1},
+           tuple(range(4, 13)), 0.20, ions=(79.95736, 98.95577), perfluoroalkyl=True, h_substituted=True),
+    Family(lambda k: f"{k - 2}:2 Fluorotelomer sulfonate",
+           lambda k: {"C": k, "H": 5, "F": 2 * k - 3, "O": 3, "S": 1},
+           (6, 8, 10, 12), 0.12, losses=(20.00623, 40.01246), ions=(79.95736, 80.96519)),
+    Family(lambda k: f"{k - 2}:2 Fluorotelomer phosphate monoester",
+           lambda k: {"C": k, "H": 6, "F": 2 * k - 3, "O": 4, "P": 1},
+           (6, 8, 10, 12), 0.08, losses=(20.00623,), ions=(78.95905, 96.96962)),
+    Family(lambda n: f"Perfluoro{ALKANES[n]}esulfonamide",
+           lambda n: {"C": n, "H": 2, "F": 2 * n + 1, "N": 1, "O": 2, "S": 1},
+           tuple(range(4, 11)), 0.10, ions=(77.96552,), perfluoroalkyl=True),
+    Family(lambda n: f"Perfluoropolyether acid C{n}",
+           lambda n: {"C": n, "H": 1, "F": 2 * n - 1, "O": 3},
+           tuple(range(4, 11)), 0.10, losses=(43.98983,), ions=(84.99056,), perfluoroalkyl=True),
+    Family(lambda n: f"Fluorinated surfactant C{n}",
+           lambda n: {"C": n, "H": n + 2, "F": n + 1, "N": 1, "O": 2},
+           tuple(range(3, 13)), 0.15, losses=(20.00623, 18.01056)),
+)
+
+
+def formula_string(elements: Dict[str, int]) -> str:
+    return "".join(f"{e}{elements[e] if elements[e] > 1 else ''}" for e in HILL_ORDER if elements.get(e))
+
+
+def monoisotopic_mass(elements: Dict[str, int]) -> float:
+    return sum(MASSES[e] * n for e, n in elements.items())
+
+
+@dataclass
+class SyntheticCompound:
+    name: str
+    formula: str
+    fixedmass: float
+    family: Family
+    carbons: int
+    rt: float                   # retention time of its peaks (min)
+    sulfur: bool
+
+
+def make_compounds(rng: np.random.Generator, n: int) -> List[SyntheticCompound]:
+    """n compounds drawn from FAMILIES by weight; repeated structures become isomers."""
+    weights = np.array([f.weight for f in FAMILIES])
+    picks = rng.choice(len(FAMILIES), size=n, p=weights / weights.sum())
+    seen: Dict[str, int] = {}
+    compounds = []
+    for pick in picks:
+        family = FAMILIES[pick]
+        chain = int(rng.choice(family.chains))
+        elements = dict(family.elements(chain))
+        name = family.name(chain)
+        if family.h_substituted and rng.random() < 0.3:
+            elements["H"] += 1
+            elements["F"] -= 1
+            name = f"{int(rng.integers(2, chain + 1))}H-{name}"
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        rt = 1.5 + 0.85 * chain + 0.3 * pick
+        if count:
+            name = f"{name} isomer {count}"
+            rt -= rng.uniform(0.05, 0.6)  # branched isomers elute earlier
+        compounds.append(SyntheticCompound(
+            name, formula_string(elements), monoisotopic_mass(elements), family,
+            chain, max(0.2, rt + rng.normal(0, 0.05)), "S" in elements
+        ))
+    return compounds
+
+
+# ============================================================================
+# Spectra
+# ============================================================================
+
+def spectrum_template(rng: np.random.Generator, compound: SyntheticCompound) -> Tuple[np.ndarray, np.ndarray]:
+    """Ion m/z values and relative abundances (precursor = 100) of one peak, m/z sorted."""
+    precursor = compound.fixedmass - PROTON
+    mz = [precursor, precursor + C13_SHIFT]
+    rel = [100.0, 1.07 * compound.carbons]
+    if compound.sulfur:
+        mz.append(precursor + S34_SHIFT)
+        rel.append(4.4)
+    for loss in compound.family.losses:
+        if precursor - loss > 50:
+            mz.append(precursor - loss)
+            rel.append(rng.uniform(5, 60))
+    fragments = list(compound.family.ions)
+    if compound.family.perfluoroalkyl:
+        fragments += [_ion({"C": k, "F": 2 * k + 1}) for k in range(1, compound.carbons)]
+    fragments = [f for f in fragments if 50 < f < precursor - 1]
+    if fragments:
+        for f in rng.choice(fragments, size=min(len(fragments), 4), replace=False):
+            mz.append(float(f))
+            rel.append(rng.uniform(2, 40))
+    n_noise = int(rng.integers(3, 12))
+    mz.extend(rng.uniform(50, precursor + 50, n_noise))
+    rel.extend(rng.uniform(0.1, 3, n_noise))
+    mz, rel = np.asarray(mz), np.asarray(rel)
+    order = np.argsort(mz)
+    return mz[order], rel[order]
+
+
+def peak_scans(
+    rng: np.random.Generator,
+    mz: np.ndarray,
+    rel: np.ndarray,
+    rt: float,
+    n_scans: int,
+    apex: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    MS1 scans across a Gaussian chromatographic peak: (scantimes, mz matrix,
+    intensity matrix), one row per scan, with 2 ppm m/z and 8 % intensity noise.
+    """
+    sigma = rng.uniform(0.03, 0.08)
+    times = rt + np.linspace(-2.5 * sigma, 2.5 * sigma, n_scans)
+    profile = np.exp(-0.5 * ((times - rt) / sigma) ** 2)
+    mz_scans = mz * (1 + rng.normal(0, 2e-6, (n_scans, len(mz))))
+    intensity = (apex / 100.0) * profile[:, None] * rel * rng.lognormal(0, 0.08, (n_scans, len(mz)))
+    return times, mz_scans, np.maximum(intensity, 1.0)
+
+
+# ============================================================================
+# Schema
+# ============================================================================
+
+def _import_csv(conn: sqlite3.Connection, path: Path, table: str, skip: int) -> None:
+    """The sqlite3 shell's `.import --csv --skip N file table` into an existing table."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))[skip:]
+    if rows:
+        conn.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * len(rows[0]))})", rows)
+
+
+def run_sql_script(conn: sqlite3.Connection, path: Path, root: Path = DIMSPEC_ROOT) -> None:
+    """
+    Execute a DIMSpec SQL script the way the sqlite3 shell does, including its
+    `.read` and `.import --csv` commands (paths relative to root). Other dot
+    commands are ignored.
+    """
+    buffer: List[str] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines(keepends=True):
+        pending = "".join(buffer)
+        # Dot commands start in column 0 outside of comments and string literals
+        if not line.startswith(".") or not sqlite3.complete_statement(pending + ";"):
+            buffer.append(line)
+            continue
+        if pending.strip():
+            conn.executescript(pending)
+        buffer = []
+        args = shlex.split(line.strip())
+        if args[0] == ".read":
+            run_sql_script(conn, root / args[1], root)
+        elif args[0] == ".import":
+            skip = int(args[args.index("--skip") + 1]) if "--skip" in args else 0
+            _import_csv(conn, root / args[-2], args[-1], skip)
+    if "".join(buffer).strip():
+        conn.executescript("".join(buffer))
+
+
+def create_schema(conn: sqlite3.Connection, root: Path = DIMSPEC_ROOT) -> None:
+    """DIMSpec tables, views and triggers plus the shared reference data."""
+    missing = [s for s in (*SCHEMA_SCRIPTS, *(f for f, _ in REFERENCE_CSVS)) if not (Path(root) / s).exists()]
+    if missing:
+        raise FileNotFoundError(f"DIMSpec build scripts not found under {root}: {', '.join(missing)}")
+    for script in SCHEMA_SCRIPTS:
+        run_sql_script(conn, Path(root) / script, Path(root))
+    for filename, table in REFERENCE_CSVS:
+        _import_csv(conn, Path(root) / filename, table, skip=1)
+    # The app links peaks to their compound directly (see fingerprint_store)
+    conn.execute("ALTER TABLE peaks ADD COLUMN compound_id INTEGER REFERENCES compounds(id)")
+    conn.commit()
+
+
+# ============================================================================
+# Generate
+# ============================================================================
+
+@dataclass
+class SyntheticResult:
+    rows: Dict[str, int] = field(default_factory=dict)
+    fk_violations: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+def _format_rows(matrix: np.ndarray, precision: int) -> List[str]:
+    """Space-delimited text (the ms_data spectrum format) of each matrix row."""
+    fmt = " ".join([f"%.{precision}f"] * matrix.shape[1])
+    return [fmt % tuple(row) for row in matrix.tolist()]
+
+
+def generate_database(
+    path: Union[str, Path],
+    n_compounds: int = DEFAULT_COMPOUNDS,
+    peaks_per_compound: int = DEFAULT_PEAKS_PER_COMPOUND,
+    scans_per_peak: int = DEFAULT_SCANS_PER_PEAK,
+    seed: int = 0,
+    summary: bool = True,
+    root: Path = DIMSPEC_ROOT,
+    progress: Progress = None
+) -> SyntheticResult:
+    """
+    Write a synthetic DIMSpec database (the file is replaced).
+
+    Args:
+        path: Database file to create
+        n_compounds: Compounds (ms_data rows = n_compounds * peaks_per_compound * scans_per_peak)
+        peaks_per_compound: Peaks (each in one sample) per compound
+        scans_per_peak: MS1 scans per peak
+        seed: Seed of the random generator; same seed and sizes give the same database
+        summary: Also build pfas_summary (the app's preferred library source)
+        root: Directory holding the DIMSpec config/ build scripts
+        progress: Optional callable receiving (table, rows written)
+
+    Returns:
+        SyntheticResult with row counts per table and foreign key violations
+    """
+    start = time.perf_counter()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+    rng = np.random.default_rng(seed)
+    result = SyntheticResult()
+    conn = sqlite3.connect(path)
+    try:
+        create_schema(conn, root)
+        apply_bulk_pragmas(conn)
+        conn.execute("PRAGMA foreign_keys=OFF")  # checked once at the end
+
+        conn.execute("INSERT INTO conversion_software_peaks_linkage (generated_on) VALUES (?)", (GENERATED_ON,))
+        linkage = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        contributor = conn.execute("SELECT MIN(id) FROM contributors").fetchone()[0]
+
+        compounds = make_compounds(rng, n_compounds)
+        conn.executemany(
+            "INSERT INTO compounds (id, name, obtained_from, source_type, formula, fixedmass) "
+            "VALUES (?, ?, 'synthetic', ?, ?, ?)",
+            [(i, c.name, SOURCE_TYPE, c.formula, c.fixedmass) for i, c in enumerate(compounds, 1)]
+        )
+        result.rows["compounds"] = len(compounds)
+        if progress:
+            progress("compounds", len(compounds))
+
+        n_peaks = n_compounds * peaks_per_compound
+        n_samples = max(1, -(-n_peaks // PEAKS_PER_SAMPLE))
+        conn.executemany(
+            "INSERT INTO samples (id, mzml_name, description, sample_class_id, sample_contributor, "
+            "generation_type, generated_on) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(i, f"synthetic_{i:06d}.mzML", "Synthetic benchmark sample", SAMPLE_CLASS,
+              contributor, GENERATION_TYPE, GENERATED_ON) for i in range(1, n_samples + 1)]
+        )
+        result.rows["samples"] = n_samples
+
+        peaks, links, scans = [], [], []
+        peak_id = ms_id = 0
+        n_scans_written = 0
+
+        def flush_scans():
+            nonlocal scans, n_scans_written
+            if scans:
+                conn.executemany("INSERT INTO ms_data VALUES (?, ?, 1, ?, ?, ?, ?, ?)", scans)
+                n_scans_written += len(scans)
+                scans = []
+                if progress:
+                    progress("ms_data", n_scans_written)
+
+        for compound_id, compound in enumerate(compounds, 1):
+            mz, rel = spectrum_template(rng, compound)
+            for _ in range(peaks_per_compound):
+                peak_id += 1
+                rt = compound.rt + rng.normal(0, 0.02)
+                apex = 10 ** rng.uniform(5, 7.5)
+                times, mz_scans, intensity = peak_scans(rng, mz, rel, rt, scans_per_peak, apex)
+                precursor = (compound.fixedmass - PROTON) * (1 + rng.normal(0, 1.5e-6))
+                peaks.append((
+                    peak_id, int(rng.integers(1, n_samples + 1)), linkage, scans_per_peak,
+                    precursor, ION_STATE, float(times[0]), rt, float(times[-1]), CONFIDENCE, compound_id
+                ))
+                links.append((peak_id, compound_id))
+                base = intensity.argmax(axis=1)
+                rows = np.arange(scans_per_peak)
+                for t, base_ion, base_int, mz_text, int_text in zip(
+                    times.tolist(), mz_scans[rows, base].tolist(), intensity[rows, base].tolist(),
+                    _format_rows(mz_scans, 5), _format_rows(intensity, 1)
+                ):
+                    ms_id += 1
+                    scans.append((ms_id, peak_id, t, base_ion, base_int, mz_text, int_text))
+                if len(scans) >= BATCH_ROWS:
+                    flush_scans()
+        flush_scans()
+
+        conn.executemany(
+            "INSERT INTO peaks (id, sample_id, conversion_software_peaks_linkage_id, num_points, precursor_mz, "
+            "ion_state, rt_start, rt_centroid, rt_end, identification_confidence, compound_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            peaks
+        )
+        conn.executemany("INSERT INTO compound_fragments (peak_id, compound_id) VALUES (?, ?)", links)
+        result.rows.update({"peaks": len(peaks), "compound_fragments": len(links), "ms_data": n_scans_written})
+        conn.commit()
+
+        if summary:
+            if progress:
+                progress(SUMMARY_TABLE, 0)
+            conn.execute(SUMMARY_DDL)
+            conn.execute(f"""
+                INSERT INTO {SUMMARY_TABLE}
+                    (pfas_id, name, precursor_mz, rt_mean, rt_min, rt_max, n_points, n_peaks)
+                SELECT c.id, c.name, AVG(p.precursor_mz), AVG(p.rt_centroid), MIN(p.rt_start),
+                       MAX(p.rt_end), SUM(p.num_points), COUNT(*)
+                FROM compounds c JOIN peaks p ON p.compound_id = c.id
+                GROUP BY c.id
+                ORDER BY c.id
+            """)
+            for col in SUMMARY_INDEXED_COLUMNS:
+                conn.execute(f"CREATE INDEX ix_{SUMMARY_TABLE}_{col} ON {SUMMARY_TABLE} ({col})")
+            result.rows[SUMMARY_TABLE] = conn.execute(f"SELECT COUNT(*) FROM {SUMMARY_TABLE}").fetchone()[0]
+            conn.commit()
+
+        for table, *_ in conn.execute("PRAGMA foreign_key_check").fetchall():
+            result.fk_violations[table] = result.fk_violations.get(table, 0) + 1
+    finally:
+        conn.close()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def rows_to_compounds(
+    ms_data_rows: int,
+    peaks_per_compound: int = DEFAULT_PEAKS_PER_COMPOUND,
+    scans_per_peak: int = DEFAULT_SCANS_PER_PEAK
+) -> int:
+    """Compounds needed for about ms_data_rows scans at the given density."""
+    return max(1, round(ms_data_rows / (peaks_per_compound * scans_per_peak)))
+
+
+def parse_count(text: str) -> int:
+    """Row count from '10000', '10k', '2.5M' and the like."""
+    value = str(text).strip().lower().replace("_", "").replace(",", "")
+    factor = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    try:
+        number = float(value[:-1] if factor > 1 else value)
+    except ValueError:
+        raise ValueError(f"not a row count: {text!r}") from None
+    if number <= 0:
+        raise ValueError(f"row count must be positive: {text!r}")
+    return int(round(number * factor))
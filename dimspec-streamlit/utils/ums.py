@@ -0,0 +1,802 @@
+"""
+Uncertainty Mass Spectra (UMS)
+Consensus spectra with per-ion mean and standard deviation across all scans of a
+peak, ported from R/spectral_analysis/uncertainty.R (getEIC, mergems, get_ums) and
+spectral_comparison.R (pool.ums). Ions are matched across scans by sorting all of
+them once by m/z instead of the scan-by-scan list merging of the R code.
+
+See https://doi.org/10.1021/jasms.0c00423 for the method.
+"""
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils import database as db
+from utils import data_processing as dp
+from utils.common import connect_readonly, pool_workers
+from utils.schema_catalog import get_catalog
+
+# Instrument mass accuracy defaults (create_peak_table_ms1/ms2 in the R code)
+DEFAULT_MASS_ERROR_PPM = 5.0
+DEFAULT_MIN_ERROR = 0.002  # Da
+
+UMS_COLUMNS = ["mz", "mz_u", "int", "int_u", "n"]
+
+
+def mass_tolerance(mz: Any, masserror: float = DEFAULT_MASS_ERROR_PPM, minerror: float = DEFAULT_MIN_ERROR) -> np.ndarray:
+    """Half-width of the m/z match window: max(ppm of mz, minerror)."""
+    return np.maximum(np.asarray(mz, dtype=np.float64) * masserror * 1e-6, minerror)
+
+
+def empty_ums(numscans: int = 0) -> pd.DataFrame:
+    ums = pd.DataFrame({c: pd.Series(dtype=np.int64 if c == "n" else np.float64) for c in UMS_COLUMNS})
+    ums.attrs["numscans"] = numscans
+    return ums
+
+
+# ============================================================================
+# Peak Tables
+# ============================================================================
+
+def extract_eic(
+    mz_arrays: Sequence[Any],
+    int_arrays: Sequence[Any],
+    mass: float,
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR
+) -> np.ndarray:
+    """
+    Extracted ion chromatogram: summed intensity within the mass window of `mass`
+    in each scan (getEIC).
+    """
+    mz_values, offsets = dp.pack_ragged(mz_arrays)
+    int_values, _ = dp.pack_ragged(int_arrays)
+    n_scans = len(offsets) - 1
+    tol = float(mass_tolerance(mass, masserror, minerror))
+    scan_idx = np.repeat(np.arange(n_scans), np.diff(offsets))
+    hit = (mz_values >= mass - tol) & (mz_values <= mass + tol)
+    return np.bincount(scan_idx[hit], weights=int_values[hit], minlength=n_scans)
+
+
+def group_masses(
+    sorted_mz: np.ndarray,
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR
+) -> np.ndarray:
+    """
+    Group label per ion for m/z values sorted ascending: an ion joins the previous
+    group when it lies within the mass tolerance of its lower neighbour. This is
+    the sort-based equivalent of growing mergems' [min, max] windows.
+    """
+    if len(sorted_mz) == 0:
+        return np.empty(0, dtype=np.int64)
+    gaps = np.diff(sorted_mz) > mass_tolerance(sorted_mz[:-1], masserror, minerror)
+    return np.concatenate([[0], np.cumsum(gaps)]).astype(np.int64)
+
+
+def build_peak_table(
+    mz_arrays: Sequence[Any],
+    int_arrays: Sequence[Any],
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Align the ions of several scans (mergems + create_peak_table_ms1/ms2).
+
+    Returns:
+        (masses, intensities): (n_ions, n_scans) matrices, NaN where an ion was not
+        observed in a scan. Rows are ordered by m/z. When one scan has several
+        ions in the same group, the most intense one is kept.
+    """
+    mz_values, offsets = dp.pack_ragged(mz_arrays)
+    int_values, _ = dp.pack_ragged(int_arrays)
+    n_scans = len(offsets) - 1
+    if len(mz_values) == 0:
+        empty = np.empty((0, n_scans))
+        return empty, empty.copy()
+    scan_idx = np.repeat(np.arange(n_scans), np.diff(offsets))
+
+    order = np.argsort(mz_values, kind="stable")
+    mz_sorted, int_sorted, scan_sorted = mz_values[order], int_values[order], scan_idx[order]
+    group = group_masses(mz_sorted, masserror, minerror)
+
+    # One cell per (group, scan): keep the most intense ion
+    cell = np.lexsort((-int_sorted, scan_sorted, group))
+    group, scan_sorted = group[cell], scan_sorted[cell]
+    first = np.ones(len(cell), dtype=bool)
+    first[1:] = (group[1:] != group[:-1]) | (scan_sorted[1:] != scan_sorted[:-1])
+    cell = cell[first]
+
+    n_ions = int(group[-1]) + 1
+    masses = np.full((n_ions, n_scans), np.nan)
+    intensities = np.full((n_ions, n_scans), np.nan)
+    masses[group[first], scan_sorted[first]] = mz_sorted[cell]
+    intensities[group[first], scan_sorted[first]] = int_sorted[cell]
+    return masses, intensities
+
+
+# ============================================================================
+# Consensus Spectra
+# ============================================================================
+
+def _row_correlation(eic: np.ndarray, table: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlation of each row with eic over the scans where the row is
+    observed (cor(..., use = "complete.obs")); NaN where undefined.
+    """
+    observed = ~np.isnan(table)
+    n = observed.sum(axis=1)
+    x = np.where(observed, eic[None, :], 0.0)
+    y = np.where(observed, table, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mx = x.sum(axis=1) / n
+        my = y.sum(axis=1) / n
+        dx = np.where(observed, x - mx[:, None], 0.0)
+        dy = np.where(observed, y - my[:, None], 0.0)
+        return (dx * dy).sum(axis=1) / np.sqrt((dx ** 2).sum(axis=1) * (dy ** 2).sum(axis=1))
+
+
+def _nan_mean_sd(table: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row-wise mean, sample sd (NaN below two observations) and count, ignoring NaN."""
+    observed = ~np.isnan(table)
+    n = observed.sum(axis=1)
+    filled = np.where(observed, table, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=1) / n
+        ss = (np.where(observed, table - mean[:, None], 0.0) ** 2).sum(axis=1)
+        sd = np.sqrt(ss / (n - 1))
+    sd[n < 2] = np.nan
+    return mean, sd, n
+
+
+def get_ums(
+    masses: np.ndarray,
+    intensities: np.ndarray,
+    eic: Optional[np.ndarray] = None,
+    correl: Optional[float] = None,
+    ph: Optional[float] = None,
+    freq: Optional[float] = None,
+    normfn: str = "sum"
+) -> pd.DataFrame:
+    """
+    Uncertainty mass spectrum of a peak table (get_ums).
+
+    Args:
+        masses / intensities: (n_ions, n_scans) peak table from build_peak_table
+        eic: Precursor intensity per scan (needed for correl and ph)
+        correl: Minimum correlation of an ion with the EIC to keep it
+        ph: Minimum chromatographic peak height (% of the EIC range) of a scan to use it
+        freq: Minimum observation frequency (% of scans) of an ion to keep it
+        normfn: Per-scan intensity normalization, 'sum' or 'mean'
+
+    Returns:
+        DataFrame with mz, mz_u, int, int_u, n (one row per ion, by m/z);
+        attrs['numscans'] holds the number of scans used.
+    """
+    if normfn not in ("sum", "mean"):
+        raise ValueError("normfn must be 'sum' or 'mean'")
+    masses = np.asarray(masses, dtype=np.float64)
+    intensities = np.asarray(intensities, dtype=np.float64)
+    eic = None if eic is None else np.asarray(eic, dtype=np.float64)
+
+    if correl is not None and not np.isnan(correl) and eic is not None:
+        with np.errstate(invalid="ignore"):
+            keep = _row_correlation(eic, intensities) >= correl
+        masses, intensities = masses[keep], intensities[keep]
+    if ph is not None and not np.isnan(ph) and eic is not None and len(eic):
+        min_height = (ph / 100) * (eic.max() - eic.min()) + eic.min()
+        scans = eic >= min_height
+        masses, intensities = masses[:, scans], intensities[:, scans]
+    if freq is not None and not np.isnan(freq):
+        observed = (~np.isnan(masses)).sum(axis=1)
+        keep = observed >= masses.shape[1] * freq / 100
+        masses, intensities = masses[keep], intensities[keep]
+
+    numscans = masses.shape[1]
+    if masses.size == 0:
+        return empty_ums(numscans)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if normfn == "sum":
+            scale = np.nansum(intensities, axis=0)
+        else:
+            scale = np.nanmean(intensities, axis=0)
+        intensities = intensities / scale[None, :]
+
+    mz, mz_u, n = _nan_mean_sd(masses)
+    inten, inten_u, _ = _nan_mean_sd(intensities)
+    keep = ~np.isnan(mz) & ~np.isnan(inten)
+    ums = pd.DataFrame({
+        "mz": mz[keep], "mz_u": mz_u[keep],
+        "int": inten[keep], "int_u": inten_u[keep],
+        "n": n[keep].astype(np.int64),
+    })
+    ums.attrs["numscans"] = numscans
+    return ums
+
+
+def peak_table(
+    scans: Sequence[Dict[str, Any]],
+    mass: Optional[float] = None,
+    ms_n: int = 1,
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR
+) -> Optional[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+    """
+    Peak table of one peak at one MS level (create_peak_table_ms1/ms2).
+
+    Args:
+        scans: Scan dicts with 'ms_n', 'scantime', 'mz', 'intensity' (see db.fetch_peak_scans)
+        mass: Precursor m/z for the EIC; without it there is no EIC
+        ms_n: MS level. MS2 scans take the EIC of the nearest MS1 scan, as in get_ums.
+
+    Returns:
+        (masses, intensities, eic), or None when the peak has no scans at ms_n
+    """
+    scans = sorted(scans, key=lambda s: s["scantime"])
+    levels = np.array([s["ms_n"] for s in scans], dtype=np.int64)
+    target = np.flatnonzero(levels == ms_n)
+    if len(target) == 0:
+        return None
+
+    eic = None
+    ms1 = np.flatnonzero(levels == 1)
+    if mass is not None and len(ms1):
+        ms1_eic = extract_eic([scans[i]["mz"] for i in ms1], [scans[i]["intensity"] for i in ms1],
+                              mass, masserror, minerror)
+        if ms_n == 1:
+            eic = ms1_eic
+        else:
+            nearest = np.abs(target[:, None] - ms1[None, :]).argmin(axis=1)
+            eic = ms1_eic[nearest]
+
+    masses, intensities = build_peak_table(
+        [scans[i]["mz"] for i in target], [scans[i]["intensity"] for i in target], masserror, minerror
+    )
+    return masses, intensities, eic
+
+
+def consensus_spectrum(
+    scans: Sequence[Dict[str, Any]],
+    mass: Optional[float] = None,
+    ms_n: int = 1,
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR,
+    correl: Optional[float] = None,
+    ph: Optional[float] = None,
+    freq: Optional[float] = None,
+    normfn: str = "sum"
+) -> pd.DataFrame:
+    """
+    UMS of one peak at one MS level from all of its scans (see peak_table).
+    correl/ph need the precursor mass and are skipped without it.
+    """
+    table = peak_table(scans, mass, ms_n, masserror, minerror)
+    if table is None:
+        return empty_ums()
+    masses, intensities, eic = table
+    return get_ums(masses, intensities, eic, correl=correl, ph=ph, freq=freq, normfn=normfn)
+
+
+def pool_ums(
+    ums_list: Sequence[pd.DataFrame],
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR
+) -> pd.DataFrame:
+    """
+    Pool several UMS of the same compound into one (pool.ums): ions are matched
+    by m/z, means are averaged, standard deviations pooled weighted by n - 1
+    and counts summed.
+    """
+    frames = [u for u in ums_list if u is not None and len(u)]
+    numscans = sum(int(u.attrs.get("numscans", 0)) for u in ums_list if u is not None)
+    if not frames:
+        return empty_ums(numscans)
+    if len(frames) == 1:
+        pooled = frames[0][UMS_COLUMNS].reset_index(drop=True)
+        pooled.attrs["numscans"] = numscans
+        return pooled
+
+    stacked = pd.concat([u[UMS_COLUMNS] for u in frames], ignore_index=True)
+    stacked = stacked.sort_values("mz", kind="stable")
+    mz = stacked["mz"].to_numpy(dtype=np.float64)
+    group = group_masses(mz, masserror, minerror)
+    n = stacked["n"].to_numpy(dtype=np.float64)
+    dof = np.maximum(n - 1, 0)
+
+    def pooled_sd(sd: np.ndarray) -> np.ndarray:
+        # sqrt(sum((n - 1) * sd^2) / sum(n - 1)); single observations carry no spread
+        ss = np.bincount(group, weights=dof * np.nan_to_num(sd) ** 2)
+        total = np.bincount(group, weights=dof)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, np.sqrt(ss / total), np.nan)
+
+    size = np.bincount(group)
+    pooled = pd.DataFrame({
+        "mz": np.bincount(group, weights=mz) / size,
+        "mz_u": pooled_sd(stacked["mz_u"].to_numpy(dtype=np.float64)),
+        "int": np.bincount(group, weights=stacked["int"].to_numpy(dtype=np.float64)) / size,
+        "int_u": pooled_sd(stacked["int_u"].to_numpy(dtype=np.float64)),
+        "n": np.bincount(group, weights=n).astype(np.int64),
+    })
+    pooled.attrs["numscans"] = numscans
+    return pooled
+
+
+# ============================================================================
+# Optimal Parameters
+# ============================================================================
+
+# optimal_ums defaults (R/spectral_analysis/optimal_ums.R)
+OPTIMAL_UMS_GRID = {
+    "max_correl": 0.75, "correl_bin": 0.05,
+    "max_ph": 10.0, "ph_bin": 1.0,
+    "max_freq": 10.0, "freq_bin": 1.0,
+    "min_n_peaks": 3,
+}
+
+
+def _descending_range(maximum: float, step: float) -> np.ndarray:
+    """seq(maximum, 0, by = -step) followed by NA (no cutoff)."""
+    values = maximum - step * np.arange(int(np.floor(maximum / step + 1e-9)) + 1)
+    return np.append(np.round(values, 10), np.nan)
+
+
+def optimal_ums(
+    masses: np.ndarray,
+    intensities: np.ndarray,
+    eic: Optional[np.ndarray] = None,
+    max_correl: float = OPTIMAL_UMS_GRID["max_correl"],
+    correl_bin: float = OPTIMAL_UMS_GRID["correl_bin"],
+    max_ph: float = OPTIMAL_UMS_GRID["max_ph"],
+    ph_bin: float = OPTIMAL_UMS_GRID["ph_bin"],
+    max_freq: float = OPTIMAL_UMS_GRID["max_freq"],
+    freq_bin: float = OPTIMAL_UMS_GRID["freq_bin"],
+    min_n_peaks: int = OPTIMAL_UMS_GRID["min_n_peaks"]
+) -> Optional[Dict[str, Any]]:
+    """
+    Optimal correl/ph/freq cutoffs for a peak table (optimal_ums).
+
+    Every combination of the three cutoff ranges (each ending in NA = no cutoff)
+    is scored at once: ion correlations are computed once, per-cutoff scan and
+    ion masks are broadcast against each other, and the number of scans and ions
+    each combination leaves follows from counting. The combination with the
+    highest sum of cutoffs (each scaled by its maximum, NA = 0) plus scans used
+    (scaled by the most scans of any combination) wins among those that keep at
+    least one ion and min_n_peaks scans.
+
+    Returns:
+        {'correl', 'ph', 'freq', 'n'} (None for an NA cutoff), or None when no
+        combination qualifies
+    """
+    masses = np.asarray(masses, dtype=np.float64)
+    n_scans = masses.shape[1]
+    if n_scans < min_n_peaks:
+        min_n_peaks = 1
+    observed = ~np.isnan(masses)
+
+    correl_range = _descending_range(max_correl, correl_bin)
+    ph_range = _descending_range(max_ph, ph_bin)
+    freq_range = _descending_range(max_freq, freq_bin)
+
+    # Ions kept by each correl cutoff: (n_ions, n_correl)
+    if eic is not None:
+        eic = np.asarray(eic, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            cors = _row_correlation(eic, np.asarray(intensities, dtype=np.float64))
+            ion_ok = cors[:, None] >= correl_range[None, :]
+        # Scans kept by each ph cutoff: (n_ph, n_scans)
+        low, high = (eic.min(), eic.max()) if len(eic) else (0.0, 0.0)
+        with np.errstate(invalid="ignore"):
+            scan_ok = eic[None, :] >= ((ph_range / 100) * (high - low) + low)[:, None]
+    else:
+        # Without an EIC the correl/ph cutoffs cannot be applied (get_ums skips them)
+        ion_ok = np.ones((len(masses), len(correl_range)), dtype=bool)
+        scan_ok = np.ones((len(ph_range), n_scans), dtype=bool)
+    ion_ok[:, -1] = True
+    scan_ok[-1] = True
+
+    numscans = scan_ok.sum(axis=1)                                    # (n_ph,)
+    seen = observed.astype(np.int64) @ scan_ok.T.astype(np.int64)     # (n_ions, n_ph)
+    with np.errstate(invalid="ignore"):
+        min_seen = numscans[:, None] * freq_range[None, :] / 100      # (n_ph, n_freq)
+    freq_ok = (seen[:, :, None] >= min_seen[None, :, :]) | np.isnan(min_seen)[None, :, :]
+    ion_kept = freq_ok & (seen[:, :, None] > 0)                       # (n_ions, n_ph, n_freq)
+    n_ions = np.einsum("ic,ipf->fpc", ion_ok.astype(np.int64), ion_kept.astype(np.int64))
+
+    # Grid in expand.grid order (correl fastest), so ties resolve like the R code
+    shape = n_ions.shape
+    n_grid = np.broadcast_to(numscans[None, :, None], shape)
+    valid = (n_grid >= min_n_peaks) & (n_ions > 0)
+
+    # The unrelaxed cutoffs are used as-is when they are good enough
+    if valid[0, 0, 0]:
+        return {"correl": float(max_correl), "ph": float(max_ph), "freq": float(max_freq),
+                "n": int(numscans[0])}
+    if not valid.any():
+        return None
+
+    score = (
+        np.nan_to_num(freq_range / max_freq)[:, None, None]
+        + np.nan_to_num(ph_range / max_ph)[None, :, None]
+        + np.nan_to_num(correl_range / max_correl)[None, None, :]
+        + n_grid / max(numscans.max(), 1)
+    )
+    best = np.unravel_index(np.argmax(np.where(valid, score, -np.inf)), shape)
+    f, p, c = best
+
+    def cutoff(value: float) -> Optional[float]:
+        return None if np.isnan(value) else float(value)
+
+    return {"correl": cutoff(correl_range[c]), "ph": cutoff(ph_range[p]),
+            "freq": cutoff(freq_range[f]), "n": int(numscans[p])}
+
+
+# ============================================================================
+# Persistence
+# ============================================================================
+
+# Consensus spectra per (peak, MS level), arrays packed as little-endian float64 BLOBs
+# like ms_data_packed. A new, changed or deleted scan drops its peak's rows through
+# triggers, so a stored UMS always covers every current scan of the peak.
+UMS_TABLE = "peak_ums"
+
+UMS_DDL = f"""
+CREATE TABLE IF NOT EXISTS {UMS_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    peak_id INTEGER NOT NULL,
+    ms_n INTEGER NOT NULL,
+    n_scans INTEGER NOT NULL,
+    n_ions INTEGER NOT NULL,
+    masserror REAL NOT NULL,
+    minerror REAL NOT NULL,
+    correl REAL,
+    ph REAL,
+    freq REAL,
+    mz BLOB NOT NULL,
+    mz_u BLOB NOT NULL,
+    intensity BLOB NOT NULL,
+    intensity_u BLOB NOT NULL,
+    n BLOB NOT NULL,
+    UNIQUE (peak_id, ms_n),
+    FOREIGN KEY (peak_id) REFERENCES peaks(id) ON UPDATE CASCADE ON DELETE CASCADE
+);
+CREATE TRIGGER IF NOT EXISTS {UMS_TABLE}_stale_on_insert
+AFTER INSERT ON ms_data
+BEGIN
+    DELETE FROM {UMS_TABLE} WHERE peak_id = NEW.peak_id;
+END;
+CREATE TRIGGER IF NOT EXISTS {UMS_TABLE}_stale_on_update
+AFTER UPDATE ON ms_data
+BEGIN
+    DELETE FROM {UMS_TABLE} WHERE peak_id IN (OLD.peak_id, NEW.peak_id);
+END;
+CREATE TRIGGER IF NOT EXISTS {UMS_TABLE}_stale_on_delete
+AFTER DELETE ON ms_data
+BEGIN
+    DELETE FROM {UMS_TABLE} WHERE peak_id = OLD.peak_id;
+END;
+"""
+
+_BLOB_COLUMNS = ("mz", "mz_u", "intensity", "intensity_u", "n")
+
+# Optimal UMS settings per (peak, MS level), as defined by the DIMSpec schema
+# (config/sql_nodes/data.sql); created here for databases built without it.
+OPT_PARAMS_TABLE = "opt_ums_params"
+
+OPT_PARAMS_DDL = f"""
+CREATE TABLE IF NOT EXISTS {OPT_PARAMS_TABLE} (
+    peak_id INTEGER NOT NULL,
+    mslevel INTEGER NOT NULL,
+    correl REAL,
+    ph REAL,
+    freq REAL,
+    n INTEGER,
+    masserror REAL,
+    minerror REAL,
+    UNIQUE (peak_id, mslevel),
+    FOREIGN KEY (peak_id) REFERENCES peaks(id) ON UPDATE CASCADE ON DELETE CASCADE
+);
+"""
+
+
+def has_ums_table(conn: sqlite3.Connection) -> bool:
+    return get_catalog(conn).object_type(UMS_TABLE) == 'table'
+
+
+def ums_from_row(row: Sequence[Any]) -> pd.DataFrame:
+    """UMS from the (n_scans, mz, mz_u, intensity, intensity_u, n) columns of a stored row."""
+    n_scans, mz, mz_u, inten, inten_u, n = row
+    ums = pd.DataFrame({
+        "mz": db.unpack_array(mz), "mz_u": db.unpack_array(mz_u),
+        "int": db.unpack_array(inten), "int_u": db.unpack_array(inten_u),
+        "n": db.unpack_array(n).astype(np.int64),
+    })
+    ums.attrs["numscans"] = n_scans
+    return ums
+
+
+def _ums_record(peak_id: int, ms_n: int, ums: pd.DataFrame, settings: Dict[str, Any]) -> Tuple:
+    return (
+        peak_id, ms_n, int(ums.attrs.get("numscans", 0)), len(ums),
+        settings["masserror"], settings["minerror"],
+        settings.get("correl"), settings.get("ph"), settings.get("freq"),
+        db.pack_array(ums["mz"]), db.pack_array(ums["mz_u"]),
+        db.pack_array(ums["int"]), db.pack_array(ums["int_u"]),
+        db.pack_array(ums["n"]),
+    )
+
+
+def get_peak_ums(
+    conn: sqlite3.Connection,
+    peak_id: int,
+    ms_n: int = 1,
+    compute: bool = True
+) -> Optional[pd.DataFrame]:
+    """
+    Consensus spectrum of a peak: the stored one when build_consensus_spectra has
+    run, otherwise computed from the peak's scans (unless compute=False).
+    None when the peak has no scans at that MS level.
+    """
+    if has_ums_table(conn):
+        row = conn.execute(
+            f"SELECT n_scans, {', '.join(_BLOB_COLUMNS)} FROM {UMS_TABLE} WHERE peak_id = ? AND ms_n = ?",
+            (peak_id, ms_n)
+        ).fetchone()
+        if row is not None:
+            return ums_from_row(tuple(row))
+    if not compute:
+        return None
+    scans = db.fetch_peak_scans(conn, [peak_id]).get(peak_id, [])
+    settings = _optimal_settings(conn, [peak_id]).get((peak_id, ms_n), _default_settings())
+    ums = consensus_spectrum(
+        scans, _precursor_mz(conn, [peak_id]).get(peak_id), ms_n,
+        settings["masserror"], settings["minerror"],
+        correl=settings["correl"], ph=settings["ph"], freq=settings["freq"]
+    )
+    return ums if ums.attrs.get("numscans") else None
+
+
+def get_compound_ums(conn: sqlite3.Connection, compound_id: int, ms_n: int = 1) -> Optional[pd.DataFrame]:
+    """
+    Consensus spectrum of a compound: the UMS of each of its peaks (see
+    get_peak_ums and database.compound_peak_links) pooled with pool_ums.
+    None when no peak has scans at ms_n.
+    """
+    links = db.compound_peak_links(conn)
+    if links is None:
+        return None
+    peak_ids = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT peak_id FROM ({links}) WHERE compound_id = ? ORDER BY peak_id", (compound_id,)
+    ).fetchall()]
+    spectra = [u for u in (get_peak_ums(conn, pid, ms_n) for pid in peak_ids) if u is not None]
+    if not spectra:
+        return None
+    return pool_ums(spectra)
+
+
+def _precursor_mz(conn: sqlite3.Connection, peak_ids: List[int]) -> Dict[int, float]:
+    if "precursor_mz" not in db.get_column_names(conn, "peaks") or not peak_ids:
+        return {}
+    cursor = conn.execute(
+        f"SELECT id, precursor_mz FROM peaks WHERE id IN ({','.join('?' * len(peak_ids))})", peak_ids
+    )
+    return {pid: mz for pid, mz in cursor.fetchall() if mz is not None}
+
+
+def _default_settings(
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR,
+    correl: Optional[float] = None,
+    ph: Optional[float] = None,
+    freq: Optional[float] = None
+) -> Dict[str, Any]:
+    return {"masserror": masserror, "minerror": minerror, "correl": correl, "ph": ph, "freq": freq}
+
+
+def _optimal_settings(conn: sqlite3.Connection, peak_ids: List[int]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+    """Stored optimal parameters as {(peak_id, mslevel): settings} (empty without the table)."""
+    if get_catalog(conn).object_type(OPT_PARAMS_TABLE) != 'table' or not peak_ids:
+        return {}
+    cursor = conn.execute(f"""
+        SELECT peak_id, mslevel, correl, ph, freq, masserror, minerror
+        FROM {OPT_PARAMS_TABLE} WHERE peak_id IN ({','.join('?' * len(peak_ids))})
+    """, list(peak_ids))
+    settings = {}
+    for peak_id, mslevel, correl, ph, freq, masserror, minerror in cursor.fetchall():
+        settings[(peak_id, mslevel)] = _default_settings(
+            DEFAULT_MASS_ERROR_PPM if masserror is None else masserror,
+            DEFAULT_MIN_ERROR if minerror is None else minerror,
+            correl, ph, freq
+        )
+    return settings
+
+
+def build_consensus_spectra(
+    conn: sqlite3.Connection,
+    ms_levels: Iterable[int] = (1, 2),
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR,
+    correl: Optional[float] = None,
+    ph: Optional[float] = None,
+    freq: Optional[float] = None,
+    use_optimal: bool = True,
+    rebuild: bool = False,
+    batch_size: int = 500,
+    progress: Optional[Any] = None
+) -> int:
+    """
+    Compute and store the UMS of every peak and MS level that has scans.
+    Peaks with stored optimal parameters (opt_ums_params, see
+    optimize_ums_params) use those unless use_optimal=False; the others use
+    the given settings. Only peaks without a stored UMS are processed unless
+    rebuild=True, so re-running after new data is incremental.
+    Requires a writable connection.
+
+    Returns:
+        Number of peaks processed
+    """
+    conn.executescript(UMS_DDL)
+    if rebuild:
+        conn.execute(f"DELETE FROM {UMS_TABLE}")
+        conn.commit()
+    defaults = _default_settings(masserror, minerror, correl, ph, freq)
+    levels = tuple(ms_levels)
+
+    processed = 0
+    last_id = -1
+    while True:
+        cursor = conn.execute(f"""
+            SELECT p.id FROM peaks p
+            WHERE p.id > ? AND NOT EXISTS (SELECT 1 FROM {UMS_TABLE} u WHERE u.peak_id = p.id)
+            ORDER BY p.id
+            LIMIT ?
+        """, (last_id, batch_size))
+        peak_ids = [row[0] for row in cursor.fetchall()]
+        if not peak_ids:
+            break
+        last_id = peak_ids[-1]
+        scans_by_peak = db.fetch_peak_scans(conn, peak_ids)
+        masses = _precursor_mz(conn, peak_ids)
+        optimal = _optimal_settings(conn, peak_ids) if use_optimal else {}
+        records = []
+        for peak_id in peak_ids:
+            scans = scans_by_peak.get(peak_id, [])
+            present = {s["ms_n"] for s in scans}
+            for ms_n in levels:
+                if ms_n not in present:
+                    continue
+                settings = optimal.get((peak_id, ms_n), defaults)
+                ums = consensus_spectrum(
+                    scans, masses.get(peak_id), ms_n, settings["masserror"], settings["minerror"],
+                    correl=settings["correl"], ph=settings["ph"], freq=settings["freq"]
+                )
+                records.append(_ums_record(peak_id, ms_n, ums, settings))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {UMS_TABLE} "
+            "(peak_id, ms_n, n_scans, n_ions, masserror, minerror, correl, ph, freq, "
+            "mz, mz_u, intensity, intensity_u, n) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            records
+        )
+        conn.commit()
+        processed += len(peak_ids)
+        if progress:
+            progress(processed)
+    return processed
+
+
+PARALLEL_MIN_PEAKS = 200
+FETCH_BLOCK = 250  # peaks per worker task
+
+
+def _optimize_peaks(
+    db_path: str,
+    peak_ids: List[int],
+    ms_levels: Tuple[int, ...],
+    masserror: float,
+    minerror: float,
+    grid: Dict[str, Any]
+) -> List[Tuple]:
+    """
+    Worker: optimal parameters for a block of peaks as opt_ums_params rows.
+    """
+    conn = connect_readonly(db_path)
+    records = []
+    try:
+        scans_by_peak = db.fetch_peak_scans(conn, peak_ids)
+        masses = _precursor_mz(conn, peak_ids)
+    finally:
+        conn.close()
+    for peak_id in peak_ids:
+        scans = scans_by_peak.get(peak_id, [])
+        for ms_n in ms_levels:
+            table = peak_table(scans, masses.get(peak_id), ms_n, masserror, minerror)
+            if table is None:
+                continue
+            best = optimal_ums(*table, **grid)
+            if best is None:
+                continue
+            records.append((peak_id, ms_n, best["correl"], best["ph"], best["freq"], best["n"],
+                            masserror, minerror))
+    return records
+
+
+def optimize_ums_params(
+    conn: sqlite3.Connection,
+    db_path: Path,
+    ms_levels: Iterable[int] = (1, 2),
+    masserror: float = DEFAULT_MASS_ERROR_PPM,
+    minerror: float = DEFAULT_MIN_ERROR,
+    grid: Optional[Dict[str, Any]] = None,
+    workers: Optional[int] = None,
+    rebuild: bool = False,
+    batch_size: int = 2000,
+    progress: Optional[Any] = None
+) -> int:
+    """
+    Search the optimal UMS parameters of every peak and store them in
+    opt_ums_params. Peaks are fanned out over a process pool; only peaks without
+    stored parameters are searched unless rebuild=True. Stored consensus spectra
+    of updated peaks are dropped so build_consensus_spectra recomputes them with
+    the new parameters.
+
+    Args:
+        conn: Writable connection to the database
+        db_path: Database file (workers open their own connections to it)
+        grid: optimal_ums keyword overrides (see OPTIMAL_UMS_GRID)
+        workers: Process count; None uses all cores for large batches, 1 stays in-process
+
+    Returns:
+        Number of (peak, MS level) parameter rows written
+    """
+    conn.executescript(OPT_PARAMS_DDL)
+    if rebuild:
+        conn.execute(f"DELETE FROM {OPT_PARAMS_TABLE}")
+        conn.commit()
+    grid = {**OPTIMAL_UMS_GRID, **(grid or {})}
+    levels = tuple(ms_levels)
+    db_file = str(Path(db_path).resolve())
+    # Peaks are read up front so writes below do not disturb the scan
+    peak_ids = [row[0] for row in conn.execute(f"""
+        SELECT p.id FROM peaks p
+        WHERE NOT EXISTS (SELECT 1 FROM {OPT_PARAMS_TABLE} o WHERE o.peak_id = p.id)
+        ORDER BY p.id
+    """).fetchall()]
+    workers = pool_workers(len(peak_ids), PARALLEL_MIN_PEAKS, workers)
+    block = max(1, min(FETCH_BLOCK, -(-len(peak_ids) // workers)))
+    blocks = [peak_ids[s:s + block] for s in range(0, len(peak_ids), block)]
+
+    def write(records: List[Tuple]) -> None:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {OPT_PARAMS_TABLE} "
+            "(peak_id, mslevel, correl, ph, freq, n, masserror, minerror) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            records
+        )
+        if records and has_ums_table(conn):
+            updated = sorted({r[0] for r in records})
+            conn.execute(
+                f"DELETE FROM {UMS_TABLE} WHERE peak_id IN ({','.join('?' * len(updated))})", updated
+            )
+        conn.commit()
+
+    written = 0
+    args = (levels, masserror, minerror, grid)
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for records in pool.map(_optimize_peaks, [db_file] * len(blocks), blocks,
+                                    *[[a] * len(blocks) for a in args]):
+                write(records)
+                written += len(records)
+                if progress:
+                    progress(written)
+    else:
+        for peak_block in blocks:
+            records = _optimize_peaks(db_file, peak_block, *args)
+            write(records)
+            written += len(records)
+            if progress:
+                progress(written)
+    return written